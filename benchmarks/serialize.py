@@ -0,0 +1,117 @@
+"""
+Incident serialization benchmark.
+
+Compares the old NDJSON path (regular dataclass + dataclasses.asdict +
+json.dumps per incident) against the slotted Incident with its hand-written
+serializer writing to a buffered stream. Reports time, peak traced
+allocations and retained bytes per incident.
+
+Usage:
+    python benchmarks/serialize.py              # 1,000,000 incidents
+    python benchmarks/serialize.py -n 200000
+"""
+from __future__ import annotations
+import argparse
+import dataclasses
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from detecttool.engine import Incident  # noqa: E402
+
+
+@dataclasses.dataclass
+class LegacyIncident:
+    """The pre-slots Incident, kept here for comparison."""
+    rule_id: str
+    type: str
+    severity: str
+    message: str
+    line_no: int
+    extracted: Dict[str, str]
+    context: List[str] = dataclasses.field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return dataclasses.asdict(self)
+
+
+MESSAGE = "Dec 24 17:40:10 kernel: Out of memory: Killed process {pid} (python3) total-vm:123456kB"
+CONTEXT = ["Dec 24 17:40:10 kernel:  dump_stack+0x6d/0x88", "Dec 24 17:40:10 kernel:  oom_kill_process+0x1f/0x40"]
+
+
+def make(cls, n: int) -> list:
+    return [
+        cls(rule_id="oom_basic", type="OOM", severity="high",
+            message=MESSAGE.format(pid=i), line_no=i,
+            extracted={"pid": str(i), "comm": "python3"},
+            context=list(CONTEXT) if cls is LegacyIncident else tuple(CONTEXT))
+        for i in range(n)
+    ]
+
+
+def legacy_write(items, out) -> None:
+    for inc in items:
+        out.write(json.dumps(inc.to_dict(), ensure_ascii=False) + "\n")
+
+
+def fast_write(items, out) -> None:
+    for inc in items:
+        inc.write_json(out)
+
+
+def _devnull() -> io.TextIOWrapper:
+    return io.TextIOWrapper(open(os.devnull, "wb"), encoding="utf-8", write_through=False)
+
+
+def run(label: str, cls, write: Callable, n: int, traced: int) -> None:
+    # 计时不开 tracemalloc（它会让分配密集的代码慢一个数量级）
+    items = make(cls, n)
+    out = _devnull()
+    t0 = time.perf_counter()
+    write(items, out)
+    out.flush()
+    elapsed = time.perf_counter() - t0
+    out.close()
+    del items
+
+    # 内存：对象常驻大小 + 序列化过程中的峰值分配
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    items = make(cls, traced)
+    held = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    out = _devnull()
+    write(items, out)
+    out.flush()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    out.close()
+
+    print(f"{label:<26} {elapsed:7.2f} s  {n / elapsed / 1000:7.0f}k inc/s  "
+          f"held {held / traced:5.0f} B/inc  serialize peak {peak / traced:6.1f} B/inc")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-n", type=int, default=1_000_000)
+    args = ap.parse_args()
+    n = args.n
+    # 两条路径输出必须一致
+    assert make(Incident, 1)[0].to_json() == json.dumps(make(LegacyIncident, 1)[0].to_dict(), ensure_ascii=False)
+
+    print(f"{n:,} incidents (allocations traced on {min(n, 100_000):,})")
+    traced = min(n, 100_000)
+    run("dataclass + asdict/dumps", LegacyIncident, legacy_write, n, traced)
+    run("slots + write_json", Incident, fast_write, n, traced)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Startup benchmark for the detecttool CLI.
+
+Runs ``python -X importtime`` on a fresh interpreter several times and reports
+the cumulative import time of ``detecttool.cli`` (median of N runs), plus the
+heavyweight modules that were pulled in.
+
+Usage:
+    python benchmarks/startup.py                 # report
+    python benchmarks/startup.py --budget-ms 150 # exit 1 if over budget
+"""
+from __future__ import annotations
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+HEAVY = ("rich", "yaml")
+
+
+def measure(module: str = "detecttool.cli") -> Tuple[int, Dict[str, int]]:
+    """Return (cumulative_us for `module`, {top_level_module: cumulative_us})."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(SRC), env.get("PYTHONPATH")) if p)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    total = 0
+    tops: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        try:
+            cumulative = int(parts[1].strip())
+        except ValueError:
+            continue  # 表头行
+        name = parts[2].strip()
+        if name == module:
+            total = cumulative
+        top = name.split(".")[0]
+        if name == top:
+            tops[top] = max(tops.get(top, 0), cumulative)
+    return total, tops
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=7)
+    ap.add_argument("--module", default="detecttool.cli")
+    ap.add_argument("--budget-ms", type=float, default=None)
+    args = ap.parse_args()
+
+    samples = []
+    tops: Dict[str, int] = {}
+    for _ in range(args.runs):
+        total, tops = measure(args.module)
+        samples.append(total)
+    median_ms = statistics.median(samples) / 1000.0
+
+    print(f"{args.module}: median {median_ms:.1f} ms over {args.runs} runs "
+          f"(min {min(samples) / 1000:.1f} ms, max {max(samples) / 1000:.1f} ms)")
+    heavy = [m for m in HEAVY if m in tops]
+    print(f"heavy modules imported: {', '.join(heavy) if heavy else 'none'}")
+    for name, us in sorted(tops.items(), key=lambda x: x[1], reverse=True)[:8]:
+        print(f"  {name:<20} {us / 1000:8.1f} ms")
+
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        print(f"FAIL: over budget ({median_ms:.1f} ms > {args.budget_ms:.1f} ms)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Syslog receiver load generator.
+
+Sends kernel-log-like syslog messages from many simulated hosts over UDP
+or TCP (octet-counted framing), ~1% of them matching a rule. Without
+--target it starts an in-process receiver with per-host detection on
+127.0.0.1 (in-process detection, or --workers processes) and reports
+how many messages per second were detected.
+
+Usage:
+    python benchmarks/syslog_load.py                      # 200,000 msgs, 2000 hosts, TCP
+    python benchmarks/syslog_load.py --proto udp -n 100000 --rate 30000
+    python benchmarks/syslog_load.py -n 500000 --workers 4
+    python benchmarks/syslog_load.py --target 10.0.0.5:514 --rfc 5424
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from typing import Iterator, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from detecttool.config import load_config  # noqa: E402
+from detecttool.hosts import HostDetectors  # noqa: E402
+from detecttool.shard import ShardedDetectors  # noqa: E402
+from detecttool.sources.syslog import SyslogReceiver, format_syslog, frame_octet_counted, parse_address  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+NORMAL = "usb 1-2: new high-speed USB device number {i} using xhci_hcd"
+MATCHING = "Out of memory: Killed process {i} (worker)"
+
+
+def messages(n: int, hosts: int, rfc: str) -> Iterator[bytes]:
+    ts = time.time()
+    for i in range(n):
+        text = (MATCHING if i % 100 == 0 else NORMAL).format(i=i)
+        yield format_syslog(f"host{i % hosts:05d}", text, rfc=rfc, ts=ts)
+
+
+def _pace(sent: int, rate: float, start: float) -> None:
+    if rate > 0:
+        ahead = sent / rate - (time.perf_counter() - start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def send(target: Tuple[str, int], proto: str, n: int, hosts: int, rfc: str, rate: float = 0.0,
+         batch: int = 200) -> float:
+    start = time.perf_counter()
+    if proto == "udp":
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for i, msg in enumerate(messages(n, hosts, rfc)):
+            s.sendto(msg, target)
+            if i % batch == 0:
+                _pace(i, rate, start)
+        s.close()
+    else:
+        s = socket.create_connection(target)
+        buf = []
+        for i, msg in enumerate(messages(n, hosts, rfc)):
+            buf.append(frame_octet_counted(msg))
+            if len(buf) >= batch:
+                s.sendall(b"".join(buf))
+                buf = []
+                _pace(i, rate, start)
+        s.sendall(b"".join(buf))
+        s.close()
+    return time.perf_counter() - start
+
+
+def run_local(args) -> None:
+    cfg = load_config(os.path.join(ROOT, "configs", "rules.yaml"))
+    if args.workers:
+        hosts = ShardedDetectors(cfg.rules, prefilter=cfg.prefilter, workers=args.workers).start()
+    else:
+        hosts = HostDetectors(cfg.rules, prefilter=cfg.prefilter)
+    found = [0]
+
+    def handle(host: str, line: str) -> None:
+        found[0] += len(hosts.process(host, line))
+
+    addr = ("127.0.0.1", 0)
+    receiver = SyslogReceiver(handle, udp=addr if args.proto == "udp" else None,
+                              tcp=addr if args.proto == "tcp" else None)
+
+    async def main() -> None:
+        await receiver.start()
+        target = receiver.addresses[args.proto]
+        start = time.perf_counter()
+        # 发送端放到另一个进程，不和接收端抢 GIL
+        sender = multiprocessing.Process(target=send, args=(target, args.proto, args.n, args.hosts, args.rfc, args.rate))
+        sender.start()
+        last, idle = -1, 0
+        while idle < 10:  # 1 秒内不再有新消息就算结束（UDP 可能丢包）
+            await asyncio.sleep(0.1)
+            if args.workers:
+                found[0] += len(hosts.heartbeat())
+            got = receiver.udp_messages + receiver.tcp_messages
+            idle = idle + 1 if got == last else 0
+            last = got
+            if got >= args.n:
+                break
+        elapsed = time.perf_counter() - start - (idle * 0.1 if last < args.n else 0)
+        sender.join()
+        await receiver.close()
+        if args.workers:
+            # worker 把积压的批次处理完才算数
+            found[0] += len(hosts.flush())
+            elapsed = time.perf_counter() - start
+            hosts.close()
+        print(f"{args.proto}/{args.rfc}, {args.workers} worker(s): {last:,}/{args.n:,} messages "
+              f"from {args.hosts:,} hosts in {elapsed:.2f}s = {last / elapsed:,.0f} msg/s, {found[0]:,} incidents")
+
+    asyncio.run(main())
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-n", type=int, default=200_000, help="messages to send")
+    ap.add_argument("--hosts", type=int, default=2000, help="simulated hosts")
+    ap.add_argument("--proto", choices=("udp", "tcp"), default="tcp")
+    ap.add_argument("--rfc", choices=("3164", "5424"), default="3164")
+    ap.add_argument("-w", "--workers", type=int, default=0, help="detect in N worker processes (serve-syslog --workers)")
+    ap.add_argument("--rate", type=float, default=0.0, help="messages per second (0 = as fast as possible; UDP beyond what the receiver keeps up with is lost)")
+    ap.add_argument("--target", help="send to a running serve-syslog at HOST:PORT instead of an in-process receiver")
+    args = ap.parse_args()
+    if args.target:
+        elapsed = send(parse_address(args.target), args.proto, args.n, args.hosts, args.rfc, args.rate)
+        print(f"sent {args.n:,} messages in {elapsed:.2f}s = {args.n / elapsed:,.0f} msg/s")
+    else:
+        run_local(args)
+
+
+if __name__ == "__main__":
+    main()
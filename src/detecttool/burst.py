@@ -0,0 +1,171 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import sys
+
+from .config import BurstSpec
+from .engine import Incident, _parse_syslog_ts
+
+BURST_TYPE = "BURST"
+
+
+class _Counter:
+    """Windowed count and baseline of one key."""
+    __slots__ = ("window", "count", "prev", "ewma", "active")
+
+    def __init__(self, window: int) -> None:
+        self.window = window  # 当前窗口编号（时间 // window_seconds）
+        self.count = 0
+        self.prev = 0  # 上一个窗口的计数，用来估算滑动窗口
+        self.ewma = 0.0  # 每窗口计数的指数滑动平均（基线）
+        self.active = False  # 正在突发中：已经报过，回落后才再报
+
+
+class BurstDetector:
+    """
+    Burst detection over the incident stream of scan / monitor.
+
+    Incidents are counted per key (their type, rule and/or extracted comm,
+    see `bursts.by`) in fixed log-time windows; the count of the last
+    `window_seconds` is estimated from the current and the previous window
+    (sliding window counter). When it reaches `min_count` and exceeds
+    `factor` x the key's baseline (EWMA of past window counts, empty
+    windows count as 0), one BURST incident is added after the triggering
+    one; the key reports again only after its rate has dropped below half
+    the threshold.
+
+    State is O(1) per key and bounded by `max_keys` (least recently seen
+    keys are dropped). Incidents without a syslog timestamp use `clock`,
+    or are not counted when clock is None (scan).
+    """
+    def __init__(self, spec: Optional[BurstSpec], *, clock: Optional[Callable[[], float]] = None) -> None:
+        self.clock = clock
+        self._keys: "OrderedDict[Tuple[str, ...], _Counter]" = OrderedDict()  # LRU：末尾最近出现
+        self._ts_prefix = ""
+        self._ts: Optional[float] = None
+        self.seen = 0
+        self.bursts = 0
+        self.evicted = 0
+        self.spec: Optional[BurstSpec] = None
+        self.update(spec)
+
+    @property
+    def active(self) -> bool:
+        return self.spec is not None
+
+    def update(self, spec: Optional[BurstSpec]) -> None:
+        """(Re)configure; counters are kept when the spec is unchanged."""
+        if spec == self.spec:
+            return
+        self.spec = spec
+        self._keys.clear()
+        if spec is not None:
+            self.alpha = 2.0 / (spec.baseline_windows + 1)
+            self.rule_id = sys.intern("burst_" + "_".join(spec.by))
+            self._types = frozenset(spec.types)
+
+    def _key(self, inc: Incident) -> Tuple[str, ...]:
+        parts = []
+        for dim in self.spec.by:
+            if dim == "type":
+                parts.append(inc.type)
+            elif dim == "rule":
+                parts.append(inc.rule_id)
+            else:
+                parts.append(inc.extracted.get("comm") or "-")
+        return tuple(parts)
+
+    def _log_ts(self, text: str) -> Optional[float]:
+        # 同一秒内的行时间戳前缀相同，不重复解析
+        prefix = text[:15]
+        if prefix != self._ts_prefix:
+            self._ts_prefix = prefix
+            self._ts = _parse_syslog_ts(prefix)
+        return self._ts
+
+    def _counter(self, key: Tuple[str, ...], window: int) -> _Counter:
+        c = self._keys.get(key)
+        if c is None:
+            c = self._keys[key] = _Counter(window)
+            if len(self._keys) > self.spec.max_keys:
+                self._keys.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._keys.move_to_end(key)
+        return c
+
+    def observe(self, inc: Incident) -> Optional[Incident]:
+        """Count one incident; returns a BURST incident when it starts a burst."""
+        spec = self.spec
+        if spec is None or inc.type == BURST_TYPE or (self._types and inc.type not in self._types):
+            return None
+        ts = self._log_ts(inc.message)
+        if ts is None:
+            if self.clock is None:
+                return None
+            ts = self.clock()
+        self.seen += 1
+        width = spec.window_seconds
+        window = int(ts // width)
+        key = self._key(inc)
+        c = self._counter(key, window)
+        if window > c.window:
+            # 窗口前移：上个窗口计入基线，中间空着的窗口按 0 衰减
+            skipped = window - c.window - 1
+            c.ewma += self.alpha * (c.count - c.ewma)
+            c.ewma *= (1 - self.alpha) ** skipped
+            c.prev = c.count if skipped == 0 else 0
+            c.window = window
+            c.count = 0
+        c.count += 1  # 乱序到达的旧时间戳算进当前窗口
+
+        frac = min(max(ts / width - window, 0.0), 1.0)
+        recent = c.count + c.prev * (1.0 - frac)
+        threshold = max(float(spec.min_count), spec.factor * max(c.ewma, 1.0))
+        if c.active:
+            if recent < threshold / 2:
+                c.active = False  # 回落到阈值一半以下才重新报（避免在阈值附近反复报）
+            return None
+        if recent < threshold:
+            return None
+        c.active = True
+        self.bursts += 1
+        return self._incident(inc, key, c, recent)
+
+    def _incident(self, inc: Incident, key: Tuple[str, ...], c: _Counter, recent: float) -> Incident:
+        spec = self.spec
+        label = "/".join(key)
+        count = int(round(recent))
+        extracted = {
+            "key": label,
+            "count": str(count),
+            "baseline": f"{c.ewma:.1f}",
+            "window_seconds": f"{spec.window_seconds:g}",
+        }
+        for dim, value in zip(spec.by, key):
+            extracted[dim] = value
+        return Incident(
+            rule_id=self.rule_id,
+            type=BURST_TYPE,
+            severity=spec.severity,
+            # 触发行在前：保留它的时间戳，折叠窗口和 sink 汇总按日志时间计
+            message=(f"{inc.message} [burst of {label}: {count} incident(s) in the last "
+                     f"{spec.window_seconds:g}s, usually {c.ewma:.1f}]"),
+            line_no=inc.line_no,
+            extracted=extracted,
+        )
+
+    def process(self, incidents: Iterable[Incident]) -> List[Incident]:
+        """Pass incidents through, each burst right after the incident that started it."""
+        if self.spec is None:
+            return incidents if isinstance(incidents, list) else list(incidents)
+        out: List[Incident] = []
+        for inc in incidents:
+            out.append(inc)
+            burst = self.observe(inc)
+            if burst is not None:
+                out.append(burst)
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {"seen": self.seen, "keys": len(self._keys), "bursts": self.bursts, "evicted": self.evicted}
@@ -1,25 +1,63 @@
 from __future__ import annotations
+import itertools
 import json
 import os
-import shutil
-import subprocess
 import sys
-from collections import Counter
+import time
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Any, Optional, Tuple
 import typer
-from rich.console import Console
-from rich.table import Table
-from .engine import detect_lines, Detector, MultiLineAggregator, Incident
+from .engine import detect_lines, iter_incidents, Detector, MultiLineAggregator, Incident
 from .sources.file_follow import follow_file
 from .config import load_config
 
+if TYPE_CHECKING:
+    import subprocess
+
 app = typer.Typer(help="SuSG2025 DetectTool - Linux abnormal log detection")
-console = Console()
 
 
-def _iter_file_lines(path: str):
+class _LazyConsole:
+    """
+    Defers importing rich until something is actually printed, so the
+    JSON/NDJSON paths (cron jobs, the systemd service) never pay for it.
+    """
+    _console = None
+
+    def __getattr__(self, name: str):
+        if _LazyConsole._console is None:
+            from rich.console import Console
+            _LazyConsole._console = Console()
+        return getattr(_LazyConsole._console, name)
+
+
+console = _LazyConsole()
+
+
+def _status(msg: str) -> None:
+    """Plain status line on stderr, keeps stdout pure NDJSON."""
+    print(msg, file=sys.stderr, flush=True)
+
+
+def _iter_file_lines(path: str, *, spans: bool = False, since: Optional[float] = None, until: Optional[float] = None):
+    """
+    (line_no, line) pairs; with spans=True (line_no, line, (offset, length))
+    from a binary read. since/until restrict to that log-time range by
+    seeking (see seek.py).
+    """
     try:
+        if since is not None or until is not None:
+            from .seek import iter_time_range
+
+            for item in iter_time_range(path, since, until):
+                yield item if spans else item[:2]
+            return
+        if spans:
+            from .context import iter_line_spans
+
+            with open(path, "rb") as f:
+                yield from iter_line_spans(f)
+            return
         with open(path, "r", encoding="utf-8", errors="replace") as f:
             for i, line in enumerate(f, start=1):
                 yield i, line
@@ -40,45 +78,463 @@ def scan(
     file: str = typer.Option(..., "--file", "-f", help="Path to a log file to scan"),
     config: str = typer.Option("configs/rules.yaml", "--config", "-c", help="Path to rules YAML"),
     json_out: bool = typer.Option(False, "--json", help="Output JSON instead of table"),
+    collapse: Optional[str] = typer.Option(None, "--collapse", help="Collapse repeated incidents within this window (e.g. 60s, 5m) into one counted summary"),
+    before: int = typer.Option(0, "--before", "-B", help="Attach up to N preceding log lines to each incident"),
+    before_bytes: str = typer.Option("64K", "--before-bytes", help="Memory budget for --before lines (e.g. 64K, 1M)"),
+    context_mem: str = typer.Option("64M", "--context-mem", help="RAM budget for multi-line context of non-regular inputs (pipes); beyond it context spills to a temp file"),
+    since: Optional[str] = typer.Option(None, "--since", help="Only lines logged at/after this time: 30m, 2h, 03:00, 2025-12-24 03:00, epoch"),
+    until: Optional[str] = typer.Option(None, "--until", help="Only lines logged before this time (same formats as --since)"),
+    last: Optional[str] = typer.Option(None, "--last", help="Only the last part of the file by log time (e.g. 30m, 1h), read backward from EOF"),
+    tail_bytes: Optional[str] = typer.Option(None, "--tail-bytes", help="Only the last N bytes of the file (e.g. 50M)"),
+    types: Optional[List[str]] = typer.Option(None, "--types", help="Only compile rules of these incident types (comma-separated or repeatable, e.g. PANIC,DEADLOCK)"),
+    min_severity: Optional[str] = typer.Option(None, "--min-severity", help="Only compile rules of at least this severity: low, medium, high, critical"),
+    rule_ids: Optional[List[str]] = typer.Option(None, "--rules", help="Only compile these rule ids (comma-separated or repeatable)"),
+    output_format: str = typer.Option("auto", "--format", help="Non-JSON output: auto (table, or stream above --table-limit incidents), table, stream (fixed-width rows as found) or tsv"),
+    table_limit: int = typer.Option(5000, "--table-limit", help="With --format auto, stream instead of building a table above this many incidents"),
+    templates: bool = typer.Option(False, "--templates", help="Also mine log templates: report new (NEW_TEMPLATE) or suddenly frequent (TEMPLATE_SPIKE) ones"),
+    templates_state: Optional[str] = typer.Option(None, "--templates-state", help="Template table kept between runs (default: under ~/.cache/detecttool/templates)"),
+    template_warmup: int = typer.Option(2000, "--template-warmup", help="Lines learned silently before new templates are reported (when no saved table exists)"),
+    bursts: bool = typer.Option(True, "--bursts/--no-bursts", help="Apply `bursts` from the rules file: report BURST when one type/rule/comm suddenly fires far above its usual rate"),
 ):
+    from .context import ContextStore
+
+    # 普通文件：context 只记 (偏移, 长度)，输出时才回读；管道等输入超出预算后落到临时文件
+    store = ContextStore(file)
     try:
-        cfg = load_config(config)
-        incidents = detect_lines(_iter_file_lines(file), cfg.rules)
-    except FileNotFoundError as e:
-        console.print(f"[bold red]Error:[/bold red] {e}", style="red")
-        raise typer.Exit(1)
-    except PermissionError as e:
-        console.print(f"[bold red]Error:[/bold red] {e}", style="red")
-        raise typer.Exit(1)
-    except ValueError as e:
-        console.print(f"[bold red]Configuration Error:[/bold red] {e}", style="red")
-        raise typer.Exit(1)
+        try:
+            collapse_window = _parse_collapse(collapse)
+            before_budget = _parse_before(before, before_bytes)
+            from .units import parse_size
+
+            store.mem_budget = parse_size(context_mem)
+            if output_format not in SCAN_FORMATS:
+                raise ValueError(f"--format must be one of {', '.join(SCAN_FORMATS)}, got {output_format!r}")
+            if table_limit < 0:
+                raise ValueError(f"--table-limit must be >= 0, got {table_limit}")
+            t_since, t_until = _parse_time_range(since, until)
+            tail = _open_tail(file, last, tail_bytes, ranged=t_since is not None or t_until is not None)
+            cfg = load_config(config, rule_filter=_rule_filter(types, min_severity, rule_ids))
+            miner, miner_path = _open_miner(templates, templates_state, file, template_warmup)
+            from .index import AutoIndexer
+
+            # 大文件整读一遍时顺带建稀疏索引，之后的按时间/尾部扫描可以直接定位
+            partial = tail is not None or t_since is not None or t_until is not None
+            indexer = None if partial else AutoIndexer.for_file(file)
+            window = _open_range(file, t_since, t_until) if t_since is not None or t_until is not None else None
+            lines = tail if tail is not None else (window if window is not None else _iter_file_lines(file, spans=True))
+            if indexer is not None:
+                lines = indexer.wrap(lines)
+            finish = []
+            if indexer is not None:
+                finish.append(indexer.finish)
+            if miner_path is not None:
+                finish.append(lambda: _save_miner(miner, miner_path))
+            burst = None
+            if bursts and cfg.bursts is not None:
+                from .burst import BurstDetector
+
+                burst = BurstDetector(cfg.bursts)
+            stream = _scan_stream(
+                iter_incidents(lines, cfg.rules, prefilter=cfg.prefilter, before_lines=before,
+                               before_bytes=before_budget, context_store=store, miner=miner),
+                tail=tail, collapse_window=collapse_window, finish=finish, burst=burst,
+            )
+            line_note = _line_note(tail, window)
+            columns = _scan_columns(before=bool(before), counted=bool(collapse_window))
+
+            if json_out or output_format == "table":
+                incidents = _collect(stream, sort=bool(collapse_window))
+            elif output_format == "auto":
+                # 先缓冲到阈值：没超过就照常画表格，超过了改成流式输出，内存只占阈值这么多
+                incidents = []
+                for inc in stream:
+                    incidents.append(inc)
+                    if len(incidents) > table_limit:
+                        _status(f"More than {table_limit} incidents: streaming rows instead of a table (--format table to force)")
+                        _stream_rows(itertools.chain(incidents, stream), columns, tsv=False, line_note=line_note)
+                        raise typer.Exit(0)
+                if collapse_window:
+                    incidents.sort(key=lambda inc: inc.line_no)
+            else:
+                _stream_rows(stream, columns, tsv=output_format == "tsv", line_note=line_note)
+                raise typer.Exit(0)
+        except FileNotFoundError as e:
+            console.print(f"[bold red]Error:[/bold red] {e}", style="red")
+            raise typer.Exit(1)
+        except PermissionError as e:
+            console.print(f"[bold red]Error:[/bold red] {e}", style="red")
+            raise typer.Exit(1)
+        except ValueError as e:
+            console.print(f"[bold red]Configuration Error:[/bold red] {e}", style="red")
+            raise typer.Exit(1)
+
+        if json_out:
+            print(json.dumps([x.to_dict() for x in incidents], ensure_ascii=False, indent=2), flush=True)
+            raise typer.Exit(0)
+
+        from rich.table import Table
+
+        title = f"Incidents ({len(incidents)})"
+        if line_note:
+            title += f" - line numbers relative to {line_note}"
+        table = Table(title=title)
+        for name in columns:
+            if name in _RIGHT_ALIGNED:
+                table.add_column(name, justify="right")
+            elif name == "Message":
+                table.add_column(name, overflow="fold")
+            else:
+                table.add_column(name)
+        for inc in incidents:
+            table.add_row(*_scan_row(inc, columns))
 
-    if json_out:
-        print(json.dumps([x.to_dict() for x in incidents], ensure_ascii=False, indent=2), flush=True)
-        raise typer.Exit(0)
+        console.print(table)
+    finally:
+        store.close()
 
-    table = Table(title=f"Incidents ({len(incidents)})")
-    table.add_column("Line", justify="right")
-    table.add_column("Type")
-    table.add_column("Severity")
-    table.add_column("Rule")
-    table.add_column("Extracted")
-    table.add_column("Ctx", justify="right")
-    table.add_column("Message", overflow="fold")
 
+def _parse_time_range(since: Optional[str], until: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """--since/--until -> epoch seconds (None = open end)."""
+    from .units import parse_time
+
+    t_since = parse_time(since) if since else None
+    t_until = parse_time(until) if until else None
+    if t_since is not None and t_until is not None and t_until <= t_since:
+        raise ValueError(f"--until must be later than --since ({until!r} <= {since!r})")
+    return t_since, t_until
+
+
+SCAN_FORMATS = ("auto", "table", "stream", "tsv")
+_TEMPLATE_SAVE_SECONDS = 600.0
+_RIGHT_ALIGNED = {"Line", "Ctx", "Before", "Count"}
+# stream 格式的列宽（Message 不截断）；超出的内容以 … 截断
+_STREAM_WIDTHS = {"Line": 8, "Type": 14, "Severity": 8, "Rule": 24, "Extracted": 32, "Ctx": 4, "Before": 6, "Count": 6}
+
+
+def _scan_stream(incidents, *, tail, collapse_window: Optional[float], finish=(), burst=None) -> Iterator[Incident]:
+    """
+    Post-processing of scan's incident stream: tail-relative line numbers,
+    burst detection, collapsing; `finish` callbacks (side index, template
+    table) run once the input is exhausted.
+    """
+    relative = tail is not None and not tail.absolute
+    collapser = None
+    if collapse_window:
+        from .collapse import StormCollapser
+
+        collapser = StormCollapser(collapse_window)
     for inc in incidents:
-        table.add_row(
-            str(inc.line_no),
-            inc.type,
-            inc.severity,
-            inc.rule_id,
-            json.dumps(inc.extracted, ensure_ascii=False),
-            str(len(inc.context)),
-            inc.message,
+        if relative:
+            # 没有索引时不知道起点之前有多少行：行号改成相对文件末尾（-1 为最后一行）
+            inc.line_no = tail.relative(inc.line_no)
+        found = [inc]
+        if burst is not None:
+            b = burst.observe(inc)
+            if b is not None:
+                found.append(b)
+        if collapser is None:
+            yield from found
+        else:
+            for x in found:
+                yield from collapser.add(x)
+    if collapser is not None:
+        yield from collapser.flush()
+    for done in finish:
+        done()
+
+
+def _collect(stream: Iterator[Incident], *, sort: bool) -> List[Incident]:
+    incidents = list(stream)
+    if sort:
+        # 折叠后的汇总按窗口关闭顺序产生，表格/JSON 按首行排序
+        incidents.sort(key=lambda inc: inc.line_no)
+    return incidents
+
+
+def _scan_columns(*, before: bool, counted: bool) -> List[str]:
+    cols = ["Line", "Type", "Severity", "Rule", "Extracted", "Ctx"]
+    if before:
+        cols.append("Before")
+    if counted:
+        cols.append("Count")
+    cols.append("Message")
+    return cols
+
+
+def _scan_row(inc: Incident, columns: List[str]) -> List[str]:
+    row = [
+        str(inc.line_no),
+        inc.type,
+        inc.severity,
+        inc.rule_id,
+        json.dumps(inc.extracted, ensure_ascii=False),
+        str(len(inc.context)),
+    ]
+    if "Before" in columns:
+        row.append(str(len(inc.before)))
+    if "Count" in columns:
+        row.append(str(inc.storm["count"]) if inc.storm else "1")
+    row.append(_storm_note(inc) if inc.storm else inc.message)
+    return row
+
+
+def _fit(text: str, width: int, right: bool) -> str:
+    if len(text) > width:
+        text = text[:width - 1] + "…"
+    return text.rjust(width) if right else text.ljust(width)
+
+
+def _stream_rows(incidents: Iterator[Incident], columns: List[str], *, tsv: bool, line_note: Optional[str] = None) -> int:
+    """
+    Print incidents one row at a time (fixed-width or TSV) in constant
+    memory, for results too large for a rich table. Returns the count.
+    TSV cells escape backslash, tab, newline and CR as \\\\, \\t, \\n, \\r.
+    """
+    out = sys.stdout
+    if tsv:
+        # 先转义反斜杠，否则原文里的 "\\t" 和转义出来的 "\\t" 分不开
+        tsv_cell = lambda v: v.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+        fmt_row = lambda row: "\t".join(tsv_cell(v) for v in row)
+    else:
+        def fmt_row(row: List[str]) -> str:
+            cells = [_fit(v, _STREAM_WIDTHS[c], c in _RIGHT_ALIGNED) for c, v in zip(columns, row[:-1])]
+            return " ".join(cells + [row[-1]])
+    n = 0
+    try:
+        if line_note:
+            _status(f"Line numbers are relative to {line_note}")
+        out.write(fmt_row(columns) + "\n")
+        for inc in incidents:
+            out.write(fmt_row(_scan_row(inc, columns)) + "\n")
+            n += 1
+        if not tsv:
+            out.write(f"-- {n} incident(s) --\n")
+        out.flush()
+    except BrokenPipeError:
+        # 下游（head 等）提前关闭：静默结束
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, out.fileno())
+    return n
+
+
+def _open_miner(enabled: bool, state: Optional[str], file: str, warmup: int):
+    """--templates: (TemplateMiner with the saved table loaded, where to save it) or (None, None)."""
+    if not enabled:
+        return None, None
+    from .templates import TemplateMiner, default_templates_path
+
+    if warmup < 0:
+        raise ValueError(f"--template-warmup must be >= 0, got {warmup}")
+    miner = TemplateMiner(warmup_lines=warmup)
+    path = Path(state) if state else default_templates_path(file)
+    if path is not None and path.exists():
+        miner.load(path)  # 不兼容/损坏的表直接重新学习
+    return miner, path
+
+
+def _save_miner(miner, path: Path) -> None:
+    try:
+        miner.save(path)
+    except OSError as e:
+        _status(f"Could not save template table {path}: {e}")
+
+
+def _split_list(values: Optional[List[str]]) -> Tuple[str, ...]:
+    """Repeatable and/or comma-separated option values -> tuple."""
+    return tuple(v.strip() for item in values or [] for v in item.split(",") if v.strip())
+
+
+def _rule_filter(types: Optional[List[str]], min_severity: Optional[str], rule_ids: Optional[List[str]]):
+    """--types/--min-severity/--rules -> config.RuleFilter (None = all rules)."""
+    from .config import RuleFilter
+
+    flt = RuleFilter(
+        types=_split_list(types),
+        min_severity=min_severity.lower() if min_severity else None,
+        rule_ids=_split_list(rule_ids),
+    )
+    return flt if flt.active else None
+
+
+def _open_range(file: str, since: Optional[float], until: Optional[float]):
+    """--since/--until -> a seek.TimeRangeReader positioned at the start of the range."""
+    from .seek import TimeRangeReader
+
+    try:
+        return TimeRangeReader(file, since, until)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Log file not found: {file}\n"
+            f"Please check the file path and try again"
         )
 
-    console.print(table)
+
+def _line_note(tail, window) -> Optional[str]:
+    """What scan's line numbers count from when they are not absolute (None = absolute)."""
+    if tail is not None and not tail.absolute:
+        return "end of file (-1 = last line)"
+    if window is not None and not window.absolute:
+        return "start of --since range (1 = first line)"
+    return None
+
+
+def _open_tail(file: str, last: Optional[str], tail_bytes: Optional[str], *, ranged: bool):
+    """--last/--tail-bytes -> a seek.TailReader positioned near EOF (None = whole file)."""
+    if last is None and tail_bytes is None:
+        return None
+    if last is not None and tail_bytes is not None:
+        raise ValueError("--last and --tail-bytes cannot be combined")
+    if ranged:
+        raise ValueError("--last/--tail-bytes cannot be combined with --since/--until")
+    from .seek import TailReader
+    from .units import parse_duration, parse_size
+
+    seconds = parse_duration(last) if last is not None else None
+    nbytes = parse_size(tail_bytes) if tail_bytes is not None else None
+    if (seconds is not None and seconds <= 0) or (nbytes is not None and nbytes <= 0):
+        raise ValueError(f"--last/--tail-bytes must be positive, got {last or tail_bytes!r}")
+    try:
+        return TailReader(file, seconds=seconds, nbytes=nbytes)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Log file not found: {file}\n"
+            f"Please check the file path and try again"
+        )
+    except PermissionError:
+        raise PermissionError(
+            f"Permission denied: {file}\n"
+            f"Please ensure you have read permission for this file"
+        )
+
+
+def _parse_collapse(window: Optional[str]) -> Optional[float]:
+    """--collapse value -> seconds (None = collapsing off)."""
+    if not window:
+        return None
+    from .units import parse_duration
+
+    seconds = parse_duration(window)
+    if seconds <= 0:
+        raise ValueError(f"--collapse must be a positive duration, got {window!r}")
+    return seconds
+
+
+def _parse_before(lines: int, budget: str) -> int:
+    """--before/--before-bytes -> byte budget of the before-context ring buffer."""
+    if lines < 0:
+        raise ValueError(f"--before must be >= 0, got {lines}")
+    from .units import parse_size
+
+    return parse_size(budget)
+
+
+def _storm_note(inc: Incident) -> str:
+    """Message plus a one-line summary of a collapsed storm."""
+    st = inc.storm
+    span = f"lines {st['first_line']}-{st['last_line']}"
+    if st["first_time"]:
+        span += f", {st['first_time']} .. {st['last_time']}"
+    samples = ", ".join(st["comms"]) or "-"
+    return f"{inc.message}\n[dim]x{st['count']} ({span}; comm: {samples})[/dim]"
+
+def _print_incident(inc: Incident, json_out: bool) -> None:
+    """Render one incident for monitor mode."""
+    if json_out:
+        inc.write_json(sys.stdout)
+        sys.stdout.flush()
+        return
+    console.print(
+        f"[bold]{inc.type}[/bold] "
+        f"[dim](rule={inc.rule_id}, severity={inc.severity}, line={inc.line_no})[/dim]\n"
+        f"{_storm_note(inc) if inc.storm else inc.message}\n"
+        f"[dim]extracted={json.dumps(inc.extracted, ensure_ascii=False)}[/dim]"
+    )
+    if inc.before:
+        console.print(f"[dim]--- before ({len(inc.before)}) ---[/dim]")
+        for l in inc.before:
+            console.print(f"[dim]{l}[/dim]")
+    if inc.context:
+        console.print(f"[dim]--- context ({len(inc.context)}) ---[/dim]")
+        for l in inc.context[:30]:
+            console.print(f"[dim]{l}[/dim]")
+        if len(inc.context) > 30:
+            console.print(f"[dim]... ({len(inc.context)-30} more)[/dim]")
+    console.print("")  # 空行分隔
+
+
+def _stop_on_sigterm() -> Callable[[], None]:
+    """
+    Treat SIGTERM (systemctl stop) like Ctrl+C so open blocks are flushed
+    and sinks drain their batches. Returns a function restoring the old handler.
+    """
+    import signal
+    import threading
+
+    if threading.current_thread() is not threading.main_thread():
+        return lambda: None
+
+    def _raise(signum, frame):
+        raise KeyboardInterrupt
+
+    old = signal.signal(signal.SIGTERM, _raise)
+    return lambda: signal.signal(signal.SIGTERM, old)
+
+
+def _apply_reload(reloader, detector, json_out: bool, limiter=None, burst=None) -> None:
+    """
+    Swap a freshly compiled rule set into the detector (a Detector, or
+    HostDetectors for serve-syslog), rate limiter and burst detector, if one is ready.
+    """
+    err = reloader.poll_error()
+    if err:
+        msg = f"Rule reload failed, keeping current rules: {err}"
+        if json_out:
+            _status(msg)
+        else:
+            console.print(f"[bold red]{msg}[/bold red]")
+    new_cfg = reloader.poll()
+    if new_cfg is None:
+        return
+    diff = detector.swap_rules(new_cfg.rules, prefilter=new_cfg.prefilter)
+    if limiter is not None:
+        limiter.update(new_cfg)
+    if burst is not None:
+        burst.update(new_cfg.bursts)
+    msg = (
+        f"Rules reloaded: {len(new_cfg.rules)} rules "
+        f"(+{len(diff['added'])} -{len(diff['removed'])} ~{len(diff['changed'])})"
+    )
+    if json_out:
+        _status(msg)
+    else:
+        console.print(f"[green]{msg}[/green]")
+
+
+def _open_sinks(specs: List[str], **options: Any) -> list:
+    """Open every --sink spec; on a bad spec close the ones already started."""
+    from .sinks import open_sink
+
+    sinks = []
+    try:
+        for spec in specs:
+            sinks.append(open_sink(spec, **options))
+    except ValueError:
+        _close_sinks(sinks)
+        raise
+    return sinks
+
+
+def _close_sinks(sinks: list) -> None:
+    """Drain sinks and report their accounting on stderr."""
+    for s in sinks:
+        s.close()
+        st = s.stats()
+        line = (f"sink {s.name}: written={st['written']} dropped={st['dropped']} "
+                f"batches={st['batches']} errors={st['errors']}")
+        if st.get("last_error"):
+            line += f" last_error={st['last_error']}"
+        _status(line)
+
 
 @app.command()
 def monitor(
@@ -87,9 +543,42 @@ def monitor(
     json_out: bool = typer.Option(False, "--json", help="Output JSON lines (one incident per line)"),
     from_start: bool = typer.Option(False, "--from-start", help="Read file from beginning (default: follow new lines only)"),
     poll_interval: float = typer.Option(0.2, "--poll", help="Polling interval seconds for file follow"),
+    reload: bool = typer.Option(True, "--reload/--no-reload", help="Reload rules on SIGHUP or when the config file changes"),
+    reload_interval: float = typer.Option(2.0, "--reload-interval", help="Seconds between config file change checks"),
+    sink: Optional[List[str]] = typer.Option(None, "--sink", help="Extra output: file:PATH[?max_bytes=50M&max_age=1d&backups=5], unix:PATH, sqlite:PATH or http(s)://URL (repeatable)"),
+    sink_batch: int = typer.Option(100, "--sink-batch", help="Max incidents per sink write"),
+    sink_flush: float = typer.Option(1.0, "--sink-flush", help="Max seconds an incident waits in a sink batch"),
+    sink_queue: int = typer.Option(10000, "--sink-queue", help="Bounded queue size per sink"),
+    sink_on_full: str = typer.Option("drop", "--sink-on-full", help="When a sink queue is full: drop or block"),
+    quiet: bool = typer.Option(False, "--quiet", "-q", help="Do not print incidents to stdout (use with --sink)"),
+    queue_size: int = typer.Option(10000, "--queue-size", help="Bounded queue size between reader, detection and output stages"),
+    on_slow_output: str = typer.Option("block", "--on-slow-output", help="When output can't keep up: block, drop-newest or drop-oldest"),
+    metrics_interval: float = typer.Option(0.0, "--metrics-interval", help="Print pipeline queue metrics to stderr every N seconds (0 = off)"),
+    collapse: Optional[str] = typer.Option(None, "--collapse", help="Collapse repeated incidents within this window (e.g. 60s, 5m); summaries are emitted when the window closes"),
+    rate_limit: bool = typer.Option(True, "--rate-limit/--no-rate-limit", help="Apply rate_limit / rate_limits from the rules file"),
+    before: int = typer.Option(0, "--before", "-B", help="Attach up to N preceding log lines to each incident"),
+    before_bytes: str = typer.Option("64K", "--before-bytes", help="Memory budget for --before lines (e.g. 64K, 1M)"),
+    types: Optional[List[str]] = typer.Option(None, "--types", help="Only compile rules of these incident types (comma-separated or repeatable, e.g. PANIC,DEADLOCK)"),
+    min_severity: Optional[str] = typer.Option(None, "--min-severity", help="Only compile rules of at least this severity: low, medium, high, critical"),
+    rule_ids: Optional[List[str]] = typer.Option(None, "--rules", help="Only compile these rule ids (comma-separated or repeatable)"),
+    control: Optional[str] = typer.Option(None, "--control", help="Serve live status (counters, offsets, open blocks) on this Unix socket, see service-status"),
+    templates: bool = typer.Option(False, "--templates", help="Also mine log templates: report new (NEW_TEMPLATE) or suddenly frequent (TEMPLATE_SPIKE) ones"),
+    templates_state: Optional[str] = typer.Option(None, "--templates-state", help="Template table kept between runs (default: under ~/.cache/detecttool/templates)"),
+    template_warmup: int = typer.Option(2000, "--template-warmup", help="Lines learned silently before new templates are reported (when no saved table exists)"),
+    bursts: bool = typer.Option(True, "--bursts/--no-bursts", help="Apply `bursts` from the rules file: report BURST when one type/rule/comm suddenly fires far above its usual rate"),
 ):
+    from .pipeline import OUTPUT_POLICIES, MonitorPipeline
+
     try:
-        cfg = load_config(config)
+        collapse_window = _parse_collapse(collapse)
+        before_budget = _parse_before(before, before_bytes)
+        rule_filter = _rule_filter(types, min_severity, rule_ids)
+        cfg = load_config(config, rule_filter=rule_filter)
+        miner, miner_path = _open_miner(templates, templates_state, file, template_warmup)
+        if on_slow_output not in OUTPUT_POLICIES:
+            raise ValueError(f"--on-slow-output must be one of {', '.join(OUTPUT_POLICIES)}, got {on_slow_output!r}")
+        sinks = _open_sinks(sink or [], batch_size=sink_batch, flush_interval=sink_flush,
+                            queue_size=sink_queue, on_full=sink_on_full, source=os.path.abspath(file))
     except FileNotFoundError as e:
         console.print(f"[bold red]Error:[/bold red] {e}", style="red")
         raise typer.Exit(1)
@@ -97,56 +586,319 @@ def monitor(
         console.print(f"[bold red]Configuration Error:[/bold red] {e}", style="red")
         raise typer.Exit(1)
 
-    detector = Detector(cfg.rules)
-    agg = MultiLineAggregator(detector)
-    console.print(f"[green]Monitoring[/green] {file}  (Ctrl+C to stop)")
-    console.print(f"Config: {config} | from_start={from_start} | poll={poll_interval}s")
+    status = None
+    if control:
+        from .control import DaemonStatus
+
+        status = DaemonStatus()
+
+    def _output(inc: Incident) -> None:
+        if not quiet:
+            _print_incident(inc, json_out)
+        for s in sinks:
+            s.emit(inc)
+        if status is not None:
+            status.record(inc)
+
+    detector = Detector(cfg.rules, prefilter=cfg.prefilter)
+    agg = MultiLineAggregator(detector, before_lines=before, before_bytes=before_budget)
+    process, finish = agg.process, agg.flush
+    if miner is not None:
+        save_due = [time.monotonic() + _TEMPLATE_SAVE_SECONDS]
+
+        def process(line_no: int, line: str, _inner=process) -> List[Incident]:
+            out = _inner(line_no, line)
+            if line_no:
+                found = miner.process(line_no, line)
+                if found:
+                    out = out + found
+            elif miner_path is not None and time.monotonic() >= save_due[0]:
+                # 空闲时定期保存模板表（检测线程里做，不与学习并发）
+                save_due[0] = time.monotonic() + _TEMPLATE_SAVE_SECONDS
+                _save_miner(miner, miner_path)
+            return out
+
+        def finish(_inner=finish) -> List[Incident]:
+            out = _inner()
+            if miner_path is not None:
+                _save_miner(miner, miner_path)
+            return out
+
+    burst = None
+    if bursts:
+        from .burst import BurstDetector
+
+        # 折叠之前计数：风暴汇总会把突发压成一条；没有 bursts 配置时直接放行（热加载可以再打开）
+        burst = BurstDetector(cfg.bursts, clock=time.time)
+
+        def process(line_no: int, line: str, _inner=process) -> List[Incident]:
+            return burst.process(_inner(line_no, line))
+
+        def finish(_inner=finish) -> List[Incident]:
+            return burst.process(_inner())
+
+    if collapse_window:
+        from .collapse import StormCollapser
+
+        collapser = StormCollapser(collapse_window)
+
+        def process(line_no: int, line: str, _inner=process) -> List[Incident]:
+            out = collapser.add_all(_inner(line_no, line))
+            if line_no == 0:
+                # 心跳：日志空闲时也要按时吐出已到期的风暴汇总
+                out.extend(collapser.expire())
+            return out
+
+        def finish(_inner=finish) -> List[Incident]:
+            return collapser.add_all(_inner()) + collapser.flush()
+
+    limiter = None
+    if rate_limit:
+        from .ratelimit import RateLimiter
+
+        # 限流放在最后：折叠后的风暴汇总只占一个令牌
+        limiter = RateLimiter(cfg)
+
+        def process(line_no: int, line: str, _inner=process) -> List[Incident]:
+            return limiter.process(_inner(line_no, line))
+
+        def finish(_inner=finish) -> List[Incident]:
+            return limiter.process(_inner()) + limiter.flush()
+
+    reloader = None
+    if reload:
+        from .reload import RuleReloader
+
+        reloader = RuleReloader(config, check_interval=reload_interval, rule_filter=rule_filter)
+        reloader.install_signal_handler()
+        reloader.start()
 
-    try:
-         for line_no, line in follow_file(
+    if json_out:
+        _status(f"Monitoring {file}  (Ctrl+C to stop)")
+        _status(f"Config: {config} | from_start={from_start} | poll={poll_interval}s | reload={reload}")
+    else:
+        console.print(f"[green]Monitoring[/green] {file}  (Ctrl+C to stop)")
+        console.print(f"Config: {config} | from_start={from_start} | poll={poll_interval}s | reload={reload}")
+
+    position: Dict[str, Any] = {}
+    pipeline = MonitorPipeline(
+        follow_file(
             file,
             start_at_end=(not from_start),
             poll_interval=poll_interval,
             yield_heartbeat=True,  # 关键：让 idle flush 生效
-        ):
-            hits = agg.process(line_no, line)
-            for inc in hits:
-                if json_out:
-                    print(json.dumps(inc.to_dict(), ensure_ascii=False), flush=True)
-                else:
-                    console.print(
-                        f"[bold]{inc.type}[/bold] "
-                        f"[dim](rule={inc.rule_id}, severity={inc.severity}, line={inc.line_no})[/dim]\n"
-                        f"{inc.message}\n"
-                        f"[dim]extracted={json.dumps(inc.extracted, ensure_ascii=False)}[/dim]"
-                    )
-                    if inc.context:
-                        console.print(f"[dim]--- context ({len(inc.context)}) ---[/dim]")
-                        for l in inc.context[:30]:
-                            console.print(f"[dim]{l}[/dim]")
-                        if len(inc.context) > 30:
-                            console.print(f"[dim]... ({len(inc.context)-30} more)[/dim]")
-                    console.print("")  # 空行分隔
-    except KeyboardInterrupt:
-        # 退出前 flush 一下，避免最后一个块丢失
-        for inc in agg.flush():
-            if json_out:
-                print(json.dumps(inc.to_dict(), ensure_ascii=False), flush=True)
-            else:
-                console.print(
-                    f"[bold]{inc.type}[/bold] "
-                    f"[dim](rule={inc.rule_id}, severity={inc.severity}, line={inc.line_no})[/dim]\n"
-                    f"{inc.message}\n"
-                    f"[dim]extracted={json.dumps(inc.extracted, ensure_ascii=False)}[/dim]"
-                )
-                if inc.context:
-                    console.print(f"[dim]--- context ({len(inc.context)}) ---[/dim]")
-                    for l in inc.context[:30]:
-                        console.print(f"[dim]{l}[/dim]")
-                    if len(inc.context) > 30:
-                        console.print(f"[dim]... ({len(inc.context)-30} more)[/dim]")
-                console.print("")
-        console.print("[yellow]Stopped.[/yellow]")
+            position=position,
+        ),
+        process,
+        _output,
+        finish=finish,  # 退出前 flush 一下，避免最后一个块（及未关闭的风暴窗口）丢失
+        # 新规则在后台线程编译好，检测线程在行与行之间做一次引用替换；聚合块与冷却状态保留
+        between_lines=(lambda: _apply_reload(reloader, detector, json_out, limiter, burst)) if reloader is not None else None,
+        line_queue_size=queue_size,
+        incident_queue_size=queue_size,
+        output_policy=on_slow_output,
+    )
+
+    def _report_metrics() -> None:
+        m = pipeline.metrics()
+        if limiter is not None:
+            m["rate_limit"] = limiter.stats()
+        _status("metrics " + json.dumps(m, ensure_ascii=False))
+
+    def _live_status() -> Dict[str, Any]:
+        # 控制套接字线程调用：只读内存里的计数，不碰 incidents.log
+        st = status.snapshot()
+        source = dict(position)
+        try:
+            source["size"] = os.stat(file).st_size
+        except OSError:
+            source["size"] = None
+        block = agg.open_block()
+        st.update(
+            source=source,
+            config=os.path.abspath(config),
+            rules=len(detector.rules),
+            pipeline=pipeline.metrics(),
+            blocks=[block] if block is not None else [],
+        )
+        if limiter is not None:
+            st["rate_limit"] = limiter.stats()
+        if miner is not None:
+            st["templates"] = miner.stats()
+        if burst is not None and burst.active:
+            st["bursts"] = burst.stats()
+        return st
+
+    server = None
+    restore_sigterm = _stop_on_sigterm()
+    try:
+        if control:
+            from .control import ControlServer
+
+            try:
+                server = ControlServer(control, _live_status).start()
+            except (OSError, ValueError) as e:
+                console.print(f"[bold red]Configuration Error:[/bold red] {e}", style="red")
+                raise typer.Exit(1)
+        pipeline.start()
+        try:
+            try:
+                pipeline.run(tick=_report_metrics, tick_interval=metrics_interval)
+            except KeyboardInterrupt:
+                # 停止读取，检测线程 flush 聚合块，输出阶段把队列里剩下的事件吐完
+                pipeline.stop()
+                pipeline.run()
+        except Exception as e:
+            # 读取/检测线程出错时管道已经停下，这里按普通错误报告
+            console.print(f"[bold red]Error:[/bold red] {type(e).__name__}: {e}", style="red")
+            raise typer.Exit(1)
+        if json_out:
+            _status("Stopped.")
+        else:
+            console.print("[yellow]Stopped.[/yellow]")
+        if metrics_interval > 0:
+            _report_metrics()
+    finally:
+        restore_sigterm()
+        if server is not None:
+            server.close()
+        if reloader is not None:
+            reloader.stop()
+        _close_sinks(sinks)
+
+
+_LISTEN_OFF = ("", "off", "none")
+
+
+@app.command("serve-syslog")
+def serve_syslog(
+    config: str = typer.Option("configs/rules.yaml", "--config", "-c", help="Path to rules YAML"),
+    udp: str = typer.Option("0.0.0.0:514", "--udp", help="UDP listen address HOST:PORT ('off' to disable)"),
+    tcp: str = typer.Option("0.0.0.0:514", "--tcp", help="TCP listen address HOST:PORT, octet-counted or newline framing ('off' to disable)"),
+    json_out: bool = typer.Option(False, "--json", help="Output JSON lines (one incident per line)"),
+    quiet: bool = typer.Option(False, "--quiet", "-q", help="Do not print incidents to stdout (use with --sink)"),
+    max_hosts: int = typer.Option(10000, "--max-hosts", help="Hosts whose detection state is kept (per worker); the least recently heard is dropped beyond this"),
+    workers: int = typer.Option(0, "--workers", "-w", help="Detect in N worker processes, hosts assigned by consistent hash of the hostname (0 = in the receiver process)"),
+    ipc_batch: int = typer.Option(500, "--ipc-batch", help="With --workers: max messages per batch sent to a worker"),
+    worker_queue: int = typer.Option(64, "--worker-queue", help="With --workers: bounded queue per worker, in batches; a full queue slows the receiver down"),
+    reload: bool = typer.Option(True, "--reload/--no-reload", help="Reload rules on SIGHUP or when the config file changes"),
+    reload_interval: float = typer.Option(2.0, "--reload-interval", help="Seconds between config file change checks"),
+    sink: Optional[List[str]] = typer.Option(None, "--sink", help="Extra output, same specs as monitor --sink (repeatable)"),
+    sink_batch: int = typer.Option(100, "--sink-batch", help="Max incidents per sink write"),
+    sink_flush: float = typer.Option(1.0, "--sink-flush", help="Max seconds an incident waits in a sink batch"),
+    sink_queue: int = typer.Option(10000, "--sink-queue", help="Bounded queue size per sink"),
+    sink_on_full: str = typer.Option("drop", "--sink-on-full", help="When a sink queue is full: drop or block"),
+    metrics_interval: float = typer.Option(0.0, "--metrics-interval", help="Print receiver/host metrics to stderr every N seconds (0 = off)"),
+    before: int = typer.Option(0, "--before", "-B", help="Attach up to N preceding lines of the same host to each incident"),
+    before_bytes: str = typer.Option("64K", "--before-bytes", help="Memory budget for --before lines per host (e.g. 64K, 1M)"),
+    types: Optional[List[str]] = typer.Option(None, "--types", help="Only compile rules of these incident types (comma-separated or repeatable, e.g. PANIC,DEADLOCK)"),
+    min_severity: Optional[str] = typer.Option(None, "--min-severity", help="Only compile rules of at least this severity: low, medium, high, critical"),
+    rule_ids: Optional[List[str]] = typer.Option(None, "--rules", help="Only compile these rule ids (comma-separated or repeatable)"),
+):
+    """Receive syslog over UDP/TCP from many hosts and detect incidents per host."""
+    import asyncio
+    from .hosts import HostDetectors
+    from .sources.syslog import SyslogReceiver, parse_address
+
+    try:
+        udp_addr = None if udp.strip().lower() in _LISTEN_OFF else parse_address(udp)
+        tcp_addr = None if tcp.strip().lower() in _LISTEN_OFF else parse_address(tcp)
+        if udp_addr is None and tcp_addr is None:
+            raise ValueError("--udp and --tcp are both off, nothing to listen on")
+        if max_hosts < 1:
+            raise ValueError(f"--max-hosts must be >= 1, got {max_hosts}")
+        if workers < 0 or ipc_batch < 1 or worker_queue < 1:
+            raise ValueError("--workers must be >= 0, --ipc-batch and --worker-queue >= 1")
+        before_budget = _parse_before(before, before_bytes)
+        rule_filter = _rule_filter(types, min_severity, rule_ids)
+        cfg = load_config(config, rule_filter=rule_filter)
+        sinks = _open_sinks(sink or [], batch_size=sink_batch, flush_interval=sink_flush,
+                            queue_size=sink_queue, on_full=sink_on_full, source="syslog")
+    except FileNotFoundError as e:
+        console.print(f"[bold red]Error:[/bold red] {e}", style="red")
+        raise typer.Exit(1)
+    except ValueError as e:
+        console.print(f"[bold red]Configuration Error:[/bold red] {e}", style="red")
+        raise typer.Exit(1)
+
+    if workers:
+        from .shard import ShardedDetectors
+
+        # 接收进程只做解析和按主机分发，检测在 worker 里；事件异步返回，在下一次 tick 输出
+        hosts = ShardedDetectors(cfg.rules, prefilter=cfg.prefilter, workers=workers, batch_size=ipc_batch,
+                                 queue_size=worker_queue, before_lines=before, before_bytes=before_budget,
+                                 max_hosts=max_hosts)
+    else:
+        hosts = HostDetectors(cfg.rules, prefilter=cfg.prefilter, before_lines=before,
+                              before_bytes=before_budget, max_hosts=max_hosts)
+
+    def _output(inc: Incident) -> None:
+        if not quiet:
+            _print_incident(inc, json_out)
+        for s in sinks:
+            s.emit(inc)
+
+    def _handle(host: str, line: str) -> None:
+        # 在事件循环线程里直接检测：每条消息只做一次预过滤 search，绝大多数到此为止
+        for inc in hosts.process(host, line):
+            _output(inc)
+
+    receiver = SyslogReceiver(_handle, udp=udp_addr, tcp=tcp_addr)
+
+    reloader = None
+    if reload:
+        from .reload import RuleReloader
+
+        reloader = RuleReloader(config, check_interval=reload_interval, rule_filter=rule_filter)
+        reloader.install_signal_handler()
+        reloader.start()
+
+    def _report_metrics() -> None:
+        _status("metrics " + json.dumps({"receiver": receiver.stats(), "hosts": hosts.stats()}, ensure_ascii=False))
+
+    metrics_due = [time.monotonic() + metrics_interval]
+
+    def _tick() -> None:
+        # 空闲主机的多行块按 idle 超时关闭；热加载、指标也在事件循环里做，不与检测并发
+        for inc in hosts.heartbeat():
+            _output(inc)
+        if reloader is not None:
+            _apply_reload(reloader, hosts, json_out)
+        if metrics_interval > 0 and time.monotonic() >= metrics_due[0]:
+            metrics_due[0] = time.monotonic() + metrics_interval
+            _report_metrics()
+
+    async def _serve() -> None:
+        if workers:
+            hosts.start()  # 先起 worker：监听一打开（UDP 可能在 TCP 还没建好时）就会有消息进来
+        await receiver.start()
+        where = ", ".join(f"{proto} {host}:{port}" for proto, (host, port) in receiver.addresses.items())
+        if json_out:
+            _status(f"Receiving syslog on {where}  (Ctrl+C to stop)")
+        else:
+            console.print(f"[green]Receiving syslog[/green] on {where}  (Ctrl+C to stop)")
+        await receiver.run(asyncio.Event(), tick=_tick, tick_interval=0.05 if workers else 0.2, handle_signals=True)
+
+    try:
+        try:
+            asyncio.run(_serve())
+        except OSError as e:
+            console.print(f"[bold red]Error:[/bold red] Cannot listen: {e}", style="red")
+            raise typer.Exit(1)
+        for inc in hosts.flush():
+            _output(inc)
+        if json_out:
+            _status("Stopped.")
+        else:
+            console.print("[yellow]Stopped.[/yellow]")
+        if metrics_interval > 0:
+            _report_metrics()
+    finally:
+        if workers:
+            hosts.close()
+        if reloader is not None:
+            reloader.stop()
+        _close_sinks(sinks)
 
 
 def _generate_statistics(incidents: List[Incident], total_lines: int, top_n: int = 10) -> Dict[str, Any]:
@@ -161,60 +913,81 @@ def _generate_statistics(incidents: List[Incident], total_lines: int, top_n: int
     Returns:
         Dictionary containing all statistics
     """
-    total = len(incidents)
-
-    # Count by type
-    type_counts = Counter(inc.type for inc in incidents)
-
-    # Count by severity
-    severity_counts = Counter(inc.severity for inc in incidents)
-
-    # Count by rule ID
-    rule_counts = Counter(inc.rule_id for inc in incidents)
-
-    # Extract and count process names (comm)
-    comm_list = [inc.extracted.get('comm') for inc in incidents if inc.extracted.get('comm')]
-    comm_counts = Counter(comm_list)
-
-    # Extract and count PIDs
-    pid_list = [inc.extracted.get('pid') for inc in incidents if inc.extracted.get('pid')]
-    pid_counts = Counter(pid_list)
-
-    return {
-        'total_lines_scanned': total_lines,
-        'total_incidents': total,
-        'unique_types': len(type_counts),
-        'by_type': dict(type_counts),
-        'by_severity': dict(severity_counts),
-        'by_rule': dict(rule_counts),
-        'top_processes': comm_counts.most_common(top_n),
-        'top_pids': pid_counts.most_common(top_n),
-    }
+    from .stats import StatsAccumulator
+
+    return StatsAccumulator().add_all(incidents).result(total_lines, top_n=top_n)
 
 
 @app.command()
 def stats(
-    file: str = typer.Option(..., "--file", "-f", help="Path to a log file to analyze"),
+    file: Optional[str] = typer.Option(None, "--file", "-f", help="Path to a log file to analyze"),
     config: str = typer.Option("configs/rules.yaml", "--config", "-c", help="Path to rules YAML"),
     json_out: bool = typer.Option(False, "--json", help="Output JSON instead of tables"),
     top: int = typer.Option(10, "--top", "-n", help="Show top N items in rankings"),
+    incremental: bool = typer.Option(False, "--incremental", "-i", help="Only process bytes appended since the last --incremental run"),
+    state: Optional[str] = typer.Option(None, "--state", help="State file for --incremental (default: under ~/.cache/detecttool/stats)"),
+    bucket: Optional[str] = typer.Option(None, "--bucket", "-b", help="Also count incidents per time bucket of the log timestamp (e.g. 1m, 5m, 1h)"),
+    since: Optional[str] = typer.Option(None, "--since", help="Only lines logged at/after this time: 30m, 2h, 03:00, 2025-12-24 03:00, epoch"),
+    until: Optional[str] = typer.Option(None, "--until", help="Only lines logged before this time (same formats as --since)"),
+    types: Optional[List[str]] = typer.Option(None, "--types", help="Only compile rules of these incident types (comma-separated or repeatable, e.g. PANIC,DEADLOCK)"),
+    min_severity: Optional[str] = typer.Option(None, "--min-severity", help="Only compile rules of at least this severity: low, medium, high, critical"),
+    rule_ids: Optional[List[str]] = typer.Option(None, "--rules", help="Only compile these rule ids (comma-separated or repeatable)"),
+    incidents_log: Optional[str] = typer.Option(None, "--incidents-log", help="Instead of --file: totals of an incidents log written by the file sink, from its summary sidecar"),
 ):
     """
     Analyze log file and show statistics of detected incidents.
 
     Provides statistics by type, severity, and top affected processes/PIDs.
+    With --incremental, aggregate state is kept between runs together with
+    the file's inode, byte offset and line count, so periodic runs over a
+    growing log only read the new bytes (rotation/truncation -> full rescan).
+    With --bucket, a timeline of per-bucket counts by type/severity and the
+    peak incident rate is computed in the same pass.
+    With --incidents-log, the counts come from the summary sidecar of the
+    daemon's incidents log without reading any of its segments.
     """
-    try:
-        cfg = load_config(config)
-
-        # Scan the log file (single pass)
-        total_lines = 0
-        lines_with_tracking = []
-        for line_no, line in _iter_file_lines(file):
-            lines_with_tracking.append((line_no, line))
-            total_lines = line_no
+    from .stats import StatsAccumulator, config_fingerprint, default_state_path, incremental_stats, summary_stats
+    from .units import parse_duration
 
-        incidents = detect_lines(iter(lines_with_tracking), cfg.rules)
+    inc_info = None
+    try:
+        bucket_seconds = None
+        if bucket:
+            bucket_seconds = int(parse_duration(bucket))
+            if bucket_seconds < 1:
+                raise ValueError(f"--bucket must be at least 1s, got {bucket!r}")
+        t_since, t_until = _parse_time_range(since, until)
+        ranged = t_since is not None or t_until is not None
+        if ranged and (incremental or state):
+            raise ValueError("--since/--until cannot be combined with --incremental")
+        rule_filter = _rule_filter(types, min_severity, rule_ids)
+        if incidents_log:
+            if file or incremental or state or bucket_seconds or ranged or rule_filter is not None:
+                raise ValueError("--incidents-log reads only the summary sidecar and cannot be combined "
+                                 "with --file, --incremental, --bucket, --since/--until or rule filters")
+        elif not file:
+            raise ValueError("--file is required (or --incidents-log)")
+        cfg = None if incidents_log else load_config(config, rule_filter=rule_filter)
+        state_path = Path(state) if state else (default_state_path(file) if incremental else None)
+
+        if incidents_log:
+            stats_data = summary_stats(incidents_log)
+        elif incremental and state_path is not None:
+            stats_data, inc_info = incremental_stats(
+                file, cfg, config_fingerprint(config, rule_filter), state_path, top_n=top,
+                bucket_seconds=bucket_seconds,
+            )
+        else:
+            # Scan the log file (single streaming pass)
+            detector = Detector(cfg.rules, prefilter=cfg.prefilter)
+            agg = MultiLineAggregator(detector)
+            acc = StatsAccumulator(bucket_seconds=bucket_seconds)
+            total_lines = 0
+            for line_no, line in _iter_file_lines(file, since=t_since, until=t_until):
+                acc.add_all(agg.process(line_no, line))
+                total_lines += 1
+            acc.add_all(agg.flush())
+            stats_data = acc.result(total_lines, top_n=top)
     except FileNotFoundError as e:
         console.print(f"[bold red]Error:[/bold red] {e}", style="red")
         raise typer.Exit(1)
@@ -225,15 +998,14 @@ def stats(
         console.print(f"[bold red]Configuration Error:[/bold red] {e}", style="red")
         raise typer.Exit(1)
 
-    # Generate statistics
-    stats_data = _generate_statistics(incidents, total_lines, top_n=top)
-
     # JSON output
     if json_out:
         print(json.dumps(stats_data, ensure_ascii=False, indent=2), flush=True)
         raise typer.Exit(0)
 
     # Rich table output
+    from rich.table import Table
+
     total = stats_data['total_incidents']
 
     console.print("\n[bold cyan]═══════════════════════════════════════[/bold cyan]")
@@ -241,9 +1013,18 @@ def stats(
     console.print("[bold cyan]═══════════════════════════════════════[/bold cyan]\n")
 
     # Overview
-    console.print(f"[bold]Total lines scanned:[/bold] {stats_data['total_lines_scanned']:,}")
+    log_info = stats_data.get('incidents_log')
+    if log_info is not None:
+        console.print(f"[bold]Incidents log:[/bold] {log_info['path']} "
+                      f"({log_info['segments']} segment(s), from the summary sidecar)")
+    else:
+        console.print(f"[bold]Total lines scanned:[/bold] {stats_data['total_lines_scanned']:,}")
     console.print(f"[bold]Total incidents detected:[/bold] {total:,}")
     console.print(f"[bold]Unique incident types:[/bold] {stats_data['unique_types']}\n")
+    if inc_info is not None:
+        why = f" ({inc_info['reason']})" if inc_info["reason"] else ""
+        console.print(f"[dim]{inc_info['mode'].capitalize()} scan{why}: "
+                      f"{inc_info['bytes_processed']:,} bytes processed[/dim]\n")
 
     if total == 0:
         console.print("[yellow]No incidents detected in the log file.[/yellow]")
@@ -331,9 +1112,211 @@ def stats(
 
         console.print(rule_table)
 
+    # Table 6: Timeline (only with --bucket)
+    timeline = stats_data.get('timeline')
+    if timeline and timeline['buckets']:
+        console.print()
+        _print_timeline(timeline)
+
     console.print("\n[bold cyan]═══════════════════════════════════════[/bold cyan]\n")
 
 
+def _print_timeline(timeline: Dict[str, Any], width: int = 20) -> None:
+    from rich.table import Table
+
+    peak = timeline['peak']
+    top_count = peak['count'] if peak else 1
+    types = sorted({t for b in timeline['buckets'] for t in b['by_type']})
+    table = Table(title=f"Incidents per {timeline['bucket_seconds']}s bucket",
+                  show_header=True, header_style="bold magenta")
+    table.add_column("Bucket start", style="cyan", no_wrap=True)
+    table.add_column("Total", justify="right", style="green", no_wrap=True)
+    for t in types:
+        table.add_column(t, justify="right", no_wrap=True)
+    table.add_column("", no_wrap=True)
+
+    for b in timeline['buckets']:
+        bar = "█" * max(1, round(b['total'] * width / top_count))
+        is_peak = peak is not None and b['start'] == peak['start']
+        table.add_row(
+            b['start'], str(b['total']),
+            *[str(b['by_type'].get(t, "")) for t in types],
+            f"[red]{bar}[/red] peak" if is_peak else bar,
+        )
+    console.print(table)
+    if peak:
+        console.print(f"[bold]Peak:[/bold] {peak['count']} incidents in the bucket starting "
+                      f"{peak['start']} ({peak['per_minute']:g}/min)")
+    if timeline['untimed_incidents']:
+        console.print(f"[dim]{timeline['untimed_incidents']} incident(s) without a parseable timestamp[/dim]")
+
+
+@app.command()
+def query(
+    db: str = typer.Option(..., "--db", help="SQLite incident database (written by monitor --sink sqlite:PATH)"),
+    types: Optional[List[str]] = typer.Option(None, "--type", "-t", help="Filter by incident type (repeatable)"),
+    severities: Optional[List[str]] = typer.Option(None, "--severity", "-s", help="Filter by severity (repeatable)"),
+    rules: Optional[List[str]] = typer.Option(None, "--rule", "-r", help="Filter by rule id (repeatable)"),
+    comms: Optional[List[str]] = typer.Option(None, "--comm", help="Filter by process name (repeatable)"),
+    pids: Optional[List[int]] = typer.Option(None, "--pid", help="Filter by PID (repeatable)"),
+    sources: Optional[List[str]] = typer.Option(None, "--source", help="Filter by monitored log file (repeatable)"),
+    since: Optional[str] = typer.Option(None, "--since", help="Start time: 30m, 2h, 03:00, 2025-12-24 03:00, epoch"),
+    until: Optional[str] = typer.Option(None, "--until", help="End time (exclusive), same formats as --since"),
+    group_by: Optional[str] = typer.Option(None, "--group-by", "-g", help="Count by: type, severity, rule, comm, pid, source, hour, day"),
+    limit: int = typer.Option(100, "--limit", "-n", help="Max rows/groups to return"),
+    json_out: bool = typer.Option(False, "--json", help="Output JSON instead of a table"),
+):
+    """
+    Query the incident database instead of rescanning logs.
+
+    Example:
+        detecttool query --db /var/lib/detecttool/incidents.db --type OOM --since 24h
+        detecttool query --db incidents.db --group-by hour --since 7d
+    """
+    import sqlite3
+    from . import store
+    from .units import parse_time
+
+    if not Path(db).exists():
+        console.print(f"[bold red]Error:[/bold red] Database not found: {db}", style="red")
+        raise typer.Exit(1)
+    try:
+        t_since = parse_time(since) if since else None
+        t_until = parse_time(until) if until else None
+        filters = {
+            "type": types or [],
+            "severity": severities or [],
+            "rule_id": rules or [],
+            "comm": comms or [],
+            "pid": pids or [],
+            "source": [os.path.abspath(x) for x in sources or []],
+        }
+        conn = store.connect(db, readonly=True)
+        try:
+            if group_by:
+                groups = store.group_counts(conn, group_by, filters=filters, since=t_since, until=t_until, limit=limit)
+            else:
+                rows = store.query(conn, filters=filters, since=t_since, until=t_until, limit=limit)
+        finally:
+            conn.close()
+    except ValueError as e:
+        console.print(f"[bold red]Error:[/bold red] {e}", style="red")
+        raise typer.Exit(1)
+    except (sqlite3.Error, OSError) as e:
+        # 不是 SQLite 文件、没有 incidents 表、没有读权限等
+        console.print(f"[bold red]Error:[/bold red] Cannot read database {db}: {e}", style="red")
+        raise typer.Exit(1)
+
+    from datetime import datetime
+
+    def _fmt_ts(ts: Optional[float]) -> str:
+        return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts is not None else "-"
+
+    if group_by:
+        if json_out:
+            print(json.dumps([{"group": g, "count": n} for g, n in groups], ensure_ascii=False, indent=2), flush=True)
+            raise typer.Exit(0)
+        from rich.table import Table
+
+        table = Table(title=f"Incidents by {group_by}", show_header=True, header_style="bold magenta")
+        table.add_column(group_by.capitalize(), style="cyan")
+        table.add_column("Count", justify="right", style="green")
+        for g, n in groups:
+            table.add_row("-" if g is None else str(g), str(n))
+        console.print(table)
+        return
+
+    if json_out:
+        print(json.dumps(rows, ensure_ascii=False, indent=2), flush=True)
+        raise typer.Exit(0)
+    from rich.table import Table
+
+    table = Table(title=f"Incidents ({len(rows)})")
+    table.add_column("Time")
+    table.add_column("Type")
+    table.add_column("Severity")
+    table.add_column("Rule")
+    table.add_column("Comm")
+    table.add_column("PID", justify="right")
+    table.add_column("Message", overflow="fold")
+    for r in rows:
+        table.add_row(
+            _fmt_ts(r["ts"]), r["type"], r["severity"], r["rule_id"],
+            r["comm"] or "", "" if r["pid"] is None else str(r["pid"]), r["message"],
+        )
+    console.print(table)
+
+
+@app.command("index")
+def index_cmd(
+    file: str = typer.Option(..., "--file", "-f", help="Log file to index"),
+    stride: int = typer.Option(1024, "--stride", help="Record offset/line/time every N lines"),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Index path (default: FILE.dtidx, or the cache dir if that is not writable)"),
+    line: Optional[int] = typer.Option(None, "--line", "-l", help="Print this line (and --around lines) using the index"),
+    around: int = typer.Option(0, "--around", "-C", help="Lines of context around --line"),
+    json_out: bool = typer.Option(False, "--json", help="Output JSON"),
+):
+    """
+    Build or refresh the sparse line/offset/time index of a large log.
+
+    The index lets later runs start in the middle of the file (time
+    ranges, tails, random line access) instead of reading from byte 0.
+    It is used only while the file's inode, size and mtime match; a grown
+    file is indexed from where the old index stopped.
+
+    Example:
+        detecttool index -f /var/log/kern.log
+        detecttool index -f /var/log/kern.log --line 1200000 -C 3
+    """
+    from datetime import datetime
+    from .index import build_index, load_index, read_lines, save_index
+
+    paths = [Path(output)] if output else None
+    try:
+        idx = load_index(file, paths=paths)
+        mode = "up to date"
+        where = idx.path if idx is not None else None
+        if idx is None or idx.stride != stride:
+            previous = idx or load_index(file, paths=paths, stale=True)
+            idx, extended = build_index(file, stride=stride, previous=previous)
+            mode = "extended" if extended else "built"
+            where = save_index(idx, file, Path(output) if output else None)
+            if where is None:
+                raise PermissionError(f"Cannot write index for {file} (sidecar and cache dir not writable)")
+        shown = read_lines(file, idx, line - around, 2 * around + 1) if line is not None else []
+    except (OSError, ValueError) as e:
+        # index 不读配置：参数错误（--stride 等）也只是普通的 Error
+        console.print(f"[bold red]Error:[/bold red] {e}", style="red")
+        raise typer.Exit(1)
+
+    first, last = idx.time_range()
+    fmt = lambda ts: datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts is not None else None
+    info = {
+        "file": file,
+        "index": str(where) if where else None,
+        "mode": mode,
+        "lines": idx.lines,
+        "bytes": idx.end_offset,
+        "stride": idx.stride,
+        "entries": len(idx),
+        "first_time": fmt(first),
+        "last_time": fmt(last),
+    }
+    if json_out:
+        if line is not None:
+            info["lines_shown"] = [{"line_no": n, "text": t} for n, t in shown]
+        print(json.dumps(info, ensure_ascii=False, indent=2), flush=True)
+        raise typer.Exit(0)
+
+    console.print(f"[bold]Index[/bold] {file}: {mode} ({where})")
+    console.print(f"  {idx.lines:,} lines, {idx.end_offset:,} bytes, {len(idx):,} entries (every {idx.stride} lines)")
+    if first is not None:
+        console.print(f"  time range: {info['first_time']} .. {info['last_time']}")
+    for n, text in shown:
+        marker = ">" if n == line else " "
+        print(f"{marker}{n:>10}: {text}")
+
+
 # -------------------------
 # Daemon / Service Management
 # -------------------------
@@ -347,12 +1330,13 @@ After=syslog.target network.target
 [Service]
 Type=simple
 Environment=PYTHONUNBUFFERED=1
-ExecStart={detecttool_path} monitor -f {log_file} -c {config_path} --json
+ExecStart={detecttool_path} monitor -f {log_file} -c {config_path} --json --quiet --sink "file:{output_dir}/incidents.log?{rotation}" --control /run/{service_name}/control.sock
+ExecReload=/bin/kill -HUP $MAINPID
+RuntimeDirectory={service_name}
 Restart=on-failure
 RestartSec=5
 User=root
 
-StandardOutput=append:{output_dir}/incidents.log
 StandardError=append:{output_dir}/error.log
 
 [Install]
@@ -360,8 +1344,23 @@ WantedBy=multi-user.target
 """
 
 
+def _rotation_query(max_bytes: str, max_age: Optional[str], backups: int, compress: bool) -> str:
+    """Options of the service's incidents.log file sink (validated here, not at service start)."""
+    from .units import parse_duration, parse_size
+
+    parse_size(max_bytes)
+    opts = [f"max_bytes={max_bytes}"]
+    if max_age:
+        parse_duration(max_age)
+        opts.append(f"max_age={max_age}")
+    opts += [f"backups={backups}", f"compress={int(compress)}", "summary=1"]
+    return "&".join(opts)
+
+
 def _find_detecttool_path() -> str:
     """Find the detecttool executable path."""
+    import shutil
+
     # Try to find in PATH
     which_result = shutil.which("detecttool")
     if which_result:
@@ -381,8 +1380,10 @@ def _get_absolute_config_path(config: str) -> str:
     return str(Path.cwd() / config_path)
 
 
-def _run_systemctl(args: List[str], check: bool = True) -> subprocess.CompletedProcess:
+def _run_systemctl(args: List[str], check: bool = True) -> "subprocess.CompletedProcess":
     """Run systemctl command."""
+    import subprocess
+
     cmd = ["systemctl"] + args
     try:
         return subprocess.run(cmd, capture_output=True, text=True, check=check)
@@ -413,6 +1414,26 @@ def install_service(
         "--name",
         help="Service name"
     ),
+    max_bytes: str = typer.Option(
+        "50M",
+        "--max-bytes",
+        help="Rotate incidents.log at this size (e.g. 50M, 0 = never)"
+    ),
+    max_age: Optional[str] = typer.Option(
+        None,
+        "--max-age",
+        help="Also rotate incidents.log after this long (e.g. 1d)"
+    ),
+    backups: int = typer.Option(
+        10,
+        "--backups",
+        help="Rotated incidents.log segments to keep"
+    ),
+    compress: bool = typer.Option(
+        True,
+        "--compress/--no-compress",
+        help="gzip rotated incidents.log segments"
+    ),
 ):
     """
     Install systemd service for daemon mode.
@@ -429,6 +1450,12 @@ def install_service(
         console.print("Please run with: [bold]sudo detecttool install-service ...[/bold]")
         raise typer.Exit(1)
 
+    try:
+        rotation = _rotation_query(max_bytes, max_age, backups, compress)
+    except ValueError as e:
+        console.print(f"[bold red]Configuration Error:[/bold red] {e}", style="red")
+        raise typer.Exit(1)
+
     # Check if log file exists
     if not Path(log_file).exists():
         console.print(f"[bold yellow]Warning:[/bold yellow] Log file '{log_file}' does not exist.")
@@ -458,6 +1485,8 @@ def install_service(
         log_file=log_file,
         config_path=config_path,
         output_dir=output_dir,
+        service_name=service_name,
+        rotation=rotation,
     )
 
     # Write service file
@@ -485,6 +1514,7 @@ def install_service(
     console.print(f"  Start:         [cyan]sudo systemctl start {service_name}[/cyan]")
     console.print(f"  Stop:          [cyan]sudo systemctl stop {service_name}[/cyan]")
     console.print(f"  Restart:       [cyan]sudo systemctl restart {service_name}[/cyan]")
+    console.print(f"  Reload rules:  [cyan]sudo systemctl reload {service_name}[/cyan]")
     console.print(f"  Status:        [cyan]sudo systemctl status {service_name}[/cyan]")
     console.print(f"  Enable boot:   [cyan]sudo systemctl enable {service_name}[/cyan]")
     console.print(f"  Disable boot:  [cyan]sudo systemctl disable {service_name}[/cyan]")
@@ -551,6 +1581,8 @@ def uninstall_service(
     if remove_logs:
         log_dir = Path("/var/log/detecttool")
         if log_dir.exists():
+            import shutil
+
             shutil.rmtree(log_dir)
             console.print(f"[green]Removed[/green] log directory: {log_dir}")
 
@@ -564,69 +1596,164 @@ def service_status(
         "--name",
         help="Service name to check"
     ),
+    control: Optional[str] = typer.Option(
+        None,
+        "--socket",
+        help="Daemon control socket (default: /run/<name>/control.sock)"
+    ),
+    json_out: bool = typer.Option(False, "--json", help="Print the daemon's live status as JSON"),
+    incidents_path: str = typer.Option(
+        "/var/log/detecttool/incidents.log",
+        "--incidents-log",
+        help="Incidents log written by the service (its .summary.json sidecar is read)"
+    ),
 ):
     """
     Show daemon service status.
 
+    Live counters come from the running daemon's control socket (see
+    monitor --control) and totals over all incidents.log segments from
+    the log's summary sidecar, so nothing is re-read from incidents.log.
+
     Example:
         detecttool service-status
     """
+    from .control import default_socket_path, query
+    from .sinks.file import load_summary, summary_totals
+
+    control = control or default_socket_path(service_name)
+    try:
+        live = query(control)
+    except OSError:
+        live = None
+    summary = load_summary(incidents_path)
+    totals = summary_totals(summary) if summary is not None else None
+
+    if json_out:
+        # 出错也输出 JSON，脚本只需解析 stdout 并看退出码
+        out = dict(live) if live is not None else {"ok": False, "error": f"control socket not reachable: {control}"}
+        if totals is not None:
+            out["incidents_log"] = {"path": incidents_path, **totals}
+        print(json.dumps(out, ensure_ascii=False, indent=2), flush=True)
+        raise typer.Exit(1 if live is None and totals is None else 0)
+
     service_file = Path(f"/etc/systemd/system/{service_name}.service")
 
-    if not service_file.exists():
+    if not service_file.exists() and live is None:
         console.print(f"[bold yellow]Service not installed[/bold yellow]")
         console.print(f"Service file not found: {service_file}")
         console.print(f"\nTo install: [cyan]sudo detecttool install-service -f /var/log/kern.log[/cyan]")
         raise typer.Exit(0)
 
-    # Get service status
-    result = _run_systemctl(["is-active", service_name], check=False)
-    is_active = result.stdout.strip() == "active"
-
-    result = _run_systemctl(["is-enabled", service_name], check=False)
-    is_enabled = result.stdout.strip() == "enabled"
-
-    # Display status
     console.print(f"\n[bold]Service:[/bold] {service_name}")
-
-    if is_active:
-        console.print(f"[bold]Status:[/bold]  [bold green]running[/bold green]")
-    else:
-        console.print(f"[bold]Status:[/bold]  [bold red]stopped[/bold red]")
-
-    if is_enabled:
-        console.print(f"[bold]Boot:[/bold]    [green]enabled[/green]")
+    if service_file.exists():
+        # Get service status
+        result = _run_systemctl(["is-active", service_name], check=False)
+        is_active = result.stdout.strip() == "active"
+
+        result = _run_systemctl(["is-enabled", service_name], check=False)
+        is_enabled = result.stdout.strip() == "enabled"
+
+        if is_active:
+            console.print(f"[bold]Status:[/bold]  [bold green]running[/bold green]")
+        else:
+            console.print(f"[bold]Status:[/bold]  [bold red]stopped[/bold red]")
+
+        if is_enabled:
+            console.print(f"[bold]Boot:[/bold]    [green]enabled[/green]")
+        else:
+            console.print(f"[bold]Boot:[/bold]    [yellow]disabled[/yellow]")
+
+    if live is not None:
+        _print_live_status(live)
     else:
-        console.print(f"[bold]Boot:[/bold]    [yellow]disabled[/yellow]")
+        console.print(f"\n[dim]Control socket not reachable ({control}): no live counters. "
+                      f"Reinstall the service to enable it.[/dim]")
 
-    # Show log file stats if available
-    incidents_log = Path("/var/log/detecttool/incidents.log")
+    # Show log file size and the segment summary if available
+    incidents_log = Path(incidents_path)
     if incidents_log.exists():
-        stat = incidents_log.stat()
-        size_kb = stat.st_size / 1024
+        size_kb = incidents_log.stat().st_size / 1024
         console.print(f"\n[bold]Incidents Log:[/bold] {incidents_log}")
         console.print(f"  Size: {size_kb:.1f} KB")
+        if totals is not None:
+            _print_log_summary(totals)
 
-        # Count incidents (lines in JSON log)
-        try:
-            with open(incidents_log, "r") as f:
-                line_count = sum(1 for _ in f)
-            console.print(f"  Incidents: {line_count}")
-        except Exception:
-            pass
+    if not service_file.exists():
+        return
 
     # Show detailed status from systemctl
     console.print(f"\n[dim]─── systemctl status {service_name} ───[/dim]")
-    result = subprocess.run(
-        ["systemctl", "status", service_name, "--no-pager", "-l"],
-        capture_output=True,
-        text=True,
-    )
+    result = _run_systemctl(["status", service_name, "--no-pager", "-l"], check=False)
     # Print status output (trim to reasonable length)
     lines = result.stdout.split("\n")[:15]
     for line in lines:
         console.print(f"[dim]{line}[/dim]")
 
 
+def _print_live_status(live: Dict[str, Any]) -> None:
+    """Human-readable view of a control socket status reply."""
+    if not live.get("ok"):
+        console.print(f"\n[bold red]Daemon status error:[/bold red] {live.get('error')}")
+        return
+    incidents = live["incidents"]
+    source = live.get("source") or {}
+    pipe = live.get("pipeline") or {}
+    console.print(f"\n[bold]Daemon:[/bold]  pid {live['pid']}, up {_format_uptime(live['uptime_seconds'])}")
+    if source:
+        size = source.get("size")
+        lag = f", {size - source['offset']:,} bytes behind" if size is not None and size > source.get("offset", 0) else ""
+        console.print(f"  Source:    {source.get('path')} (line {source.get('line_no', 0):,}, "
+                      f"offset {source.get('offset', 0):,}{lag}, reopened {source.get('reopens', 0)}x)")
+    if pipe:
+        console.print(f"  Lines:     {pipe.get('lines_processed', 0):,} processed, "
+                      f"queue {pipe['queues']['lines']['depth']}/{pipe['queues']['lines']['capacity']}")
+    console.print(f"  Rules:     {live.get('rules')} from {live.get('config')}")
+    console.print(f"  Incidents: {incidents['total']:,}")
+    if incidents["by_type"]:
+        by_type = ", ".join(f"{k}={v}" for k, v in sorted(incidents["by_type"].items(), key=lambda x: -x[1]))
+        by_sev = ", ".join(f"{k}={v}" for k, v in incidents["by_severity"].items())
+        console.print(f"    by type:     {by_type}")
+        console.print(f"    by severity: {by_sev}")
+    for block in live.get("blocks") or []:
+        console.print(f"  Open block: {block['type']} ({block['rule_id']}) from line {block['start_line_no']}, "
+                      f"{block['context_lines']} context lines")
+    if "rate_limit" in live:
+        console.print(f"  Rate limit: {live['rate_limit']['suppressed']} suppressed")
+    if "bursts" in live:
+        console.print(f"  Bursts:    {live['bursts']['bursts']} reported over {live['bursts']['keys']} key(s)")
+    recent = incidents.get("recent") or []
+    if recent:
+        console.print("\n[bold]Last incidents:[/bold]")
+        for inc in recent[-5:]:
+            console.print(f"  [{inc['severity']}] {inc['type']} line {inc['line_no']}: {inc['message']}", markup=False)
+
+
+def _print_log_summary(totals: Dict[str, Any]) -> None:
+    """Totals from an incidents log summary sidecar (all segments, incl. deleted ones)."""
+    from datetime import datetime
+
+    console.print(f"  Segments: {totals['segments']} on disk, {totals['count']:,} incidents in total")
+    if totals["by_type"]:
+        by_type = ", ".join(f"{k}={v}" for k, v in sorted(totals["by_type"].items(), key=lambda x: -x[1]))
+        console.print(f"    by type: {by_type}")
+    if totals["first_log_ts"] is not None:
+        first = datetime.fromtimestamp(totals["first_log_ts"]).strftime("%Y-%m-%d %H:%M:%S")
+        last = datetime.fromtimestamp(totals["last_log_ts"]).strftime("%Y-%m-%d %H:%M:%S")
+        console.print(f"    log time: {first} .. {last}")
+
+
+def _format_uptime(seconds: float) -> str:
+    seconds = int(seconds)
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    if days:
+        return f"{days}d {hours}h {minutes}m"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {secs}s"
+
+
 if __name__ == "__main__":
     app()
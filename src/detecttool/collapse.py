@@ -0,0 +1,168 @@
+from __future__ import annotations
+from dataclasses import replace
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import re
+import time
+
+from .engine import Incident, _SYSLOG_TS, _parse_syslog_ts
+
+# 数字/十六进制（pid、内存大小、printk 时间戳、地址）都归一成 #
+_VOLATILE = re.compile(r"0x[0-9a-fA-F]+|\d+")
+
+
+def fingerprint(inc: Incident) -> str:
+    """
+    Normalized identity of an incident: same rule, same message once the
+    syslog timestamp, process name and all numbers are masked. OOM kills of
+    different processes therefore share one fingerprint.
+    """
+    text = _SYSLOG_TS.sub("", inc.message, count=1)
+    comm = inc.extracted.get("comm")
+    if comm:
+        text = re.sub(rf"(?<![\w-]){re.escape(comm)}(?![\w-])", "<comm>", text)
+    return f"{inc.rule_id}|{_VOLATILE.sub('#', text)}"
+
+
+def _fmt_ts(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts is not None else None
+
+
+class _Group:
+    __slots__ = ("first", "first_ts", "opened", "last_line", "last_ts", "count", "comms", "pids")
+
+    def __init__(self, inc: Incident, ts: Optional[float]) -> None:
+        self.first = inc
+        self.first_ts = ts
+        self.opened = time.monotonic()
+        self.last_line = inc.line_no
+        self.last_ts = ts
+        self.count = 0
+        self.comms: Dict[str, None] = {}  # dict 保持首次出现顺序
+        self.pids: Dict[str, None] = {}
+
+
+class StormCollapser:
+    """
+    Collapses repeated incidents into one counted summary per window.
+
+    Incidents sharing a fingerprint (see fingerprint()) whose log
+    timestamps fall within `window_seconds` of the first one are held back
+    and emitted once when the window closes: a single occurrence comes out
+    unchanged, several come out as the first incident with a `storm`
+    summary (count, first/last line and time, comm/pid samples).
+
+    Windows close when a later log timestamp passes them, on expire()
+    (monitor heartbeat), when more than `max_groups` are open (oldest
+    first) and on flush(). Untimed lines use the latest log time seen.
+    All windows run on the log clock, never on the wall clock: logs from a
+    host with a skewed clock, or replayed ones, collapse the same way.
+    """
+    def __init__(self, window_seconds: float = 60.0, *, max_samples: int = 5, max_groups: int = 10000) -> None:
+        if window_seconds <= 0:
+            raise ValueError("collapse window must be positive")
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self.max_groups = max_groups
+        self._groups: Dict[str, _Group] = {}
+        self._clock: Optional[float] = None
+        self._clock_at = 0.0  # _clock 更新时的 monotonic 时间，空闲时按它推算日志时钟
+        self._oldest: Optional[float] = None  # 打开的组里最早的 first_ts，没有到期的组时免扫描
+        self.incidents_in = 0
+        self.incidents_out = 0
+
+    def _close(self, key: str) -> Incident:
+        g = self._groups.pop(key)
+        self.incidents_out += 1
+        if g.count == 1:
+            return g.first
+        return replace(g.first, storm={
+            "count": g.count,
+            "first_line": g.first.line_no,
+            "last_line": g.last_line,
+            "first_time": _fmt_ts(g.first_ts),
+            "last_time": _fmt_ts(g.last_ts),
+            "comms": list(g.comms),
+            "pids": list(g.pids),
+            "fingerprint": key,
+        })
+
+    def _expire_before(self, ts: float) -> List[Incident]:
+        cutoff = ts - self.window_seconds
+        if self._oldest is None or self._oldest >= cutoff:
+            return []
+        # 组按打开顺序存放，但乱序时间戳下 first_ts 不一定单调，整体扫一遍；
+        # 每次扫描至少关闭一个组，所以总代价与组数成正比
+        expired = [k for k, g in self._groups.items() if g.first_ts is not None and g.first_ts < cutoff]
+        out = [self._close(k) for k in expired]
+        self._oldest = min((g.first_ts for g in self._groups.values() if g.first_ts is not None), default=None)
+        return out
+
+    def add(self, inc: Incident) -> List[Incident]:
+        """Feed one incident; returns the summaries whose window closed."""
+        self.incidents_in += 1
+        out: List[Incident] = []
+        ts = _parse_syslog_ts(inc.message)
+        if ts is not None:
+            if self._clock is None or ts > self._clock:
+                self._clock = ts
+                self._clock_at = time.monotonic()
+                out.extend(self._expire_before(ts))
+        else:
+            ts = self._clock
+
+        key = fingerprint(inc)
+        g = self._groups.get(key)
+        if g is None:
+            if len(self._groups) >= self.max_groups:
+                out.append(self._close(next(iter(self._groups))))
+            g = self._groups[key] = _Group(inc, ts)
+            if ts is not None and (self._oldest is None or ts < self._oldest):
+                self._oldest = ts
+        g.count += 1
+        g.last_line = inc.line_no
+        if ts is not None:
+            g.last_ts = ts
+        comm = inc.extracted.get("comm")
+        if comm and len(g.comms) < self.max_samples:
+            g.comms[comm] = None
+        pid = inc.extracted.get("pid")
+        if pid and len(g.pids) < self.max_samples:
+            g.pids[pid] = None
+        return out
+
+    def add_all(self, incidents: Iterable[Incident]) -> List[Incident]:
+        out: List[Incident] = []
+        for inc in incidents:
+            out.extend(self.add(inc))
+        return out
+
+    def expire(self, now: Optional[float] = None) -> List[Incident]:
+        """
+        Close windows older than `now`, a log time; for idle periods in
+        monitor. By default `now` is the latest log time seen plus the time
+        elapsed since it was seen. Groups without any log time expire by how
+        long they have been open.
+        """
+        if now is None and self._clock is not None:
+            now = self._clock + (time.monotonic() - self._clock_at)
+        out = self._expire_before(now) if now is not None else []
+        cutoff = time.monotonic() - self.window_seconds
+        untimed = [k for k, g in self._groups.items() if g.first_ts is None and g.opened < cutoff]
+        out.extend(self._close(k) for k in untimed)
+        return out
+
+    def flush(self) -> List[Incident]:
+        """Close every open window (end of input), in first-line order."""
+        keys = sorted(self._groups, key=lambda k: self._groups[k].first.line_no)
+        self._oldest = None
+        return [self._close(k) for k in keys]
+
+
+def collapse_incidents(incidents: Iterable[Incident], window_seconds: float, **kwargs) -> List[Incident]:
+    """Batch helper: collapse a complete incident list, ordered by first line."""
+    c = StormCollapser(window_seconds, **kwargs)
+    out = c.add_all(incidents)
+    out.extend(c.flush())
+    out.sort(key=lambda inc: inc.line_no)
+    return out
@@ -1,8 +1,80 @@
 from __future__ import annotations
-from dataclasses import dataclass, field
-from typing import List, Pattern
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+import hashlib
+import json
+import os
 import re
-import yaml
+import sys
+
+from . import __version__
+
+# 缓存内容的格式变化时加一，让旧缓存失效
+_CACHE_FORMAT = 5
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Token bucket: `rate` incidents per second on average, bursts up to `burst`."""
+    rate: float
+    burst: int
+    # 超限后是否继续按比例抽样放行（否则全部计入 suppressed）
+    sample: bool = True
+
+
+BURST_DIMENSIONS: Tuple[str, ...] = ("type", "rule", "comm")
+
+
+@dataclass(frozen=True)
+class BurstSpec:
+    """
+    Burst detection: a synthetic BURST incident when the incidents of one
+    key (by type / rule / comm) within `window_seconds` reach `min_count`
+    and exceed `factor` x the usual count per window (EWMA over about
+    `baseline_windows` windows).
+    """
+    window_seconds: float = 60.0
+    factor: float = 5.0
+    min_count: int = 10
+    by: Tuple[str, ...] = ("type",)
+    types: Tuple[str, ...] = ()  # 只看这些类型（空 = 全部）
+    baseline_windows: int = 30
+    severity: str = "high"
+    max_keys: int = 10000
+
+
+@dataclass(frozen=True)
+class MultiLine:
+    """
+    Multi-line block declared on a rule: a line matching the start keywords
+    (and the rule) opens a block, following lines become its context until
+    an end marker, a log-time gap > window_seconds, max_lines, a new block
+    or an idle flush. None means the aggregator default.
+    """
+    start_any: Tuple[str, ...] = ()
+    start_all: Tuple[str, ...] = ()
+    end: Tuple[str, ...] = ()
+    window_seconds: Optional[float] = None
+    max_lines: Optional[int] = None
+
+
+# 内核 Oops/panic 的通用结束标记
+DEFAULT_END_MARKERS: Tuple[str, ...] = (
+    "end trace",
+    "End trace",
+    "end Kernel panic",
+    "End Kernel panic",
+    "---[ end",
+)
+
+# 规则文件里完全没写 multiline 时（旧配置），按类型沿用原来内置的多行行为
+LEGACY_MULTILINE: Dict[str, MultiLine] = {
+    "PANIC": MultiLine(start_any=("Kernel panic - not syncing",), end=DEFAULT_END_MARKERS),
+    "OOPS": MultiLine(start_any=("Oops:", "BUG:", "Unable to handle kernel"), end=DEFAULT_END_MARKERS),
+    # 只用真正的“起始行”触发，避免 echo hung_task_timeout_secs 误触发
+    "DEADLOCK": MultiLine(start_all=("blocked for more than", "task"), end=DEFAULT_END_MARKERS),
+}
 
 
 @dataclass
@@ -17,28 +89,217 @@ class Rule:
     regex_all: List[Pattern[str]] = field(default_factory=list)
 
     cooldown_seconds: int = 0
+    rate_limit: Optional[RateLimit] = None
+    multiline: Optional[MultiLine] = None
 
 
 @dataclass
 class Config:
     version: int = 1
     rules: List[Rule] = field(default_factory=list)
+    # 关键字预过滤：一行里不含任何规则关键字时可以整体跳过规则匹配
+    prefilter: Optional[Pattern[str]] = None
+    # 按事件类型的限流（同类型、自身没配 rate_limit 的规则共享一个令牌桶）
+    type_limits: Dict[str, RateLimit] = field(default_factory=dict)
+    rate_limit_summary_seconds: float = 60.0
+    bursts: Optional[BurstSpec] = None
+
+
+SEVERITY_LEVELS: Tuple[str, ...] = ("low", "medium", "high", "critical")
+
+
+@dataclass(frozen=True)
+class RuleFilter:
+    """
+    --types / --min-severity / --rules: which rules get compiled at all.
+    Rules left out never run, contribute no prefilter keywords and no
+    multi-line triggers (see apply_rule_filter).
+    """
+    types: Tuple[str, ...] = ()
+    min_severity: Optional[str] = None
+    rule_ids: Tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        if self.min_severity is not None and self.min_severity not in SEVERITY_LEVELS:
+            raise ValueError(
+                f"Invalid severity {self.min_severity!r} (expected one of {', '.join(SEVERITY_LEVELS)})"
+            )
 
+    @property
+    def active(self) -> bool:
+        return bool(self.types or self.min_severity or self.rule_ids)
 
-def load_config(path: str) -> Config:
+    def allows(self, rule: Rule) -> bool:
+        if self.types and rule.type.upper() not in {t.upper() for t in self.types}:
+            return False
+        if self.rule_ids and rule.id not in self.rule_ids:
+            return False
+        if self.min_severity is not None:
+            level = SEVERITY_LEVELS.index(rule.severity) if rule.severity in SEVERITY_LEVELS else -1
+            if level < SEVERITY_LEVELS.index(self.min_severity):
+                return False
+        return True
+
+    def key(self) -> str:
+        """Stable text form, part of state keys that depend on the rule set."""
+        return (
+            f"types={','.join(sorted(t.upper() for t in self.types))};"
+            f"min_severity={self.min_severity or ''};"
+            f"rules={','.join(sorted(self.rule_ids))}"
+        )
+
+
+def apply_rule_filter(cfg: Config, rule_filter: Optional[RuleFilter]) -> Config:
+    """Config with only the rules the filter allows, prefilter recompiled for them."""
+    if rule_filter is None or not rule_filter.active:
+        return cfg
+    known_types = {r.type.upper() for r in cfg.rules}
+    unknown = [t for t in rule_filter.types if t.upper() not in known_types]
+    if unknown:
+        raise ValueError(f"Unknown incident type(s) in --types: {', '.join(unknown)}")
+    known_ids = {r.id for r in cfg.rules}
+    unknown = [i for i in rule_filter.rule_ids if i not in known_ids]
+    if unknown:
+        raise ValueError(f"Unknown rule id(s) in --rules: {', '.join(unknown)}")
+    rules = [r for r in cfg.rules if rule_filter.allows(r)]
+    if not rules:
+        raise ValueError("No rules left after applying --types/--min-severity/--rules")
+    return replace(cfg, rules=rules, prefilter=build_prefilter(rules))
+
+
+def build_prefilter(rules: List[Rule]) -> Optional[Pattern[str]]:
+    """
+    Build a single alternation regex over every rule keyword.
+
+    A rule can only match a line containing at least one of its keywords, so a
+    line that matches none of them can skip rule evaluation entirely. Returns
+    None when some rule has no keywords (it must then run on every line).
+    """
+    keywords: List[str] = []
+    for rule in rules:
+        kws = rule.keywords_any or rule.keywords_all
+        if not kws:
+            return None
+        keywords.extend(kws)
+    if not keywords:
+        return None
+    # 长的放前面，避免短关键字抢先匹配（对 search 结果无影响，但更直观）
+    uniq = sorted(set(keywords), key=len, reverse=True)
+    return re.compile("|".join(re.escape(k) for k in uniq))
+
+
+_RATE_UNIT = {"s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_rate_limit(spec: Any, where: str) -> RateLimit:
+    """
+    rate_limit: {rate: 10/s | 600/m | 5, burst: 50, sample: true}
+    A bare number is incidents per second; burst defaults to max(1, rate per second).
+    """
+    if not isinstance(spec, dict) or "rate" not in spec:
+        raise ValueError(f"Invalid rate_limit in {where}: expected a mapping with 'rate' (e.g. {{rate: 10/s, burst: 50}})")
+    raw = str(spec["rate"]).strip()
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*(?:/\s*([smh]))?", raw)
+    if not m or float(m.group(1)) <= 0:
+        raise ValueError(f"Invalid rate_limit rate in {where}: {raw!r} (expected e.g. 10/s, 600/m, 100/h)")
+    rate = float(m.group(1)) / _RATE_UNIT[m.group(2) or "s"]
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f) or {}
-    except FileNotFoundError:
-        raise FileNotFoundError(
-            f"Configuration file not found: {path}\n"
-            f"Please ensure the file exists or specify a different config with --config"
+        burst = int(spec.get("burst", max(1, round(rate))))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid rate_limit burst in {where}: {spec.get('burst')!r}")
+    if burst < 1:
+        raise ValueError(f"Invalid rate_limit burst in {where}: must be >= 1")
+    return RateLimit(rate=rate, burst=burst, sample=bool(spec.get("sample", True)))
+
+
+def _parse_bursts(spec: Any) -> Optional[BurstSpec]:
+    """
+    bursts: {window: 60s, factor: 5, min_count: 10, by: [type, comm],
+             types: [OOM], baseline_windows: 30, severity: high, max_keys: 10000}
+    `bursts: true` uses the defaults.
+    """
+    if spec is None or spec is False:
+        return None
+    if spec is True:
+        return BurstSpec()
+    if not isinstance(spec, dict):
+        raise ValueError("Invalid bursts: expected true or a mapping")
+    unknown = set(spec) - {"window", "factor", "min_count", "by", "types", "baseline_windows", "severity", "max_keys"}
+    if unknown:
+        raise ValueError(f"Invalid bursts: unknown option(s) {', '.join(sorted(unknown))}")
+    from .units import parse_duration
+
+    by = _str_tuple(spec.get("by", "type"), "bursts.by")
+    bad = [d for d in by if d not in BURST_DIMENSIONS]
+    if bad or not by:
+        raise ValueError(f"Invalid bursts.by: {', '.join(bad) or '(empty)'} (expected some of: {', '.join(BURST_DIMENSIONS)})")
+    try:
+        out = BurstSpec(
+            window_seconds=parse_duration(str(spec.get("window", "60s"))),
+            factor=float(spec.get("factor", 5.0)),
+            min_count=int(spec.get("min_count", 10)),
+            by=by,
+            types=tuple(sys.intern(t) for t in _str_tuple(spec.get("types"), "bursts.types")),
+            baseline_windows=int(spec.get("baseline_windows", 30)),
+            severity=sys.intern(str(spec.get("severity", "high"))),
+            max_keys=int(spec.get("max_keys", 10000)),
         )
-    except yaml.YAMLError as e:
-        raise ValueError(f"Invalid YAML in configuration file {path}: {e}")
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid bursts: {e}")
+    if out.window_seconds <= 0 or out.factor <= 1 or out.min_count < 1 or out.baseline_windows < 1 or out.max_keys < 1:
+        raise ValueError("Invalid bursts: window must be > 0, factor > 1, min_count/baseline_windows/max_keys >= 1")
+    if out.severity not in SEVERITY_LEVELS:
+        raise ValueError(f"Invalid bursts.severity: {out.severity!r} (expected one of: {', '.join(SEVERITY_LEVELS)})")
+    return out
+
+
+def _str_tuple(value: Any, where: str) -> Tuple[str, ...]:
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    if not isinstance(value, list) or not all(isinstance(v, str) and v for v in value):
+        raise ValueError(f"Invalid {where}: expected a list of non-empty strings")
+    return tuple(value)
+
+
+def _parse_multiline(spec: Any, r: dict) -> Optional[MultiLine]:
+    """
+    multiline: true | {start_any, start_all, end, window_seconds, max_lines}
+    Without start_any/start_all the rule's own keywords start the block;
+    without `end` the default kernel end markers apply.
+    """
+    if spec is None or spec is False:
+        return None
+    where = f"multiline of rule '{r['id']}'"
+    if spec is True:
+        spec = {}
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid {where}: expected true or a mapping")
+    start_any = _str_tuple(spec.get("start_any"), f"{where}.start_any")
+    start_all = _str_tuple(spec.get("start_all"), f"{where}.start_all")
+    if not start_any and not start_all:
+        start_any = tuple(r.get("keywords_any") or ())
+        start_all = tuple(r.get("keywords_all") or ())
+    if not start_any and not start_all:
+        raise ValueError(f"Invalid {where}: needs start_any/start_all or rule keywords to start a block")
+    end = _str_tuple(spec["end"], f"{where}.end") if "end" in spec else DEFAULT_END_MARKERS
+    try:
+        window = float(spec["window_seconds"]) if spec.get("window_seconds") is not None else None
+        max_lines = int(spec["max_lines"]) if spec.get("max_lines") is not None else None
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {where}: window_seconds/max_lines must be numbers")
+    if (window is not None and window <= 0) or (max_lines is not None and max_lines < 1):
+        raise ValueError(f"Invalid {where}: window_seconds and max_lines must be positive")
+    return MultiLine(start_any=start_any, start_all=start_all, end=end,
+                     window_seconds=window, max_lines=max_lines)
+
 
+def _build_config(data: dict) -> Config:
     rules: List[Rule] = []
-    for idx, r in enumerate(data.get("rules", []) or [], start=1):
+    raw_rules = data.get("rules", []) or []
+    legacy_multiline = not any(isinstance(r, dict) and "multiline" in r for r in raw_rules)
+    for idx, r in enumerate(raw_rules, start=1):
         # Validate required fields
         if "id" not in r:
             raise ValueError(f"Rule #{idx} is missing required field 'id'")
@@ -60,16 +321,158 @@ def load_config(path: str) -> Config:
 
         rules.append(
             Rule(
-                id=r["id"],
-                type=r["type"],
-                severity=r.get("severity", "medium"),
+                # intern：每个 Incident 都引用这几个字符串，避免重复对象
+                id=sys.intern(str(r["id"])),
+                type=sys.intern(str(r["type"])),
+                severity=sys.intern(str(r.get("severity", "medium"))),
                 keywords_any=r.get("keywords_any", []) or [],
                 keywords_all=r.get("keywords_all", []) or [],
                 regex_any=regex_any_compiled,
                 regex_all=regex_all_compiled,
                 cooldown_seconds=int(r.get("cooldown_seconds", 0) or 0),
+                rate_limit=_parse_rate_limit(r["rate_limit"], f"rule '{r['id']}'") if r.get("rate_limit") else None,
+                multiline=(
+                    LEGACY_MULTILINE.get(str(r["type"])) if legacy_multiline
+                    else _parse_multiline(r.get("multiline"), r)
+                ),
             )
         )
 
-    return Config(version=int(data.get("version", 1)), rules=rules)
+    type_limits = {
+        sys.intern(str(t)): _parse_rate_limit(spec, f"rate_limits.{t}")
+        for t, spec in (data.get("rate_limits") or {}).items()
+    }
+    return Config(
+        version=int(data.get("version", 1)),
+        rules=rules,
+        prefilter=build_prefilter(rules),
+        type_limits=type_limits,
+        rate_limit_summary_seconds=float(data.get("rate_limit_summary_seconds", 60.0)),
+        bursts=_parse_bursts(data.get("bursts")),
+    )
+
+
+# -------------------------
+# Parsed config cache
+# -------------------------
+def _cache_dir() -> Optional[Path]:
+    """
+    Directory for the config cache (and other caches).
+    DETECTTOOL_CACHE_DIR overrides the location, DETECTTOOL_NO_CACHE=1 disables it.
+    """
+    if os.environ.get("DETECTTOOL_NO_CACHE"):
+        return None
+    env = os.environ.get("DETECTTOOL_CACHE_DIR")
+    if env:
+        return Path(env)
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "detecttool"
+
+
+def _cache_key(raw: bytes) -> str:
+    h = hashlib.sha256()
+    # 工具版本 / Python 版本变化都会让旧缓存失效
+    h.update(f"{__version__}|{_CACHE_FORMAT}|{sys.version_info[0]}.{sys.version_info[1]}|".encode())
+    h.update(raw)
+    return h.hexdigest()[:32]
+
+
+def _cache_path(cache_dir: Path, path: str, key: str) -> Path:
+    src = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    return cache_dir / f"{src}-{key}.json"
+
+
+def _trusted(p: Path) -> bool:
+    """
+    Owned by the current user and not writable by group/others. Whoever can
+    write the cache decides which rules run (the service runs as root), so
+    entries in a directory anyone else can write are neither read nor written.
+    """
+    try:
+        st = os.stat(p)
+    except OSError:
+        return False
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        return False
+    return not st.st_mode & 0o022
+
+
+def _read_cache(entry: Path) -> Optional[Dict[str, Any]]:
+    """The parsed YAML (plain JSON data, never code) of a trusted cache entry."""
+    if not (_trusted(entry.parent) and _trusted(entry)):
+        return None
+    try:
+        with open(entry, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _write_cache(entry: Path, data: Dict[str, Any]) -> None:
+    """Best effort: a read-only home directory must not break detection."""
+    try:
+        text = json.dumps(data, ensure_ascii=False)
+        if json.loads(text) != data:
+            return  # 日期、非字符串键等 JSON 表示不了的 YAML：不缓存
+    except (TypeError, ValueError):
+        return
+    try:
+        entry.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if not _trusted(entry.parent):
+            return
+        tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, entry)
+        # 同一个配置文件只保留最新一份缓存（含旧格式的条目）
+        prefix = entry.name.split("-", 1)[0]
+        for old in entry.parent.glob(f"{prefix}-*"):
+            if old != entry and old.suffix in (".json", ".pickle"):
+                old.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def _parse_yaml(raw: bytes, path: str) -> dict:
+    import yaml  # 只有缓存未命中时才需要 PyYAML
+
+    try:
+        return yaml.safe_load(raw) or {}
+    except yaml.YAMLError as e:
+        raise ValueError(f"Invalid YAML in configuration file {path}: {e}")
+
+
+def load_config(path: str, *, use_cache: bool = True, rule_filter: Optional[RuleFilter] = None) -> Config:
+    """Compiled rules from `path` (cached), pruned by `rule_filter` if given."""
+    return apply_rule_filter(_load_config(path, use_cache=use_cache), rule_filter)
+
+
+def _load_config(path: str, *, use_cache: bool) -> Config:
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Configuration file not found: {path}\n"
+            f"Please ensure the file exists or specify a different config with --config"
+        )
+
+    # 缓存的是解析后的 YAML（JSON），省掉 YAML 解析；正则每次都要编译，pickle 也省不掉
+    cache_dir = _cache_dir() if use_cache else None
+    entry: Optional[Path] = None
+    if cache_dir is not None:
+        entry = _cache_path(cache_dir, path, _cache_key(raw))
+        data = _read_cache(entry)
+        if data is not None:
+            try:
+                return _build_config(data)
+            except ValueError:
+                pass  # 不该发生（写入前校验过）：按未命中处理
 
+    data = _parse_yaml(raw, path)
+    cfg = _build_config(data)
+    if entry is not None:
+        _write_cache(entry, data)
+    return cfg
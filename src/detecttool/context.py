@@ -0,0 +1,137 @@
+from __future__ import annotations
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple, Union
+import os
+import tempfile
+import threading
+
+# 一行上下文的引用：内存里的字符串，或 (偏移, 长度) —— 指向源文件（file-backed）或溢出文件
+Ref = Union[str, Tuple[int, int]]
+Span = Tuple[int, int]
+
+
+def iter_line_spans(f: BinaryIO, *, offset: int = 0, line_no: int = 0) -> Iterator[Tuple[int, str, Span]]:
+    """
+    Yield (line_no, text, (offset, length)) for a binary file. `text` keeps
+    its newline like text-mode iteration ("\\r\\n" becomes "\\n"); the span
+    covers the line without its line ending.
+    """
+    for raw in f:
+        line_no += 1
+        n = len(raw)
+        end = n
+        if raw.endswith(b"\n"):
+            end -= 2 if raw.endswith(b"\r\n") else 1
+        text = raw[:end].decode("utf-8", errors="replace")
+        yield line_no, (text + "\n" if end < n else text), (offset, end)
+        offset += n
+
+
+class ContextStore:
+    """
+    Where multi-line context lives until an incident is rendered.
+
+    For a regular file the context is a list of (offset, length) spans into
+    that file and is only read back when the incident is printed or
+    serialized. For other sources (pipes, stdin) lines are kept as strings
+    until `mem_budget` bytes are held, after that they are appended to an
+    anonymous temp file and referenced by span as well.
+    """
+    def __init__(self, path: Optional[str] = None, *, mem_budget: int = 64 * 1024 * 1024) -> None:
+        self.path = path if path is not None and os.path.isfile(path) else None
+        self.mem_budget = mem_budget
+        self.mem_bytes = 0
+        self.spilled_bytes = 0
+        self._src: Optional[BinaryIO] = None
+        self._spill: Optional[BinaryIO] = None
+        self._lock = threading.Lock()
+
+    @property
+    def file_backed(self) -> bool:
+        return self.path is not None
+
+    def ref(self, text: str, span: Optional[Span] = None) -> Ref:
+        """Reference for one context line (text without newline)."""
+        if self.path is not None and span is not None:
+            return span
+        n = len(text) if text.isascii() else len(text.encode("utf-8"))
+        if self.mem_bytes + n <= self.mem_budget:
+            self.mem_bytes += n
+            return text
+        data = text.encode("utf-8")
+        with self._lock:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(prefix="detecttool-ctx-")
+            self._spill.seek(0, os.SEEK_END)
+            off = self._spill.tell()
+            self._spill.write(data)
+        self.spilled_bytes += len(data)
+        return (off, len(data))
+
+    def read(self, ref: Ref) -> str:
+        if isinstance(ref, str):
+            return ref
+        off, n = ref
+        with self._lock:
+            if self.path is not None:
+                if self._src is None:
+                    self._src = open(self.path, "rb")
+                f = self._src
+            else:
+                f = self._spill
+                f.flush()
+            f.seek(off)
+            data = f.read(n)
+        return data.decode("utf-8", errors="replace")
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._src, self._spill):
+                if f is not None:
+                    f.close()
+            self._src = self._spill = None
+
+    def __enter__(self) -> "ContextStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class LazyContext(Sequence[str]):
+    """
+    Incident context backed by a ContextStore. len() is free; iterating,
+    indexing or comparing reads the lines (nothing is cached, so a
+    rendered incident does not keep its context in memory).
+    """
+    __slots__ = ("_store", "_refs")
+
+    def __init__(self, store: ContextStore, refs: List[Ref]) -> None:
+        self._store = store
+        self._refs = refs
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def __bool__(self) -> bool:
+        return bool(self._refs)
+
+    def __iter__(self) -> Iterator[str]:
+        read = self._store.read
+        for ref in self._refs:
+            yield read(ref)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self._store.read(r) for r in self._refs[index])
+        return self._store.read(self._refs[index])
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (LazyContext, tuple, list)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LazyContext({len(self._refs)} lines)"
+
+    def materialize(self) -> Tuple[str, ...]:
+        return tuple(self)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Optional
+import json
+import os
+import socket
+import threading
+import time
+
+from .engine import Incident
+
+COMMANDS = ("ping", "status")
+_MAX_REQUEST = 4096
+
+
+def default_socket_path(service_name: str = "detecttool") -> str:
+    # systemd 单元里的 RuntimeDirectory= 会创建 /run/<服务名>
+    return f"/run/{service_name}/control.sock"
+
+
+class DaemonStatus:
+    """
+    In-memory counters of a running monitor, updated by the output stage
+    and read by the control socket: incidents by type/severity and the
+    last `recent` incidents.
+    """
+    def __init__(self, *, recent: int = 20) -> None:
+        self.started_at = time.time()
+        self.total = 0
+        self.by_type: Counter = Counter()
+        self.by_severity: Counter = Counter()
+        self.recent: deque = deque(maxlen=recent)
+        self.last_incident_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, inc: Incident) -> None:
+        # 只保存摘要：context 可能是指向文件的 LazyContext，不在这里读
+        brief = {
+            "line_no": inc.line_no,
+            "type": inc.type,
+            "severity": inc.severity,
+            "rule_id": inc.rule_id,
+            "message": inc.message,
+        }
+        if inc.storm:
+            brief["count"] = inc.storm.get("count")
+        with self._lock:
+            self.total += 1
+            self.by_type[inc.type] += 1
+            self.by_severity[inc.severity] += 1
+            self.recent.append(brief)
+            self.last_incident_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "started_at": self.started_at,
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                "incidents": {
+                    "total": self.total,
+                    "by_type": dict(self.by_type),
+                    "by_severity": dict(self.by_severity),
+                    "last_at": self.last_incident_at,
+                    "recent": list(self.recent),
+                },
+            }
+
+
+class ControlServer:
+    """
+    Unix control socket of the monitor daemon. A client sends one command
+    line ("status" or "ping") and gets one JSON line back; `status_fn`
+    builds the status from in-memory state, nothing is read from disk.
+    Connections are served one at a time on a background thread.
+    """
+    def __init__(self, path: str, status_fn: Callable[[], Dict[str, Any]], *, mode: int = 0o660) -> None:
+        self.path = path
+        self.status_fn = status_fn
+        self.mode = mode
+        self.requests = 0
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> "ControlServer":
+        if os.path.exists(self.path):
+            if _alive(self.path):
+                raise ValueError(f"Control socket already in use: {self.path} (another monitor is running)")
+            os.unlink(self.path)  # 上次异常退出留下的
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.bind(self.path)
+        os.chmod(self.path, self.mode)
+        s.listen(8)
+        s.settimeout(0.5)
+        self._sock = s
+        self._thread = threading.Thread(target=self._serve, name="detecttool-control", daemon=True)
+        self._thread.start()
+        return self
+
+    def _serve(self) -> None:
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            with conn:
+                try:
+                    conn.settimeout(2.0)
+                    conn.sendall(self._answer(_recv_line(conn)))
+                except OSError:
+                    pass
+
+    def _answer(self, raw: bytes) -> bytes:
+        cmd = raw.decode("utf-8", errors="replace").strip().lower()
+        self.requests += 1
+        if cmd == "ping":
+            reply: Dict[str, Any] = {"ok": True, "pid": os.getpid()}
+        elif cmd == "status":
+            try:
+                reply = {"ok": True, **self.status_fn()}
+            except Exception as e:  # 状态出错不能拖垮守护进程
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        else:
+            reply = {"ok": False, "error": f"unknown command {cmd!r}, expected one of: {', '.join(COMMANDS)}"}
+        return (json.dumps(reply, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self) -> "ControlServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _recv_line(conn: socket.socket) -> bytes:
+    buf = b""
+    while b"\n" not in buf and len(buf) < _MAX_REQUEST:
+        chunk = conn.recv(1024)
+        if not chunk:
+            break
+        buf += chunk
+    return buf.split(b"\n", 1)[0]
+
+
+def _alive(path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(0.5)
+            s.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+def query(path: str, command: str = "status", *, timeout: float = 2.0) -> Dict[str, Any]:
+    """Send one command to a daemon's control socket. Raises OSError if nobody is listening."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall(command.encode("utf-8") + b"\n")
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    try:
+        return json.loads(buf)
+    except ValueError:
+        raise OSError(f"Invalid reply from control socket {path}")
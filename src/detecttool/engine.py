@@ -1,28 +1,95 @@
 from __future__ import annotations
-from dataclasses import dataclass, asdict, field
-from typing import Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from dataclasses import dataclass
+from json.encoder import encode_basestring as _json_str
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Pattern, Sequence, TextIO, Tuple, Union
+import json
 import re
+import sys
 import time
 from datetime import datetime
 
-from .config import Rule
+from .config import Rule, build_prefilter
+from .context import ContextStore, LazyContext, Span
 
 
 # -------------------------
 # Model
 # -------------------------
-@dataclass
+# rule_id/type/severity 取值很少，缓存它们编码后的 JSON 片段
+_JSON_STR_CACHE: Dict[str, str] = {}
+
+
+def _json_str_cached(s: str) -> str:
+    enc = _JSON_STR_CACHE.get(s)
+    if enc is None:
+        enc = _json_str(s)
+        if len(_JSON_STR_CACHE) < 4096:
+            _JSON_STR_CACHE[s] = enc
+    return enc
+
+
+@dataclass(slots=True)
 class Incident:
-    rule_id: str
+    rule_id: str  # rule_id/type/severity 直接引用 Rule 里 intern 过的字符串
     type: str
     severity: str
     message: str
     line_no: int
     extracted: Dict[str, str]
-    context: List[str] = field(default_factory=list)  # 多行聚合附带的上下文（不含 message 那一行）
+    context: Sequence[str] = ()  # 多行聚合附带的上下文（不含 message 那一行）；file-backed 扫描时是 LazyContext
+    storm: Optional[Dict[str, Any]] = None  # 风暴折叠后的汇总（见 collapse.py），普通事件为 None
+    before: Tuple[str, ...] = ()  # 触发行之前的若干行（环形缓冲，默认关闭）
 
     def to_dict(self) -> Dict:
-        return asdict(self)
+        # 浅拷贝即可：字符串不可变，不需要 asdict 的深拷贝
+        d = {
+            "rule_id": self.rule_id,
+            "type": self.type,
+            "severity": self.severity,
+            "message": self.message,
+            "line_no": self.line_no,
+            "extracted": dict(self.extracted),
+            "context": list(self.context),
+        }
+        if self.before:
+            d["before"] = list(self.before)
+        if self.storm is not None:
+            d["storm"] = dict(self.storm)
+        return d
+
+    def to_json(self) -> str:
+        """
+        Same text as json.dumps(self.to_dict(), ensure_ascii=False), built
+        without the intermediate dict/list copies.
+        """
+        ex = self.extracted
+        extracted = (
+            "{" + ", ".join(f"{_json_str(k)}: {_json_str(v)}" for k, v in ex.items()) + "}"
+            if ex else "{}"
+        )
+        ctx = self.context
+        context = "[" + ", ".join(map(_json_str, ctx)) + "]" if ctx else "[]"
+        # 可选字段只在有值时输出，普通事件的 JSON 保持不变
+        tail = ""
+        if self.before:
+            tail += ', "before": [' + ", ".join(map(_json_str, self.before)) + "]"
+        if self.storm is not None:
+            tail += f', "storm": {json.dumps(self.storm, ensure_ascii=False)}'
+        return (
+            f'{{"rule_id": {_json_str_cached(self.rule_id)}, '
+            f'"type": {_json_str_cached(self.type)}, '
+            f'"severity": {_json_str_cached(self.severity)}, '
+            f'"message": {_json_str(self.message)}, '
+            f'"line_no": {int(self.line_no)}, '
+            f'"extracted": {extracted}, '
+            f'"context": {context}{tail}}}'
+        )
+
+    def write_json(self, fp: TextIO) -> None:
+        """Write one NDJSON line to a (buffered) text stream; the caller decides when to flush."""
+        fp.write(self.to_json())
+        fp.write("\n")
 
 
 # -------------------------
@@ -77,20 +144,63 @@ class Cooldown:
         self._last[fingerprint] = now
         return True
 
+    def snapshot(self) -> Dict[str, float]:
+        """Cooldown state as {fingerprint: seconds since last allowed}, for persisting."""
+        now = time.time()
+        return {fp: round(now - ts, 3) for fp, ts in self._last.items()}
+
+    def restore(self, ages: Dict[str, float]) -> None:
+        """Inverse of snapshot(): ages are relative to now, so a resumed scan
+        behaves as if it had never stopped."""
+        now = time.time()
+        self._last = {fp: now - float(age) for fp, age in ages.items()}
+
+    def forget_rules(self, rule_ids) -> None:
+        """Drop cooldown state of the given rules (fingerprints start with 'rule_id|')."""
+        ids = set(rule_ids)
+        if not ids:
+            return
+        self._last = {fp: ts for fp, ts in self._last.items() if fp.split("|", 1)[0] not in ids}
+
 
 class Detector:
     """
     Stateful detector for streaming logs.
     Keeps cooldown state across lines.
     """
-    def __init__(self, rules: List[Rule]) -> None:
+    def __init__(self, rules: List[Rule], *, prefilter: Optional[Pattern[str]] = None) -> None:
         self.rules = rules
+        self.prefilter = prefilter if prefilter is not None else build_prefilter(rules)
         self.cooldown = Cooldown()
 
+    def swap_rules(self, rules: List[Rule], *, prefilter: Optional[Pattern[str]] = None) -> Dict[str, List[str]]:
+        """
+        Replace the rule set in place (hot reload).
+        Cooldown state survives for rules whose definition did not change;
+        added/changed/removed rules start fresh. Returns the diff by rule id.
+        """
+        old = {r.id: r for r in self.rules}
+        new = {r.id: r for r in rules}
+        diff = {
+            "added": [rid for rid in new if rid not in old],
+            "removed": [rid for rid in old if rid not in new],
+            "changed": [rid for rid in new if rid in old and new[rid] != old[rid]],
+        }
+        diff["unchanged"] = [rid for rid in new if rid in old and rid not in diff["changed"]]
+
+        self.cooldown.forget_rules(diff["removed"] + diff["changed"])
+        self.rules = rules
+        self.prefilter = prefilter if prefilter is not None else build_prefilter(rules)
+        return diff
+
     def process_line(self, line_no: int, line: str) -> List[Incident]:
         text = line.rstrip("\n")
         hits: List[Incident] = []
 
+        # 绝大多数日志行不含任何关键字，一次 search 即可跳过全部规则
+        if self.prefilter is not None and not self.prefilter.search(text):
+            return hits
+
         for rule in self.rules:
             if not _keywords_match(rule, text):
                 continue
@@ -122,14 +232,6 @@ _SYSLOG_TS = re.compile(r"^(?P<mon>[A-Z][a-z]{2})\s+(?P<day>\d{1,2})\s+(?P<h>\d{
 _MONTH = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
           "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
 
-_END_MARKERS = (
-    "end trace",
-    "End trace",
-    "end Kernel panic",
-    "End Kernel panic",
-    "---[ end",
-)
-
 def _parse_syslog_ts(line: str) -> Optional[float]:
     """
     Parse syslog timestamp like: 'Dec 24 17:40:11 ...'
@@ -153,30 +255,123 @@ def _parse_syslog_ts(line: str) -> Optional[float]:
         return None
 
 
-def _trigger_type(text: str) -> Optional[str]:
-    if "Kernel panic - not syncing" in text:
-        return "PANIC"
-    if ("Oops:" in text) or ("BUG:" in text) or ("Unable to handle kernel" in text):
-        return "OOPS"
-    # ✅ DEADLOCK 只用真正的“起始行”触发，避免 echo hung_task_timeout_secs 误触发
-    if ("blocked for more than" in text) and ("task" in text):
-        return "DEADLOCK"
-    return None
+# -------------------------
+# Block table (multi-line rules compiled)
+# -------------------------
+class BlockSpec:
+    """Compiled MultiLine of one rule."""
+    __slots__ = ("rule_id", "type", "severity", "start_all", "end_re", "window_seconds", "max_lines")
+
+    def __init__(self, rule: Rule, window_seconds: float, max_lines: int) -> None:
+        ml = rule.multiline
+        self.rule_id = rule.id
+        self.type = rule.type
+        self.severity = rule.severity
+        self.start_all = ml.start_all
+        self.end_re = re.compile("|".join(re.escape(m) for m in ml.end)) if ml.end else None
+        self.window_seconds = ml.window_seconds if ml.window_seconds is not None else window_seconds
+        self.max_lines = ml.max_lines if ml.max_lines is not None else max_lines
+
+
+class BlockTable:
+    """
+    Start/end matching for every multi-line rule, compiled once per rule set.
 
+    All start keywords form one alternation regex, so deciding whether a
+    line opens a block is a single search whatever the number of rules;
+    each block has one end-marker regex. Which block a keyword opens is a
+    dict lookup; when several match, the earlier rule wins.
+    """
+    def __init__(self, rules: List[Rule], *, window_seconds: float, max_lines: int) -> None:
+        self.specs: List[BlockSpec] = []
+        self._by_keyword: Dict[str, List[int]] = {}
+        for rule in rules:
+            if rule.multiline is None:
+                continue
+            idx = len(self.specs)
+            self.specs.append(BlockSpec(rule, window_seconds, max_lines))
+            for kw in rule.multiline.start_any or rule.multiline.start_all[:1]:
+                self._by_keyword.setdefault(kw, []).append(idx)
+        kws = sorted(self._by_keyword, key=len, reverse=True)
+        self._start_re = re.compile("|".join(re.escape(k) for k in kws)) if kws else None
+
+    def match_start(self, text: str) -> Optional[BlockSpec]:
+        if self._start_re is None:
+            return None
+        best: Optional[int] = None
+        for m in self._start_re.finditer(text):
+            for idx in self._by_keyword[m.group(0)]:
+                if (best is None or idx < best) and all(k in text for k in self.specs[idx].start_all):
+                    best = idx
+                    break
+        return self.specs[best] if best is not None else None
+
+
+class LineRing:
+    """
+    The last `max_lines` lines of a stream, holding at most `max_bytes`
+    (UTF-8) in total; oldest lines are evicted first and a single line
+    larger than the budget is not kept. Used for before-context: copying
+    happens only when an incident asks for snapshot().
+    """
+    __slots__ = ("max_lines", "max_bytes", "_lines", "_sizes", "_bytes")
 
+    def __init__(self, max_lines: int, max_bytes: int) -> None:
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self._lines: deque = deque()
+        self._sizes: deque = deque()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def append(self, text: str) -> None:
+        n = len(text) if text.isascii() else len(text.encode("utf-8"))
+        if n > self.max_bytes:
+            self.clear()  # 放不下：丢掉旧行，避免 before 里出现不连续的行
+            return
+        lines, sizes = self._lines, self._sizes
+        lines.append(text)
+        sizes.append(n)
+        self._bytes += n
+        while len(lines) > self.max_lines or self._bytes > self.max_bytes:
+            lines.popleft()
+            self._bytes -= sizes.popleft()
+
+    def snapshot(self) -> Tuple[str, ...]:
+        return tuple(self._lines)
+
+    def clear(self) -> None:
+        self._lines.clear()
+        self._sizes.clear()
+        self._bytes = 0
 
 
 class MultiLineAggregator:
     """
-    Aggregates multi-line kernel events for OOPS/PANIC:
-    - Start on trigger line
+    Aggregates multi-line kernel events declared by `multiline` on rules
+    (see config.MultiLine; OOPS/PANIC/DEADLOCK in the default rules):
+    - Start on a line matching a block's start keywords; the detector runs
+      on it once, its hits are held until the block ends
     - Collect subsequent lines as context
     - Flush on:
-        * new trigger line
+        * new start line
         * log timestamp gap > window_seconds
         * end marker
         * idle timeout (monitor heartbeat)
         * max_lines reached
+    window_seconds / max_lines here are defaults for rules that omit them.
+
+    With before_lines > 0 every incident also carries up to that many
+    preceding lines of the stream (bounded by before_bytes) as `before`.
+
+    With a `context_store`, context lines are kept as references (file
+    spans passed to process(), or spilled text) and incidents get a
+    LazyContext that is only read when rendered.
+
+    `table` is an already compiled BlockTable for detector.rules, so that
+    many aggregators over the same rules (HostDetectors) share one.
     """
     def __init__(
         self,
@@ -185,50 +380,140 @@ class MultiLineAggregator:
         window_seconds: float = 5.0,
         max_lines: int = 200,
         idle_flush_seconds: float = 0.8,
+        before_lines: int = 0,
+        before_bytes: int = 64 * 1024,
+        context_store: Optional[ContextStore] = None,
+        table: Optional[BlockTable] = None,
     ) -> None:
         self.detector = detector
+        self.context_store = context_store
         self.window_seconds = window_seconds
         self.max_lines = max_lines
         self.idle_flush_seconds = idle_flush_seconds
+        self.ring: Optional[LineRing] = LineRing(before_lines, before_bytes) if before_lines > 0 else None
+        self.before: Tuple[str, ...] = ()
 
-        self.active_type: Optional[str] = None
+        self._rules: Optional[List[Rule]] = None
+        self._table: Optional[BlockTable] = None
+        if table is not None:
+            self.use_table(table)
+
+        self.block: Optional[BlockSpec] = None
+        self.hits: List[Incident] = []
         self.start_line_no: int = 0
         self.start_line: str = ""
         self.start_ts: Optional[float] = None
         self.context: List[str] = []
         self._last_activity_wall: float = 0.0
 
-    def _start(self, t: str, line_no: int, line: str) -> None:
-        self.active_type = t
+    @property
+    def active_type(self) -> Optional[str]:
+        return self.block.type if self.block is not None else None
+
+    @property
+    def table(self) -> BlockTable:
+        # 热加载换了规则列表就重新编译（只比较对象身份，每行 O(1)）
+        if self._rules is not self.detector.rules:
+            self._rules = self.detector.rules
+            self._table = BlockTable(self._rules, window_seconds=self.window_seconds, max_lines=self.max_lines)
+        return self._table
+
+    def use_table(self, table: BlockTable) -> None:
+        """Use a BlockTable compiled elsewhere for the current detector.rules."""
+        self._rules = self.detector.rules
+        self._table = table
+
+    def _start(self, spec: BlockSpec, line_no: int, text: str, ts: Optional[float]) -> None:
+        self.block = spec
+        # 触发行只检测这一次，命中结果在块结束时带上 context 输出
+        self.hits = self.detector.process_line(line_no, text)
+        self.before = self.ring.snapshot() if self.ring is not None else ()
         self.start_line_no = line_no
-        self.start_line = line.rstrip("\n")
-        self.start_ts = _parse_syslog_ts(self.start_line)
+        self.start_line = text
+        self.start_ts = ts
         self.context = []
         self._last_activity_wall = time.time()
 
+    def snapshot(self) -> Optional[Dict]:
+        """The open block (if any) as plain data, for resuming a scan later."""
+        if self.block is None:
+            return None
+        return {
+            "rule_id": self.block.rule_id,
+            "start_line_no": self.start_line_no,
+            "start_line": self.start_line,
+            "start_ts": self.start_ts,
+            "context": list(self._context_lines()),
+            "hits": [inc.to_dict() for inc in self.hits],
+            "before": list(self.before),
+        }
+
+    def open_block(self) -> Optional[Dict]:
+        """Cheap summary of the open block for status reports (no context is read)."""
+        block = self.block
+        if block is None:
+            return None
+        return {
+            "type": block.type,
+            "rule_id": block.rule_id,
+            "start_line_no": self.start_line_no,
+            "context_lines": len(self.context),
+            "idle_seconds": round(time.time() - self._last_activity_wall, 3),
+        }
+
+    def restore(self, state: Optional[Dict]) -> None:
+        """Re-open a block saved by snapshot(). A block whose rule no longer exists is dropped."""
+        if not state:
+            return
+        spec = next((b for b in self.table.specs if b.rule_id == state["rule_id"]), None)
+        if spec is None:
+            return
+        self.block = spec
+        self.hits = [
+            Incident(**{k: (tuple(v) if k in ("context", "before") else v) for k, v in d.items()})
+            for d in state.get("hits") or []
+        ]
+        self.start_line_no = int(state["start_line_no"])
+        self.start_line = state["start_line"]
+        self.start_ts = state.get("start_ts")
+        self.context = list(state.get("context") or [])
+        self.before = tuple(state.get("before") or ())
+        self._last_activity_wall = time.time()
+
+    def _context_lines(self) -> Iterable[str]:
+        store = self.context_store
+        return self.context if store is None else map(store.read, self.context)
+
     def _emit(self) -> List[Incident]:
-        if not self.active_type:
+        spec = self.block
+        if spec is None:
             return []
-        hits = self.detector.process_line(self.start_line_no, self.start_line)
+        hits = self.hits
 
-        # 如果规则没命中（理论上不该），做一个兜底事件
+        # 起始行规则没命中（正则不匹配或冷却中），做一个兜底事件
         if not hits:
-            severity = "high" if self.active_type == "OOPS" else "critical"
             hits = [
                 Incident(
-                    rule_id=f"multiline_{self.active_type.lower()}",
-                    type=self.active_type,
-                    severity=severity,
+                    rule_id=sys.intern(f"multiline_{spec.type.lower()}"),
+                    type=spec.type,
+                    severity=spec.severity,
                     message=self.start_line,
                     line_no=self.start_line_no,
                     extracted={},
                 )
             ]
 
+        # 有 store 时直接把引用列表交给 LazyContext，不复制行内容
+        store = self.context_store
+        context = tuple(self.context) if store is None else LazyContext(store, self.context)
         for inc in hits:
-            if inc.type == self.active_type:
-                inc.context = list(self.context)
-        self.active_type = None
+            if inc.type == spec.type:
+                inc.context = context
+            if self.before:
+                inc.before = self.before
+        self.block = None
+        self.before = ()
+        self.hits = []
         self.start_line_no = 0
         self.start_line = ""
         self.start_ts = None
@@ -239,61 +524,102 @@ class MultiLineAggregator:
     def flush(self) -> List[Incident]:
         return self._emit()
 
-    def process(self, line_no: int, line: str) -> List[Incident]:
+    def _detect(self, line_no: int, text: str) -> List[Incident]:
+        hits = self.detector.process_line(line_no, text)
+        if hits and self.ring is not None and len(self.ring):
+            before = self.ring.snapshot()
+            for inc in hits:
+                inc.before = before
+        return hits
+
+    def process(self, line_no: int, line: str, span: Optional[Span] = None) -> List[Incident]:
+        """`span` is the (offset, length) of the line in a file-backed source."""
         # heartbeat: (0, "") 用于 idle flush
         if line_no == 0 and line == "":
-            if self.active_type and (time.time() - self._last_activity_wall) >= self.idle_flush_seconds:
+            if self.block is not None and (time.time() - self._last_activity_wall) >= self.idle_flush_seconds:
                 return self._emit()
             return []
 
         text = line.rstrip("\n")
-        t = _trigger_type(text)
-
-        # 若当前在聚合中，先处理“切断条件”
-        if self.active_type:
-            # 新触发：先 flush 老的，再 start 新的（本行作为新块的起始行）
-            if t is not None:
-                out = self._emit()
-                self._start(t, line_no, text)
-                return out
-
-            # 时间窗口切断：避免把很久后的其它日志吸进 context
-            if self.start_ts is not None:
-                cur_ts = _parse_syslog_ts(text)
-                if cur_ts is not None and (cur_ts - self.start_ts) > self.window_seconds:
-                    out = self._emit()
-                    # 这行不属于之前的块，作为普通行继续处理
-                    return out + self.process(line_no, line)
-
-            # 追加到 context
-            if len(self.context) < self.max_lines:
-                self.context.append(text)
-            self._last_activity_wall = time.time()
-
-            # 结束标记：立刻 flush（包括该行）
-            if any(m in text for m in _END_MARKERS) or len(self.context) >= self.max_lines:
-                return self._emit()
-
-            return []
-
-        # 不在聚合中：如果触发多行类型 -> start block（先不立刻输出，等待聚合结束/flush）
-        if t is not None:
-            self._start(t, line_no, text)
-            return []
-
-        # 普通行：直接走规则检测
-        return self.detector.process_line(line_no, line)
-
-
-def detect_lines(lines: Iterator[Tuple[int, str]], rules: List[Rule]) -> List[Incident]:
-    detector = Detector(rules)
-    agg = MultiLineAggregator(detector)
+        out = self._step(line_no, text, span)
+        if self.ring is not None:
+            self.ring.append(text)  # 本行处理完才进缓冲：before 不包含触发行自己
+        return out
+
+    def _step(self, line_no: int, text: str, span: Optional[Span]) -> List[Incident]:
+        start = self.table.match_start(text)
+
+        if self.block is None:
+            if start is not None:
+                self._start(start, line_no, text, _parse_syslog_ts(text))
+                return []
+            # 普通行：直接走规则检测
+            return self._detect(line_no, text)
+
+        # 在块中：新的起始行 -> 先输出老块，本行开启新块
+        if start is not None:
+            out = self._emit()
+            self._start(start, line_no, text, _parse_syslog_ts(text))
+            return out
+
+        spec = self.block
+        # 时间窗口切断：这行不属于之前的块，输出老块后按普通行检测（不是起始行，无需再判断）
+        if self.start_ts is not None:
+            cur_ts = _parse_syslog_ts(text)
+            if cur_ts is not None and (cur_ts - self.start_ts) > spec.window_seconds:
+                return self._emit() + self._detect(line_no, text)
+
+        if len(self.context) < spec.max_lines:
+            store = self.context_store
+            self.context.append(text if store is None else store.ref(text, span))
+        self._last_activity_wall = time.time()
 
-    incidents: List[Incident] = []
-    for line_no, line in lines:
-        incidents.extend(agg.process(line_no, line))
+        # 结束标记：立刻输出（包括该行）
+        if (spec.end_re is not None and spec.end_re.search(text)) or len(self.context) >= spec.max_lines:
+            return self._emit()
+        return []
+
+
+def iter_incidents(
+    lines: Iterable[Union[Tuple[int, str], Tuple[int, str, Span]]],
+    rules: List[Rule],
+    *,
+    prefilter: Optional[Pattern[str]] = None,
+    before_lines: int = 0,
+    before_bytes: int = 64 * 1024,
+    context_store: Optional[ContextStore] = None,
+    miner: Optional[Any] = None,
+) -> Iterator[Incident]:
+    """
+    Incidents as they are detected (streaming form of detect_lines).
+    `lines` yields (line_no, line) or, for a file-backed context_store,
+    (line_no, line, span) as produced by context.iter_line_spans().
+    `miner` (templates.TemplateMiner) sees every line after the rules.
+    """
+    detector = Detector(rules, prefilter=prefilter)
+    agg = MultiLineAggregator(
+        detector, before_lines=before_lines, before_bytes=before_bytes, context_store=context_store
+    )
+
+    process = agg.process
+    mine = miner.process if miner is not None else None
+    for item in lines:
+        hits = process(*item)
+        if hits:
+            yield from hits
+        if mine is not None:
+            found = mine(item[0], item[1])
+            if found:
+                yield from found
 
     # 文件结束时把未 flush 的块吐出来
-    incidents.extend(agg.flush())
-    return incidents
+    yield from agg.flush()
+
 
+def detect_lines(
+    lines: Iterable[Union[Tuple[int, str], Tuple[int, str, Span]]],
+    rules: List[Rule],
+    **kwargs: Any,
+) -> List[Incident]:
+    """All incidents of `lines` as a list; keyword options as for iter_incidents()."""
+    return list(iter_incidents(lines, rules, **kwargs))
@@ -0,0 +1,141 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, List, Optional, Pattern, Set
+
+from .config import Rule, build_prefilter
+from .engine import BlockTable, Detector, Incident, MultiLineAggregator
+
+
+class _HostState:
+    __slots__ = ("agg", "line_no")
+
+    def __init__(self, agg: MultiLineAggregator) -> None:
+        self.agg = agg
+        self.line_no = 0  # 该主机收到的第几条消息
+
+
+class HostDetectors:
+    """
+    Detection state per sending host for multi-host sources (serve-syslog):
+    each host gets its own Detector (cooldowns) and MultiLineAggregator,
+    so lines of one host never end up in another host's block. The compiled
+    rules, prefilter and multi-line BlockTable are shared. Incidents carry `extracted["host"]`; line_no counts
+    the messages of that host.
+
+    At most `max_hosts` hosts are kept; the least recently heard one is
+    flushed and dropped to make room.
+    """
+    def __init__(
+        self,
+        rules: List[Rule],
+        *,
+        prefilter: Optional[Pattern[str]] = None,
+        before_lines: int = 0,
+        before_bytes: int = 64 * 1024,
+        max_hosts: int = 10000,
+    ) -> None:
+        self.rules = rules
+        # 预过滤正则只编译一次，所有主机共用
+        self.prefilter = prefilter if prefilter is not None else build_prefilter(rules)
+        self.before_lines = before_lines
+        self.before_bytes = before_bytes
+        self.max_hosts = max_hosts
+        self._table: Optional[BlockTable] = None  # 第一台主机编译，之后所有主机共用
+        self._hosts: "OrderedDict[str, _HostState]" = OrderedDict()  # LRU：末尾最近收到
+        self._open: Set[str] = set()  # 有未关闭多行块的主机，心跳只看这些
+        self.messages = 0
+        self.evicted = 0
+
+    def _state(self, host: str) -> _HostState:
+        st = self._hosts.get(host)
+        if st is None:
+            detector = Detector(self.rules, prefilter=self.prefilter)
+            agg = MultiLineAggregator(detector, before_lines=self.before_lines, before_bytes=self.before_bytes,
+                                      table=self._table)
+            if self._table is None:
+                self._table = agg.table
+            st = self._hosts[host] = _HostState(agg)
+        else:
+            self._hosts.move_to_end(host)
+        return st
+
+    @staticmethod
+    def _tag(host: str, incidents: List[Incident]) -> List[Incident]:
+        for inc in incidents:
+            inc.extracted["host"] = host
+        return incidents
+
+    def process(self, host: str, line: str) -> List[Incident]:
+        """Detect on one message of `host`; may also return incidents of an evicted host."""
+        st = self._state(host)
+        self.messages += 1
+        st.line_no += 1
+        out = st.agg.process(st.line_no, line)
+        if out:
+            self._tag(host, out)
+        if st.agg.block is not None:
+            self._open.add(host)
+        else:
+            self._open.discard(host)
+        if len(self._hosts) > self.max_hosts:
+            out = out + self._evict()
+        return out
+
+    def _evict(self) -> List[Incident]:
+        host, st = self._hosts.popitem(last=False)
+        self._open.discard(host)
+        self.evicted += 1
+        return self._tag(host, st.agg.flush())
+
+    def heartbeat(self) -> List[Incident]:
+        """Idle flush: close blocks of hosts that have gone quiet."""
+        out: List[Incident] = []
+        for host in list(self._open):
+            agg = self._hosts[host].agg
+            found = agg.process(0, "")
+            if found:
+                out.extend(self._tag(host, found))
+            if agg.block is None:
+                self._open.discard(host)
+        return out
+
+    def flush(self) -> List[Incident]:
+        """End of input: every open block."""
+        out: List[Incident] = []
+        for host in list(self._open):
+            out.extend(self._tag(host, self._hosts[host].agg.flush()))
+        self._open.clear()
+        return out
+
+    def forget(self, hosts) -> List[Incident]:
+        """Drop the state of these hosts (rebalanced to another worker), closing their open blocks."""
+        out: List[Incident] = []
+        for host in hosts:
+            st = self._hosts.pop(host, None)
+            if st is None:
+                continue
+            self._open.discard(host)
+            out.extend(self._tag(host, st.agg.flush()))
+        return out
+
+    def swap_rules(self, rules: List[Rule], *, prefilter: Optional[Pattern[str]] = None) -> Dict[str, List[str]]:
+        """
+        Hot reload: known hosts swap in place (cooldowns of unchanged rules
+        kept), new hosts get the new rules. Returns the diff by rule id.
+        """
+        prefilter = prefilter if prefilter is not None else build_prefilter(rules)
+        diff = Detector(self.rules, prefilter=self.prefilter).swap_rules(rules, prefilter=prefilter)
+        self.rules = rules
+        self.prefilter = prefilter
+        self._table = None
+        for st in self._hosts.values():
+            st.agg.detector.swap_rules(rules, prefilter=prefilter)
+            if self._table is None:
+                self._table = st.agg.table  # 新规则只编译一次
+            else:
+                st.agg.use_table(self._table)
+        return diff
+
+    def stats(self) -> Dict[str, int]:
+        return {"hosts": len(self._hosts), "open_blocks": len(self._open),
+                "messages": self.messages, "evicted": self.evicted}
@@ -0,0 +1,376 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+import hashlib
+import json
+import os
+import sys
+
+from .config import _cache_dir
+from .engine import _parse_syslog_ts
+
+INDEX_VERSION = 1
+DEFAULT_STRIDE = 1024  # 每 1024 行记一条：1 GB 的内核日志约 1 万条、240 KB
+SIDECAR_SUFFIX = ".dtidx"
+AUTO_INDEX_BYTES = 16 * 1024 * 1024  # scan 顺带建索引的最小文件大小
+_MAGIC = b"DTIDX\n"
+_NO_TS = -1
+_HEAD_BYTES = 4096
+
+
+def sidecar_path(log_path: str) -> Path:
+    return Path(str(log_path) + SIDECAR_SUFFIX)
+
+
+def cache_index_path(log_path: str) -> Optional[Path]:
+    """Index location under the cache dir, for logs in read-only directories."""
+    base = _cache_dir()
+    if base is None:
+        return None
+    key = hashlib.sha256(os.path.abspath(log_path).encode()).hexdigest()[:24]
+    return base / "index" / f"{key}{SIDECAR_SUFFIX}"
+
+
+def _head_hash(f: BinaryIO, limit: int) -> str:
+    f.seek(0)
+    return hashlib.sha256(f.read(min(limit, _HEAD_BYTES))).hexdigest()[:32]
+
+
+class IndexBuilder:
+    """
+    Collects index entries from a forward pass: (offset, lines before,
+    first syslog timestamp of the stride) at every `stride`-th line.
+    Fed by build_index() or, opportunistically, by scan.
+    """
+    __slots__ = ("stride", "entries", "_need_ts")
+
+    def __init__(self, stride: int = DEFAULT_STRIDE, entries: Optional[array] = None) -> None:
+        if stride < 1:
+            raise ValueError(f"index stride must be >= 1, got {stride}")
+        self.stride = stride
+        self.entries = entries if entries is not None else array("q")
+        self._need_ts = False
+
+    def wants(self, line_no: int) -> bool:
+        return self._need_ts or (line_no - 1) % self.stride == 0
+
+    def observe(self, line_no: int, text: str, offset: int) -> None:
+        if (line_no - 1) % self.stride == 0:
+            self.entries.extend((offset, line_no - 1, _NO_TS))
+            self._need_ts = True
+        if self._need_ts:
+            ts = _parse_syslog_ts(text)
+            if ts is not None:
+                self.entries[-1] = int(ts)
+                self._need_ts = False
+
+
+class LogIndex:
+    """
+    Sparse line/offset/time index of one log file.
+
+    `entries` is a flat int64 array of (byte offset, lines before that
+    offset, first syslog timestamp in the stride or -1). The index is only
+    trusted while the file's device/inode, size and mtime are unchanged
+    (see matches()); a grown file with the same inode and head can be
+    extended instead of rebuilt.
+    """
+    def __init__(
+        self,
+        *,
+        stride: int,
+        dev: int,
+        ino: int,
+        size: int,
+        mtime_ns: int,
+        end_offset: int,
+        lines: int,
+        head: str,
+        entries: array,
+    ) -> None:
+        self.stride = stride
+        self.dev = dev
+        self.ino = ino
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.end_offset = end_offset  # 最后一个完整行之后的偏移
+        self.lines = lines  # 完整行数
+        self.head = head
+        self.entries = entries
+        self.path: Optional[Path] = None  # 读出/写入的索引文件
+
+    def __len__(self) -> int:
+        return len(self.entries) // 3
+
+    def entry(self, i: int) -> Tuple[int, int, Optional[int]]:
+        off, before, ts = self.entries[3 * i:3 * i + 3]
+        return off, before, (None if ts == _NO_TS else ts)
+
+    def matches(self, st: os.stat_result) -> bool:
+        return (self.dev, self.ino, self.size, self.mtime_ns) == (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def time_range(self) -> Tuple[Optional[int], Optional[int]]:
+        stamps = [ts for ts in self.entries[2::3] if ts != _NO_TS]
+        return (stamps[0], stamps[-1]) if stamps else (None, None)
+
+    def locate_line(self, line_no: int) -> Tuple[int, int]:
+        """(offset, lines before it) of the nearest entry at or before `line_no`."""
+        if not len(self) or line_no < 1:
+            return 0, 0
+        i = min((line_no - 1) // self.stride, len(self) - 1)
+        off, before, _ = self.entry(i)
+        return off, before
+
+    def locate_offset(self, offset: int) -> Tuple[int, int]:
+        """(offset, lines before it) of the last entry at or before byte `offset`."""
+        k = bisect_left(range(len(self)), offset + 1, key=lambda i: self.entries[3 * i])
+        if k == 0:
+            return 0, 0
+        off, before, _ = self.entry(k - 1)
+        return off, before
+
+    def seek_time(self, ts: float) -> Tuple[int, int]:
+        """
+        (offset, lines before it) of a point at or before the first line
+        with a timestamp >= ts: the last entry whose timestamp is < ts.
+        Assumes timestamps grow through the file, like syslog does.
+        """
+        timed = [i for i in range(len(self)) if self.entries[3 * i + 2] != _NO_TS]
+        k = bisect_left(timed, ts, key=lambda i: self.entries[3 * i + 2])
+        if k == 0:
+            return 0, 0
+        off, before, _ = self.entry(timed[k - 1])
+        return off, before
+
+    def to_header(self) -> Dict[str, Any]:
+        return {
+            "version": INDEX_VERSION,
+            "byteorder": sys.byteorder,
+            "stride": self.stride,
+            "dev": self.dev,
+            "ino": self.ino,
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "end_offset": self.end_offset,
+            "lines": self.lines,
+            "head": self.head,
+            "entries": len(self),
+        }
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC)
+            f.write(json.dumps(self.to_header()).encode() + b"\n")
+            self.entries.tofile(f)
+        os.replace(tmp, path)
+        self.path = path
+
+    @classmethod
+    def read(cls, path: Path) -> Optional["LogIndex"]:
+        """Parse an index file; None if it is missing, corrupt or from another format."""
+        try:
+            with open(path, "rb") as f:
+                if f.readline() != _MAGIC:
+                    return None
+                hdr = json.loads(f.readline())
+                if hdr.get("version") != INDEX_VERSION or hdr.get("byteorder") != sys.byteorder:
+                    return None
+                entries = array("q")
+                entries.fromfile(f, 3 * int(hdr["entries"]))
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+        idx = cls(
+            stride=hdr["stride"], dev=hdr["dev"], ino=hdr["ino"], size=hdr["size"],
+            mtime_ns=hdr["mtime_ns"], end_offset=hdr["end_offset"], lines=hdr["lines"],
+            head=hdr["head"], entries=entries,
+        )
+        idx.path = Path(path)
+        return idx
+
+
+def index_candidates(log_path: str) -> List[Path]:
+    """Where an index of `log_path` may live: sidecar first, then the cache dir."""
+    paths = [sidecar_path(log_path)]
+    cached = cache_index_path(log_path)
+    if cached is not None:
+        paths.append(cached)
+    return paths
+
+
+def load_index(log_path: str, *, paths: Optional[List[Path]] = None, stale: bool = False) -> Optional[LogIndex]:
+    """
+    The first index of `log_path` that is still valid for the file as it
+    is now. With stale=True an outdated index of the same inode is
+    returned too (build_index() can extend it).
+    """
+    try:
+        st = os.stat(log_path)
+    except OSError:
+        return None
+    fallback = None
+    for p in paths or index_candidates(log_path):
+        idx = LogIndex.read(p)
+        if idx is None:
+            continue
+        if idx.matches(st):
+            return idx
+        if stale and fallback is None and (idx.dev, idx.ino) == (st.st_dev, st.st_ino):
+            fallback = idx
+    return fallback
+
+
+def save_index(idx: LogIndex, log_path: str, path: Optional[Path] = None) -> Optional[Path]:
+    """Write next to the log if possible, else under the cache dir. Returns where, or None."""
+    for p in [path] if path is not None else index_candidates(log_path):
+        try:
+            idx.save(p)
+            return p
+        except OSError:
+            continue
+    return None
+
+
+def build_index(
+    log_path: str,
+    *,
+    stride: int = DEFAULT_STRIDE,
+    previous: Optional[LogIndex] = None,
+) -> Tuple[LogIndex, bool]:
+    """
+    Index `log_path` in one sequential pass. A `previous` index of the same
+    file (same inode and stride, unchanged head, not truncated) is extended
+    from where it stopped. Returns (index, extended).
+    """
+    try:
+        f = open(log_path, "rb")
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Log file not found: {log_path}\n"
+            f"Please check the file path and try again"
+        )
+    except PermissionError:
+        raise PermissionError(
+            f"Permission denied: {log_path}\n"
+            f"Please ensure you have read permission for this file"
+        )
+
+    with f:
+        st = os.fstat(f.fileno())
+        extended = (
+            previous is not None
+            and previous.stride == stride
+            and (previous.dev, previous.ino) == (st.st_dev, st.st_ino)
+            and previous.end_offset <= st.st_size
+            and _head_hash(f, previous.end_offset) == previous.head
+        )
+        if extended:
+            builder = IndexBuilder(stride, array("q", previous.entries))
+            offset, lines = previous.end_offset, previous.lines
+        else:
+            builder = IndexBuilder(stride)
+            offset, lines = 0, 0
+
+        f.seek(offset)
+        wants = builder.wants
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break  # 末尾半行不进索引，等它写完
+            lines += 1
+            if wants(lines):
+                builder.observe(lines, raw.decode("utf-8", errors="replace"), offset)
+            offset += len(raw)
+
+        idx = LogIndex(
+            stride=stride, dev=st.st_dev, ino=st.st_ino, size=st.st_size, mtime_ns=st.st_mtime_ns,
+            end_offset=offset, lines=lines, head=_head_hash(f, offset), entries=builder.entries,
+        )
+    return idx, extended
+
+
+def iter_lines_from(f: BinaryIO, offset: int, line_no: int) -> Iterator[Tuple[int, int, bytes]]:
+    """(line_no, offset, raw line) from a known line start."""
+    f.seek(offset)
+    for raw in f:
+        line_no += 1
+        yield line_no, offset, raw
+        offset += len(raw)
+
+
+def read_lines(log_path: str, idx: Optional[LogIndex], start: int, count: int) -> List[Tuple[int, str]]:
+    """Lines start..start+count-1 (1-based), seeking via the index when there is one."""
+    start = max(1, start)
+    off, before = idx.locate_line(start) if idx is not None else (0, 0)
+    out: List[Tuple[int, str]] = []
+    with open(log_path, "rb") as f:
+        for line_no, _, raw in iter_lines_from(f, off, before):
+            if line_no >= start + count:
+                break
+            if line_no >= start:
+                out.append((line_no, raw.decode("utf-8", errors="replace").rstrip("\r\n")))
+    return out
+
+
+class AutoIndexer:
+    """
+    Builds an index as a side effect of a full forward pass (scan) over
+    (line_no, line, span) items and stores it under the cache dir, so the
+    next time-range or tail scan of a large log can seek.
+    """
+    def __init__(self, log_path: str, st: os.stat_result, path: Path, stride: int = DEFAULT_STRIDE) -> None:
+        self.log_path = log_path
+        self.st = st
+        self.path = path
+        self.builder = IndexBuilder(stride)
+        self._last: Optional[Tuple[int, str, Tuple[int, int]]] = None
+
+    @classmethod
+    def for_file(cls, log_path: str) -> Optional["AutoIndexer"]:
+        """None for small or non-regular files, disabled cache, or when a valid index exists."""
+        try:
+            st = os.stat(log_path)
+        except OSError:
+            return None
+        path = cache_index_path(log_path)
+        if path is None or not os.path.isfile(log_path) or st.st_size < AUTO_INDEX_BYTES:
+            return None
+        if load_index(log_path) is not None:
+            return None
+        return cls(log_path, st, path)
+
+    def wrap(self, items):
+        observe = self.builder.observe
+        wants = self.builder.wants
+        for item in items:
+            line_no, text, span = item
+            if wants(line_no):
+                observe(line_no, text, span[0])
+            self._last = item
+            yield item
+
+    def finish(self) -> Optional[Path]:
+        """Save the index if the file did not change during the pass."""
+        try:
+            st = os.stat(self.log_path)
+        except OSError:
+            return None
+        if self._last is None or (st.st_size, st.st_mtime_ns) != (self.st.st_size, self.st.st_mtime_ns):
+            return None
+        line_no, text, (off, _) = self._last
+        if text.endswith("\n"):
+            lines, end = line_no, st.st_size
+        else:
+            lines, end = line_no - 1, off
+        entries = self.builder.entries
+        if len(entries) and entries[-3] >= end:
+            del entries[-3:]  # 只覆盖未完成的末尾半行的条目
+        with open(self.log_path, "rb") as f:
+            head = _head_hash(f, end)
+        idx = LogIndex(
+            stride=self.builder.stride, dev=st.st_dev, ino=st.st_ino, size=st.st_size,
+            mtime_ns=st.st_mtime_ns, end_offset=end, lines=lines, head=head, entries=entries,
+        )
+        return save_index(idx, self.log_path, self.path)
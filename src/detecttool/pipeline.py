@@ -0,0 +1,228 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import queue
+import threading
+import time
+
+from .engine import Incident
+
+# 队列结束标记
+_EOF = object()
+
+OUTPUT_POLICIES = ("block", "drop-newest", "drop-oldest")
+
+
+class StageQueue:
+    """
+    Bounded queue between two pipeline stages with depth/drop metrics.
+
+    policy decides what put() does when the queue is full:
+      - "block":       wait for the consumer (no loss, producer slows down)
+      - "drop-newest": discard the item being put
+      - "drop-oldest": evict the oldest queued item to make room
+    """
+    def __init__(self, name: str, maxsize: int, policy: str = "block") -> None:
+        if policy not in OUTPUT_POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}, expected one of: {', '.join(OUTPUT_POLICIES)}")
+        self.name = name
+        self.policy = policy
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, maxsize))
+        self.put_count = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item: Any, *, force: bool = False) -> bool:
+        """Returns False if the item (or an older one) was dropped. force=True always blocks."""
+        dropped = False
+        if force or self.policy == "block":
+            self._q.put(item)
+        else:
+            try:
+                self._q.put_nowait(item)
+            except queue.Full:
+                if self.policy == "drop-newest":
+                    self.dropped += 1
+                    return False
+                try:
+                    self._q.get_nowait()
+                    self._q.task_done()
+                    self.dropped += 1
+                    dropped = True
+                except queue.Empty:
+                    pass
+                self._q.put(item)
+        if item is not _EOF:
+            self.put_count += 1
+        depth = self._q.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return not dropped
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        item = self._q.get(timeout=timeout)
+        self._q.task_done()
+        return item
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "depth": self._q.qsize(),
+            "max_depth": self.max_depth,
+            "capacity": self._q.maxsize,
+            "put": self.put_count,
+            "dropped": self.dropped,
+            "policy": self.policy,
+        }
+
+
+class MonitorPipeline:
+    """
+    reader thread -> detection thread -> output stage (caller's thread).
+
+    - reader:    iterates `source` (e.g. follow_file) into the line queue;
+                 always blocks when full, so no log line is ever lost.
+    - detection: runs `process(line_no, line)` and queues incidents; calls
+                 `finish()` once the source ends or stop() is requested
+                 (e.g. MultiLineAggregator.flush) and `between_lines()`
+                 before each line (e.g. hot reload).
+    - output:    run() drains incidents into `output(inc)`. When output is
+                 slower than detection the incident queue applies
+                 `output_policy` (see StageQueue).
+    An error in the reader or detection stage stops the pipeline and is
+    re-raised by run().
+    A slow terminal therefore only fills the incident queue instead of
+    stalling the file reader.
+    """
+    def __init__(
+        self,
+        source: Iterable[Tuple[int, str]],
+        process: Callable[[int, str], List[Incident]],
+        output: Callable[[Incident], None],
+        *,
+        finish: Optional[Callable[[], List[Incident]]] = None,
+        between_lines: Optional[Callable[[], None]] = None,
+        line_queue_size: int = 10000,
+        incident_queue_size: int = 10000,
+        output_policy: str = "block",
+    ) -> None:
+        self.source = source
+        self.process = process
+        self.output = output
+        self.finish = finish
+        self.between_lines = between_lines
+
+        self.lines = StageQueue("lines", line_queue_size, "block")
+        self.incidents = StageQueue("incidents", incident_queue_size, output_policy)
+
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.started_at = 0.0
+        self.lines_read = 0
+        self.lines_processed = 0
+        self.incidents_detected = 0
+        self.incidents_output = 0
+        self.error: Optional[BaseException] = None
+
+    # -------- stages --------
+    def _reader(self) -> None:
+        it: Iterator[Tuple[int, str]] = iter(self.source)
+        try:
+            for item in it:
+                if self._stop.is_set():
+                    break
+                self.lines.put(item)
+                if item[0]:
+                    self.lines_read += 1
+        except BaseException as e:  # 读失败要让主线程知道
+            self.error = e
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+            self.lines.put(_EOF, force=True)
+
+    def _detector(self) -> None:
+        eof = failed = False
+        try:
+            while True:
+                item = self.lines.get()
+                if item is _EOF:
+                    eof = True
+                    break
+                if self.between_lines is not None:
+                    self.between_lines()
+                line_no, line = item
+                for inc in self.process(line_no, line):
+                    self.incidents_detected += 1
+                    self.incidents.put(inc)
+                if line_no:
+                    self.lines_processed += 1
+            if self.finish is not None:
+                for inc in self.finish():
+                    self.incidents_detected += 1
+                    self.incidents.put(inc, force=True)
+        except BaseException as e:
+            # 检测出错：整条管道停下，run() 抛出这个错误，而不是只剩读线程继续跟踪文件
+            if self.error is None:
+                self.error = e
+            self._stop.set()
+            failed = True
+        finally:
+            self.incidents.put(_EOF, force=True)
+        if failed and not eof:
+            self._drain_lines()
+
+    def _drain_lines(self) -> None:
+        # 读线程可能正卡在满队列上，替它取走剩下的行直到结束标记
+        while self.lines.get() is not _EOF:
+            pass
+
+    # -------- control --------
+    def start(self) -> "MonitorPipeline":
+        self.started_at = time.time()
+        for name, target in (("reader", self._reader), ("detector", self._detector)):
+            t = threading.Thread(target=target, name=f"detecttool-{name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self) -> None:
+        """Ask the reader to stop; detection flushes and the output stage drains."""
+        self._stop.set()
+
+    def run(self, *, tick: Optional[Callable[[], None]] = None, tick_interval: float = 0.0) -> None:
+        """
+        Output stage: deliver incidents until the pipeline has drained.
+        `tick` is called every `tick_interval` seconds (e.g. to report metrics).
+        """
+        if not self._threads:
+            self.start()
+        next_tick = time.monotonic() + tick_interval if tick and tick_interval > 0 else None
+        while True:
+            if next_tick is not None and time.monotonic() >= next_tick:
+                tick()
+                next_tick = time.monotonic() + tick_interval
+            try:
+                item = self.incidents.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _EOF:
+                break
+            self.output(item)
+            self.incidents_output += 1
+        for t in self._threads:
+            t.join(timeout=2.0)
+        if self.error is not None:
+            raise self.error
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 3) if self.started_at else 0.0,
+            "lines_read": self.lines_read,
+            "lines_processed": self.lines_processed,
+            "incidents_detected": self.incidents_detected,
+            "incidents_output": self.incidents_output,
+            "queues": {
+                "lines": self.lines.metrics(),
+                "incidents": self.incidents.metrics(),
+            },
+        }
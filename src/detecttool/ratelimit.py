@@ -0,0 +1,205 @@
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import math
+import sys
+import time
+
+from .config import Config, RateLimit
+from .engine import Incident
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: int, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = now
+
+    def take(self, now: float) -> bool:
+        elapsed = now - self.stamp
+        if elapsed > 0:
+            self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+            self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class _Budget:
+    """Limiter state of one rule (or one incident type)."""
+    __slots__ = ("key", "limit", "bucket", "arrival_rate", "_slot_start", "_slot_count",
+                 "overflow", "suppressed", "sampled", "since", "last")
+
+    def __init__(self, key: str, limit: RateLimit, now: float) -> None:
+        self.key = key
+        self.limit = limit
+        self.bucket = TokenBucket(limit.rate, limit.burst, now)
+        self.arrival_rate = 0.0  # 到达速率的 EWMA（条/秒），决定抽样步长
+        self._slot_start = now
+        self._slot_count = 0
+        self.overflow = 0
+        self.suppressed = 0
+        self.sampled = 0
+        self.since = now
+        self.last: Optional[Incident] = None
+
+    def observe(self, now: float) -> None:
+        self._slot_count += 1
+        elapsed = now - self._slot_start
+        if elapsed >= 1.0:
+            self.arrival_rate = 0.5 * self.arrival_rate + 0.5 * (self._slot_count / elapsed)
+            self._slot_start = now
+            self._slot_count = 0
+
+    def stride(self, now: float) -> int:
+        # 超限 N 倍就每 N 条放行 1 条，抽样流量约等于配置的速率；
+        # 当前这一秒的计数也算进去，洪峰刚开始时就能收紧
+        current = self._slot_count / max(now - self._slot_start, 0.1)
+        rate = max(self.arrival_rate, current, self.limit.rate)
+        return max(2, math.ceil(rate / self.limit.rate))
+
+
+class RateLimiter:
+    """
+    Per-rule / per-type token buckets with adaptive sampling for monitor.
+
+    Rules with a `rate_limit` get their own bucket; other rules share the
+    bucket of their type from the top-level `rate_limits`. Rules without
+    either are never limited, so a flood of one rule cannot delay the
+    critical ones. Once a bucket is empty, incidents are sampled (every
+    N-th passes, N = how many times the arrival rate exceeds the limit)
+    unless `sample: false`; the rest are counted. Every
+    `summary_interval` seconds each bucket with suppressed incidents emits
+    one "N suppressed" summary incident, so totals stay accountable.
+    """
+    def __init__(
+        self,
+        config: Config,
+        *,
+        summary_interval: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.clock = clock
+        self._budgets: Dict[str, _Budget] = {}
+        self._route: Dict[Tuple[str, str], Optional[_Budget]] = {}
+        self._limits: Dict[str, RateLimit] = {}
+        self._rule_keys: Dict[str, str] = {}
+        self._retired: List[_Budget] = []  # 热加载后被替换的桶，等下次汇总报告完再丢弃
+        self._next_summary = clock()
+        self.passed = 0
+        self.suppressed_total = 0
+        self.update(config, summary_interval=summary_interval)
+
+    @property
+    def active(self) -> bool:
+        return bool(self._limits)
+
+    def update(self, config: Config, *, summary_interval: Optional[float] = None) -> None:
+        """(Re)configure from a Config; buckets whose limit is unchanged keep their state."""
+        self._limits = {}
+        self._rule_keys = {}
+        for rule in config.rules:
+            if rule.rate_limit is not None:
+                key = f"rule:{rule.id}"
+                self._limits[key] = rule.rate_limit
+                self._rule_keys[rule.id] = key
+        for t, limit in config.type_limits.items():
+            self._limits[f"type:{t}"] = limit
+        self.summary_interval = summary_interval if summary_interval is not None else config.rate_limit_summary_seconds
+
+        now = self.clock()
+        for key, b in list(self._budgets.items()):
+            if self._limits.get(key) != b.limit:
+                del self._budgets[key]
+                if b.suppressed:
+                    self._retired.append(b)  # 已累计的 suppressed 计数在下次汇总时照常报告
+        for key, limit in self._limits.items():
+            if key not in self._budgets:
+                self._budgets[key] = _Budget(key, limit, now)
+        self._route.clear()
+
+    def _budget_for(self, inc: Incident) -> Optional[_Budget]:
+        route = (inc.rule_id, inc.type)
+        try:
+            return self._route[route]
+        except KeyError:
+            key = self._rule_keys.get(inc.rule_id) or f"type:{inc.type}"
+            b = self._route[route] = self._budgets.get(key)
+            return b
+
+    def allow(self, inc: Incident, now: Optional[float] = None) -> bool:
+        b = self._budget_for(inc)
+        if b is None:
+            self.passed += 1
+            return True
+        now = self.clock() if now is None else now
+        b.observe(now)
+        if b.bucket.take(now):
+            self.passed += 1
+            return True
+        b.overflow += 1
+        if b.limit.sample and b.overflow % b.stride(now) == 0:
+            b.sampled += 1
+            self.passed += 1
+            return True
+        b.suppressed += 1
+        b.last = inc
+        self.suppressed_total += 1
+        return False
+
+    def process(self, incidents: Iterable[Incident]) -> List[Incident]:
+        """Filter incidents and append any summaries that are due."""
+        if not self._limits and not self._retired:
+            return incidents if isinstance(incidents, list) else list(incidents)
+        now = self.clock()
+        out = [inc for inc in incidents if self.allow(inc, now)]
+        if now >= self._next_summary:
+            out.extend(self.summaries(now))
+        return out
+
+    def _summary(self, b: _Budget, now: float) -> Incident:
+        inc = b.last
+        limit = b.limit
+        what = b.key.split(":", 1)[1]
+        rule_id = sys.intern(f"ratelimit_{what if b.key.startswith('rule:') else what.lower()}")
+        msg = (
+            f"{b.suppressed} {inc.type} incident(s) suppressed by rate limit "
+            f"({limit.rate:g}/s, burst {limit.burst}) of {b.key} in the last {now - b.since:.0f}s"
+        )
+        if b.sampled:
+            msg += f"; {b.sampled} sampled"
+        return Incident(
+            rule_id=rule_id,
+            type=inc.type,
+            severity=inc.severity,
+            message=msg,
+            line_no=inc.line_no,
+            extracted={"suppressed": str(b.suppressed), "sampled": str(b.sampled), "limit": b.key},
+        )
+
+    def summaries(self, now: Optional[float] = None, *, force: bool = False) -> List[Incident]:
+        """Summary incidents for every bucket that suppressed something; resets the counters."""
+        now = self.clock() if now is None else now
+        if not force and now < self._next_summary:
+            return []
+        self._next_summary = now + self.summary_interval
+        out: List[Incident] = []
+        for b in self._retired + list(self._budgets.values()):
+            if b.suppressed:
+                out.append(self._summary(b, now))
+            b.suppressed = 0
+            b.sampled = 0
+            b.overflow = 0
+            b.since = now
+        self._retired = []
+        return out
+
+    def flush(self) -> List[Incident]:
+        """Report whatever is still pending (end of input)."""
+        return self.summaries(force=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"passed": self.passed, "suppressed": self.suppressed_total}
@@ -0,0 +1,111 @@
+from __future__ import annotations
+from typing import Optional, Tuple
+import os
+import signal
+import threading
+
+from .config import Config, RuleFilter, load_config
+
+
+class RuleReloader:
+    """
+    Watches a rules file and recompiles it in a background thread.
+
+    A reload is triggered by SIGHUP (see install_signal_handler) or by a
+    change of the file's inode/size/mtime. Compilation happens off the hot
+    path; the monitor loop calls poll() between lines and swaps the new rule
+    set into its Detector. An invalid file keeps the current rules and is
+    reported through poll_error(). `rule_filter` is applied to every
+    reloaded rule set, like at startup.
+    """
+    def __init__(self, path: str, *, check_interval: float = 1.0, rule_filter: Optional[RuleFilter] = None) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self.rule_filter = rule_filter
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pending: Optional[Config] = None
+        self._error: Optional[str] = None
+        self._stamp = self._file_stamp()
+        self._thread: Optional[threading.Thread] = None
+
+    def _file_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    # -------- trigger --------
+    def request(self) -> None:
+        """Ask for a reload regardless of file changes (what SIGHUP does)."""
+        self._wake.set()
+
+    def install_signal_handler(self) -> bool:
+        """Reload on SIGHUP. Only possible from the main thread on POSIX."""
+        if not hasattr(signal, "SIGHUP"):
+            return False
+        try:
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.request())
+        except ValueError:
+            return False
+        return True
+
+    # -------- worker --------
+    def start(self) -> "RuleReloader":
+        self._thread = threading.Thread(target=self._run, name="detecttool-reload", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            forced = self._wake.wait(self.check_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            stamp = self._file_stamp()
+            if stamp is None:
+                # 编辑器保存时可能短暂不存在，下一轮再看
+                continue
+            if not forced and stamp == self._stamp:
+                continue
+            self._stamp = stamp
+            self.reload_now()
+
+    def reload_now(self) -> bool:
+        """Compile the file synchronously and stage it for poll()."""
+        try:
+            cfg = load_config(self.path, rule_filter=self.rule_filter)
+        except (OSError, ValueError) as e:
+            with self._lock:
+                self._error = str(e)
+            return False
+        with self._lock:
+            self._pending = cfg
+            self._error = None
+        return True
+
+    # -------- consumer (hot path) --------
+    def poll(self) -> Optional[Config]:
+        """Return a freshly compiled Config once, or None if nothing new."""
+        if self._pending is None:
+            return None
+        with self._lock:
+            cfg, self._pending = self._pending, None
+        return cfg
+
+    def poll_error(self) -> Optional[str]:
+        """Return the last reload error once, or None."""
+        if self._error is None:
+            return None
+        with self._lock:
+            err, self._error = self._error, None
+        return err
@@ -0,0 +1,283 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from .context import Span, iter_line_spans
+from .engine import _parse_syslog_ts
+from .index import LogIndex, _head_hash, load_index
+
+_PROBE_LINES = 256  # 探测点之后最多看这么多行找时间戳
+_SEEK_SLACK = 64 * 1024  # 二分到这个范围内就改成顺序读
+_COUNT_BLOCK = 1024 * 1024
+_TAIL_BLOCK = 1024 * 1024  # 从文件尾往回读的块大小
+
+
+def _line_start(f: BinaryIO, pos: int) -> int:
+    """Offset of the first line starting at or after `pos`."""
+    if pos <= 0:
+        return 0
+    f.seek(pos - 1)
+    f.readline()
+    return f.tell()
+
+
+def _probe(f: BinaryIO, pos: int) -> Optional[float]:
+    """Timestamp of the first timestamped line at or after `pos` (None if none nearby)."""
+    f.seek(_line_start(f, pos))
+    for _ in range(_PROBE_LINES):
+        raw = f.readline()
+        if not raw:
+            return None
+        ts = _parse_syslog_ts(raw[:32].decode("utf-8", errors="replace"))
+        if ts is not None:
+            return ts
+    return None
+
+
+def count_lines(f: BinaryIO, end: int, *, start: int = 0) -> int:
+    """Newlines in [start, end): line numbers for a seek without an index (counted, not parsed)."""
+    f.seek(start)
+    n = 0
+    left = end - start
+    while left > 0:
+        block = f.read(min(_COUNT_BLOCK, left))
+        if not block:
+            break
+        n += block.count(b"\n")
+        left -= len(block)
+    return n
+
+
+def log_time(ts: float) -> float:
+    """
+    A --since/--until bound on the clock of _parse_syslog_ts, which dates
+    every (year-less) syslog line in the current year: same month, day and
+    time, current year. So '2025-12-24 03:00' finds 'Dec 24 03:00:00'
+    whichever year it is run in; a window cannot span New Year.
+    """
+    dt = datetime.fromtimestamp(ts)
+    year = datetime.now().year
+    if dt.year == year:
+        return ts
+    try:
+        return dt.replace(year=year).timestamp()
+    except ValueError:  # 2 月 29 日
+        return dt.replace(year=year, day=28).timestamp()
+
+
+def seek_time(f: BinaryIO, size: int, ts: float) -> int:
+    """
+    Offset of a line start at or before the first line with a syslog
+    timestamp >= ts, by binary search over byte offsets probing the
+    nearest timestamp. Assumes timestamps grow through the file.
+    """
+    lo, hi = 0, size
+    while hi - lo > _SEEK_SLACK:
+        mid = (lo + hi) // 2
+        probe = _probe(f, mid)
+        if probe is not None and probe < ts:
+            lo = mid
+        else:
+            hi = mid  # 没找到时间戳也往前收：起点靠前只会多读，不会漏
+    return _line_start(f, lo)
+
+
+class TimeRangeReader:
+    """
+    Lines logged in [since, until) as (line_no, line, span), like
+    context.iter_line_spans() over the whole file but starting from a
+    seek (the index when there is one, else a binary search). Lines before
+    the first timestamp >= since are skipped; reading stops at the first
+    timestamp >= until. Untimed lines (call traces) stay with the
+    timestamped line before them.
+
+    Line numbers are absolute when reading from the start or when an index
+    of the file (even an older one of the same, only appended-to file) can
+    resolve them; otherwise `absolute` is False and they count from the
+    first line of the range (1), since numbering the lines before the seek
+    would mean reading them all.
+    """
+    def __init__(
+        self,
+        path: str,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        *,
+        use_index: bool = True,
+    ) -> None:
+        self.path = path
+        self.since = log_time(since) if since is not None else None
+        self.until = log_time(until) if until is not None else None
+        self.offset = 0
+        self.line_base: Optional[int] = 0
+        with open(path, "rb") as f:
+            if self.since is not None:
+                size = f.seek(0, 2)
+                idx = load_index(path) if use_index else None
+                if idx is not None:
+                    self.offset, self.line_base = idx.seek_time(self.since)
+                else:
+                    self.offset = seek_time(f, size, self.since)
+                    stale = load_index(path, stale=True) if use_index else None
+                    self.line_base = _index_line_base(f, stale, self.offset, size)
+        self.absolute = self.line_base is not None
+
+    def __iter__(self) -> Iterator[Tuple[int, str, Span]]:
+        with open(self.path, "rb") as f:
+            items = _iter_window(f, self.offset, self.line_base or 0, self.since, self.until)
+            if self.absolute:
+                yield from items
+                return
+            shift = None
+            for line_no, text, span in items:
+                if shift is None:
+                    shift = line_no - 1  # 二分停在窗口前一点：从窗口第一行开始数
+                yield line_no - shift, text, span
+
+
+def iter_time_range(
+    path: str,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    *,
+    use_index: bool = True,
+) -> Iterator[Tuple[int, str, Span]]:
+    """Iterate a TimeRangeReader (when the line numbers do not matter)."""
+    return iter(TimeRangeReader(path, since, until, use_index=use_index))
+
+
+def _iter_window(
+    f: BinaryIO, offset: int, before: int, since: Optional[float], until: Optional[float]
+) -> Iterator[Tuple[int, str, Span]]:
+    f.seek(offset)
+    started = since is None
+    parse = _TsCache()
+    for line_no, text, span in iter_line_spans(f, offset=offset, line_no=before):
+        if not started:
+            ts = parse(text)
+            if ts is None or ts < since:
+                continue
+            started = True
+        elif until is not None:
+            ts = parse(text)
+        else:
+            yield line_no, text, span
+            continue
+        if until is not None and ts is not None and ts >= until:
+            return
+        yield line_no, text, span
+
+
+class _TsCache:
+    """_parse_syslog_ts with the last second cached: consecutive lines mostly share it."""
+    __slots__ = ("prefix", "ts")
+
+    def __init__(self) -> None:
+        self.prefix = ""
+        self.ts: Optional[float] = None
+
+    def __call__(self, text: str) -> Optional[float]:
+        prefix = text[:15]
+        if prefix != self.prefix:
+            self.prefix = prefix
+            self.ts = _parse_syslog_ts(prefix)
+        return self.ts
+
+
+def tail_start_time(f: BinaryIO, size: int, seconds: float) -> Tuple[int, Optional[float]]:
+    """
+    Read backward from EOF in large blocks: (offset of the first line after
+    the last line logged before `last timestamp - seconds`, that cutoff).
+    (0, None) when the file has no timestamps at all.
+    """
+    pos = size
+    carry = b""  # 块开头被截断的半行，拼到前一块的末尾
+    cutoff: Optional[float] = None
+    while pos > 0:
+        block_start = max(0, pos - _TAIL_BLOCK)
+        f.seek(block_start)
+        data = f.read(pos - block_start) + carry
+        parts = data.split(b"\n")
+        if block_start > 0:
+            carry = parts[0]
+            off = block_start + len(carry) + 1
+            parts = parts[1:]
+        else:
+            carry = b""
+            off = 0
+        starts = []
+        for part in parts:
+            starts.append(off)
+            off += len(part) + 1
+        for part, start in zip(reversed(parts), reversed(starts)):
+            ts = _parse_syslog_ts(part[:32].decode("utf-8", errors="replace"))
+            if ts is None:
+                continue
+            if cutoff is None:
+                cutoff = ts - seconds
+            elif ts < cutoff:
+                return min(start + len(part) + 1, size), cutoff
+        pos = block_start
+    return 0, cutoff
+
+
+def _index_line_base(f: BinaryIO, idx: Optional[LogIndex], offset: int, size: int) -> Optional[int]:
+    """Lines before `offset` from an index of this file (possibly older, if only appended to)."""
+    if idx is None or idx.end_offset > size or _head_hash(f, idx.end_offset) != idx.head:
+        return None
+    if offset <= idx.end_offset:
+        base_off, before = idx.locate_offset(offset)
+    else:
+        base_off, before = idx.end_offset, idx.lines  # 索引之后追加的部分数换行符补上
+    return before + count_lines(f, offset, start=base_off)
+
+
+class TailReader:
+    """
+    Lines at the end of a file: the last `seconds` of log time (relative to
+    the last timestamp in the file) or the last `nbytes`, found by reading
+    backward from EOF, then yielded forward as (line_no, line, span).
+
+    Line numbers are absolute when an index of the file (even an older one
+    of the same, only appended-to file) can resolve them; otherwise
+    `absolute` is False and they count from the start of the tail, use
+    relative() to turn them into -1 = last line. The tail is fixed when the
+    reader is created (lines appended later are not read), so relative()
+    works while streaming.
+    """
+    def __init__(
+        self,
+        path: str,
+        *,
+        seconds: Optional[float] = None,
+        nbytes: Optional[int] = None,
+        use_index: bool = True,
+    ) -> None:
+        if (seconds is None) == (nbytes is None):
+            raise ValueError("exactly one of --last / --tail-bytes is required")
+        self.path = path
+        self.cutoff: Optional[float] = None
+        with open(path, "rb") as f:
+            size = self.end = f.seek(0, 2)
+            if seconds is not None:
+                self.offset, self.cutoff = tail_start_time(f, size, seconds)
+            else:
+                self.offset = _line_start(f, max(0, size - nbytes))
+            idx = load_index(path, stale=True) if use_index else None
+            self.line_base = _index_line_base(f, idx, self.offset, size)
+            # 尾部的行数只数换行符（尾部本来就要读一遍，开销很小）
+            self.tail_lines = count_lines(f, size, start=self.offset)
+            if size > self.offset:
+                f.seek(size - 1)
+                self.tail_lines += f.read(1) != b"\n"
+        self.absolute = self.line_base is not None
+
+    def __iter__(self) -> Iterator[Tuple[int, str, Span]]:
+        with open(self.path, "rb") as f:
+            for item in _iter_window(f, self.offset, self.line_base or 0, self.cutoff, None):
+                if item[2][0] >= self.end:
+                    return
+                yield item
+
+    def relative(self, line_no: int) -> int:
+        return line_no - (self.line_base or 0) - self.tail_lines - 1
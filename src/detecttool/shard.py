@@ -0,0 +1,453 @@
+from __future__ import annotations
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+import hashlib
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from .config import Rule, build_prefilter
+from .engine import Detector, Incident
+
+_STATS_SECONDS = 1.0
+_HEARTBEAT_SECONDS = 0.2
+_MAX_BACKOFF = 30.0
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring with `replicas` virtual points per node: removing
+    a node moves only its keys to the neighbouring nodes, adding it back
+    moves exactly those keys back.
+    """
+    def __init__(self, nodes=(), *, replicas: int = 100) -> None:
+        self.replicas = replicas
+        self._points: List[Tuple[int, int]] = []  # (哈希值, 节点) 有序
+        self.nodes: set = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: int) -> None:
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            insort(self._points, (_hash(f"worker-{node}#{i}"), node))
+
+    def remove(self, node: int) -> None:
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self._points = [p for p in self._points if p[1] != node]
+
+    def node_for(self, key: str) -> Optional[int]:
+        if not self._points:
+            return None
+        i = bisect_right(self._points, (_hash(key), -1))
+        return self._points[i % len(self._points)][1]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+def _worker_main(slot: int, rules: List[Rule], prefilter: Optional[Pattern[str]], options: Dict[str, Any],
+                 inbox, outbox) -> None:
+    """
+    Worker process: per-host detection for the hosts hashed to this slot.
+    Inbox messages: ("lines", [(host, line), ...], [host to forget after them, ...]),
+    ("rules", rules, prefilter), ("forget", [host, ...]), ("stop",). Results go to the outbox as
+    ("incidents", [...]), ("stats", {...}), ("stopped", {...}).
+    """
+    from .hosts import HostDetectors
+
+    # Ctrl+C / systemctl stop 由父进程处理：它把队列里剩下的批次发完再让 worker 停下
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    parent = os.getppid()
+    hosts = HostDetectors(rules, prefilter=prefilter, **options)
+    next_beat = time.monotonic() + _HEARTBEAT_SECONDS
+    next_stats = time.monotonic() + _STATS_SECONDS
+    while True:
+        try:
+            msg = inbox.get(timeout=_HEARTBEAT_SECONDS)
+        except queue.Empty:
+            msg = None
+            if os.getppid() != parent:
+                return  # 父进程没了
+        out: List[Incident] = []
+        if msg is not None:
+            kind = msg[0]
+            if kind == "lines":
+                process = hosts.process
+                for host, line in msg[1]:
+                    found = process(host, line)
+                    if found:
+                        out.extend(found)
+                if msg[2]:
+                    out.extend(hosts.forget(msg[2]))
+            elif kind == "rules":
+                hosts.swap_rules(msg[1], prefilter=msg[2])
+            elif kind == "forget":
+                out = hosts.forget(msg[1])
+            elif kind == "stop":
+                outbox.put(("incidents", hosts.flush()))
+                outbox.put(("stopped", hosts.stats()))
+                return
+        now = time.monotonic()
+        if now >= next_beat:
+            # 队列一直不空时也要按时关闭空闲主机的多行块
+            next_beat = now + _HEARTBEAT_SECONDS
+            out.extend(hosts.heartbeat())
+        if out:
+            outbox.put(("incidents", out))
+        if now >= next_stats:
+            next_stats = now + _STATS_SECONDS
+            outbox.put(("stats", hosts.stats()))
+
+
+class _Worker:
+    __slots__ = ("slot", "proc", "inbox", "outbox", "batch", "forget", "batch_since", "batches", "messages",
+                 "max_depth", "queue_full", "dropped", "restarts", "failures", "restart_at", "started_at", "hosts")
+
+    def __init__(self, slot: int) -> None:
+        self.slot = slot
+        self.proc = None
+        self.inbox = None
+        self.outbox = None  # 每个 worker 一个：被 kill 的 worker 不会卡住别人的结果队列
+        self.batch: List[Tuple[str, str]] = []
+        self.forget: Dict[str, None] = {}  # 被淘汰出路由表的主机，随下一批通知 worker 忘掉
+        self.batch_since = 0.0
+        self.batches = 0
+        self.messages = 0
+        self.max_depth = 0
+        self.queue_full = 0  # 发送时队列已满的次数
+        self.dropped = 0  # 队列满而丢弃的消息
+        self.restarts = 0
+        self.failures = 0  # 连续异常退出次数，决定重启退避
+        self.restart_at = 0.0
+        self.started_at = 0.0
+        self.hosts: Dict[str, int] = {}  # worker 上报的 HostDetectors.stats()
+
+    def depth(self) -> int:
+        try:
+            return self.inbox.qsize() if self.inbox is not None else 0
+        except NotImplementedError:  # macOS 没有 sem_getvalue
+            return -1
+
+
+class ShardedDetectors:
+    """
+    HostDetectors spread over `workers` processes. Each host is owned by
+    exactly one worker (consistent hash of the hostname), so its multi-line
+    blocks and cooldowns live in one place. Lines are sent in batches of up
+    to `batch_size` (or after `flush_interval` seconds) over a bounded
+    queue per worker (`queue_size` batches). Sending never blocks the
+    receiver's event loop: a batch that finds the queue full is dropped
+    and counted (only control messages and the final flush wait).
+
+    A worker that dies is taken off the ring: its hosts move to the other
+    workers until it has been restarted (with backoff), then move back; the
+    worker that held them meanwhile flushes and forgets them. Same
+    interface as HostDetectors; incidents come back asynchronously, so
+    process()/heartbeat() return whatever has arrived.
+    """
+    def __init__(
+        self,
+        rules: List[Rule],
+        *,
+        prefilter: Optional[Pattern[str]] = None,
+        workers: int = 2,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        queue_size: int = 64,
+        before_lines: int = 0,
+        before_bytes: int = 64 * 1024,
+        max_hosts: int = 10000,
+        start_method: str = "spawn",
+    ) -> None:
+        if workers < 1:
+            raise ValueError(f"workers must be >= 1, got {workers}")
+        self.rules = rules
+        self.prefilter = prefilter if prefilter is not None else build_prefilter(rules)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.max_hosts = max_hosts
+        self.options = {"before_lines": before_lines, "before_bytes": before_bytes, "max_hosts": max_hosts}
+        self._ctx = multiprocessing.get_context(start_method)
+        self._workers = [_Worker(i) for i in range(workers)]
+        self.ring = HashRing()
+        # 主机 -> 当前所属 worker，按最近出现排序；重新分配时据此通知旧 worker 忘掉哪些主机
+        self._owner: "OrderedDict[str, int]" = OrderedDict()
+        self._pending: List[Incident] = []
+        self.messages = 0
+        self.dropped = 0
+        self.moved_hosts = 0
+        self._stopping = False
+
+    # -------- lifecycle --------
+    def start(self) -> "ShardedDetectors":
+        for w in self._workers:
+            self._spawn(w)
+        return self
+
+    def _spawn(self, w: _Worker) -> None:
+        w.inbox = self._ctx.Queue(maxsize=self.queue_size)
+        w.outbox = self._ctx.Queue()
+        w.proc = self._ctx.Process(
+            target=_worker_main,
+            args=(w.slot, self.rules, self.prefilter, self.options, w.inbox, w.outbox),
+            name=f"detecttool-worker-{w.slot}",
+            daemon=True,
+        )
+        w.proc.start()
+        w.started_at = time.monotonic()
+        self.ring.add(w.slot)
+        self._rebalance()
+
+    def close(self) -> None:
+        """Kill whatever is still running (after flush(), or on error)."""
+        for w in self._workers:
+            if w.proc is not None and w.proc.is_alive():
+                w.proc.kill()  # worker 忽略 SIGTERM（留给 flush 收尾），这里只能 SIGKILL
+                w.proc.join(timeout=1.0)
+            for q in (w.inbox, w.outbox):
+                if q is not None:
+                    q.cancel_join_thread()
+
+    # -------- routing --------
+    def _route(self, host: str) -> Optional[_Worker]:
+        """Owner of `host`; None while no worker is running."""
+        owner = self._owner
+        slot = owner.get(host)
+        if slot is not None:
+            owner.move_to_end(host)
+            return self._workers[slot]
+        slot = self.ring.node_for(host)
+        if slot is None:
+            return None
+        if len(owner) >= self.max_hosts * len(self._workers):
+            # 最久没出现的主机出表时它的 worker 也要忘掉它：以后再换主人就不会留下过期状态
+            old, old_slot = owner.popitem(last=False)
+            self._workers[old_slot].forget[old] = None
+        w = self._workers[slot]
+        w.forget.pop(host, None)
+        owner[host] = slot
+        return w
+
+    def process(self, host: str, line: str) -> List[Incident]:
+        self.messages += 1
+        w = self._route(host)
+        if w is None:
+            self.dropped += 1  # 所有 worker 都在等重启
+            return self._drain()
+        if not w.batch:
+            w.batch_since = time.monotonic()
+        w.batch.append((host, line))
+        if len(w.batch) >= self.batch_size:
+            self._send(w)
+            return self._drain()
+        return []
+
+    def _send(self, w: _Worker, item: Optional[tuple] = None, *, block: bool = False) -> bool:
+        """
+        Send the pending batch (or, with block=True, wait to send a control
+        message or the last batch). An unblocked batch that finds the queue
+        full is dropped and counted: this runs on the receiver's event loop.
+        False if the worker died meanwhile or the batch was dropped.
+        """
+        lines: List[Tuple[str, str]] = []
+        forget: List[str] = []
+        if item is None:
+            if not w.batch and not w.forget:
+                return True
+            lines, w.batch = w.batch, []
+            forget, w.forget = list(w.forget), {}
+            item = ("lines", lines, forget)
+        while True:
+            try:
+                if block:
+                    w.inbox.put(item, timeout=0.5)
+                else:
+                    w.inbox.put_nowait(item)
+                break
+            except queue.Full:
+                w.queue_full += 1
+                if not w.proc.is_alive():
+                    self._worker_died(w)
+                    for host, line in lines:  # 交给接手的 worker
+                        self.process(host, line)
+                    return False
+                if not block:
+                    w.dropped += len(lines)
+                    self.dropped += len(lines)
+                    for host in forget:
+                        w.forget[host] = None  # 随下一批再通知
+                    return False
+                self._pending.extend(self._drain())
+        if lines:
+            w.batches += 1
+            w.messages += len(lines)
+        depth = w.depth()
+        if depth > w.max_depth:
+            w.max_depth = depth
+        return True
+
+    def _drain(self) -> List[Incident]:
+        out, self._pending = self._pending, []
+        for w in self._workers:
+            if w.outbox is not None:
+                self._receive(w, out)
+        return out
+
+    @staticmethod
+    def _receive(w: _Worker, out: List[Incident], timeout: Optional[float] = None) -> bool:
+        """Take what `w` has sent so far; True once it reported "stopped"."""
+        stopped = False
+        while True:
+            try:
+                if timeout is None:
+                    kind, payload = w.outbox.get_nowait()
+                else:
+                    kind, payload = w.outbox.get(timeout=timeout)
+                    timeout = None
+            except queue.Empty:
+                return stopped
+            if kind == "incidents":
+                out.extend(payload)
+            else:
+                w.hosts = payload
+                stopped = stopped or kind == "stopped"
+
+    # -------- rebalancing --------
+    def _rebalance(self) -> None:
+        """Re-hash known hosts after a ring change; old owners flush and forget the hosts they lost."""
+        if not self._owner or not len(self.ring):
+            return
+        for w in self._workers:
+            if w.proc is not None and w.batch:
+                self._send(w, block=True)  # 先发出旧主人的积压，保证它按顺序处理完再 forget
+        moved: Dict[int, List[str]] = {}
+        for host, old in self._owner.items():
+            new = self.ring.node_for(host)
+            if new != old:
+                moved.setdefault(old, []).append(host)
+                self._owner[host] = new
+        for slot, hosts in moved.items():
+            self.moved_hosts += len(hosts)
+            w = self._workers[slot]
+            if w.proc is not None and w.proc.is_alive():
+                self._send(w, ("forget", hosts), block=True)
+
+    def _worker_died(self, w: _Worker) -> None:
+        w.proc.join(timeout=0)
+        self._receive(w, self._pending)  # 死前已经送出的结果
+        w.inbox.cancel_join_thread()
+        w.outbox.cancel_join_thread()
+        w.restarts += 1
+        w.failures = w.failures + 1 if time.monotonic() - w.started_at < _MAX_BACKOFF else 1
+        w.restart_at = time.monotonic() + min(_MAX_BACKOFF, 0.5 * 2 ** (w.failures - 1))
+        lost, w.batch = w.batch, []
+        w.forget = {}  # 它的状态已经没了
+        w.proc = None
+        w.inbox = None
+        w.outbox = None
+        w.hosts = {}
+        self.ring.remove(w.slot)
+        if not len(self.ring):
+            # 全挂了：等重启，期间的消息只能丢弃；主机等有 worker 起来后重新分配
+            self._owner = OrderedDict((h, s) for h, s in self._owner.items() if s != w.slot)
+            self.dropped += len(lost)
+            return
+        self._rebalance()
+        for host, line in lost:
+            self.process(host, line)
+
+    def _check_workers(self) -> None:
+        if self._stopping:
+            return
+        now = time.monotonic()
+        for w in self._workers:
+            if w.proc is None:
+                if now >= w.restart_at:
+                    self._spawn(w)
+            elif not w.proc.is_alive():
+                self._worker_died(w)
+
+    def heartbeat(self) -> List[Incident]:
+        """Send batches that waited flush_interval, restart dead workers, collect results."""
+        self._check_workers()
+        now = time.monotonic()
+        for w in self._workers:
+            if (w.batch or w.forget) and w.proc is not None and now - w.batch_since >= self.flush_interval:
+                self._send(w)
+        return self._drain()
+
+    def flush(self, timeout: float = 10.0) -> List[Incident]:
+        """End of input: send everything, let every worker flush its open blocks and stop."""
+        self._stopping = True
+        running = []
+        for w in self._workers:
+            if w.proc is not None and w.proc.is_alive():
+                if self._send(w, block=True) and self._send(w, ("stop",), block=True):
+                    running.append(w)
+        out = self._drain()
+        waiting = list(running)
+        deadline = time.monotonic() + timeout
+        while waiting and time.monotonic() < deadline:
+            for w in list(waiting):
+                if self._receive(w, out, timeout=0.05):
+                    waiting.remove(w)
+                elif not w.proc.is_alive():
+                    self._receive(w, out)
+                    waiting.remove(w)
+        for w in running:
+            w.proc.join(timeout=1.0)
+        return out
+
+    def swap_rules(self, rules: List[Rule], *, prefilter: Optional[Pattern[str]] = None) -> Dict[str, List[str]]:
+        """Hot reload in every worker; restarted workers start with the new rules."""
+        prefilter = prefilter if prefilter is not None else build_prefilter(rules)
+        diff = Detector(self.rules, prefilter=self.prefilter).swap_rules(rules, prefilter=prefilter)
+        self.rules = rules
+        self.prefilter = prefilter
+        for w in self._workers:
+            if w.proc is not None:
+                self._send(w, block=True)
+                self._send(w, ("rules", rules, prefilter), block=True)
+        return diff
+
+    def stats(self) -> Dict[str, Any]:
+        workers = []
+        for w in self._workers:
+            workers.append({
+                "slot": w.slot,
+                "pid": w.proc.pid if w.proc is not None else None,
+                "alive": w.proc is not None and w.proc.is_alive(),
+                "queue_depth": w.depth(),
+                "queue_max_depth": w.max_depth,
+                "queue_capacity": self.queue_size,
+                "pending": len(w.batch),
+                "batches": w.batches,
+                "messages": w.messages,
+                "queue_full": w.queue_full,
+                "dropped": w.dropped,
+                "restarts": w.restarts,
+                "hosts": w.hosts.get("hosts", 0),
+                "open_blocks": w.hosts.get("open_blocks", 0),
+            })
+        return {
+            "hosts": sum(x["hosts"] for x in workers),
+            "messages": self.messages,
+            "dropped": self.dropped,
+            "moved_hosts": self.moved_hosts,
+            "restarts": sum(x["restarts"] for x in workers),
+            "workers": workers,
+        }
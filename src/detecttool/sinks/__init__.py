@@ -0,0 +1,70 @@
+"""
+Batched output sinks for incidents.
+
+Sink specs (as used by `monitor --sink`):
+    file:/var/log/detecttool/incidents.ndjson?max_bytes=50M&max_age=1d&backups=5&compress=1&summary=1
+    unix:/run/detecttool/incidents.sock
+    http://collector:8080/ingest        (https:// too)
+    sqlite:/var/lib/detecttool/incidents.db
+"""
+from __future__ import annotations
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from .base import BatchingSink
+from ..units import parse_duration, parse_size
+
+
+def open_sink(spec: str, *, source: Optional[str] = None, **kwargs: Any) -> BatchingSink:
+    """
+    Build and start a sink from a spec string. `kwargs` are the common
+    batching options (batch_size, flush_interval, queue_size, on_full...);
+    `source` (the monitored log) is recorded by sinks that store it.
+    """
+    scheme, sep, rest = spec.partition(":")
+    if not sep:
+        raise ValueError(f"Invalid sink spec {spec!r}: expected file:PATH, unix:PATH, sqlite:PATH or http(s)://URL")
+    scheme = scheme.lower()
+
+    if scheme == "file":
+        parts = urlsplit(rest)
+        path = parts.path if parts.query else rest
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        unknown = set(query) - {"max_bytes", "max_age", "backups", "compress", "summary"}
+        if unknown:
+            raise ValueError(f"Unknown file sink option(s): {', '.join(sorted(unknown))}")
+        from .file import NdjsonFileSink
+
+        sink: BatchingSink = NdjsonFileSink(
+            path,
+            max_bytes=parse_size(query["max_bytes"]) if "max_bytes" in query else 0,
+            max_age=parse_duration(query["max_age"]) if "max_age" in query else 0.0,
+            backup_count=int(query.get("backups", 5)),
+            compress=_flag(query, "compress"),
+            summary=_flag(query, "summary"),
+            **kwargs,
+        )
+    elif scheme == "unix":
+        from .unix_socket import UnixSocketSink
+
+        sink = UnixSocketSink(rest, **kwargs)
+    elif scheme in ("http", "https"):
+        from .http import HttpSink
+
+        sink = HttpSink(spec, **kwargs)
+    elif scheme == "sqlite":
+        from .sqlite import SqliteSink
+
+        sink = SqliteSink(rest, source=source, **kwargs)
+    else:
+        raise ValueError(f"Unknown sink type {scheme!r} in {spec!r}")
+    return sink.start()
+
+
+def _flag(query: dict, key: str) -> bool:
+    value = query.get(key, "0").lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"Invalid value for file sink option {key}: {value!r} (expected 1/0)")
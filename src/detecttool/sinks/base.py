@@ -0,0 +1,204 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+import json
+import queue
+import threading
+import time
+
+# 队列里的控制标记
+_STOP = object()
+_FLUSH = object()
+
+
+def _dumps(record: Any) -> str:
+    # Incident 自带免拷贝的序列化，其它记录（dict）走 json.dumps
+    to_json = getattr(record, "to_json", None)
+    if to_json is not None:
+        return to_json()
+    return json.dumps(record, ensure_ascii=False)
+
+
+def encode_ndjson(records: List[Any]) -> bytes:
+    return "".join(_dumps(r) + "\n" for r in records).encode("utf-8")
+
+
+class BatchingSink(ABC):
+    """
+    Base class for buffered incident writers.
+
+    Records go into a bounded queue and a background thread writes them in
+    batches of up to `batch_size`, at most `flush_interval` seconds after the
+    first record of a batch arrived. When the queue is full, `on_full`
+    decides what happens:
+      - "drop":  the record is discarded and counted in `dropped`
+      - "block": the producer waits (up to `block_timeout` seconds, None =
+                 forever) and the record is dropped only if that times out
+    A batch whose write still fails after `retries` attempts is dropped and
+    counted in `errors`/`dropped`. Subclasses implement `_write(records)`.
+    """
+    name = "sink"
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        queue_size: int = 10000,
+        on_full: str = "drop",
+        block_timeout: Optional[float] = None,
+        retries: int = 2,
+        retry_backoff: float = 0.2,
+    ) -> None:
+        if on_full not in ("drop", "block"):
+            raise ValueError(f"on_full must be 'drop' or 'block', got {on_full!r}")
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.on_full = on_full
+        self.block_timeout = block_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.last_error: Optional[str] = None
+        self.counters: Dict[str, int] = {
+            "accepted": 0,
+            "written": 0,
+            "dropped": 0,
+            "blocked": 0,
+            "batches": 0,
+            "errors": 0,
+        }
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[key] += n
+
+    # -------- producer side --------
+    def start(self) -> "BatchingSink":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"detecttool-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def emit(self, record: Any) -> bool:
+        """Queue one record (an Incident or a plain dict). Returns False if it was dropped."""
+        if self._closed:
+            self._count("dropped")
+            return False
+        try:
+            self._q.put_nowait(record)
+        except queue.Full:
+            if self.on_full == "drop":
+                self._count("dropped")
+                return False
+            self._count("blocked")
+            try:
+                self._q.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                self._count("dropped")
+                return False
+        self._count("accepted")
+        return True
+
+    def flush(self) -> None:
+        """Write everything queued so far and wait for it."""
+        if self._thread is None or self._closed:
+            return
+        self._q.put(_FLUSH)
+        self._q.join()
+
+    def close(self) -> None:
+        """Drain the queue, stop the writer thread and release resources."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._q.put(_STOP)
+            self._thread.join()  # 写线程退出前自己调用 _close()
+        else:
+            self._close()
+
+    def __enter__(self) -> "BatchingSink":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self.counters)
+        out["queue_depth"] = self._q.qsize()
+        out["queue_size"] = self._q.maxsize
+        if self.last_error:
+            out["last_error"] = self.last_error
+        return out
+
+    # -------- writer thread --------
+    def _run(self) -> None:
+        try:
+            self._drain()
+        finally:
+            # 资源（文件、套接字、sqlite 连接）在写线程里创建，也在写线程里释放
+            self._close()
+
+    def _drain(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._q.get()
+            if item is _STOP:
+                self._q.task_done()
+                break
+            if item is _FLUSH:
+                self._q.task_done()
+                continue
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stopping = True
+                    self._q.task_done()
+                    break
+                if nxt is _FLUSH:
+                    self._q.task_done()
+                    break
+                batch.append(nxt)
+
+            self._write_batch(batch)
+            for _ in batch:
+                self._q.task_done()
+
+    def _write_batch(self, batch: List[Any]) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                self._write(batch)
+            except Exception as e:  # 写失败不能拖垮检测主流程
+                self.last_error = f"{type(e).__name__}: {e}"
+                if attempt < self.retries:
+                    time.sleep(self.retry_backoff * (attempt + 1))
+                    continue
+                self._count("errors")
+                self._count("dropped", len(batch))
+                return
+            self._count("written", len(batch))
+            self._count("batches")
+            return
+
+    # -------- subclass hooks --------
+    @abstractmethod
+    def _write(self, records: List[Any]) -> None:
+        """Write one batch; raising counts as a failed attempt (retried). Runs on the writer thread."""
+
+    def _close(self) -> None:
+        """Release resources; runs on the writer thread."""
@@ -0,0 +1,321 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import gzip
+import json
+import os
+import shutil
+import time
+
+from .base import BatchingSink, encode_ndjson
+
+SUMMARY_SUFFIX = ".summary.json"
+SUMMARY_VERSION = 1
+_COUNTERS = ("by_type", "by_severity", "by_rule")
+
+
+def summary_path(path: str) -> str:
+    return path + SUMMARY_SUFFIX
+
+
+def _field(record: Any, name: str) -> Any:
+    if isinstance(record, dict):
+        return record.get(name)
+    return getattr(record, name, None)
+
+
+def _new_segment(name: str) -> Dict[str, Any]:
+    return {
+        "file": name,
+        "count": 0,
+        "bytes": 0,  # 未压缩的 NDJSON 字节数
+        "by_type": {},
+        "by_severity": {},
+        "by_rule": {},
+        "first_written": None,
+        "last_written": None,
+        "first_log_ts": None,
+        "last_log_ts": None,
+    }
+
+
+def _observe(seg: Dict[str, Any], record: Any, written: Optional[float]) -> None:
+    from ..engine import _parse_syslog_ts
+
+    seg["count"] += 1
+    for key, field in zip(_COUNTERS, ("type", "severity", "rule_id")):
+        value = _field(record, field)
+        if value is not None:
+            seg[key][value] = seg[key].get(value, 0) + 1
+    if written is not None:
+        if seg["first_written"] is None:
+            seg["first_written"] = written
+        seg["last_written"] = written
+    message = _field(record, "message")
+    ts = _parse_syslog_ts(message) if isinstance(message, str) else None
+    if ts is not None:
+        if seg["first_log_ts"] is None or ts < seg["first_log_ts"]:
+            seg["first_log_ts"] = ts
+        if seg["last_log_ts"] is None or ts > seg["last_log_ts"]:
+            seg["last_log_ts"] = ts
+
+
+def _merge(into: Dict[str, Any], seg: Dict[str, Any]) -> None:
+    into["count"] += seg["count"]
+    into["bytes"] += seg["bytes"]
+    for key in _COUNTERS:
+        for k, v in seg[key].items():
+            into[key][k] = into[key].get(k, 0) + v
+    for key, pick in (("first_written", min), ("first_log_ts", min), ("last_written", max), ("last_log_ts", max)):
+        if seg[key] is not None:
+            into[key] = seg[key] if into[key] is None else pick(into[key], seg[key])
+
+
+def summarize_segment(path: str) -> Dict[str, Any]:
+    """Rebuild one segment's summary by reading it (plain or .gz NDJSON)."""
+    seg = _new_segment(os.path.basename(path))
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for raw in f:
+            seg["bytes"] += len(raw)
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                continue  # 写到一半被截断的行
+            _observe(seg, record, None)
+    seg["last_written"] = os.path.getmtime(path)
+    return seg
+
+
+def load_summary(path: str) -> Optional[Dict[str, Any]]:
+    """The summary sidecar of an incidents log (None if missing or unreadable)."""
+    try:
+        with open(summary_path(path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != SUMMARY_VERSION:
+        return None
+    return data
+
+
+def summary_totals(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Counts and time range over every segment, including expired ones."""
+    total = _new_segment("*")
+    for seg in summary["segments"]:
+        _merge(total, seg)
+    _merge(total, summary["expired"])
+    del total["file"]
+    total["segments"] = len(summary["segments"])
+    return total
+
+
+class NdjsonFileSink(BatchingSink):
+    """
+    Append incidents as NDJSON to a file, rotating by size and/or age.
+    Rotated files are named path.1 (newest) ... path.N (oldest), like logrotate.
+
+    compress=True gzips rotated files (path.1.gz ...). summary=True keeps
+    path.summary.json next to the log: per segment counts by type/severity/
+    rule and first/last time, plus totals of segments already deleted, so
+    aggregate questions don't need to read the segments. The sidecar is
+    rewritten at most every `summary_interval` seconds (and on rotation and
+    close); failing to write it never fails or repeats a batch.
+    """
+    name = "file"
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_bytes: int = 0,
+        max_age: float = 0.0,
+        backup_count: int = 5,
+        compress: bool = False,
+        summary: bool = False,
+        summary_interval: float = 5.0,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.compress = compress
+        self.rotations = 0
+
+        self._f = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._summary: Optional[Dict[str, Any]] = None
+        self._want_summary = summary
+        self.summary_interval = summary_interval
+        self.summary_errors = 0
+        self._summary_saved_at = 0.0
+        self._summary_dirty = False
+
+    def _open(self) -> None:
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._f = open(self.path, "ab")
+        self._size = self._f.tell()
+        self._opened_at = time.time()
+        if self._want_summary and self._summary is None:
+            self._summary = self._reconcile_summary()
+
+    def _should_rotate(self, incoming: int) -> bool:
+        if self._size == 0:
+            return False
+        if self.max_bytes and self._size + incoming > self.max_bytes:
+            return True
+        if self.max_age and (time.time() - self._opened_at) >= self.max_age:
+            return True
+        return False
+
+    def _rotated_name(self, i: int) -> str:
+        return f"{self.path}.{i}"
+
+    def _existing(self, i: int) -> Optional[str]:
+        for name in (self._rotated_name(i), self._rotated_name(i) + ".gz"):
+            if os.path.exists(name):
+                return name
+        return None
+
+    def rotate(self) -> Optional[str]:
+        """Close the current file and shift backups. Returns the new path.1 (None if no backups kept)."""
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            self.rotations += 1
+            self._rotate_summary(None)
+            return None
+        oldest = self._existing(self.backup_count)
+        if oldest is not None:
+            os.remove(oldest)
+        for i in range(self.backup_count - 1, 0, -1):
+            src = self._existing(i)
+            if src is not None:
+                os.replace(src, self._rotated_name(i + 1) + (".gz" if src.endswith(".gz") else ""))
+        dst = self._rotated_name(1)
+        if os.path.exists(self.path):
+            os.replace(self.path, dst)
+            if self.compress:
+                dst = _gzip_file(dst)
+        self.rotations += 1
+        self._rotate_summary(dst)
+        return dst
+
+    def _write(self, records: List[Any]) -> None:
+        data = encode_ndjson(records)
+        if self._f is None:
+            self._open()
+        if self._should_rotate(len(data)):
+            self.rotate()
+            self._open()
+        self._f.write(data)
+        self._f.flush()
+        self._size += len(data)
+        if self._summary is not None:
+            # 数据已经落盘：摘要出错只记录，不能让重试把这批再写一遍
+            try:
+                seg = self._summary["segments"][0]
+                now = time.time()
+                for r in records:
+                    _observe(seg, r, now)
+                seg["bytes"] = self._size
+            except Exception as e:
+                self._summary_failed(e)
+            self._save_summary(force=False)
+
+    def _close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if self._summary_dirty:
+            self._save_summary()
+
+    # -------- summary sidecar --------
+    def _reconcile_summary(self) -> Dict[str, Any]:
+        """Load the sidecar; segments it does not describe (or describes wrongly) are re-read once."""
+        old = load_summary(self.path)
+        known = {seg["file"]: seg for seg in old["segments"]} if old else {}
+        base = os.path.basename(self.path)
+        segments = []
+        current = known.get(base)
+        if current is None or current["bytes"] != self._size:
+            current = summarize_segment(self.path)
+        segments.append(current)
+        for i in range(1, self.backup_count + 1):
+            name = self._existing(i)
+            if name is None:
+                break
+            seg = known.get(os.path.basename(name))
+            segments.append(seg if seg is not None else summarize_segment(name))
+        expired = old["expired"] if old else _new_segment("expired")
+        summary = {"version": SUMMARY_VERSION, "path": base, "segments": segments, "expired": expired}
+        self._summary = summary
+        self._save_summary()
+        return summary
+
+    def _rotate_summary(self, dst: Optional[str]) -> None:
+        summary = self._summary
+        if summary is None:
+            return
+        segments = summary["segments"]
+        if dst is None:
+            dropped = segments
+            segments = []
+        else:
+            segments[0]["file"] = os.path.basename(dst)
+            segments[0]["stored_bytes"] = os.path.getsize(dst)
+            # 依次后移一位：.1 -> .2 ...，超出 backup_count 的并入 expired
+            for i, seg in enumerate(segments[1:], start=2):
+                seg["file"] = f"{os.path.basename(self.path)}.{i}" + (".gz" if seg["file"].endswith(".gz") else "")
+            dropped = segments[self.backup_count:]
+            segments = segments[:self.backup_count]
+        for seg in dropped:
+            _merge(summary["expired"], seg)
+        summary["segments"] = [_new_segment(os.path.basename(self.path))] + segments
+        self._save_summary()
+
+    def _save_summary(self, *, force: bool = True) -> None:
+        """Rewrite the sidecar (unforced: at most every summary_interval seconds). Never raises."""
+        now = time.monotonic()
+        if not force and now - self._summary_saved_at < self.summary_interval:
+            self._summary_dirty = True
+            return
+        self._summary_saved_at = now
+        path = summary_path(self.path)
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._summary, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except Exception as e:  # 磁盘满、目录只读等：下次再写
+            self._summary_failed(e)
+            self._summary_dirty = True
+            return
+        self._summary_dirty = False
+
+    def _summary_failed(self, e: Exception) -> None:
+        self.summary_errors += 1
+        self.last_error = f"summary: {type(e).__name__}: {e}"
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        out["rotations"] = self.rotations
+        if self._want_summary:
+            out["summary_errors"] = self.summary_errors
+        return out
+
+
+def _gzip_file(path: str) -> str:
+    dst = path + ".gz"
+    tmp = dst + ".tmp"
+    with open(path, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as out:
+        shutil.copyfileobj(src, out, 1024 * 1024)
+    os.replace(tmp, dst)
+    os.remove(path)
+    return dst
@@ -0,0 +1,35 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import urllib.request
+
+from .base import BatchingSink, encode_ndjson
+
+
+class HttpSink(BatchingSink):
+    """
+    POST each batch as one NDJSON body (Content-Type: application/x-ndjson)
+    to a collector URL. Any non-2xx response counts as a failed write.
+    """
+    name = "http"
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        timeout: float = 5.0,
+        headers: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/x-ndjson"}
+        self.headers.update(headers or {})
+
+    def _write(self, records: List[Any]) -> None:
+        req = urllib.request.Request(self.url, data=encode_ndjson(records), headers=self.headers, method="POST")
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            status = getattr(resp, "status", 200)
+            if not 200 <= status < 300:
+                raise OSError(f"collector returned HTTP {status}")
+            resp.read()
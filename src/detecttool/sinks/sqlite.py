@@ -0,0 +1,34 @@
+from __future__ import annotations
+from typing import Any, List, Optional
+import os
+
+from .base import BatchingSink
+from .. import store
+
+
+class SqliteSink(BatchingSink):
+    """
+    Store incidents in an indexed SQLite database (WAL mode), one
+    transaction per batch. Query it with `detecttool query --db PATH`.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str, *, source: Optional[str] = None, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.source = source
+        self._conn = None
+
+    def _write(self, records: List[Any]) -> None:
+        # sqlite3 连接只能在创建它的线程里用，所以在写线程里懒打开
+        if self._conn is None:
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self._conn = store.connect(self.path)
+        store.insert_many(self._conn, records, source=self.source)
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
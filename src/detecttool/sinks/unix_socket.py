@@ -0,0 +1,46 @@
+from __future__ import annotations
+from typing import Any, List
+import socket
+
+from .base import BatchingSink, encode_ndjson
+
+
+class UnixSocketSink(BatchingSink):
+    """
+    Stream NDJSON incidents to a Unix domain socket (SOCK_STREAM).
+    Connects lazily and reconnects on the next batch after an error.
+    """
+    name = "unix"
+
+    def __init__(self, path: str, *, connect_timeout: float = 2.0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self._sock = None
+
+    def _connect(self) -> socket.socket:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(self.connect_timeout)
+        try:
+            s.connect(self.path)
+        except OSError:
+            s.close()
+            raise
+        return s
+
+    def _write(self, records: List[Any]) -> None:
+        if self._sock is None:
+            self._sock = self._connect()
+        try:
+            self._sock.sendall(encode_ndjson(records))
+        except OSError:
+            self._close()
+            raise
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Iterator, Tuple
+from typing import Any, Dict, Iterator, Optional, Tuple
 import os
 import time
 
@@ -10,6 +10,7 @@ def follow_file(
     start_at_end: bool = True,
     poll_interval: float = 0.2,
     yield_heartbeat: bool = False,
+    position: Optional[Dict[str, Any]] = None,
 ) -> Iterator[Tuple[int, str]]:
     """
     Follow a text file like `tail -f`.
@@ -17,6 +18,10 @@ def follow_file(
       - actual line number if start_at_end=False (read from beginning)
       - incremental counter starting from 1 if start_at_end=True (new lines only)
     Handles simple truncation/rotation by reopening when inode changes or file shrinks.
+
+    If `position` is given it is kept up to date for status reporting:
+    line_no per line; inode, byte offset and reopens whenever the reader
+    catches up with the file (tell() in text mode is too slow per line).
     """
     line_no = 0
 
@@ -35,14 +40,21 @@ def follow_file(
         else:
             f.seek(0, os.SEEK_SET)
             line_no = 0
+        if position is not None:
+            position.update(path=path, inode=inode, offset=f.tell(), line_no=line_no, reopens=0)
 
         while True:
             line = f.readline()
             if line:
                 line_no += 1
+                if position is not None:
+                    position["line_no"] = line_no
                 yield line_no, line
                 continue
 
+            if position is not None:
+                position["offset"] = f.tell()
+
             # 没有新行：检查是否被截断/轮转
             time.sleep(poll_interval)
             if yield_heartbeat:
@@ -67,6 +79,9 @@ def follow_file(
                 else:
                     f.seek(0, os.SEEK_SET)
                     line_no = 0
+                if position is not None:
+                    position.update(inode=inode, offset=f.tell(), line_no=line_no,
+                                    reopens=position["reopens"] + 1)
 
     finally:
         try:
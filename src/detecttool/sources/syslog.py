@@ -0,0 +1,359 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import re
+import signal
+import socket
+import time
+
+SYSLOG_PORT = 514
+MAX_MESSAGE = 64 * 1024
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+_UDP_RCVBUF = 8 * 1024 * 1024  # 突发时让内核先缓冲住，不在用户态丢包
+
+_PRI = re.compile(r"<(\d{1,3})>")
+_BSD_TS = re.compile(r"[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d ")
+_RFC5424 = re.compile(r"[1-9]\d? (?:-|\d{4}-\d\d-\d\dT)")  # VERSION 后必须跟 TIMESTAMP，"12 disks ..." 不算
+
+
+class SyslogMessage(NamedTuple):
+    host: str
+    line: str  # 统一成 "Mmm dd HH:MM:SS host tag: msg"，规则和时间戳解析照常工作
+
+
+def _bsd_time(ts: float) -> str:
+    t = time.localtime(ts)
+    return f"{_MONTHS[t.tm_mon - 1]} {t.tm_mday:2d} {t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+
+
+def _rfc5424_time(value: str, now: float) -> str:
+    if value == "-":
+        return _bsd_time(now)
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return _bsd_time(now)
+    return _bsd_time(dt.timestamp())  # 带时区的换成本地时间，和文件日志一致
+
+
+def _split_sd(rest: str) -> Tuple[str, str]:
+    """(structured data, message) of the part after MSGID."""
+    if not rest.startswith("["):
+        sd, _, msg = rest.partition(" ")
+        return sd, msg
+    i, n, quoted = 0, len(rest), False
+    while i < n:
+        ch = rest[i]
+        if ch == "\\" and quoted:
+            i += 2
+            continue
+        if ch == '"':
+            quoted = not quoted
+        elif ch == "]" and not quoted and (i + 1 == n or rest[i + 1] != "["):
+            return rest[:i + 1], rest[i + 2:]
+        i += 1
+    return rest, ""
+
+
+def parse_syslog(data: bytes, peer: str = "", *, now: Optional[float] = None) -> Optional[SyslogMessage]:
+    """
+    Parse one RFC 5424 or RFC 3164 (BSD) message. The host is the HOSTNAME
+    field, or `peer` (the sender's address) when the message has none.
+    Returns None for an empty message.
+    """
+    text = data.decode("utf-8", errors="replace").rstrip("\r\n\x00")
+    if not text.strip():
+        return None
+    now = time.time() if now is None else now
+    m = _PRI.match(text)
+    if m is not None:
+        text = text[m.end():]
+
+    if _RFC5424.match(text):
+        parts = text.split(" ", 6)
+        if len(parts) >= 6:
+            ts, host, app, procid = parts[1], parts[2], parts[3], parts[4]
+            msg = _split_sd(parts[6])[1] if len(parts) == 7 else ""
+            if msg.startswith("\ufeff"):
+                msg = msg[1:]
+            host = peer if host == "-" else host
+            tag = "" if app == "-" else (app if procid == "-" else f"{app}[{procid}]")
+            body = f"{tag}: {msg}" if tag else msg
+            return SyslogMessage(host, f"{_rfc5424_time(ts, now)} {host} {body}")
+
+    m = _BSD_TS.match(text)
+    if m is None:
+        # 没有时间戳（有些设备只发 "tag: msg"）：按收到的时间补上
+        return SyslogMessage(peer, f"{_bsd_time(now)} {peer} {text}")
+    ts, rest = text[:m.end() - 1], text[m.end():]
+    first, _, after = rest.partition(" ")
+    if first.endswith(":") or "[" in first or not after:
+        host = peer  # 省略了 HOSTNAME，第一个词就是 TAG
+    else:
+        host, rest = first, after
+    return SyslogMessage(host, f"{ts} {host} {rest}")
+
+
+def format_syslog(host: str, message: str, *, rfc: str = "3164", ts: Optional[float] = None,
+                  app: str = "kernel", pri: int = 4) -> bytes:
+    """Build one syslog message (for tests and the load generator)."""
+    ts = time.time() if ts is None else ts
+    if rfc == "5424":
+        stamp = datetime.fromtimestamp(ts).astimezone().isoformat(timespec="milliseconds")
+        return f"<{pri}>1 {stamp} {host} {app} - - - {message}".encode("utf-8")
+    return f"<{pri}>{_bsd_time(ts)} {host} {app}: {message}".encode("utf-8")
+
+
+def frame_octet_counted(payload: bytes) -> bytes:
+    """RFC 6587 octet-counting framing for TCP."""
+    return str(len(payload)).encode("ascii") + b" " + payload
+
+
+def parse_address(spec: str, default_port: int = SYSLOG_PORT) -> Tuple[str, int]:
+    """'0.0.0.0:514', ':5514', '[::]:514' or a bare host -> (host, port)."""
+    spec = spec.strip()
+    if spec.startswith("["):
+        host, _, port = spec[1:].partition("]")
+        port = port.lstrip(":")
+    elif spec.count(":") == 1:
+        host, port = spec.split(":")
+    else:
+        host, port = spec, ""
+    try:
+        port_no = int(port) if port else default_port
+    except ValueError:
+        raise ValueError(f"Invalid listen address {spec!r} (expected HOST:PORT)")
+    if not 0 <= port_no <= 65535:
+        raise ValueError(f"Invalid port in {spec!r}")
+    return host or "0.0.0.0", port_no
+
+
+class OctetFramer:
+    """
+    Split a TCP byte stream into syslog messages (RFC 6587): octet-counted
+    ("LEN SP MSG") when a frame starts with a digit, otherwise terminated by
+    LF (or NUL). Frames longer than `max_message` are cut.
+    """
+    def __init__(self, max_message: int = MAX_MESSAGE) -> None:
+        self.max_message = max_message
+        self._buf = bytearray()
+        self._skip = 0  # 超长 octet-counted 帧还没收完、要丢弃的字节
+        self.truncated = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        if self._skip:
+            drop = min(self._skip, len(data))
+            data = data[drop:]
+            self._skip -= drop
+        buf = self._buf
+        buf += data
+        out: List[bytes] = []
+        pos, n = 0, len(buf)
+        while pos < n:
+            length = None
+            if 48 <= buf[pos] <= 57:  # 数字开头：octet-counted
+                sp = buf.find(b" ", pos, min(n, pos + 12))
+                if sp < 0 and n - pos < 12:
+                    break  # 长度字段还没收全
+                if sp >= 0:
+                    try:
+                        length = int(buf[pos:sp])
+                    except ValueError:
+                        length = None  # 不是合法长度，按换行分帧
+            if length is None:
+                new = self._line(buf, pos, n, out)
+                if new == pos:
+                    break
+                pos = new
+                continue
+            start = sp + 1
+            end = start + length
+            if length > self.max_message:
+                if n - start < self.max_message:
+                    break
+                out.append(bytes(buf[start:start + self.max_message]))
+                self.truncated += 1
+                if end > n:
+                    self._skip = end - n
+                    pos = n
+                    break
+                pos = end
+                continue
+            if end > n:
+                break
+            out.append(bytes(buf[start:end]))
+            pos = end
+        del buf[:pos]
+        return out
+
+    def _line(self, buf: bytearray, pos: int, n: int, out: List[bytes]) -> int:
+        lf = buf.find(b"\n", pos)
+        nul = buf.find(b"\x00", pos, lf if lf >= 0 else n)
+        end = nul if nul >= 0 else lf
+        if end < 0:
+            if n - pos > self.max_message:
+                out.append(bytes(buf[pos:pos + self.max_message]))
+                self.truncated += 1
+                return n
+            return pos
+        if end > pos:
+            out.append(bytes(buf[pos:end]))
+        return end + 1
+
+
+Handler = Callable[[str, str], None]
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, receiver: "SyslogReceiver") -> None:
+        self.receiver = receiver
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        r = self.receiver
+        r.udp_messages += 1
+        r.bytes += len(data)
+        r._deliver(data, addr[0])
+
+    def error_received(self, exc: Exception) -> None:
+        self.receiver.errors += 1
+
+
+class _TcpProtocol(asyncio.Protocol):
+    def __init__(self, receiver: "SyslogReceiver") -> None:
+        self.receiver = receiver
+        self.framer = OctetFramer(receiver.max_message)
+        self.peer = ""
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        peer = transport.get_extra_info("peername")
+        self.peer = peer[0] if peer else ""
+        self.receiver.tcp_connections += 1
+        self.receiver.tcp_open += 1
+
+    def data_received(self, data: bytes) -> None:
+        r = self.receiver
+        r.bytes += len(data)
+        frames = self.framer.feed(data)
+        r.tcp_messages += len(frames)
+        for frame in frames:
+            r._deliver(frame, self.peer)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        r = self.receiver
+        r.tcp_open -= 1
+        rest = self.framer.feed(b"\n")  # 连接关闭时最后一条没有换行也交出去
+        r.tcp_messages += len(rest)
+        for frame in rest:
+            r._deliver(frame, self.peer)
+        r.truncated += self.framer.truncated
+
+
+class SyslogReceiver:
+    """
+    Syslog server on asyncio: UDP datagrams and TCP streams (octet-counted
+    or newline framing), RFC 5424 and RFC 3164 messages. Every message is
+    passed to `handler(host, line)` on the event loop thread, with the
+    line normalized to the BSD layout the rules and timestamps expect.
+    """
+    def __init__(
+        self,
+        handler: Handler,
+        *,
+        udp: Optional[Tuple[str, int]] = None,
+        tcp: Optional[Tuple[str, int]] = None,
+        max_message: int = MAX_MESSAGE,
+    ) -> None:
+        if udp is None and tcp is None:
+            raise ValueError("serve-syslog needs at least one of UDP or TCP")
+        self.handler = handler
+        self.udp = udp
+        self.tcp = tcp
+        self.max_message = max_message
+        self.addresses: Dict[str, Tuple[str, int]] = {}
+
+        self.udp_messages = 0
+        self.tcp_messages = 0
+        self.tcp_connections = 0
+        self.tcp_open = 0
+        self.bytes = 0
+        self.bad = 0
+        self.truncated = 0
+        self.errors = 0
+        self._udp_transport: Optional[asyncio.DatagramTransport] = None
+        self._tcp_server: Optional[asyncio.AbstractServer] = None
+
+    def _deliver(self, data: bytes, peer: str) -> None:
+        msg = parse_syslog(data, peer)
+        if msg is None:
+            self.bad += 1
+            return
+        self.handler(msg.host, msg.line)
+
+    async def start(self) -> "SyslogReceiver":
+        loop = asyncio.get_running_loop()
+        if self.udp is not None:
+            transport, _ = await loop.create_datagram_endpoint(lambda: _UdpProtocol(self), local_addr=self.udp)
+            sock = transport.get_extra_info("socket")
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _UDP_RCVBUF)
+            except OSError:
+                pass
+            self._udp_transport = transport
+            self.addresses["udp"] = sock.getsockname()[:2]
+        if self.tcp is not None:
+            server = await loop.create_server(lambda: _TcpProtocol(self), self.tcp[0], self.tcp[1],
+                                              reuse_address=True)
+            self._tcp_server = server
+            self.addresses["tcp"] = server.sockets[0].getsockname()[:2]
+        return self
+
+    async def close(self) -> None:
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+            self._udp_transport = None
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            await self._tcp_server.wait_closed()
+            self._tcp_server = None
+
+    async def run(
+        self,
+        stop: asyncio.Event,
+        *,
+        tick: Optional[Callable[[], None]] = None,
+        tick_interval: float = 0.5,
+        handle_signals: bool = False,
+    ) -> None:
+        """Serve until `stop` is set (or SIGINT/SIGTERM with handle_signals), calling `tick` periodically."""
+        loop = asyncio.get_running_loop()
+        if handle_signals:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
+        if not self.addresses:
+            await self.start()
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=tick_interval)
+                except asyncio.TimeoutError:
+                    pass
+                if tick is not None:
+                    tick()
+        finally:
+            await self.close()
+            if handle_signals:
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    loop.remove_signal_handler(sig)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "udp_messages": self.udp_messages,
+            "tcp_messages": self.tcp_messages,
+            "tcp_connections": self.tcp_connections,
+            "tcp_open": self.tcp_open,
+            "bytes": self.bytes,
+            "bad": self.bad,
+            "truncated": self.truncated,
+            "errors": self.errors,
+        }
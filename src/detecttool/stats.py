@@ -0,0 +1,507 @@
+from __future__ import annotations
+from array import array
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
+import json
+import os
+
+from . import __version__
+from .config import Config, RuleFilter, _cache_dir
+from .engine import Detector, Incident, MultiLineAggregator, _parse_syslog_ts
+
+STATE_VERSION = 2
+# 用文件开头的一段内容识别“同 inode 但被整体改写”的情况
+_HEAD_BYTES = 4096
+
+
+def _numpy():
+    """NumPy if installed (optional speed-up), else None."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class BucketMatrix:
+    """
+    Counts per (category, time bucket) in contiguous integer arrays.
+
+    Column j holds bucket number `origin + j` (bucket number = ts // width).
+    With NumPy, increments are buffered and applied in batches with
+    np.add.at into one 2-D int64 matrix; without it, each category row is
+    an array('q') incremented in place. Both grow on demand in either time
+    direction, so out-of-order timestamps are fine.
+    """
+    _BATCH = 8192
+
+    def __init__(self, *, use_numpy: Optional[bool] = None) -> None:
+        np = _numpy() if use_numpy in (None, True) else None
+        if use_numpy and np is None:
+            raise ImportError("NumPy backend requested but numpy is not installed")
+        self._np = np
+        self.categories: Dict[str, int] = {}
+        self.origin: Optional[int] = None
+        self.width = 0
+        self._rows: List[array] = []          # 纯 Python 后端
+        self._matrix = None                    # NumPy 后端
+        self._pending_b: List[int] = []
+        self._pending_c: List[int] = []
+
+    @property
+    def backend(self) -> str:
+        return "numpy" if self._np is not None else "array"
+
+    def _ensure(self, bucket: int) -> int:
+        """Grow so that `bucket` has a column; return its column index."""
+        if self.origin is None:
+            self.origin, self.width = bucket, 1
+            if self._np is not None:
+                self._matrix = self._np.zeros((max(1, len(self.categories)), 1), dtype=self._np.int64)
+            else:
+                self._rows = [array("q", [0]) for _ in self.categories]
+            return 0
+        if bucket < self.origin:
+            extra = self.origin - bucket
+            if self._np is not None:
+                self._apply()
+                pad = self._np.zeros((self._matrix.shape[0], extra), dtype=self._np.int64)
+                self._matrix = self._np.concatenate([pad, self._matrix], axis=1)
+            else:
+                for i, row in enumerate(self._rows):
+                    self._rows[i] = array("q", bytes(8 * extra)) + row
+            self.origin = bucket
+            self.width += extra
+        elif bucket >= self.origin + self.width:
+            new_width = bucket - self.origin + 1
+            if self._np is not None:
+                self._apply()
+                cap = self._matrix.shape[1]
+                if new_width > cap:
+                    grown = self._np.zeros((self._matrix.shape[0], max(new_width, cap * 2)), dtype=self._np.int64)
+                    grown[:, :cap] = self._matrix
+                    self._matrix = grown
+            else:
+                for row in self._rows:
+                    row.extend([0] * (new_width - len(row)))
+            self.width = new_width
+        return bucket - self.origin
+
+    def _category(self, name: str) -> int:
+        idx = self.categories.get(name)
+        if idx is None:
+            idx = self.categories[name] = len(self.categories)
+            if self._np is not None:
+                if self._matrix is not None and idx >= self._matrix.shape[0]:
+                    self._apply()
+                    grown = self._np.zeros((idx * 2 + 1, self._matrix.shape[1]), dtype=self._np.int64)
+                    grown[: self._matrix.shape[0]] = self._matrix
+                    self._matrix = grown
+            elif self.origin is not None:
+                self._rows.append(array("q", bytes(8 * self.width)))
+        return idx
+
+    def add(self, bucket: int, category: str, n: int = 1) -> None:
+        c = self._category(category)
+        col = self._ensure(bucket)
+        if self._np is None:
+            self._rows[c][col] += n
+            return
+        if n != 1:
+            self._apply()
+            self._matrix[c, col] += n
+            return
+        self._pending_c.append(c)
+        self._pending_b.append(col)
+        if len(self._pending_b) >= self._BATCH:
+            self._apply()
+
+    def _apply(self) -> None:
+        if self._np is None or not self._pending_b:
+            return
+        self._np.add.at(self._matrix, (self._pending_c, self._pending_b), 1)
+        self._pending_b.clear()
+        self._pending_c.clear()
+
+    def rows(self) -> Dict[str, List[int]]:
+        """{category: counts per column}, width == self.width."""
+        if self.origin is None:
+            return {}
+        if self._np is not None:
+            self._apply()
+            return {name: self._matrix[i, : self.width].tolist() for name, i in self.categories.items()}
+        return {name: self._rows[i].tolist() for name, i in self.categories.items()}
+
+
+class TimeHistogram:
+    """
+    Per-bucket incident counts by type and severity, keyed by the parsed
+    syslog timestamp of the incident line, plus peak-rate detection.
+    """
+    def __init__(self, bucket_seconds: int, *, use_numpy: Optional[bool] = None) -> None:
+        if bucket_seconds <= 0:
+            raise ValueError("bucket width must be positive")
+        self.bucket_seconds = int(bucket_seconds)
+        self.by_type = BucketMatrix(use_numpy=use_numpy)
+        self.by_severity = BucketMatrix(use_numpy=use_numpy)
+        self.untimed = 0
+
+    def add(self, inc: Incident) -> None:
+        ts = _parse_syslog_ts(inc.message)
+        if ts is None:
+            self.untimed += 1
+            return
+        b = int(ts // self.bucket_seconds)
+        self.by_type.add(b, inc.type)
+        self.by_severity.add(b, inc.severity)
+
+    def _bucket_label(self, bucket: int) -> str:
+        return datetime.fromtimestamp(bucket * self.bucket_seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+    def _peak(self, counts: List[int], origin: int) -> Optional[Dict[str, Any]]:
+        if not counts or max(counts) == 0:
+            return None
+        j = max(range(len(counts)), key=counts.__getitem__)
+        return {
+            "start": self._bucket_label(origin + j),
+            "count": counts[j],
+            "per_minute": round(counts[j] * 60.0 / self.bucket_seconds, 3),
+        }
+
+    def result(self) -> Dict[str, Any]:
+        types = self.by_type.rows()
+        sevs = self.by_severity.rows()
+        origin = self.by_type.origin
+        out: Dict[str, Any] = {
+            "bucket_seconds": self.bucket_seconds,
+            "backend": self.by_type.backend,
+            "untimed_incidents": self.untimed,
+            "buckets": [],
+            "peak": None,
+            "peak_by_type": {},
+        }
+        if origin is None:
+            return out
+        width = self.by_type.width
+        totals = [sum(row[j] for row in types.values()) for j in range(width)]
+        for j in range(width):
+            if not totals[j]:
+                continue  # 只输出非空桶
+            out["buckets"].append({
+                "start": self._bucket_label(origin + j),
+                "total": totals[j],
+                "by_type": {t: row[j] for t, row in types.items() if row[j]},
+                "by_severity": {s: row[j] for s, row in sevs.items() if row[j]},
+            })
+        out["peak"] = self._peak(totals, origin)
+        out["peak_by_type"] = {t: self._peak(row, origin) for t, row in types.items()}
+        return out
+
+    # -------- persistence (sparse) --------
+    def to_state(self) -> Dict[str, Any]:
+        def sparse(m: BucketMatrix) -> Dict[str, Dict[str, int]]:
+            return {
+                name: {str(m.origin + j): n for j, n in enumerate(row) if n}
+                for name, row in m.rows().items()
+            }
+        return {
+            "bucket_seconds": self.bucket_seconds,
+            "untimed": self.untimed,
+            "by_type": sparse(self.by_type),
+            "by_severity": sparse(self.by_severity),
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], *, use_numpy: Optional[bool] = None) -> "TimeHistogram":
+        h = cls(int(state["bucket_seconds"]), use_numpy=use_numpy)
+        h.untimed = int(state.get("untimed", 0))
+        for m, data in ((h.by_type, state.get("by_type") or {}), (h.by_severity, state.get("by_severity") or {})):
+            for name, buckets in data.items():
+                for b, n in buckets.items():
+                    m.add(int(b), name, int(n))
+        return h
+
+
+class StatsAccumulator:
+    """
+    Streaming counterpart of cli._generate_statistics: incidents are added
+    as they are detected, so no incident list has to be kept in memory.
+    Counters keep first-seen order, so top-N ties break exactly like
+    Counter.most_common over the full incident list.
+    """
+    def __init__(self, *, bucket_seconds: Optional[int] = None) -> None:
+        self.total = 0
+        self.by_type: Counter = Counter()
+        self.by_severity: Counter = Counter()
+        self.by_rule: Counter = Counter()
+        self.comms: Counter = Counter()
+        self.pids: Counter = Counter()
+        self.timeline: Optional[TimeHistogram] = TimeHistogram(bucket_seconds) if bucket_seconds else None
+
+    def add(self, inc: Incident) -> None:
+        self.total += 1
+        if self.timeline is not None:
+            self.timeline.add(inc)
+        self.by_type[inc.type] += 1
+        self.by_severity[inc.severity] += 1
+        self.by_rule[inc.rule_id] += 1
+        comm = inc.extracted.get("comm")
+        if comm:
+            self.comms[comm] += 1
+        pid = inc.extracted.get("pid")
+        if pid:
+            self.pids[pid] += 1
+
+    def add_all(self, incidents: Iterable[Incident]) -> "StatsAccumulator":
+        for inc in incidents:
+            self.add(inc)
+        return self
+
+    def result(self, total_lines: int, top_n: int = 10) -> Dict[str, Any]:
+        out = {
+            'total_lines_scanned': total_lines,
+            'total_incidents': self.total,
+            'unique_types': len(self.by_type),
+            'by_type': dict(self.by_type),
+            'by_severity': dict(self.by_severity),
+            'by_rule': dict(self.by_rule),
+            'top_processes': self.comms.most_common(top_n),
+            'top_pids': self.pids.most_common(top_n),
+        }
+        if self.timeline is not None:
+            out['timeline'] = self.timeline.result()
+        return out
+
+    # -------- persistence --------
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "by_type": dict(self.by_type),
+            "by_severity": dict(self.by_severity),
+            "by_rule": dict(self.by_rule),
+            "comms": dict(self.comms),
+            "pids": dict(self.pids),
+            "timeline": self.timeline.to_state() if self.timeline is not None else None,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "StatsAccumulator":
+        acc = cls()
+        acc.total = int(state.get("total", 0))
+        for name in ("by_type", "by_severity", "by_rule", "comms", "pids"):
+            getattr(acc, name).update(state.get(name) or {})
+        if state.get("timeline"):
+            acc.timeline = TimeHistogram.from_state(state["timeline"])
+        return acc
+
+    def copy(self) -> "StatsAccumulator":
+        return StatsAccumulator.from_state(self.to_state())
+
+
+# -------------------------
+# Incremental stats over growing files
+# -------------------------
+def default_state_path(log_path: str) -> Optional[Path]:
+    """Per-file state under the detecttool cache dir (None if caching is disabled)."""
+    base = _cache_dir()
+    if base is None:
+        return None
+    key = hashlib.sha256(os.path.abspath(log_path).encode()).hexdigest()[:24]
+    return base / "stats" / f"{key}.json"
+
+
+def config_fingerprint(config_path: str, rule_filter: Optional[RuleFilter] = None) -> str:
+    """Rules (or the rule filter) changed -> previous aggregates are meaningless -> full rescan."""
+    with open(config_path, "rb") as f:
+        h = hashlib.sha256(f.read())
+    if rule_filter is not None and rule_filter.active:
+        h.update(b"|" + rule_filter.key().encode())
+    return h.hexdigest()[:32]
+
+
+def _head_hash(f, limit: int) -> str:
+    f.seek(0)
+    return hashlib.sha256(f.read(min(limit, _HEAD_BYTES))).hexdigest()[:32]
+
+
+def _load_state(state_path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("state_version") != STATE_VERSION or state.get("tool") != __version__:
+        return None
+    return state
+
+
+def _save_state(state_path: Path, state: Dict[str, Any]) -> None:
+    try:
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = state_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, state_path)
+    except OSError:
+        pass
+
+
+def _iter_complete_lines(f, offset: int, line_no: int) -> Iterator[Tuple[int, int, str]]:
+    """Yield (line_no, end_offset, text) for newline-terminated lines from offset."""
+    f.seek(offset)
+    for raw in f:
+        if not raw.endswith(b"\n"):
+            return
+        line_no += 1
+        offset += len(raw)
+        yield line_no, offset, raw.decode("utf-8", errors="replace")
+
+
+def incremental_stats(
+    log_path: str,
+    cfg: Config,
+    config_key: str,
+    state_path: Path,
+    *,
+    top_n: int = 10,
+    bucket_seconds: Optional[int] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Statistics for `log_path`, processing only bytes appended since the last
+    run recorded in `state_path`.
+
+    The state holds the aggregates plus everything the detector needs to
+    continue exactly where it stopped: inode/offset/line count, cooldown
+    state and the still-open multi-line block. Incidents that only exist
+    because the scan stops at EOF (open block flushed, unterminated last
+    line) are counted for this result but not persisted, so the next run
+    sees them complete - the result always equals a full scan.
+
+    Falls back to a full scan when the file was rotated (inode change),
+    truncated (size < offset), rewritten (head hash change) or the rules
+    changed. Returns (stats, info) where info describes what was done.
+    """
+    try:
+        f = open(log_path, "rb")
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Log file not found: {log_path}\n"
+            f"Please check the file path and try again"
+        )
+    except PermissionError:
+        raise PermissionError(
+            f"Permission denied: {log_path}\n"
+            f"Please ensure you have read permission for this file"
+        )
+
+    with f:
+        st = os.fstat(f.fileno())
+        state = _load_state(state_path)
+        reason = None
+        if state is None:
+            reason = "no previous state"
+        elif state.get("config") != config_key:
+            reason = "rules changed"
+        elif state.get("bucket_seconds") != bucket_seconds:
+            reason = "bucket changed"
+        else:
+            fs = state["file"]
+            if (fs["dev"], fs["ino"]) != (st.st_dev, st.st_ino):
+                reason = "file rotated"
+            elif st.st_size < fs["offset"]:
+                reason = "file truncated"
+            elif _head_hash(f, fs["offset"]) != fs["head"]:
+                reason = "file rewritten"
+
+        detector = Detector(cfg.rules, prefilter=cfg.prefilter)
+        agg = MultiLineAggregator(detector)
+        if reason is None:
+            offset = state["file"]["offset"]
+            line_no = state["file"]["lines"]
+            acc = StatsAccumulator.from_state(state["counters"])
+            detector.cooldown.restore(state["cooldown"])
+            agg.restore(state["block"])
+        else:
+            offset = 0
+            line_no = 0
+            acc = StatsAccumulator(bucket_seconds=bucket_seconds)
+        start_offset = offset
+
+        for line_no, offset, line in _iter_complete_lines(f, offset, line_no):
+            acc.add_all(agg.process(line_no, line))
+
+        new_state = {
+            "state_version": STATE_VERSION,
+            "tool": __version__,
+            "config": config_key,
+            "bucket_seconds": bucket_seconds,
+            "file": {
+                "path": os.path.abspath(log_path),
+                "dev": st.st_dev,
+                "ino": st.st_ino,
+                "offset": offset,
+                "lines": line_no,
+                "head": _head_hash(f, offset),
+            },
+            "counters": acc.to_state(),
+            "cooldown": detector.cooldown.snapshot(),
+            "block": agg.snapshot(),
+        }
+
+        # 以下只影响本次结果：末尾未换行的半行 + 文件结束时 flush 的块
+        final = acc.copy()
+        total_lines = line_no
+        f.seek(offset)
+        tail = f.read()
+        if tail:
+            total_lines += 1
+            final.add_all(agg.process(total_lines, tail.decode("utf-8", errors="replace")))
+        final.add_all(agg.flush())
+
+    _save_state(state_path, new_state)
+    info = {
+        "mode": "full" if reason else "incremental",
+        "reason": reason,
+        "bytes_processed": offset - start_offset + len(tail),
+        "state": str(state_path),
+    }
+    return final.result(total_lines, top_n=top_n), info
+
+
+def summary_stats(incidents_log: str) -> Dict[str, Any]:
+    """
+    Stats of an incidents log written by the file sink, from its summary
+    sidecar alone (no segment is read). Per-process/PID rankings are not
+    kept in the summary and come back empty.
+    """
+    from .sinks.file import load_summary, summary_totals
+
+    summary = load_summary(incidents_log)
+    if summary is None:
+        raise FileNotFoundError(
+            f"No summary sidecar for {incidents_log}\n"
+            f"It is written by monitor --sink 'file:{incidents_log}?summary=1' (install-service enables it)"
+        )
+    totals = summary_totals(summary)
+    return {
+        'total_lines_scanned': None,
+        'total_incidents': totals['count'],
+        'unique_types': len(totals['by_type']),
+        'by_type': totals['by_type'],
+        'by_severity': totals['by_severity'],
+        'by_rule': totals['by_rule'],
+        'top_processes': [],
+        'top_pids': [],
+        'incidents_log': {
+            'path': incidents_log,
+            'segments': totals['segments'],
+            'bytes': totals['bytes'],
+            'first_log_ts': totals['first_log_ts'],
+            'last_log_ts': totals['last_log_ts'],
+            'first_written': totals['first_written'],
+            'last_written': totals['last_written'],
+        },
+    }
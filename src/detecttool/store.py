@@ -0,0 +1,172 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import sqlite3
+import time
+
+from .engine import _parse_syslog_ts
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id          INTEGER PRIMARY KEY,
+    ts          REAL,              -- 日志时间戳（epoch），解析失败为 NULL
+    recorded_at REAL NOT NULL,     -- 入库时间
+    source      TEXT,
+    rule_id     TEXT NOT NULL,
+    type        TEXT NOT NULL,
+    severity    TEXT NOT NULL,
+    comm        TEXT,
+    pid         INTEGER,
+    line_no     INTEGER,
+    message     TEXT NOT NULL,
+    extracted   TEXT,              -- JSON
+    context     TEXT               -- JSON
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_ts       ON incidents(ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_type     ON incidents(type, ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_severity ON incidents(severity, ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_rule     ON incidents(rule_id, ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_comm     ON incidents(comm, ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_pid      ON incidents(pid, ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_source   ON incidents(source, ts);
+"""
+
+_COLUMNS = ("ts", "recorded_at", "source", "rule_id", "type", "severity", "comm", "pid",
+            "line_no", "message", "extracted", "context")
+
+# group-by 名称 -> SQL 表达式
+GROUP_BY = {
+    "type": "type",
+    "severity": "severity",
+    "rule": "rule_id",
+    "comm": "comm",
+    "pid": "pid",
+    "source": "source",
+    "hour": "strftime('%Y-%m-%d %H:00', ts, 'unixepoch', 'localtime')",
+    "day": "strftime('%Y-%m-%d', ts, 'unixepoch', 'localtime')",
+}
+
+
+def connect(path: str, *, readonly: bool = False) -> sqlite3.Connection:
+    """Open (and for writers, initialise) an incident database in WAL mode."""
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _field(record: Any, name: str) -> Any:
+    if isinstance(record, dict):
+        return record.get(name)
+    return getattr(record, name)
+
+
+def _row(record: Any, source: Optional[str], now: float) -> Tuple:
+    extracted = _field(record, "extracted") or {}
+    context = _field(record, "context") or ()
+    message = _field(record, "message")
+    pid = extracted.get("pid")
+    return (
+        _parse_syslog_ts(message),
+        now,
+        source,
+        _field(record, "rule_id"),
+        _field(record, "type"),
+        _field(record, "severity"),
+        extracted.get("comm"),
+        int(pid) if pid is not None and str(pid).isdigit() else None,
+        _field(record, "line_no"),
+        message,
+        json.dumps(extracted, ensure_ascii=False),
+        json.dumps(list(context), ensure_ascii=False),
+    )
+
+
+def insert_many(conn: sqlite3.Connection, records: Iterable[Any], *, source: Optional[str] = None) -> int:
+    """Insert incidents (Incident objects or dicts) in one transaction."""
+    now = time.time()
+    rows = [_row(r, source, now) for r in records]
+    with conn:
+        conn.executemany(
+            f"INSERT INTO incidents ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+            rows,
+        )
+    return len(rows)
+
+
+def _where(filters: Dict[str, Sequence[Any]], since: Optional[float], until: Optional[float]) -> Tuple[str, List[Any]]:
+    clauses: List[str] = []
+    params: List[Any] = []
+    for col, values in filters.items():
+        values = [v for v in values if v is not None]
+        if not values:
+            continue
+        if len(values) == 1:
+            clauses.append(f"{col} = ?")
+        else:
+            clauses.append(f"{col} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    if since is not None:
+        clauses.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("ts < ?")
+        params.append(until)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def query(
+    conn: sqlite3.Connection,
+    *,
+    filters: Optional[Dict[str, Sequence[Any]]] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """Newest incidents first. `filters` maps column name -> accepted values."""
+    where, params = _where(filters or {}, since, until)
+    rows = conn.execute(
+        f"SELECT * FROM incidents{where} ORDER BY ts DESC, id DESC LIMIT ?",
+        params + [limit],
+    ).fetchall()
+    out = []
+    for r in rows:
+        d = dict(r)
+        d["extracted"] = json.loads(d["extracted"] or "{}")
+        d["context"] = json.loads(d["context"] or "[]")
+        out.append(d)
+    return out
+
+
+def group_counts(
+    conn: sqlite3.Connection,
+    group_by: str,
+    *,
+    filters: Optional[Dict[str, Sequence[Any]]] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = 100,
+) -> List[Tuple[Any, int]]:
+    """
+    [(group value, count)], the `limit` largest groups by count; for time
+    buckets (hour/day) the newest `limit` buckets, oldest first.
+    """
+    if group_by not in GROUP_BY:
+        raise ValueError(f"Unknown group-by {group_by!r}, expected one of: {', '.join(GROUP_BY)}")
+    expr = GROUP_BY[group_by]
+    where, params = _where(filters or {}, since, until)
+    timeline = group_by in ("hour", "day")
+    order = "g DESC" if timeline else "n DESC, g"
+    rows = conn.execute(
+        f"SELECT {expr} AS g, COUNT(*) AS n FROM incidents{where} GROUP BY g ORDER BY {order} LIMIT ?",
+        params + [limit],
+    ).fetchall()
+    out = [(r["g"], r["n"]) for r in rows]
+    if timeline:
+        out.reverse()  # 截掉的是最旧的桶，输出仍按时间顺序
+    return out
@@ -0,0 +1,280 @@
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+
+from .engine import Incident, _parse_syslog_ts
+
+TEMPLATES_VERSION = 1
+WILDCARD = "<*>"
+
+# syslog 头（时间戳、可选主机名、程序名[pid]:）和内核的 [ 1234.567] 运行时间不参与聚类
+_HEADER_RE = re.compile(
+    r"^[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d (?:[^\s:]+ )?[\w\-./]+(?:\[\d+\])?: (?:\[\s*\d+\.\d+\] )?"
+)
+_HAS_DIGIT = re.compile(r"\d").search
+
+
+def _tokens(text: str) -> List[str]:
+    """Split the message part of a line into tokens; tokens with digits become <*>."""
+    m = _HEADER_RE.match(text)
+    if m is not None:
+        text = text[m.end():]
+    return [WILDCARD if _HAS_DIGIT(t) else t for t in text.split()]
+
+
+class Template:
+    __slots__ = ("id", "tokens", "count", "window", "window_count", "ewma", "windows_seen", "reported")
+
+    def __init__(self, tid: int, tokens: List[str]) -> None:
+        self.id = tid
+        self.tokens = tokens
+        self.count = 0
+        self.window = -1  # 当前计数窗口编号（日志时间 // window_seconds）
+        self.window_count = 0
+        self.ewma = 0.0  # 每个窗口命中数的指数滑动平均（基线）
+        self.windows_seen = 0
+        self.reported = -1  # 已报告过突增的窗口
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+    def to_state(self) -> List[Any]:
+        return [self.id, self.tokens, self.count, round(self.ewma, 4), self.windows_seen]
+
+    @classmethod
+    def from_state(cls, row: List[Any]) -> "Template":
+        t = cls(int(row[0]), list(row[1]))
+        t.count, t.ewma, t.windows_seen = int(row[2]), float(row[3]), int(row[4])
+        return t
+
+
+class TemplateMiner:
+    """
+    Online log template mining (Drain: fixed-depth parse tree keyed by token
+    count and the first `depth - 2` tokens, then the most similar template
+    in the leaf). Tokens containing digits are masked to <*>; a line joins a
+    template when at least `similarity` of its tokens match, differing
+    positions become <*>.
+
+    Memory is bounded by `max_templates` (least recently matched templates
+    are evicted). process() returns incidents for:
+      - NEW_TEMPLATE:   a template not seen before, once `warmup_lines`
+                        lines have been learned (immediately when the
+                        table was loaded from a previous run)
+      - TEMPLATE_SPIKE: a known template hit more than `spike_factor` x its
+                        usual count in one `window_seconds` log-time window
+                        (and at least `min_spike` times)
+    """
+    def __init__(
+        self,
+        *,
+        depth: int = 4,
+        similarity: float = 0.5,
+        max_children: int = 100,
+        max_templates: int = 5000,
+        warmup_lines: int = 2000,
+        window_seconds: float = 60.0,
+        spike_factor: float = 5.0,
+        min_spike: int = 20,
+        alpha: float = 0.3,
+    ) -> None:
+        self.depth = depth
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.warmup_lines = warmup_lines
+        self.window_seconds = window_seconds
+        self.spike_factor = spike_factor
+        self.min_spike = min_spike
+        self.alpha = alpha
+
+        self.templates: "OrderedDict[int, Template]" = OrderedDict()  # LRU：末尾最近命中
+        self._tree: Dict[int, Dict] = {}  # 长度 -> 前缀 token 逐层 -> 叶子 List[Template]
+        self._next_id = 1
+        self.lines = 0
+        self.evicted = 0
+        self._ts_prefix = ""
+        self._ts: Optional[float] = None
+
+    # -------- tree --------
+    def _leaf(self, tokens: List[str], create: bool) -> Optional[List[Template]]:
+        node = self._tree.get(len(tokens))
+        if node is None:
+            if not create:
+                return None
+            node = self._tree[len(tokens)] = {}
+        for tok in tokens[:self.depth - 2]:
+            child = node.get(tok)
+            if child is None:
+                if create and (tok == WILDCARD or len(node) < self.max_children):
+                    child = node[tok] = {}
+                else:
+                    # 没有这个分支（或分支已满）：走 <*> 分支
+                    child = node.get(WILDCARD)
+                    if child is None:
+                        if not create:
+                            return None
+                        child = node[WILDCARD] = {}
+            node = child
+        leaf = node.get(None)
+        if leaf is None and create:
+            leaf = node[None] = []
+        return leaf
+
+    def _best(self, leaf: List[Template], tokens: List[str]) -> Optional[Template]:
+        best, best_sim = None, -1.0
+        n = len(tokens)
+        for t in leaf:
+            same = 0
+            for a, b in zip(t.tokens, tokens):
+                if a == b:
+                    same += 1
+            sim = same / n if n else 1.0
+            if sim > best_sim:
+                best, best_sim = t, sim
+        if best is not None and best_sim >= self.similarity:
+            return best
+        return None
+
+    def _add(self, tokens: List[str]) -> Template:
+        t = Template(self._next_id, tokens)
+        self._next_id += 1
+        self._leaf(tokens, True).append(t)
+        self.templates[t.id] = t
+        if len(self.templates) > self.max_templates:
+            _, old = self.templates.popitem(last=False)
+            leaf = self._leaf(old.tokens, False)
+            if leaf is not None and old in leaf:
+                leaf.remove(old)
+            self.evicted += 1
+        return t
+
+    def match(self, text: str) -> Tuple[Template, bool]:
+        """(template of the line, created?) – learns the line."""
+        tokens = _tokens(text)
+        leaf = self._leaf(tokens, False)
+        t = self._best(leaf, tokens) if leaf else None
+        if t is None:
+            return self._add(tokens), True
+        if t.tokens != tokens:
+            merged = [a if a == b else WILDCARD for a, b in zip(t.tokens, tokens)]
+            if merged != t.tokens:
+                t.tokens = merged
+        self.templates.move_to_end(t.id)
+        return t, False
+
+    # -------- detection --------
+    def _log_ts(self, text: str) -> Optional[float]:
+        prefix = text[:15]
+        if prefix != self._ts_prefix:
+            self._ts_prefix = prefix
+            self._ts = _parse_syslog_ts(prefix)
+        return self._ts
+
+    def process(self, line_no: int, line: str) -> List[Incident]:
+        if not line_no:
+            return []  # monitor 心跳
+        text = line.rstrip("\n")
+        if not text.strip():
+            return []
+        self.lines += 1
+        t, created = self.match(text)
+        t.count += 1
+        out: List[Incident] = []
+        if created and self.lines > self.warmup_lines:
+            out.append(self._incident("NEW_TEMPLATE", "low", "template_new", line_no, text, t))
+
+        ts = self._log_ts(text)
+        if ts is None:
+            return out
+        window = int(ts // self.window_seconds)
+        if window != t.window:
+            if t.window >= 0 and window > t.window:
+                # 中间没有命中的窗口按 0 计入基线
+                t.ewma += self.alpha * (t.window_count - t.ewma)
+                t.ewma *= (1 - self.alpha) ** (window - t.window - 1)
+                t.windows_seen += 1
+            t.window = window
+            t.window_count = 0
+        t.window_count += 1
+        if (
+            t.windows_seen >= 3
+            and t.reported != window
+            and t.window_count >= self.min_spike
+            and t.window_count > self.spike_factor * max(t.ewma, 1.0)
+        ):
+            t.reported = window
+            inc = self._incident("TEMPLATE_SPIKE", "medium", "template_spike", line_no, text, t)
+            inc.extracted["window_count"] = str(t.window_count)
+            inc.extracted["baseline"] = f"{t.ewma:.1f}"
+            out.append(inc)
+        return out
+
+    @staticmethod
+    def _incident(type_: str, severity: str, rule_id: str, line_no: int, text: str, t: Template) -> Incident:
+        return Incident(
+            rule_id=rule_id,
+            type=type_,
+            severity=severity,
+            message=text,
+            line_no=line_no,
+            extracted={"template_id": str(t.id), "template": t.text, "count": str(t.count)},
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {"lines": self.lines, "templates": len(self.templates), "evicted": self.evicted}
+
+    # -------- persistence --------
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "version": TEMPLATES_VERSION,
+            "depth": self.depth,
+            "next_id": self._next_id,
+            "templates": [t.to_state() for t in self.templates.values()],
+        }
+
+    def restore(self, state: Dict[str, Any]) -> bool:
+        """Load a saved table (False if it is incompatible). Learned templates are not 'new' any more."""
+        if state.get("version") != TEMPLATES_VERSION or state.get("depth") != self.depth:
+            return False
+        self.templates.clear()
+        self._tree.clear()
+        for row in state["templates"][-self.max_templates:]:
+            t = Template.from_state(row)
+            self._leaf(t.tokens, True).append(t)
+            self.templates[t.id] = t
+        self._next_id = max(int(state.get("next_id", 1)), max(self.templates, default=0) + 1)
+        self.warmup_lines = 0
+        return True
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_state(), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def load(self, path: Path) -> bool:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return isinstance(state, dict) and self.restore(state)
+
+
+def default_templates_path(log_path: str) -> Optional[Path]:
+    """Per-log template table under the detecttool cache dir (None if caching is disabled)."""
+    from .config import _cache_dir
+
+    base = _cache_dir()
+    if base is None:
+        return None
+    key = hashlib.sha256(os.path.abspath(log_path).encode()).hexdigest()[:24]
+    return base / "templates" / f"{key}.json"
@@ -0,0 +1,54 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+import re
+import time
+
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+_SIZE_MULT = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h|d)?\s*$", re.IGNORECASE)
+_DURATION_MULT = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_size(text: str) -> int:
+    """'50M' -> 52428800. Accepts K/M/G/T with optional 'B'/'iB', plain numbers are bytes."""
+    m = _SIZE.match(str(text))
+    if not m:
+        raise ValueError(f"Invalid size: {text!r} (expected e.g. 512K, 50M, 1G)")
+    return int(float(m.group(1)) * _SIZE_MULT[m.group(2).lower()])
+
+
+def parse_duration(text: str) -> float:
+    """'30m' -> 1800.0. Accepts ms/s/m/h/d, plain numbers are seconds."""
+    m = _DURATION.match(str(text))
+    if not m:
+        raise ValueError(f"Invalid duration: {text!r} (expected e.g. 30s, 5m, 1h)")
+    return float(m.group(1)) * _DURATION_MULT[(m.group(2) or "s").lower()]
+
+
+def parse_time(text: str, *, now: Optional[float] = None) -> float:
+    """
+    Parse a point in time to epoch seconds (local time):
+      - relative:  '30m', '2h', '7d'           -> that long before now
+      - ISO:       '2025-12-24', '2025-12-24 03:15[:00]', '2025-12-24T03:15'
+      - clock:     '03:15', '03:15:30'          -> today at that time
+      - epoch:     '1766545200'
+    """
+    s = str(text).strip()
+    now = time.time() if now is None else now
+    if re.fullmatch(r"\d{9,}(\.\d+)?", s):
+        return float(s)
+    if re.fullmatch(r"\d+(\.\d+)?\s*(ms|s|m|h|d)", s, re.IGNORECASE):
+        return now - parse_duration(s)
+    m = re.fullmatch(r"(\d{1,2}):(\d{2})(?::(\d{2}))?", s)
+    if m:
+        base = datetime.fromtimestamp(now)
+        dt = base.replace(hour=int(m.group(1)), minute=int(m.group(2)), second=int(m.group(3) or 0), microsecond=0)
+        return dt.timestamp()
+    try:
+        return datetime.fromisoformat(s).timestamp()
+    except ValueError:
+        raise ValueError(
+            f"Invalid time: {text!r} (expected e.g. 30m, 03:15, 2025-12-24 03:15 or epoch seconds)"
+        )
@@ -31,3 +31,17 @@ def config_path(project_root):
 def test_log_path(fixtures_dir):
     """Return path to the test log file."""
     return fixtures_dir / "test.log"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_config_cache(tmp_path_factory):
+    """Keep the compiled config cache out of the user's home directory."""
+    import os
+
+    old = os.environ.get("DETECTTOOL_CACHE_DIR")
+    os.environ["DETECTTOOL_CACHE_DIR"] = str(tmp_path_factory.mktemp("config-cache"))
+    yield
+    if old is None:
+        os.environ.pop("DETECTTOOL_CACHE_DIR", None)
+    else:
+        os.environ["DETECTTOOL_CACHE_DIR"] = old
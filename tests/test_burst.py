@@ -0,0 +1,120 @@
+"""
+Test cases for burst detection.
+
+Tests cover:
+- `bursts` parsing in rules.yaml
+- BURST once per episode against the EWMA baseline, re-armed after the rate drops
+- Keys by type / rule / comm, bounded key table and the type filter
+- `scan` with and without --bursts
+"""
+from __future__ import annotations
+import json
+import pytest
+import yaml
+from typer.testing import CliRunner
+from detecttool.burst import BurstDetector
+from detecttool.cli import app
+from detecttool.config import BurstSpec, _build_config
+from detecttool.engine import Incident
+
+
+def _inc(sec: int, type_="FS_EXCEPTION", comm="", line_no=1):
+    msg = f"Dec 24 10:{sec // 60 % 60:02d}:{sec % 60:02d} host kernel: EXT4-fs error"
+    return Incident(rule_id=f"{type_.lower()}_basic", type=type_, severity="high", message=msg,
+                    line_no=line_no, extracted={"comm": comm} if comm else {})
+
+
+def _run(det, secs, **kw):
+    out = []
+    for i, sec in enumerate(secs, start=1):
+        out += det.process([_inc(sec, line_no=i, **kw)])
+    return [x for x in out if x.type == "BURST"]
+
+
+class TestParse:
+    """Test the bursts section of the rules file."""
+
+    def test_defaults_and_options(self):
+        assert _build_config({"rules": []}).bursts is None
+        assert _build_config({"rules": [], "bursts": True}).bursts == BurstSpec()
+        spec = _build_config({"rules": [], "bursts": {"window": "5m", "by": ["type", "comm"], "types": "OOM"}}).bursts
+        assert spec.window_seconds == 300 and spec.by == ("type", "comm") and spec.types == ("OOM",)
+
+    @pytest.mark.parametrize("bad", [
+        {"by": ["host"]}, {"factor": 1}, {"window": "0s"}, {"severity": "fatal"}, {"windw": "1m"}, "yes",
+    ])
+    def test_invalid(self, bad):
+        with pytest.raises(ValueError, match="bursts"):
+            _build_config({"rules": [], "bursts": bad})
+
+
+class TestBurstDetector:
+    """Test windowed counting against the baseline."""
+
+    def test_burst_once_then_rearm(self):
+        det = BurstDetector(BurstSpec(window_seconds=60, factor=5, min_count=10))
+        quiet = [m * 60 + k for m in range(10) for k in range(2)]  # 基线：每分钟 2 条
+        assert _run(det, quiet) == []
+        spike = [600 + k for k in range(30)]
+        bursts = _run(det, spike)
+        assert len(bursts) == 1  # 一次突发只报一条
+        assert bursts[0].extracted["key"] == "FS_EXCEPTION" and int(bursts[0].extracted["count"]) >= 10
+        assert bursts[0].rule_id == "burst_type" and bursts[0].severity == "high"
+        assert _run(det, [1200, 1201]) == []  # 回落
+        assert len(_run(det, [1800 + k for k in range(30)])) == 1  # 再次突发
+
+    def test_baseline_absorbs_steady_rate(self):
+        det = BurstDetector(BurstSpec(window_seconds=60, factor=5, min_count=10))
+        steady = [m * 60 + k for m in range(20) for k in range(15)]
+        assert len(_run(det, steady)) == 1  # 只有开头没有基线时报一次
+
+    def test_sliding_window_spans_boundary(self):
+        det = BurstDetector(BurstSpec(window_seconds=60, factor=5, min_count=10))
+        secs = list(range(54, 65))  # 跨两个固定窗口：6 + 5 条
+        assert len(_run(det, secs)) == 1
+
+    def test_keys_by_comm_and_bounded(self):
+        det = BurstDetector(BurstSpec(factor=2, min_count=3, by=("comm",), max_keys=2))
+        assert _run(det, [1, 2], comm="java") == []
+        assert len(_run(det, [3], comm="java")) == 1
+        for name in ("a", "b", "c"):
+            det.process([_inc(4, comm=name)])
+        assert det.stats()["keys"] == 2 and det.stats()["evicted"] == 2
+
+    def test_type_filter_and_no_timestamp(self):
+        det = BurstDetector(BurstSpec(factor=2, min_count=2, types=("OOM",)))
+        assert _run(det, [1, 2, 3]) == []
+        assert len(_run(det, [1, 2], type_="OOM")) == 1
+        plain = Incident(rule_id="r", type="OOM", severity="high", message="no time", line_no=1, extracted={})
+        det.process([plain])
+        assert det.stats()["seen"] == 2  # 没有时间戳、也没有时钟：不计数
+
+    def test_update_keeps_or_resets_state(self):
+        spec = BurstSpec(min_count=3)
+        det = BurstDetector(spec)
+        _run(det, [1, 2])
+        det.update(BurstSpec(min_count=3))
+        assert det.stats()["keys"] == 1
+        det.update(None)
+        assert not det.active and det.process([_inc(3)])[0].type == "FS_EXCEPTION"
+
+
+class TestScanBursts:
+    """Test `scan` with a bursts section."""
+
+    def test_scan(self, tmp_path, config_path):
+        data = yaml.safe_load(config_path.read_text())
+        data["bursts"] = {"window": "60s", "min_count": 5}
+        for rule in data["rules"]:
+            rule.pop("cooldown_seconds", None)
+        cfg = tmp_path / "rules.yaml"
+        cfg.write_text(yaml.safe_dump(data))
+        log = tmp_path / "kern.log"
+        log.write_text("".join(f"Dec 24 10:00:{k:02d} host kernel: EXT4-fs error (device sda1): bad block\n"
+                               for k in range(8)))
+        args = ["scan", "-f", str(log), "-c", str(cfg), "--json"]
+        found = json.loads(CliRunner().invoke(app, args).stdout)
+        bursts = [i for i in found if i["type"] == "BURST"]
+        assert len(bursts) == 1 and bursts[0]["line_no"] == 5
+        off = json.loads(CliRunner().invoke(app, args + ["--no-bursts"]).stdout)
+        assert off == [i for i in found if i["type"] != "BURST"]
@@ -5,7 +5,9 @@ Tests cover:
 - scan command functionality
 - stats command functionality
 - JSON output format
-- Error handling
+- Rule filter options
+- Streaming (stream/tsv) scan output, TSV escaping and the automatic table fallback
+- Error handling (monitor stops on a detection thread error)
 """
 from __future__ import annotations
 import json
@@ -223,9 +225,108 @@ class TestStatsCommand:
         assert result.exit_code != 0
 
 
+class TestRuleFilterOptions:
+    """Test --types / --min-severity / --rules on scan and stats."""
+
+    def test_scan_types(self):
+        result = runner.invoke(app, ["scan", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH), "--json", "--types", "OOM,panic"])
+        assert result.exit_code == 0
+        data = json.loads(result.stdout)
+        assert data and {i["type"] for i in data} == {"OOM", "PANIC"}
+
+    def test_stats_min_severity(self):
+        result = runner.invoke(app, ["stats", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH), "--json", "--min-severity", "critical"])
+        assert result.exit_code == 0
+        assert set(json.loads(result.stdout)["by_severity"]) == {"critical"}
+
+    def test_incremental_state_follows_filter(self, tmp_path):
+        args = ["stats", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH), "--json", "-i", "--state", str(tmp_path / "s.json")]
+        full = json.loads(runner.invoke(app, args).stdout)
+        only_oom = json.loads(runner.invoke(app, args + ["--types", "OOM"]).stdout)
+        assert set(only_oom["by_type"]) == {"OOM"} and only_oom["total_incidents"] < full["total_incidents"]
+
+    @pytest.mark.parametrize("extra", [["--types", "NOPE"], ["--min-severity", "urgent"], ["--rules", "nope"]])
+    def test_invalid(self, extra):
+        result = runner.invoke(app, ["scan", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH)] + extra)
+        assert result.exit_code == 1
+
+
+class TestStreamingOutput:
+    """Test scan --format stream/tsv and the --table-limit fallback."""
+
+    def _json(self):
+        return json.loads(runner.invoke(app, ["scan", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH), "--json"]).stdout)
+
+    def test_tsv_rows_match_json(self):
+        result = runner.invoke(app, ["scan", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH), "--format", "tsv"])
+        assert result.exit_code == 0
+        header, *rows = result.stdout.splitlines()
+        assert header.split("\t") == ["Line", "Type", "Severity", "Rule", "Extracted", "Ctx", "Message"]
+        expected = self._json()
+        assert len(rows) == len(expected)
+        for row, inc in zip(rows, expected):
+            cells = row.split("\t")
+            assert len(cells) == 7
+            assert int(cells[0]) == inc["line_no"] and cells[3] == inc["rule_id"] and cells[6] == inc["message"]
+
+    def test_tsv_escapes(self, tmp_path):
+        log = tmp_path / "kern.log"
+        msg = "Dec 24 10:00:00 h kernel: Out of memory: Killed process 7 (a\\tb\tc\rd)"
+        log.write_bytes((msg + "\n").encode())
+        result = runner.invoke(app, ["scan", "-f", str(log), "-c", str(CONFIG_PATH), "--format", "tsv"])
+        assert result.exit_code == 0
+        cells = result.stdout.splitlines()[1].split("\t")
+        assert len(cells) == 7
+        # 反斜杠先转义：原文的 "\\t" 与真正的制表符可以区分
+        assert cells[6].endswith("(a\\\\tb\\tc\\rd)")
+
+    def test_stream_rows(self):
+        result = runner.invoke(app, ["scan", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH), "--format", "stream", "-B", "2"])
+        assert result.exit_code == 0
+        lines = result.stdout.splitlines()
+        assert lines[0].split()[:7] == ["Line", "Type", "Severity", "Rule", "Extracted", "Ctx", "Before"]
+        assert lines[-1] == f"-- {len(self._json())} incident(s) --"
+
+    def test_auto_falls_back_to_stream(self):
+        result = runner.invoke(app, ["scan", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH), "--table-limit", "2"])
+        assert result.exit_code == 0
+        assert "streaming rows instead of a table" in result.stderr
+        assert "Incidents (" not in result.stdout
+        assert result.stdout.splitlines()[-1] == f"-- {len(self._json())} incident(s) --"
+        result = runner.invoke(app, ["scan", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH)])
+        assert "Incidents (" in result.stdout
+
+    def test_collapse_streams_summaries(self):
+        args = ["scan", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH), "--collapse", "1h"]
+        rows = runner.invoke(app, args + ["--format", "tsv"]).stdout.splitlines()
+        assert rows[0].split("\t")[6] == "Count"
+        data = json.loads(runner.invoke(app, args + ["--json"]).stdout)
+        assert sorted(int(r.split("\t")[0]) for r in rows[1:]) == [x["line_no"] for x in data]
+
+    @pytest.mark.parametrize("extra", [["--format", "csv"], ["--table-limit", "-1"]])
+    def test_invalid(self, extra):
+        result = runner.invoke(app, ["scan", "-f", str(TEST_LOG), "-c", str(CONFIG_PATH)] + extra)
+        assert result.exit_code == 1
+
+
 class TestEdgeCases:
     """Test edge cases for CLI commands."""
 
+    def test_monitor_detector_error_exits(self, tmp_path, monkeypatch):
+        """A detection thread error stops monitor with an Error: message and exit 1."""
+        from detecttool.engine import MultiLineAggregator
+
+        def boom(self, line_no, line):
+            raise RuntimeError("detector failed")
+
+        monkeypatch.setattr(MultiLineAggregator, "process", boom)
+        log = tmp_path / "kern.log"
+        log.write_text("Dec 24 17:40:01 h kernel: hello\n")
+        result = runner.invoke(app, ["monitor", "-f", str(log), "-c", str(CONFIG_PATH),
+                                     "--from-start", "--no-reload", "--poll", "0.05"])
+        assert result.exit_code == 1
+        assert "Error:" in result.stdout and "detector failed" in result.stdout
+
     def test_stats_empty_log(self, tmp_path):
         """Test stats on a log with no incidents."""
         # Create an empty log file
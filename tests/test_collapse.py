@@ -0,0 +1,128 @@
+"""
+Test cases for storm collapsing.
+
+Tests cover:
+- Fingerprint normalization (timestamps, numbers, process names)
+- Window handling (log time, expire on the log clock, flush, group limit)
+- Storm summary serialization and the `scan --collapse` option
+"""
+from __future__ import annotations
+import json
+import time
+import pytest
+from pathlib import Path
+from typer.testing import CliRunner
+from detecttool.cli import app
+from detecttool.collapse import StormCollapser, collapse_incidents, fingerprint
+from detecttool.config import load_config
+from detecttool.engine import Incident, detect_lines
+
+
+CONFIG_PATH = Path(__file__).parent.parent / "configs" / "rules.yaml"
+OOM_STORM = Path(__file__).parent.parent / "examples" / "logs" / "oom_storm.log"
+
+
+def _iter_file_lines(path: Path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for i, line in enumerate(f, start=1):
+            yield i, line
+
+
+def _oom(ts: str, pid: str, comm: str, line_no: int = 1) -> Incident:
+    return Incident(
+        rule_id="oom_basic", type="OOM", severity="high",
+        message=f"Dec 25 {ts} host kernel: [123.{pid}] Out of memory: Killed process {pid} ({comm}) total-vm:{pid}kB",
+        line_no=line_no, extracted={"pid": pid, "comm": comm},
+    )
+
+
+@pytest.fixture
+def storm_incidents():
+    return detect_lines(_iter_file_lines(OOM_STORM), load_config(str(CONFIG_PATH)).rules)
+
+
+class TestFingerprint:
+    """Test incident normalization."""
+
+    def test_same_event_different_process(self):
+        assert fingerprint(_oom("03:15:22", "8234", "java")) == fingerprint(_oom("03:16:40", "91", "redis-server"))
+
+    def test_different_rule_or_text(self):
+        a = _oom("03:15:22", "8234", "java")
+        b = Incident(rule_id="oom_cgroup", type="OOM", severity="high", message=a.message,
+                     line_no=1, extracted=a.extracted)
+        c = Incident(rule_id="oom_basic", type="OOM", severity="high",
+                     message="Dec 25 03:15:22 host kernel: Memory cgroup out of memory: Killed process 1 (java)",
+                     line_no=1, extracted={"pid": "1", "comm": "java"})
+        assert len({fingerprint(a), fingerprint(b), fingerprint(c)}) == 3
+
+
+class TestStormCollapser:
+    """Test windowed aggregation."""
+
+    def test_oom_storm_collapses(self, storm_incidents):
+        out = collapse_incidents(storm_incidents, 60)
+        assert len(out) < len(storm_incidents)
+        storm = out[0].storm
+        assert storm["count"] == sum(1 for i in storm_incidents if "Out of memory: Killed" in i.message)
+        assert storm["first_line"] == out[0].line_no == storm_incidents[0].line_no
+        assert storm["last_line"] > storm["first_line"]
+        assert storm["first_time"].endswith("03:15:22") and storm["last_time"].endswith("03:15:50")
+        assert storm["comms"][:2] == ["java", "mysql"] and len(storm["comms"]) <= 5
+        # 每个原始事件都被计入某个输出
+        assert sum(i.storm["count"] if i.storm else 1 for i in out) == len(storm_incidents)
+
+    def test_single_occurrence_unchanged(self):
+        inc = _oom("03:15:22", "1", "java")
+        assert collapse_incidents([inc], 60) == [inc]
+        assert inc.storm is None
+
+    def test_window_closes_on_later_log_time(self):
+        c = StormCollapser(60)
+        assert c.add(_oom("03:00:00", "1", "a", 1)) == []
+        assert c.add(_oom("03:00:30", "2", "b", 2)) == []
+        closed = c.add(_oom("03:01:01", "3", "c", 3))  # 超出首个事件 60s：旧窗口关闭，新窗口打开
+        assert len(closed) == 1 and closed[0].storm["count"] == 2
+        rest = c.flush()
+        assert len(rest) == 1 and rest[0].line_no == 3 and rest[0].storm is None
+
+    def test_expire_and_group_limit(self):
+        c = StormCollapser(60, max_groups=2)
+        c.add(_oom("03:00:00", "1", "a"))
+        assert c.expire(now=c._clock + 30) == []
+        assert len(c.expire(now=c._clock + 61)) == 1
+
+        c.add(Incident(rule_id="r1", type="X", severity="low", message="one", line_no=1, extracted={}))
+        c.add(Incident(rule_id="r2", type="X", severity="low", message="two", line_no=2, extracted={}))
+        evicted = c.add(Incident(rule_id="r3", type="X", severity="low", message="three", line_no=3, extracted={}))
+        assert [i.rule_id for i in evicted] == ["r1"]
+
+    def test_expire_uses_log_clock(self, monkeypatch):
+        c = StormCollapser(60)
+        c.add(_oom("03:00:00", "1", "a"))
+        # 日志时间与墙上时间不同（时钟偏差/回放）：不应立刻到期
+        monkeypatch.setattr(time, "time", lambda: c._clock + 86400)
+        assert c.expire() == []
+        later = time.monotonic() + 61  # 日志空闲 61s 后按日志时钟到期
+        monkeypatch.setattr(time, "monotonic", lambda: later)
+        assert len(c.expire()) == 1
+
+    def test_storm_json(self, storm_incidents):
+        inc = collapse_incidents(storm_incidents, 60)[0]
+        assert inc.to_json() == json.dumps(inc.to_dict(), ensure_ascii=False)
+        assert json.loads(inc.to_json())["storm"]["count"] == inc.storm["count"]
+
+
+class TestCollapseCli:
+    """Test `scan --collapse`."""
+
+    def test_scan_json(self, storm_incidents):
+        result = CliRunner().invoke(app, ["scan", "-f", str(OOM_STORM), "-c", str(CONFIG_PATH), "--json", "--collapse", "1m"])
+        assert result.exit_code == 0
+        data = json.loads(result.stdout)
+        assert len(data) < len(storm_incidents)
+        assert data[0]["storm"]["count"] > 1
+
+    def test_bad_window(self):
+        result = CliRunner().invoke(app, ["scan", "-f", str(OOM_STORM), "-c", str(CONFIG_PATH), "--collapse", "0s"])
+        assert result.exit_code == 1
@@ -0,0 +1,191 @@
+"""
+Test cases for configuration loading.
+
+Tests cover:
+- Config cache (hit, invalidation, corruption, owner/permission checks)
+- Keyword prefilter
+- Rule filters (--types / --min-severity / --rules) pruning the compiled rule set
+"""
+from __future__ import annotations
+import pytest
+from pathlib import Path
+from detecttool import config as config_mod
+from detecttool.config import RuleFilter, build_prefilter, load_config
+from detecttool.engine import Detector, MultiLineAggregator, detect_lines
+
+
+CONFIG_PATH = Path(__file__).parent.parent / "configs" / "rules.yaml"
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Point the config cache at a fresh directory."""
+    d = tmp_path / "cache"
+    monkeypatch.setenv("DETECTTOOL_CACHE_DIR", str(d))
+    monkeypatch.delenv("DETECTTOOL_NO_CACHE", raising=False)
+    return d
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    """A private copy of the default rules that tests may modify."""
+    p = tmp_path / "rules.yaml"
+    p.write_text(CONFIG_PATH.read_text(encoding="utf-8"), encoding="utf-8")
+    return p
+
+
+class TestConfigCache:
+    """Test the compiled configuration cache."""
+
+    def test_cache_written_on_first_load(self, cache_dir, rules_file):
+        """First load parses YAML and stores a cache entry."""
+        cfg = load_config(str(rules_file))
+        assert len(cfg.rules) == 6
+        assert len(list(cache_dir.glob("*.json"))) == 1
+
+    def test_cache_hit_skips_yaml(self, cache_dir, rules_file, monkeypatch):
+        """Second load is served from the cache without parsing YAML."""
+        first = load_config(str(rules_file))
+
+        def _fail(raw, path):
+            raise AssertionError("YAML should not be parsed on a cache hit")
+
+        monkeypatch.setattr(config_mod, "_parse_yaml", _fail)
+        second = load_config(str(rules_file))
+        assert [r.id for r in second.rules] == [r.id for r in first.rules]
+        assert second.rules[0].regex_any[0].pattern == first.rules[0].regex_any[0].pattern
+        assert second.prefilter is not None
+
+    def test_cache_invalidated_on_change(self, cache_dir, rules_file):
+        """Editing the file produces a new entry and drops the stale one."""
+        load_config(str(rules_file))
+        rules_file.write_text(
+            "version: 1\nrules:\n  - id: only\n    type: OOM\n    keywords_any: ['Killed process']\n",
+            encoding="utf-8",
+        )
+        cfg = load_config(str(rules_file))
+        assert [r.id for r in cfg.rules] == ["only"]
+        assert len(list(cache_dir.glob("*.json"))) == 1
+
+    def test_cache_invalidated_on_version(self, cache_dir, rules_file, monkeypatch):
+        """A different tool version never reuses an old entry."""
+        load_config(str(rules_file))
+        monkeypatch.setattr(config_mod, "__version__", "999.0")
+        load_config(str(rules_file))
+        # 新版本写入新条目，同一配置只保留一份
+        assert len(list(cache_dir.glob("*.json"))) == 1
+
+    def test_corrupt_cache_falls_back(self, cache_dir, rules_file):
+        """A corrupt cache entry is ignored and rewritten."""
+        load_config(str(rules_file))
+        entry = next(cache_dir.glob("*.json"))
+        entry.write_bytes(b"not json")
+        cfg = load_config(str(rules_file))
+        assert len(cfg.rules) == 6
+
+    def test_cache_is_private(self, cache_dir, rules_file):
+        """The cache directory and entries are created for the current user only."""
+        load_config(str(rules_file))
+        entry = next(cache_dir.glob("*.json"))
+        assert cache_dir.stat().st_mode & 0o777 == 0o700
+        assert entry.stat().st_mode & 0o777 == 0o600
+
+    @pytest.mark.parametrize("target", ["entry", "dir"])
+    def test_writable_by_others_ignored(self, cache_dir, rules_file, target):
+        """An entry others could have replaced is not trusted."""
+        load_config(str(rules_file))
+        entry = next(cache_dir.glob("*.json"))
+        entry.write_text('{"version": 1, "rules": [{"id": "evil", "type": "OOM", "keywords_any": ["x"]}]}')
+        (entry if target == "entry" else cache_dir).chmod(0o666 if target == "entry" else 0o777)
+        assert len(load_config(str(rules_file)).rules) == 6
+
+    def test_cache_disabled(self, cache_dir, rules_file, monkeypatch):
+        """DETECTTOOL_NO_CACHE disables the cache entirely."""
+        monkeypatch.setenv("DETECTTOOL_NO_CACHE", "1")
+        load_config(str(rules_file))
+        assert not cache_dir.exists()
+
+    def test_errors_not_cached(self, cache_dir, tmp_path):
+        """Invalid configs raise and leave no cache entry."""
+        bad = tmp_path / "bad.yaml"
+        bad.write_text("rules:\n  - type: OOM\n", encoding="utf-8")
+        with pytest.raises(ValueError):
+            load_config(str(bad))
+        assert not cache_dir.exists() or not list(cache_dir.glob("*.json"))
+
+
+class TestPrefilter:
+    """Test the keyword prefilter."""
+
+    def test_prefilter_skips_unrelated_lines(self):
+        """Lines without any rule keyword never reach the rules."""
+        cfg = load_config(str(CONFIG_PATH), use_cache=False)
+        detector = Detector(cfg.rules, prefilter=cfg.prefilter)
+        assert detector.process_line(1, "Dec 24 17:40:01 kernel: eth0 link up\n") == []
+        hits = detector.process_line(2, "Dec 24 17:40:10 kernel: reboot: Restarting system\n")
+        assert [h.type for h in hits] == ["REBOOT"]
+
+    def test_prefilter_disabled_without_keywords(self):
+        """A regex-only rule disables the prefilter."""
+        cfg = config_mod._build_config({"rules": [
+            {"id": "a", "type": "OOM", "keywords_any": ["oom"]},
+            {"id": "b", "type": "X", "regex_any": ["foo"]},
+        ]})
+        assert cfg.prefilter is None
+        assert build_prefilter(cfg.rules) is None
+
+
+class TestRuleFilter:
+    """Test pruning rules at compile time."""
+
+    LOGS = Path(__file__).parent.parent / "examples" / "logs"
+
+    def test_types_prune_rules_keywords_and_blocks(self):
+        cfg = load_config(str(CONFIG_PATH), rule_filter=RuleFilter(types=("panic", "DEADLOCK")))
+        assert {r.type for r in cfg.rules} == {"PANIC", "DEADLOCK"}
+        assert not cfg.prefilter.search("Out of memory: Killed process 1 (java)")
+        agg = MultiLineAggregator(Detector(cfg.rules, prefilter=cfg.prefilter))
+        assert {b.type for b in agg.table.specs} == {"PANIC", "DEADLOCK"}
+        assert agg.table.match_start("Oops: 0000 [#1] SMP") is None
+
+    def test_min_severity_and_rule_ids(self):
+        full = load_config(str(CONFIG_PATH))
+        cfg = load_config(str(CONFIG_PATH), rule_filter=RuleFilter(min_severity="high"))
+        assert cfg.rules and all(r.severity in ("high", "critical") for r in cfg.rules)
+        assert len(cfg.rules) < len(full.rules)
+        first = full.rules[0].id
+        assert [r.id for r in load_config(str(CONFIG_PATH), rule_filter=RuleFilter(rule_ids=(first,))).rules] == [first]
+        assert load_config(str(CONFIG_PATH), rule_filter=RuleFilter()).rules == full.rules
+
+    @pytest.mark.parametrize("log", ["mixed_production.log", "kernel_panic_full.log", "deadlock_scenario.log"])
+    def test_same_incidents_as_filtering_afterwards(self, log):
+        def run(cfg):
+            with open(self.LOGS / log, encoding="utf-8") as f:
+                return detect_lines(enumerate(f, start=1), cfg.rules, prefilter=cfg.prefilter)
+        wanted = {"PANIC", "DEADLOCK"}
+        full = [i.to_dict() for i in run(load_config(str(CONFIG_PATH))) if i.type in wanted]
+        pruned = [i.to_dict() for i in run(load_config(str(CONFIG_PATH), rule_filter=RuleFilter(types=tuple(wanted))))]
+        assert pruned == full
+
+    @pytest.mark.parametrize("flt, match", [
+        (RuleFilter(types=("NOPE",)), "Unknown incident type"),
+        (RuleFilter(rule_ids=("nope",)), "Unknown rule id"),
+        (RuleFilter(types=("REBOOT",), min_severity="critical"), "No rules left"),
+    ])
+    def test_invalid(self, flt, match):
+        with pytest.raises(ValueError, match=match):
+            load_config(str(CONFIG_PATH), rule_filter=flt)
+
+    def test_invalid_severity(self):
+        with pytest.raises(ValueError, match="Invalid severity"):
+            RuleFilter(min_severity="urgent")
+
+    def test_incremental_key_includes_filter(self):
+        from detecttool.stats import config_fingerprint
+        keys = {
+            config_fingerprint(str(CONFIG_PATH)),
+            config_fingerprint(str(CONFIG_PATH), RuleFilter(types=("PANIC",))),
+            config_fingerprint(str(CONFIG_PATH), RuleFilter(types=("PANIC",), min_severity="high")),
+        }
+        assert len(keys) == 3
+        assert config_fingerprint(str(CONFIG_PATH), RuleFilter()) == config_fingerprint(str(CONFIG_PATH))
@@ -0,0 +1,140 @@
+"""
+Test cases for the monitor daemon's control socket.
+
+Tests cover:
+- In-memory counters by type/severity and the recent incidents ring
+- status / ping / unknown commands over the Unix socket
+- Stale socket cleanup and refusing a socket that is in use
+- Read position reported by follow_file
+- `service-status` reading the live status and the incidents log summary; `--json` errors stay JSON
+"""
+from __future__ import annotations
+import json
+import pytest
+from typer.testing import CliRunner
+from detecttool.cli import app, SYSTEMD_SERVICE_TEMPLATE, _rotation_query
+from detecttool.control import ControlServer, DaemonStatus, query
+from detecttool.engine import Incident
+from detecttool.sources.file_follow import follow_file
+
+
+def _inc(type_="OOM", severity="high", line_no=1):
+    return Incident(type=type_, severity=severity, rule_id=f"{type_.lower()}_basic", line_no=line_no,
+                    message=f"{type_} at {line_no}", extracted={}, context=())
+
+
+@pytest.fixture
+def sock_path(tmp_path):
+    return str(tmp_path / "control.sock")
+
+
+class TestDaemonStatus:
+    """Test the counters kept by the output stage."""
+
+    def test_counts_and_recent(self):
+        st = DaemonStatus(recent=2)
+        for i, (t, sev) in enumerate([("OOM", "high"), ("PANIC", "critical"), ("OOM", "high")], start=1):
+            st.record(_inc(t, sev, i))
+        snap = st.snapshot()["incidents"]
+        assert snap["total"] == 3
+        assert snap["by_type"] == {"OOM": 2, "PANIC": 1}
+        assert snap["by_severity"] == {"high": 2, "critical": 1}
+        assert [x["line_no"] for x in snap["recent"]] == [2, 3]
+
+
+class TestControlServer:
+    """Test the socket protocol."""
+
+    def test_status_and_ping(self, sock_path):
+        st = DaemonStatus()
+        st.record(_inc())
+        with ControlServer(sock_path, lambda: {**st.snapshot(), "blocks": []}) as server:
+            reply = query(sock_path)
+            assert reply["ok"] and reply["incidents"]["by_type"] == {"OOM": 1}
+            assert query(sock_path, "ping")["ok"]
+            bad = query(sock_path, "reboot")
+            assert not bad["ok"] and "unknown command" in bad["error"]
+            assert server.requests == 3
+
+    def test_status_error_is_reported(self, sock_path):
+        with ControlServer(sock_path, lambda: 1 / 0):
+            reply = query(sock_path)
+        assert not reply["ok"] and "ZeroDivisionError" in reply["error"]
+
+    def test_stale_socket_replaced_and_removed(self, sock_path):
+        import socket
+
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.bind(sock_path)
+        s.close()  # 留下一个没人监听的套接字文件
+        server = ControlServer(sock_path, dict).start()
+        with pytest.raises(ValueError, match="already in use"):
+            ControlServer(sock_path, dict).start()
+        server.close()
+        with pytest.raises(OSError):
+            query(sock_path)
+
+    def test_follow_file_position(self, tmp_path):
+        log = tmp_path / "kern.log"
+        log.write_text("a\nb\n")
+        pos = {}
+        it = follow_file(str(log), start_at_end=False, poll_interval=0.01, yield_heartbeat=True, position=pos)
+        assert [next(it), next(it)] == [(1, "a\n"), (2, "b\n")]
+        assert next(it) == (0, "")  # 读到末尾后才记录偏移
+        assert pos["line_no"] == 2 and pos["offset"] == 4 and pos["reopens"] == 0
+        it.close()
+
+
+class TestServiceStatus:
+    """Test `service-status` against a live socket."""
+
+    def _status(self):
+        st = DaemonStatus()
+        st.record(_inc("PANIC", "critical", 7))
+        snap = st.snapshot()
+        snap.update(source={"path": "/var/log/kern.log", "line_no": 7, "offset": 100, "reopens": 0, "size": 150},
+                    config="/etc/detecttool/rules.yaml", rules=12, blocks=[
+                        {"type": "OOPS", "rule_id": "oops_basic", "start_line_no": 5, "context_lines": 3, "idle_seconds": 0.1}])
+        return snap
+
+    def test_json(self, sock_path):
+        with ControlServer(sock_path, self._status):
+            result = CliRunner().invoke(app, ["service-status", "--name", "detecttool-test", "--socket", sock_path, "--json"])
+        assert result.exit_code == 0
+        data = json.loads(result.stdout)
+        assert data["incidents"]["total"] == 1 and data["blocks"][0]["type"] == "OOPS"
+
+    def test_human(self, sock_path):
+        with ControlServer(sock_path, self._status):
+            result = CliRunner().invoke(app, ["service-status", "--name", "detecttool-test", "--socket", sock_path])
+        assert result.exit_code == 0
+        assert "PANIC=1" in result.stdout and "50 bytes behind" in result.stdout
+        assert "Open block: OOPS" in result.stdout
+
+    def test_unreachable(self, sock_path):
+        result = CliRunner().invoke(app, ["service-status", "--name", "detecttool-test", "--socket", sock_path, "--json"])
+        assert result.exit_code == 1
+        data = json.loads(result.stdout)  # 仍是 JSON，不是 rich 文本
+        assert data["ok"] is False and sock_path in data["error"]
+
+    def test_unit_enables_socket(self):
+        unit = SYSTEMD_SERVICE_TEMPLATE.format(detecttool_path="detecttool", log_file="/var/log/kern.log",
+                                               config_path="/etc/detecttool/rules.yaml",
+                                               output_dir="/var/log/detecttool", service_name="detecttool",
+                                               rotation=_rotation_query("50M", None, 10, True))
+        assert "--control /run/detecttool/control.sock" in unit and "RuntimeDirectory=detecttool" in unit
+        assert '--sink "file:/var/log/detecttool/incidents.log?max_bytes=50M&backups=10&compress=1&summary=1"' in unit
+        assert "StandardOutput=append" not in unit
+
+    def test_incidents_log_summary(self, sock_path, tmp_path):
+        from detecttool.sinks import open_sink
+
+        log = tmp_path / "incidents.log"
+        sink = open_sink(f"file:{log}?summary=1", batch_size=1, flush_interval=0.01)
+        sink.emit(_inc().to_dict())
+        sink.close()
+        result = CliRunner().invoke(app, ["service-status", "--name", "detecttool-test", "--socket", sock_path,
+                                          "--incidents-log", str(log), "--json"])
+        assert result.exit_code == 0  # 守护进程没在运行，也能给出日志汇总
+        data = json.loads(result.stdout)
+        assert not data["ok"] and data["incidents_log"]["count"] == 1
@@ -5,9 +5,13 @@ Tests cover:
 - Detection of all 6 abnormal types (OOM, Oops, Panic, Deadlock, Reboot, FS_Exception)
 - Field extraction (pid, comm, etc.)
 - Multi-line aggregation
+- Multi-line blocks declared in rules.yaml (block table)
+- Pre-trigger context ring buffer
+- File-backed (lazy) context and spilling
 - Cooldown mechanism
 """
 from __future__ import annotations
+import json
 import pytest
 from pathlib import Path
 from detecttool.engine import detect_lines, Detector, Incident
@@ -223,3 +227,230 @@ class TestEdgeCases:
         # All 6 types should be present and each appears once
         assert len(set(types)) == 6, "Should have 6 unique incident types"
         assert sorted(types) == sorted(["OOM", "OOPS", "PANIC", "DEADLOCK", "REBOOT", "FS_EXCEPTION"])
+
+
+class TestIncidentModel:
+    """Test the compact Incident representation and its serializer."""
+
+    def test_incident_is_slotted(self, incidents):
+        """Incidents carry no per-instance __dict__ and use tuple context."""
+        assert not hasattr(incidents[0], "__dict__")
+        panic = [inc for inc in incidents if inc.type == "PANIC"][0]
+        assert isinstance(panic.context, tuple)
+
+    def test_rule_fields_are_shared(self, config):
+        """rule_id/type/severity reference the rule's interned strings."""
+        detector = Detector(config.rules)
+        a = detector.process_line(1, "Dec 24 17:40:30 kernel: reboot: Restarting system\n")[0]
+        b = detector.process_line(2, "Dec 24 17:40:31 kernel: reboot: Restarting system\n")[0]
+        assert a.rule_id is b.rule_id and a.severity is b.severity
+
+    def test_to_json_matches_json_dumps(self, incidents):
+        """The hand-written serializer produces exactly json.dumps output."""
+        import json
+
+        tricky = Incident(
+            rule_id="r", type="T", severity="low",
+            message='quote " backslash \\ tab \t 中文 \x01',
+            line_no=7, extracted={"comm": "a\"b", "pid": "1"},
+            context=("line  ", "x"),
+        )
+        for inc in list(incidents) + [tricky]:
+            assert inc.to_json() == json.dumps(inc.to_dict(), ensure_ascii=False)
+
+    def test_write_json_ndjson_line(self, incidents):
+        """write_json appends exactly one newline-terminated record."""
+        import io
+        import json
+
+        buf = io.StringIO()
+        for inc in incidents:
+            inc.write_json(buf)
+        lines = buf.getvalue().splitlines()
+        assert len(lines) == len(incidents)
+        assert [json.loads(l)["type"] for l in lines] == [inc.type for inc in incidents]
+
+    def test_to_dict_is_a_copy(self, incidents):
+        """Mutating to_dict() output does not touch the incident."""
+        oom = [inc for inc in incidents if inc.type == "OOM"][0]
+        d = oom.to_dict()
+        d["extracted"]["pid"] = "0"
+        assert oom.extracted["pid"] == "1234"
+
+
+class TestMultiLineRules:
+    """Test multi-line blocks declared per rule."""
+
+    @staticmethod
+    def _rules(extra: str = ""):
+        from detecttool.config import _build_config
+        import yaml
+        return _build_config(yaml.safe_load(f"""
+rules:
+  - id: mce
+    type: HW
+    severity: critical
+    keywords_any: ["Machine check events logged"]
+    multiline:
+      end: ["MCE done"]
+      window_seconds: 2
+      max_lines: 3
+  - id: reboot
+    type: REBOOT
+    keywords_any: ["Restarting system"]
+{extra}
+""")).rules
+
+    @staticmethod
+    def _run(rules, lines):
+        from detecttool.engine import MultiLineAggregator
+        agg = MultiLineAggregator(Detector(rules))
+        out = []
+        for n, line in enumerate(lines, start=1):
+            out.extend(agg.process(n, line))
+        return out + agg.flush()
+
+    def test_custom_block_end_marker(self):
+        out = self._run(self._rules(), [
+            "Dec 24 10:00:00 h kernel: Machine check events logged\n",
+            "Dec 24 10:00:00 h kernel: bank 4 status\n",
+            "Dec 24 10:00:01 h kernel: MCE done\n",
+            "Dec 24 10:00:01 h kernel: after\n",
+        ])
+        assert [i.rule_id for i in out] == ["mce"]
+        assert out[0].context == ("Dec 24 10:00:00 h kernel: bank 4 status", "Dec 24 10:00:01 h kernel: MCE done")
+
+    def test_window_and_max_lines(self):
+        out = self._run(self._rules(), [
+            "Dec 24 10:00:00 h kernel: Machine check events logged\n",
+            "Dec 24 10:00:01 h kernel: a\n",
+            "Dec 24 10:00:05 h kernel: reboot: Restarting system\n",  # 超出 2s 窗口：块结束，本行按普通行检测
+            "Dec 24 10:01:00 h kernel: Machine check events logged\n",
+            "x\n", "y\n", "z\n", "w\n",  # max_lines=3
+        ])
+        assert [(i.rule_id, i.line_no, len(i.context)) for i in out] == [
+            ("mce", 1, 1), ("reboot", 3, 0), ("mce", 4, 3),
+        ]
+
+    def test_start_line_detected_once(self, monkeypatch):
+        calls = []
+        orig = Detector.process_line
+
+        def counting(self, line_no, line):
+            calls.append(line_no)
+            return orig(self, line_no, line)
+
+        monkeypatch.setattr(Detector, "process_line", counting)
+        self._run(self._rules(), [
+            "Dec 24 10:00:00 h kernel: Machine check events logged\n",
+            "Dec 24 10:00:00 h kernel: bank 4\n",
+        ])
+        assert calls == [1]  # 上下文行不做规则检测，起始行只检测一次
+
+    def test_legacy_config_keeps_builtin_blocks(self, config):
+        """A rules file without any `multiline` key behaves like before."""
+        from detecttool.config import _build_config
+        legacy = _build_config({"rules": [
+            {"id": r.id, "type": r.type, "severity": r.severity, "keywords_any": r.keywords_any,
+             "regex_any": [p.pattern for p in r.regex_any], "cooldown_seconds": r.cooldown_seconds}
+            for r in config.rules
+        ]}).rules
+        assert {r.type for r in legacy if r.multiline} == {"OOPS", "PANIC", "DEADLOCK"}
+        got = detect_lines(_iter_file_lines(TEST_LOG), legacy)
+        want = detect_lines(_iter_file_lines(TEST_LOG), config.rules)
+        assert [i.to_dict() for i in got] == [i.to_dict() for i in want]
+
+    def test_snapshot_restore_keeps_hits(self):
+        from detecttool.engine import MultiLineAggregator
+        rules = self._rules()
+        agg = MultiLineAggregator(Detector(rules))
+        agg.process(1, "Dec 24 10:00:00 h kernel: Machine check events logged\n")
+        agg.process(2, "Dec 24 10:00:00 h kernel: bank 4\n")
+        resumed = MultiLineAggregator(Detector(rules))
+        resumed.restore(agg.snapshot())
+        assert [i.to_dict() for i in resumed.flush()] == [i.to_dict() for i in agg.flush()]
+
+    @pytest.mark.parametrize("spec", ["'yes'", "{max_lines: 0}", "{end: [1]}"])
+    def test_invalid_multiline(self, spec):
+        with pytest.raises(ValueError, match="multiline"):
+            self._rules(f"    multiline: {spec}")
+
+
+class TestBeforeContext:
+    """Test the pre-trigger context ring buffer."""
+
+    LINES = [
+        "Dec 24 10:00:00 h kernel: memory pressure warning\n",
+        "Dec 24 10:00:01 h kernel: Buffer I/O error on dev sda1\n",
+        "Dec 24 10:00:02 h kernel: swap full\n",
+        "Dec 24 10:00:03 h kernel: Out of memory: Killed process 42 (java)\n",
+        "Dec 24 10:00:04 h kernel: Kernel panic - not syncing: Fatal exception\n",
+        "Dec 24 10:00:04 h kernel: trace\n",
+    ]
+
+    def _detect(self, config, **kwargs):
+        return detect_lines(enumerate(self.LINES, start=1), config.rules, **kwargs)
+
+    def test_off_by_default(self, config):
+        incidents = self._detect(config)
+        assert all(i.before == () for i in incidents)
+        assert all("before" not in i.to_dict() for i in incidents)
+
+    def test_preceding_lines_attached(self, config):
+        by_type = {i.type: i for i in self._detect(config, before_lines=2)}
+        assert by_type["OOM"].before == (self.LINES[1].rstrip("\n"), self.LINES[2].rstrip("\n"))
+        # 多行块：before 在起始行时截取，不包含起始行和块内的行
+        assert by_type["PANIC"].before == (self.LINES[2].rstrip("\n"), self.LINES[3].rstrip("\n"))
+        assert by_type["PANIC"].context == (self.LINES[5].rstrip("\n"),)
+        inc = by_type["OOM"]
+        assert inc.to_json() == json.dumps(inc.to_dict(), ensure_ascii=False)
+
+    def test_byte_budget(self):
+        from detecttool.engine import LineRing
+        ring = LineRing(10, 10)
+        for text in ("aaaa", "bbbb", "cccc"):
+            ring.append(text)
+        assert ring.snapshot() == ("bbbb", "cccc")
+        ring.append("é" * 4)  # 8 字节
+        assert ring.snapshot() == ("é" * 4,)
+        ring.append("x" * 11)  # 单行超预算：清空
+        assert ring.snapshot() == ()
+
+
+class TestLazyContext:
+    """Test context referenced by file offsets."""
+
+    LOG = Path(__file__).parent.parent / "examples" / "logs" / "kernel_panic_full.log"
+
+    def _spans(self, path):
+        from detecttool.context import iter_line_spans
+        with open(path, "rb") as f:
+            yield from iter_line_spans(f)
+
+    def test_same_output_as_text_mode(self, config):
+        from detecttool.context import ContextStore, LazyContext
+        expected = detect_lines(_iter_file_lines(self.LOG), config.rules)
+        with ContextStore(str(self.LOG)) as store:
+            lazy = detect_lines(self._spans(self.LOG), config.rules, context_store=store)
+            assert store.file_backed and store.mem_bytes == 0
+            assert any(isinstance(i.context, LazyContext) and len(i.context) for i in lazy)
+            assert [i.to_json() for i in lazy] == [i.to_json() for i in expected]
+            assert [i.to_dict() for i in lazy] == [i.to_dict() for i in expected]
+
+    def test_spans_and_crlf(self, tmp_path):
+        from detecttool.context import ContextStore
+        p = tmp_path / "crlf.log"
+        p.write_bytes("first\r\nsecond é\nlast".encode("utf-8"))
+        rows = list(self._spans(p))
+        assert [(n, t) for n, t, _ in rows] == [(1, "first\n"), (2, "second é\n"), (3, "last")]
+        with ContextStore(str(p)) as store:
+            assert [store.read(span) for _, _, span in rows] == ["first", "second é", "last"]
+
+    def test_spill_over_budget(self, config):
+        from detecttool.context import ContextStore
+        expected = detect_lines(_iter_file_lines(self.LOG), config.rules)
+        # 不是普通文件（相当于管道输入）：内存预算为 0，context 全部落到临时文件
+        with ContextStore(None, mem_budget=0) as store:
+            lazy = detect_lines(_iter_file_lines(self.LOG), config.rules, context_store=store)
+            assert not store.file_backed and store.spilled_bytes > 0
+            assert [i.to_dict() for i in lazy] == [i.to_dict() for i in expected]
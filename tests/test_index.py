@@ -0,0 +1,135 @@
+"""
+Test cases for the sidecar line/offset/time index.
+
+Tests cover:
+- Entries point at real line starts with correct line numbers and timestamps
+- Validation by inode/size/mtime, extension of a grown file
+- Time seeking and random line access
+- The `index` command and the index scan builds on the side
+"""
+from __future__ import annotations
+import json
+import pytest
+from typer.testing import CliRunner
+from detecttool.cli import app
+from detecttool.engine import _parse_syslog_ts
+from detecttool import index as index_mod
+from detecttool.index import AutoIndexer, LogIndex, build_index, load_index, read_lines, save_index
+
+
+def _write_log(path, start_line=1, count=100):
+    with open(path, "a", encoding="utf-8") as f:
+        for n in range(start_line, start_line + count):
+            f.write(f"Dec 24 10:{n // 60:02d}:{n % 60:02d} host kernel: line {n} é\n")
+
+
+@pytest.fixture
+def log(tmp_path):
+    p = tmp_path / "kern.log"
+    _write_log(p)
+    return p
+
+
+class TestBuild:
+    """Test index construction."""
+
+    def test_entries_match_file(self, log):
+        idx, extended = build_index(str(log), stride=10)
+        assert not extended and idx.lines == 100 and len(idx) == 10
+        raw = log.read_bytes()
+        for i in range(len(idx)):
+            off, before, ts = idx.entry(i)
+            assert before == 10 * i
+            line = raw[off:raw.index(b"\n", off)].decode()
+            assert line.split("line ")[1].startswith(f"{before + 1} ")
+            assert ts == int(_parse_syslog_ts(line))
+
+    def test_partial_last_line_not_indexed(self, log):
+        with open(log, "a") as f:
+            f.write("Dec 24 11:00:00 host kernel: half")
+        idx, _ = build_index(str(log), stride=10)
+        assert idx.lines == 100 and idx.end_offset < idx.size
+
+    def test_save_load_and_validation(self, log, tmp_path):
+        idx, _ = build_index(str(log), stride=10)
+        where = save_index(idx, str(log))
+        assert where == tmp_path / "kern.log.dtidx"
+        loaded = load_index(str(log))
+        assert loaded is not None and list(loaded.entries) == list(idx.entries)
+        _write_log(log, 101, 5)  # 追加：size/mtime 变了，索引不再可信
+        assert load_index(str(log)) is None
+        assert load_index(str(log), stale=True) is not None
+
+    def test_extend_equals_rebuild(self, log):
+        old, _ = build_index(str(log), stride=7)
+        _write_log(log, 101, 50)
+        ext, extended = build_index(str(log), stride=7, previous=old)
+        full, _ = build_index(str(log), stride=7)
+        assert extended
+        assert list(ext.entries) == list(full.entries) and ext.lines == full.lines == 150
+
+    def test_rewritten_file_is_rebuilt(self, log):
+        old, _ = build_index(str(log), stride=10)
+        log.write_text("Dec 24 09:00:00 host kernel: other\n" * 200)
+        _, extended = build_index(str(log), stride=10, previous=old)
+        assert not extended
+
+    def test_corrupt_index_ignored(self, log, tmp_path):
+        (tmp_path / "kern.log.dtidx").write_bytes(b"garbage")
+        assert LogIndex.read(tmp_path / "kern.log.dtidx") is None
+        assert load_index(str(log)) is None
+
+
+class TestAccess:
+    """Test seeking with an index."""
+
+    def test_seek_time(self, log):
+        idx, _ = build_index(str(log), stride=10)
+        target = _parse_syslog_ts("Dec 24 10:00:55 x")  # 第 55 行
+        off, before = idx.seek_time(target)
+        assert before == 50 and off == idx.entry(5)[0]
+        assert idx.seek_time(0) == (0, 0)
+
+    def test_read_lines(self, log):
+        idx, _ = build_index(str(log), stride=10)
+        rows = read_lines(str(log), idx, 44, 3)
+        assert [n for n, _ in rows] == [44, 45, 46]
+        assert rows[0][1].endswith("line 44 é")
+        assert read_lines(str(log), None, 44, 3) == rows
+
+
+class TestIndexCli:
+    """Test the `index` command and scan's automatic index."""
+
+    def test_build_then_up_to_date(self, log, tmp_path):
+        runner = CliRunner()
+        result = runner.invoke(app, ["index", "-f", str(log), "--stride", "10", "--json"])
+        assert result.exit_code == 0
+        data = json.loads(result.stdout)
+        assert data["mode"] == "built" and data["entries"] == 10 and data["lines"] == 100
+        result = runner.invoke(app, ["index", "-f", str(log), "--stride", "10", "--json", "--line", "50", "-C", "1"])
+        data = json.loads(result.stdout)
+        assert data["mode"] == "up to date"
+        assert [x["line_no"] for x in data["lines_shown"]] == [49, 50, 51]
+        _write_log(log, 101, 10)
+        data = json.loads(runner.invoke(app, ["index", "-f", str(log), "--stride", "10", "--json"]).stdout)
+        assert data["mode"] == "extended" and data["lines"] == 110
+
+    def test_missing_file(self, tmp_path):
+        result = CliRunner().invoke(app, ["index", "-f", str(tmp_path / "nope.log")])
+        assert result.exit_code == 1
+
+    def test_bad_stride(self, log):
+        result = CliRunner().invoke(app, ["index", "-f", str(log), "--stride", "0"])
+        assert result.exit_code == 1
+        assert "Error:" in result.stdout and "Configuration Error" not in result.stdout  # index 不读配置
+
+    def test_scan_builds_index(self, log, config_path, monkeypatch):
+        monkeypatch.setattr(index_mod, "AUTO_INDEX_BYTES", 0)
+        assert AutoIndexer.for_file(str(log)) is not None
+        result = CliRunner().invoke(app, ["scan", "-f", str(log), "-c", str(config_path), "--json"])
+        assert result.exit_code == 0
+        idx = load_index(str(log))
+        assert idx is not None and idx.lines == 100 and idx.path != log.with_name("kern.log.dtidx")
+        assert list(idx.entries) == list(build_index(str(log))[0].entries)
+        assert AutoIndexer.for_file(str(log)) is None  # 已有有效索引
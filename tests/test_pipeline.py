@@ -0,0 +1,132 @@
+"""
+Test cases for the threaded monitor pipeline.
+
+Tests cover:
+- reader -> detection -> output ordering and final flush
+- Slow output policies (block / drop-newest / drop-oldest)
+- Queue depth metrics and error propagation (a failing detector stops the reader too)
+"""
+from __future__ import annotations
+import threading
+import time
+import pytest
+from pathlib import Path
+from detecttool.config import load_config
+from detecttool.engine import Detector, Incident, MultiLineAggregator
+from detecttool.pipeline import MonitorPipeline, StageQueue
+
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+TEST_LOG = FIXTURES_DIR / "test.log"
+CONFIG_PATH = Path(__file__).parent.parent / "configs" / "rules.yaml"
+
+
+def _lines(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        return list(enumerate(f, start=1))
+
+
+def _fake_incident(n: int) -> Incident:
+    return Incident(rule_id="r", type="T", severity="low", message=str(n), line_no=n, extracted={})
+
+
+class TestMonitorPipeline:
+    """Test the staged pipeline end to end."""
+
+    def test_same_result_as_inline(self):
+        """Pipeline output equals inline aggregation, including the final flush."""
+        cfg = load_config(str(CONFIG_PATH))
+        agg = MultiLineAggregator(Detector(cfg.rules))
+        out = []
+        pipe = MonitorPipeline(_lines(TEST_LOG), agg.process, out.append, finish=agg.flush)
+        pipe.run()
+
+        assert sorted(i.type for i in out) == sorted(["OOM", "OOPS", "PANIC", "DEADLOCK", "REBOOT", "FS_EXCEPTION"])
+        m = pipe.metrics()
+        assert m["lines_read"] == m["lines_processed"] == 16
+        assert m["incidents_detected"] == m["incidents_output"] == 6
+        assert m["queues"]["lines"]["dropped"] == 0
+
+    def test_between_lines_hook(self):
+        """between_lines runs on the detection thread before every line."""
+        calls = []
+        pipe = MonitorPipeline(
+            [(1, "a\n"), (2, "b\n")],
+            lambda n, l: [],
+            lambda inc: None,
+            between_lines=lambda: calls.append(threading.current_thread().name),
+        )
+        pipe.run()
+        assert calls == ["detecttool-detector"] * 2
+
+    def test_slow_output_drop_newest(self):
+        """With drop-newest a slow output loses incidents but never blocks detection."""
+        release = threading.Event()
+        out = []
+
+        def slow_output(inc):
+            release.wait(5)
+            out.append(inc)
+
+        pipe = MonitorPipeline(
+            [(i, "x\n") for i in range(1, 51)],
+            lambda n, l: [_fake_incident(n)],
+            slow_output,
+            incident_queue_size=5,
+            output_policy="drop-newest",
+        ).start()
+        # 检测阶段不会被慢输出卡住
+        deadline = time.time() + 5
+        while pipe.lines_processed < 50 and time.time() < deadline:
+            time.sleep(0.01)
+        assert pipe.lines_processed == 50
+        release.set()
+        pipe.run()
+
+        m = pipe.metrics()["queues"]["incidents"]
+        assert m["dropped"] > 0
+        assert len(out) + m["dropped"] == 50
+        assert m["max_depth"] <= 5
+
+    def test_error_propagates(self):
+        """A failing detection stage surfaces in run()."""
+        def boom(n, l):
+            raise RuntimeError("detector failed")
+
+        pipe = MonitorPipeline([(1, "x\n")], boom, lambda inc: None)
+        with pytest.raises(RuntimeError, match="detector failed"):
+            pipe.run()
+
+    def test_error_stops_endless_source(self):
+        """A detector error stops an endless source (follow_file) instead of tailing on."""
+        def follow():
+            n = 0
+            while True:
+                n += 1
+                yield (n, "x\n") if n < 3 else (0, "")  # 之后只有心跳
+                time.sleep(0.01)
+
+        def boom(n, l):
+            if n == 2:
+                raise RuntimeError("detector failed")
+            return []
+
+        pipe = MonitorPipeline(follow(), boom, lambda inc: None, line_queue_size=1)
+        with pytest.raises(RuntimeError, match="detector failed"):
+            pipe.run()
+        assert not any(t.is_alive() for t in pipe._threads)
+
+
+class TestStageQueue:
+    """Test the bounded stage queue."""
+
+    def test_drop_oldest_keeps_newest(self):
+        q = StageQueue("q", 2, "drop-oldest")
+        for i in range(5):
+            q.put(i)
+        assert [q.get(), q.get()] == [3, 4]
+        assert q.metrics()["dropped"] == 3
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            StageQueue("q", 2, "explode")
@@ -0,0 +1,121 @@
+"""
+Test cases for per-rule rate limiting.
+
+Tests cover:
+- rate_limit / rate_limits parsing in rules.yaml
+- Token bucket bursts and refill
+- Adaptive sampling and "N suppressed" summaries (nothing lost from the accounting)
+- Per-type sharing, unlimited rules and hot reload
+"""
+from __future__ import annotations
+import pytest
+from detecttool.config import RateLimit, _build_config
+from detecttool.engine import Incident
+from detecttool.ratelimit import RateLimiter
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _config(**extra):
+    data = {
+        "rules": [
+            {"id": "io", "type": "FS_EXCEPTION", "keywords_any": ["I/O error"],
+             "rate_limit": {"rate": "2/s", "burst": 5}},
+            {"id": "ext4", "type": "FS_EXCEPTION", "keywords_any": ["EXT4-fs error"]},
+            {"id": "xfs", "type": "FS_EXCEPTION", "keywords_any": ["XFS ("]},
+            {"id": "panic", "type": "PANIC", "severity": "critical", "keywords_any": ["Kernel panic"]},
+        ],
+        "rate_limits": {"FS_EXCEPTION": {"rate": "60/m", "burst": 2, "sample": False}},
+        "rate_limit_summary_seconds": 10,
+    }
+    data.update(extra)
+    return _build_config(data)
+
+
+def _inc(rule_id: str, type_: str = "FS_EXCEPTION", line_no: int = 1) -> Incident:
+    return Incident(rule_id=rule_id, type=type_, severity="high", message="x", line_no=line_no, extracted={})
+
+
+class TestRateLimitConfig:
+    """Test parsing of rate limits."""
+
+    def test_parse(self):
+        cfg = _config()
+        assert cfg.rules[0].rate_limit == RateLimit(rate=2.0, burst=5, sample=True)
+        assert cfg.rules[1].rate_limit is None
+        assert cfg.type_limits["FS_EXCEPTION"] == RateLimit(rate=1.0, burst=2, sample=False)
+        assert cfg.rate_limit_summary_seconds == 10
+
+    @pytest.mark.parametrize("spec", [{"burst": 3}, {"rate": "fast"}, {"rate": 0}, {"rate": 5, "burst": 0}, "10/s"])
+    def test_invalid(self, spec):
+        with pytest.raises(ValueError, match="rate_limit"):
+            _build_config({"rules": [{"id": "r", "type": "T", "rate_limit": spec}]})
+
+
+class TestRateLimiter:
+    """Test token buckets, sampling and summaries."""
+
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        lim = RateLimiter(_config(), clock=clock)
+        passed = [lim.allow(_inc("ext4")) for _ in range(5)]
+        assert passed == [True, True, False, False, False]  # 类型桶 burst=2，不抽样
+        clock.now += 1.0
+        assert lim.allow(_inc("xfs"))  # 同类型共享桶，1 秒补 1 个令牌
+        assert not lim.allow(_inc("ext4"))
+
+    def test_unlimited_rules_pass(self):
+        lim = RateLimiter(_config(), clock=FakeClock())
+        assert all(lim.allow(_inc("panic", "PANIC")) for _ in range(1000))
+
+    def test_adaptive_sampling(self):
+        clock = FakeClock()
+        lim = RateLimiter(_config(), clock=clock)
+        passed = 0
+        # 3 秒内每秒 200 条，限额 2/s：超限后大约每 100 条抽 1 条
+        for _ in range(3):
+            for i in range(200):
+                clock.now += 1 / 200
+                passed += lim.allow(_inc("io"))
+        assert 5 + 3 * 2 <= passed <= 5 + 3 * 2 + 3 * 10
+        lim_b = lim._budgets["rule:io"]
+        assert lim_b.stride(clock.now) >= 50
+
+    def test_summaries_account_for_everything(self):
+        clock = FakeClock()
+        lim = RateLimiter(_config(), clock=clock)
+        total = 0
+        out = []
+        for step in range(250):
+            clock.now += 0.1
+            batch = [_inc("io", line_no=step), _inc("ext4", line_no=step)]
+            total += len(batch)
+            out.extend(lim.process(batch))
+        out.extend(lim.flush())
+        summaries = [i for i in out if i.rule_id.startswith("ratelimit_")]
+        regular = [i for i in out if not i.rule_id.startswith("ratelimit_")]
+        assert {s.rule_id for s in summaries} == {"ratelimit_io", "ratelimit_fs_exception"}
+        suppressed = sum(int(s.extracted["suppressed"]) for s in summaries)
+        assert len(regular) + suppressed == total
+        # 25 秒、每 10 秒汇总一次 + flush
+        assert len([s for s in summaries if s.rule_id == "ratelimit_io"]) == 3
+        assert "suppressed by rate limit" in summaries[0].message
+
+    def test_reload_keeps_unchanged_buckets(self):
+        clock = FakeClock()
+        lim = RateLimiter(_config(), clock=clock)
+        for _ in range(10):
+            lim.allow(_inc("ext4"))
+        assert not lim.allow(_inc("ext4"))
+        lim.update(_config())  # 同样的限额：桶状态保留
+        assert not lim.allow(_inc("ext4"))
+        lim.update(_config(rate_limits={}))  # 去掉类型限额：不再限流，已累计的计数仍然汇总
+        assert lim.allow(_inc("ext4"))
+        summaries = lim.flush()
+        assert [s.extracted["suppressed"] for s in summaries] == ["10"]
@@ -0,0 +1,128 @@
+"""
+Test cases for hot reload of rules.
+
+Tests cover:
+- Detector.swap_rules keeps cooldown state for unchanged rules
+- Aggregation blocks survive a swap
+- RuleReloader picks up file changes and SIGHUP, rejects invalid files
+"""
+from __future__ import annotations
+import os
+import signal
+import time
+import pytest
+from pathlib import Path
+from detecttool.config import load_config
+from detecttool.engine import Detector, MultiLineAggregator
+from detecttool.reload import RuleReloader
+
+
+CONFIG_PATH = Path(__file__).parent.parent / "configs" / "rules.yaml"
+
+OOM_LINE = "Dec 24 17:40:10 kernel: Out of memory: Killed process 1234 (python3)\n"
+
+
+def _wait_for(reloader: RuleReloader, timeout: float = 3.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        cfg = reloader.poll()
+        if cfg is not None:
+            return cfg
+        time.sleep(0.02)
+    return None
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    """A private copy of the default rules that tests may modify."""
+    p = tmp_path / "rules.yaml"
+    p.write_text(CONFIG_PATH.read_text(encoding="utf-8"), encoding="utf-8")
+    return p
+
+
+class TestSwapRules:
+    """Test swapping rule sets into a live Detector."""
+
+    def test_unchanged_rule_keeps_cooldown(self, rules_file):
+        """Cooldown for an unchanged rule survives the swap."""
+        detector = Detector(load_config(str(rules_file)).rules)
+        assert len(detector.process_line(1, OOM_LINE)) == 1
+
+        diff = detector.swap_rules(load_config(str(rules_file), use_cache=False).rules)
+        assert "oom_basic" in diff["unchanged"]
+        assert detector.process_line(2, OOM_LINE) == []
+
+    def test_changed_rule_resets_cooldown(self, rules_file):
+        """A rule whose definition changed starts with fresh cooldown state."""
+        detector = Detector(load_config(str(rules_file)).rules)
+        detector.process_line(1, OOM_LINE)
+
+        rules_file.write_text(
+            rules_file.read_text(encoding="utf-8").replace("cooldown_seconds: 30", "cooldown_seconds: 45"),
+            encoding="utf-8",
+        )
+        diff = detector.swap_rules(load_config(str(rules_file)).rules)
+        assert diff["changed"] == ["oom_basic"]
+        assert len(detector.process_line(2, OOM_LINE)) == 1
+
+    def test_open_block_survives_swap(self, rules_file):
+        """An in-flight multi-line block is not dropped by a swap."""
+        detector = Detector(load_config(str(rules_file)).rules)
+        agg = MultiLineAggregator(detector)
+        agg.process(1, "Dec 24 17:40:13 kernel: Kernel panic - not syncing: Fatal exception\n")
+        agg.process(2, "Dec 24 17:40:13 kernel: panic stack trace line 1\n")
+
+        detector.swap_rules(load_config(str(rules_file)).rules)
+        incidents = agg.flush()
+        assert [i.type for i in incidents] == ["PANIC"]
+        assert incidents[0].context == ("Dec 24 17:40:13 kernel: panic stack trace line 1",)
+
+
+class TestRuleReloader:
+    """Test the background rules reloader."""
+
+    def test_reload_on_file_change(self, rules_file):
+        """Editing the file stages a new config."""
+        reloader = RuleReloader(str(rules_file), check_interval=0.05).start()
+        try:
+            rules_file.write_text(
+                "version: 1\nrules:\n  - id: only\n    type: OOM\n    keywords_any: ['Killed process']\n",
+                encoding="utf-8",
+            )
+            cfg = _wait_for(reloader)
+            assert cfg is not None
+            assert [r.id for r in cfg.rules] == ["only"]
+        finally:
+            reloader.stop()
+
+    @pytest.mark.skipif(not hasattr(signal, "SIGHUP"), reason="POSIX only")
+    def test_reload_on_sighup(self, rules_file):
+        """SIGHUP forces a reload even without file changes."""
+        reloader = RuleReloader(str(rules_file), check_interval=60)
+        old = signal.getsignal(signal.SIGHUP)
+        try:
+            assert reloader.install_signal_handler()
+            reloader.start()
+            os.kill(os.getpid(), signal.SIGHUP)
+            cfg = _wait_for(reloader)
+            assert cfg is not None and len(cfg.rules) == 6
+        finally:
+            reloader.stop()
+            signal.signal(signal.SIGHUP, old)
+
+    def test_invalid_file_keeps_current_rules(self, rules_file):
+        """A broken config is reported and never staged."""
+        reloader = RuleReloader(str(rules_file))
+        rules_file.write_text("rules:\n  - id: x\n    type: OOM\n    regex_any: ['(']\n", encoding="utf-8")
+        assert reloader.reload_now() is False
+        assert reloader.poll() is None
+        assert "Invalid regex" in reloader.poll_error()
+        assert reloader.poll_error() is None
+
+    def test_reload_keeps_rule_filter(self, rules_file):
+        """Reloaded rule sets are pruned by the same --types filter."""
+        from detecttool.config import RuleFilter
+        reloader = RuleReloader(str(rules_file), rule_filter=RuleFilter(types=("OOM",)))
+        assert reloader.reload_now() is True
+        cfg = reloader.poll()
+        assert cfg.rules and {r.type for r in cfg.rules} == {"OOM"}
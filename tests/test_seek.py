@@ -0,0 +1,207 @@
+"""
+Test cases for time-range scanning (--since/--until).
+
+Tests cover:
+- Binary search over byte offsets, with and without the sidecar index
+- Line numbers after a seek: absolute with an (even stale) index, else counted from the range start
+- Absolute --since/--until dates from another year (syslog lines carry no year)
+- Untimed continuation lines and the --until cut
+- Tail scans (--last / --tail-bytes) read backward from EOF
+- `scan` / `stats` options
+"""
+from __future__ import annotations
+import json
+import pytest
+from datetime import datetime
+from typer.testing import CliRunner
+from detecttool.cli import app
+from detecttool.context import iter_line_spans
+from detecttool.index import build_index, save_index
+from detecttool import engine, seek
+from detecttool.seek import TailReader, TimeRangeReader, count_lines, iter_time_range
+
+YEAR = datetime.now().year  # syslog 时间戳不带年份，按当前年份解析
+
+
+def _t(hh_mm_ss: str) -> float:
+    return datetime.fromisoformat(f"{YEAR}-12-24 {hh_mm_ss}").timestamp()
+
+
+@pytest.fixture
+def big_log(tmp_path):
+    """~6000 lines over 100 minutes, every 10th second has an untimed trace line."""
+    p = tmp_path / "kern.log"
+    with open(p, "w", encoding="utf-8") as f:
+        for sec in range(6000):
+            h, m, s = 10 + sec // 3600, (sec // 60) % 60, sec % 60
+            f.write(f"Dec 24 {h:02d}:{m:02d}:{s:02d} host kernel: [{sec}.000] tick {sec}\n")
+            if sec % 10 == 0:
+                f.write(f" ? trace_{sec}+0x10/0x20\n")
+            if sec == 3000:
+                f.write("Dec 24 10:50:00 host kernel: Out of memory: Killed process 42 (java)\n")
+    return p
+
+
+def _all(path):
+    with open(path, "rb") as f:
+        return list(iter_line_spans(f))
+
+
+class TestTimeRange:
+    """Test seeking into a time window."""
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_matches_linear_filter(self, big_log, indexed, monkeypatch):
+        if indexed:
+            save_index(build_index(str(big_log), stride=100)[0], str(big_log))
+        else:
+            monkeypatch.setattr(seek, "count_lines", None)  # 窗口之前的部分不能整读来数行
+        window = TimeRangeReader(str(big_log), _t("10:30:00"), _t("10:40:00"), use_index=indexed)
+        rows = list(window)
+        everything = _all(big_log)
+        first = next(i for i, r in enumerate(everything) if r[1].startswith("Dec 24 10:30:00"))
+        last = next(i for i, r in enumerate(everything) if r[1].startswith("Dec 24 10:40:00"))
+        assert [r[1:] for r in rows] == [r[1:] for r in everything[first:last]]
+        assert rows[1][1].startswith(" ? trace_1800+")  # 无时间戳行跟着前一行
+        assert window.absolute == indexed
+        if indexed:
+            assert rows == everything[first:last]
+        else:
+            # 没有索引不数窗口之前的行：行号从窗口第一行算起
+            assert [r[0] for r in rows] == list(range(1, len(rows) + 1))
+
+    def test_absolute_via_stale_index(self, big_log):
+        save_index(build_index(str(big_log), stride=100)[0], str(big_log))
+        with open(big_log, "a") as f:
+            f.write("Dec 24 11:40:00 host kernel: appended\n")
+        window = TimeRangeReader(str(big_log), _t("10:30:00"), _t("10:31:00"))
+        everything = _all(big_log)
+        first = next(i for i, r in enumerate(everything) if r[1].startswith("Dec 24 10:30:00"))
+        assert window.absolute and list(window)[0] == everything[first]
+
+    def test_dates_from_another_year(self, big_log, monkeypatch):
+        class Frozen(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return cls(2030, 3, 1, 12, 0, 0)
+
+        monkeypatch.setattr(engine, "datetime", Frozen)
+        monkeypatch.setattr(seek, "datetime", Frozen)
+        # 2030 年运行时问 2029-12-24 的日志：'Dec 24' 的行都按 2030 年解析，查询范围要跟着换算
+        since = datetime(2029, 12, 24, 10, 30).timestamp()
+        until = datetime(2029, 12, 24, 10, 40).timestamp()
+        rows = list(iter_time_range(str(big_log), since, until))
+        assert rows[0][1].startswith("Dec 24 10:30:00") and rows[-1][1].startswith("Dec 24 10:39:59")
+
+    def test_spans_point_into_file(self, big_log):
+        raw = big_log.read_bytes()
+        for line_no, text, (off, n) in list(iter_time_range(str(big_log), _t("11:00:00")))[:5]:
+            assert raw[off:off + n].decode() == text.rstrip("\n")
+
+    def test_open_ends(self, big_log):
+        everything = _all(big_log)
+        assert list(iter_time_range(str(big_log), until=_t("10:00:05"))) == everything[:6]
+        assert list(iter_time_range(str(big_log), since=_t("12:00:00"))) == []
+        assert list(iter_time_range(str(big_log), since=_t("09:00:00")))[:3] == everything[:3]
+
+    def test_count_lines(self, big_log):
+        with open(big_log, "rb") as f:
+            assert count_lines(f, big_log.stat().st_size) == len(_all(big_log))
+
+
+class TestTail:
+    """Test reading the end of a file."""
+
+    @pytest.mark.parametrize("block", [1024 * 1024, 1000])
+    def test_last_duration(self, big_log, block, monkeypatch):
+        monkeypatch.setattr(seek, "_TAIL_BLOCK", block)  # 小块：跨块的半行也要拼对
+        everything = _all(big_log)
+        tail = TailReader(str(big_log), seconds=600)
+        rows = list(tail)
+        first = next(i for i, r in enumerate(everything) if r[1].startswith("Dec 24 11:29:59"))
+        assert [r[1:] for r in rows] == [r[1:] for r in everything[first:]]
+        assert not tail.absolute
+        assert tail.relative(rows[-1][0]) == -1 and tail.relative(rows[0][0]) == first - len(everything)
+
+    def test_tail_bytes_starts_on_line(self, big_log):
+        raw = big_log.read_bytes()
+        rows = list(TailReader(str(big_log), nbytes=1000))
+        off = rows[0][2][0]
+        assert raw[off - 1:off] == b"\n" and len(raw) - off <= 1000
+        assert rows[-1][1] == _all(big_log)[-1][1]
+
+    def test_absolute_via_index(self, big_log):
+        save_index(build_index(str(big_log), stride=100)[0], str(big_log))
+        with open(big_log, "a") as f:  # 索引之后又追加了内容：旧索引仍可用来推算行号
+            f.write("Dec 24 11:40:00 host kernel: appended\n")
+        everything = _all(big_log)
+        tail = TailReader(str(big_log), seconds=60)
+        rows = list(tail)
+        assert tail.absolute
+        assert rows == everything[len(everything) - len(rows):]
+
+    def test_untimed_file(self, tmp_path):
+        p = tmp_path / "plain.log"
+        p.write_text("a\nb\n")
+        assert [r[1] for r in TailReader(str(p), seconds=60)] == ["a\n", "b\n"]
+
+
+class TestTimeRangeCli:
+    """Test `--since/--until` on scan and stats."""
+
+    def test_scan_window(self, big_log, config_path):
+        args = ["scan", "-f", str(big_log), "-c", str(config_path), "--json"]
+        full = json.loads(CliRunner().invoke(app, args).stdout)
+        window = ["--since", f"{YEAR}-12-24 10:45", "--until", f"{YEAR}-12-24 10:55"]
+        result = CliRunner().invoke(app, args + window)
+        assert result.exit_code == 0
+        [inc] = json.loads(result.stdout)
+        assert len(full) == 1 and {**inc, "line_no": 0} == {**full[0], "line_no": 0}
+        assert 0 < inc["line_no"] < full[0]["line_no"]  # 没有索引：相对窗口起点
+        result = CliRunner().invoke(app, args[:-1] + window)
+        assert "relative to start of --since range" in result.stdout
+        CliRunner().invoke(app, ["index", "-f", str(big_log)])
+        assert json.loads(CliRunner().invoke(app, args + window).stdout) == full  # 有索引：绝对行号
+        result = CliRunner().invoke(app, args + ["--since", f"{YEAR}-12-24 11:00"])
+        assert json.loads(result.stdout) == []
+
+    def test_stats_window(self, big_log, config_path):
+        result = CliRunner().invoke(app, [
+            "stats", "-f", str(big_log), "-c", str(config_path), "--json",
+            "--since", f"{YEAR}-12-24 10:00:00", "--until", f"{YEAR}-12-24 10:01:00",
+        ])
+        assert result.exit_code == 0
+        assert json.loads(result.stdout)["total_lines_scanned"] == 66
+
+    @pytest.mark.parametrize("extra", [
+        ["--since", "11:00", "--until", "10:00"],
+        ["--since", "yesterday-ish"],
+    ])
+    def test_bad_range(self, big_log, config_path, extra):
+        result = CliRunner().invoke(app, ["scan", "-f", str(big_log), "-c", str(config_path)] + extra)
+        assert result.exit_code == 1
+
+    def test_stats_incremental_conflict(self, big_log, config_path):
+        result = CliRunner().invoke(app, ["stats", "-f", str(big_log), "-c", str(config_path), "-i", "--since", "1h"])
+        assert result.exit_code == 1
+
+    def test_scan_last(self, big_log, config_path):
+        args = ["scan", "-f", str(big_log), "-c", str(config_path), "--json"]
+        result = CliRunner().invoke(app, args + ["--last", "1h"])
+        assert result.exit_code == 0
+        [inc] = json.loads(result.stdout)
+        assert inc["line_no"] < 0 and "Out of memory" in inc["message"]
+        assert json.loads(CliRunner().invoke(app, args + ["--last", "30m"]).stdout) == []
+        result = CliRunner().invoke(app, ["scan", "-f", str(big_log), "-c", str(config_path), "--tail-bytes", "10K"])
+        assert result.exit_code == 0 and "relative to end of file" in result.stdout
+        result = CliRunner().invoke(app, args[:-1] + ["--last", "1h", "--format", "tsv"])
+        assert result.stdout.splitlines()[1].split("\t")[0] == str(inc["line_no"])  # 流式输出同样是相对行号
+
+    @pytest.mark.parametrize("extra", [
+        ["--last", "1h", "--tail-bytes", "1M"],
+        ["--last", "1h", "--since", "10:00"],
+        ["--last", "0s"],
+    ])
+    def test_bad_tail(self, big_log, config_path, extra):
+        result = CliRunner().invoke(app, ["scan", "-f", str(big_log), "-c", str(config_path)] + extra)
+        assert result.exit_code == 1
@@ -0,0 +1,195 @@
+"""
+Test cases for sharding syslog detection across worker processes.
+
+Tests cover:
+- Consistent hash ring: balance, and only the removed node's keys move (and move back)
+- Every host handled by one worker: multi-line blocks and cooldowns intact, batched sends
+- Per-worker queue metrics; a full queue drops (counted) instead of blocking the receiver
+- Bounded routing table: evicted hosts are forgotten by their worker
+- A killed worker: hosts rebalanced to the others, worker restarted, hosts moved back
+- All workers dead: messages counted as dropped (no exceptions) until a restart
+- Hot reload broadcast to workers, `serve-syslog --workers` argument errors
+"""
+from __future__ import annotations
+import os
+import signal
+import time
+from collections import Counter
+import pytest
+from typer.testing import CliRunner
+from detecttool.cli import app
+from detecttool.config import load_config
+from detecttool.shard import HashRing, ShardedDetectors
+
+HOSTS = [f"host{i:03d}" for i in range(300)]
+
+
+def _line(host: str, msg: str, sec: int = 0) -> str:
+    return f"Dec 24 10:00:{sec:02d} {host} kernel: {msg}"
+
+
+def _wait(sd: ShardedDetectors, cond, timeout: float = 10.0) -> list:
+    out = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        out += sd.heartbeat()
+        if cond(out):
+            return out
+        time.sleep(0.05)
+    return out
+
+
+class TestHashRing:
+    """Test the consistent hash ring."""
+
+    def test_balance(self):
+        ring = HashRing(range(4))
+        counts = Counter(ring.node_for(h) for h in HOSTS)
+        assert set(counts) == {0, 1, 2, 3}
+        assert min(counts.values()) > len(HOSTS) / 4 * 0.5
+
+    def test_minimal_movement(self):
+        ring = HashRing(range(4))
+        before = {h: ring.node_for(h) for h in HOSTS}
+        ring.remove(2)
+        after = {h: ring.node_for(h) for h in HOSTS}
+        assert all(after[h] == before[h] for h in HOSTS if before[h] != 2)
+        assert all(after[h] != 2 for h in HOSTS)
+        ring.add(2)
+        assert {h: ring.node_for(h) for h in HOSTS} == before
+
+    def test_empty(self):
+        assert HashRing().node_for("x") is None
+
+
+@pytest.fixture
+def cfg(config_path):
+    return load_config(str(config_path))
+
+
+@pytest.fixture
+def sharded(cfg):
+    sd = ShardedDetectors(cfg.rules, prefilter=cfg.prefilter, workers=2, batch_size=50)
+    sd.start()
+    yield sd
+    sd.close()
+
+
+class TestShardedDetectors:
+    """Test detection in worker processes."""
+
+    def test_blocks_and_cooldowns_per_host(self, sharded):
+        out = []
+        for h in HOSTS[:20]:
+            out += sharded.process(h, _line(h, "Kernel panic - not syncing: Fatal exception"))
+        for h in HOSTS[:20]:
+            out += sharded.process(h, _line(h, f"CPU: 1 PID: 1 Comm: {h}"))
+        for h in HOSTS[100:120]:
+            out += sharded.process(h, _line(h, "Out of memory: Killed process 7 (java)"))
+            out += sharded.process(h, _line(h, "Out of memory: Killed process 7 (java)"))  # 冷却
+        out += sharded.flush()
+        panics = [i for i in out if i.type == "PANIC"]
+        assert sorted(i.extracted["host"] for i in panics) == HOSTS[:20]
+        assert all(list(i.context)[0].endswith(f"Comm: {i.extracted['host']}") for i in panics)
+        assert Counter(i.type for i in out)["OOM"] == 20
+
+    def test_metrics(self, sharded):
+        for i, h in enumerate(HOSTS):
+            sharded.process(h, _line(h, f"hello {i}"))
+        _wait(sharded, lambda out: sharded.stats()["hosts"] == len(HOSTS))
+        st = sharded.stats()
+        assert st["messages"] == len(HOSTS) and len(st["workers"]) == 2
+        w = st["workers"][0]
+        assert {"queue_depth", "queue_max_depth", "queue_capacity", "pending", "batches"} <= set(w)
+        assert sum(x["messages"] + x["pending"] for x in st["workers"]) == len(HOSTS)
+        assert all(x["hosts"] > 0 for x in st["workers"])
+
+    def test_worker_restart_rebalances(self, sharded):
+        for h in HOSTS:
+            sharded.process(h, _line(h, "hello"))
+        _wait(sharded, lambda out: sharded.stats()["hosts"] == len(HOSTS))
+        victim = sharded.stats()["workers"][0]
+        os.kill(victim["pid"], signal.SIGKILL)
+        _wait(sharded, lambda out: sharded.stats()["restarts"] == 1)
+        assert sharded.moved_hosts == victim["hosts"]  # 只有它的主机被挪走
+        # 重启后主机回到原来的 worker，临时接手的 worker 忘掉它们
+        _wait(sharded, lambda out: sharded.stats()["workers"][0]["alive"] and len(sharded.ring) == 2)
+        assert sharded.moved_hosts == 2 * victim["hosts"]
+        h = next(h for h in HOSTS if sharded.ring.node_for(h) == 0)
+        sharded.process(h, _line(h, "Kernel panic - not syncing: after restart"))
+        out = sharded.flush()
+        assert [(i.type, i.extracted["host"]) for i in out] == [("PANIC", h)]
+
+    def test_all_workers_dead_drops_until_restart(self, cfg):
+        sd = ShardedDetectors(cfg.rules, prefilter=cfg.prefilter, workers=1, batch_size=2).start()
+        try:
+            for h in HOSTS[:10]:
+                sd.process(h, _line(h, "hello"))
+            os.kill(sd.stats()["workers"][0]["pid"], signal.SIGKILL)
+            deadline = time.monotonic() + 10
+            i = 0
+            while not (sd.stats()["restarts"] == 1 and sd.stats()["workers"][0]["alive"]):
+                assert time.monotonic() < deadline
+                h = HOSTS[i % 20]  # 已分配过的和新主机都有
+                sd.process(h, _line(h, "hello"))  # 不抛异常，只计数丢弃
+                sd.heartbeat()
+                i += 1
+                time.sleep(0.01)
+            assert sd.dropped > 0 and sd.stats()["dropped"] == sd.dropped
+            sd.process("a", _line("a", "Kernel panic - not syncing: after restart"))
+            assert [(i.type, i.extracted["host"]) for i in sd.flush()] == [("PANIC", "a")]
+        finally:
+            sd.close()
+
+    def test_route_table_eviction_forgets_host(self, cfg):
+        sd = ShardedDetectors(cfg.rules, prefilter=cfg.prefilter, workers=2, batch_size=1, max_hosts=10).start()
+        try:
+            a = HOSTS[0]
+            slot = sd.ring.node_for(a)
+            sd.process(a, _line(a, "hello"))
+            _wait(sd, lambda out: sd.stats()["workers"][slot]["hosts"] == 1)
+            for h in [h for h in HOSTS[1:] if sd.ring.node_for(h) != slot][:20]:
+                sd.process(h, _line(h, "hello"))
+            # 路由表满 (10 x 2)：最久没出现的 a 出表，它的 worker 也忘掉它，而不是整表清空留下过期状态
+            assert a not in sd._owner and len(sd._owner) == 20
+            _wait(sd, lambda out: sd.stats()["workers"][slot]["hosts"] == 0)
+            assert sd.stats()["workers"][slot]["hosts"] == 0
+        finally:
+            sd.close()
+
+    def test_full_queue_drops_instead_of_blocking(self, cfg):
+        sd = ShardedDetectors(cfg.rules, prefilter=cfg.prefilter, workers=1, batch_size=1, queue_size=1).start()
+        pid = sd.stats()["workers"][0]["pid"]
+        try:
+            os.kill(pid, signal.SIGSTOP)  # worker 卡住，队列很快就满
+            start = time.monotonic()
+            for i in range(50):
+                sd.process("a", _line("a", f"hello {i}"))
+            assert time.monotonic() - start < 0.5  # 事件循环不会被阻塞
+            st = sd.stats()
+            assert st["dropped"] == st["workers"][0]["dropped"] > 0 and st["workers"][0]["queue_full"] > 0
+            os.kill(pid, signal.SIGCONT)
+            _wait(sd, lambda out: sd.stats()["workers"][0]["queue_depth"] == 0)
+            sd.process("a", _line("a", "Kernel panic - not syncing: later"))
+            assert [i.type for i in sd.flush()] == ["PANIC"]
+        finally:
+            if sd.stats()["workers"][0]["alive"]:
+                os.kill(pid, signal.SIGCONT)
+            sd.close()
+
+    def test_swap_rules(self, sharded, cfg):
+        diff = sharded.swap_rules([r for r in cfg.rules if r.type != "OOM"])
+        assert diff["removed"] == ["oom_basic"]
+        sharded.process("a", _line("a", "Out of memory: Killed process 7 (java)"))
+        sharded.process("a", _line("a", "EXT4-fs error (device sda1): bad"))
+        assert [i.type for i in sharded.flush()] == ["FS_EXCEPTION"]
+
+
+class TestServeSyslogWorkers:
+    """Test `serve-syslog --workers` argument handling."""
+
+    @pytest.mark.parametrize("args", [["--workers", "-1"], ["--workers", "2", "--ipc-batch", "0"]])
+    def test_bad_arguments(self, config_path, args):
+        result = CliRunner().invoke(app, ["serve-syslog", "-c", str(config_path), "--udp", "off",
+                                          "--tcp", "127.0.0.1:0"] + args)
+        assert result.exit_code == 1
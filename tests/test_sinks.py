@@ -0,0 +1,321 @@
+"""
+Test cases for batched output sinks.
+
+Tests cover:
+- NDJSON file sink with size rotation
+- Compressed rotated segments and the per-segment summary sidecar (throttled, failures never repeat a batch)
+- Unix domain socket sink
+- HTTP sink against a local stub collector
+- Bounded queue drop accounting, abstract write hook and sink spec parsing
+"""
+from __future__ import annotations
+import json
+import socket
+import sys
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from detecttool.sinks import open_sink
+from detecttool.sinks.base import BatchingSink
+from detecttool.sinks.file import load_summary, summary_totals
+from detecttool.units import parse_duration, parse_size
+
+
+def _records(n: int):
+    return [{"rule_id": "oom_basic", "type": "OOM", "line_no": i} for i in range(1, n + 1)]
+
+
+class _SlowSink(BatchingSink):
+    """Sink whose writes block until released, to fill the queue."""
+    name = "slow"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+        self.written = []
+
+    def _write(self, records):
+        self.release.wait(5)
+        self.written.extend(records)
+
+
+class TestFileSink:
+    """Test the NDJSON file sink."""
+
+    def test_writes_ndjson(self, tmp_path):
+        """All records end up as one JSON object per line."""
+        path = tmp_path / "out" / "incidents.ndjson"
+        sink = open_sink(f"file:{path}", batch_size=10, flush_interval=0.05)
+        for r in _records(25):
+            sink.emit(r)
+        sink.close()
+
+        lines = path.read_text(encoding="utf-8").splitlines()
+        assert [json.loads(l)["line_no"] for l in lines] == list(range(1, 26))
+        st = sink.stats()
+        assert st["written"] == 25 and st["dropped"] == 0
+        assert st["batches"] >= 3
+
+    def test_size_rotation(self, tmp_path):
+        """Exceeding max_bytes rotates to path.1, path.2 ... keeping `backups` files."""
+        path = tmp_path / "incidents.ndjson"
+        sink = open_sink(f"file:{path}?max_bytes=200&backups=2", batch_size=1, flush_interval=0.01)
+        for r in _records(20):
+            sink.emit(r)
+        sink.close()
+
+        assert path.exists()
+        assert (tmp_path / "incidents.ndjson.1").exists()
+        assert (tmp_path / "incidents.ndjson.2").exists()
+        assert not (tmp_path / "incidents.ndjson.3").exists()
+        assert path.stat().st_size <= 200
+        assert sink.stats()["rotations"] > 2
+
+    def test_flush_writes_pending(self, tmp_path):
+        """flush() forces out a partially filled batch."""
+        path = tmp_path / "incidents.ndjson"
+        sink = open_sink(f"file:{path}", batch_size=1000, flush_interval=60)
+        sink.emit(_records(1)[0])
+        sink.flush()
+        assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+        sink.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Unix sockets only")
+class TestSegmentSummary:
+    """Test gzip rotation and the summary sidecar of the file sink."""
+
+    def _incidents(self, n):
+        types = [("OOM", "high"), ("PANIC", "critical")]
+        return [{"rule_id": f"{t.lower()}_basic", "type": t, "severity": sev, "line_no": i,
+                 "message": f"Dec 24 10:{i // 60:02d}:{i % 60:02d} kernel: {t} {i}"}
+                for i in range(1, n + 1) for t, sev in [types[i % 2]]]
+
+    def _read_all(self, tmp_path):
+        import gzip
+
+        out = []
+        for p in tmp_path.glob("incidents.log*"):
+            if p.name.endswith(".summary.json"):
+                continue
+            opener = gzip.open if p.suffix == ".gz" else open
+            with opener(p, "rt", encoding="utf-8") as f:
+                out += [json.loads(l) for l in f]
+        return out
+
+    def test_compressed_rotation_with_summary(self, tmp_path):
+        path = tmp_path / "incidents.log"
+        sink = open_sink(f"file:{path}?max_bytes=1K&backups=3&compress=1&summary=1", batch_size=5, flush_interval=0.01)
+        for r in self._incidents(100):
+            sink.emit(r)
+        sink.close()
+
+        assert (tmp_path / "incidents.log.1.gz").exists() and not (tmp_path / "incidents.log.1").exists()
+        assert not (tmp_path / "incidents.log.4.gz").exists()
+        summary = load_summary(str(path))
+        on_disk = self._read_all(tmp_path)
+        assert [s["file"] for s in summary["segments"]] == ["incidents.log"] + [f"incidents.log.{i}.gz" for i in (1, 2, 3)]
+        assert sum(s["count"] for s in summary["segments"]) == len(on_disk)
+        totals = summary_totals(summary)
+        assert totals["count"] == 100  # 已删除的段计入 expired
+        assert totals["by_type"] == {"OOM": 50, "PANIC": 50}
+        assert totals["first_log_ts"] < totals["last_log_ts"]
+        seg = summary["segments"][1]
+        assert seg["stored_bytes"] < seg["bytes"]
+
+    def test_summary_rebuilt_after_restart(self, tmp_path):
+        path = tmp_path / "incidents.log"
+        spec = f"file:{path}?max_bytes=1K&backups=20&summary=1"
+        sink = open_sink(spec, batch_size=5, flush_interval=0.01)
+        for r in self._incidents(30):
+            sink.emit(r)
+        sink.close()
+        (tmp_path / "incidents.log.summary.json").unlink()
+        with open(path, "a") as f:  # 守护进程之外追加的记录
+            f.write(json.dumps(self._incidents(1)[0]) + "\n")
+        sink = open_sink(spec, batch_size=5, flush_interval=0.01)
+        for r in self._incidents(10):
+            sink.emit(r)
+        sink.close()
+        summary = load_summary(str(path))
+        assert sum(s["count"] for s in summary["segments"]) == len(self._read_all(tmp_path)) == 41
+
+    def test_summary_failure_does_not_repeat_batch(self, tmp_path):
+        path = tmp_path / "incidents.log"
+        (tmp_path / "incidents.log.summary.json.tmp").mkdir()  # 写摘要必然失败
+        sink = open_sink(f"file:{path}?summary=1", batch_size=5, flush_interval=0.01)
+        for r in self._incidents(20):
+            sink.emit(r)
+        sink.close()
+        lines = path.read_text().splitlines()
+        assert len(lines) == len(set(lines)) == 20
+        st = sink.stats()
+        assert st["written"] == 20 and st["dropped"] == 0 and st["errors"] == 0
+        assert st["summary_errors"] > 0 and sink.last_error.startswith("summary:")
+
+    def test_summary_saves_throttled(self, tmp_path):
+        from detecttool.sinks.file import NdjsonFileSink
+
+        path = tmp_path / "incidents.log"
+        sink = NdjsonFileSink(str(path), summary=True, summary_interval=3600,
+                              batch_size=5, flush_interval=0.01).start()
+        for r in self._incidents(20):
+            sink.emit(r)
+        sink.flush()
+        assert load_summary(str(path))["segments"][0]["count"] == 0  # 只在打开时写过一次
+        sink.close()
+        assert load_summary(str(path))["segments"][0]["count"] == 20
+
+    def test_stats_from_summary(self, tmp_path):
+        from typer.testing import CliRunner
+        from detecttool.cli import app
+
+        path = tmp_path / "incidents.log"
+        sink = open_sink(f"file:{path}?max_bytes=1K&backups=1&compress=1&summary=1", batch_size=5, flush_interval=0.01)
+        for r in self._incidents(40):
+            sink.emit(r)
+        sink.close()
+        runner = CliRunner()
+        result = runner.invoke(app, ["stats", "--incidents-log", str(path), "--json"])
+        assert result.exit_code == 0
+        data = json.loads(result.stdout)
+        assert data["total_incidents"] == 40 and data["by_severity"] == {"high": 20, "critical": 20}
+        assert data["incidents_log"]["segments"] == 2
+        assert runner.invoke(app, ["stats", "--incidents-log", str(path)]).exit_code == 0
+        assert runner.invoke(app, ["stats", "--incidents-log", str(tmp_path / "other.log")]).exit_code == 1
+        assert runner.invoke(app, ["stats", "--incidents-log", str(path), "-f", str(path)]).exit_code == 1
+
+
+class TestUnixSocketSink:
+    """Test the Unix domain socket sink."""
+
+    def test_stream_to_socket(self, tmp_path):
+        """Records arrive on the listening socket as NDJSON."""
+        sock_path = str(tmp_path / "s.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(sock_path)
+        server.listen(1)
+        received = []
+
+        def _serve():
+            conn, _ = server.accept()
+            buf = b""
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                buf += chunk
+            received.extend(buf.decode().splitlines())
+            conn.close()
+
+        t = threading.Thread(target=_serve, daemon=True)
+        t.start()
+        sink = open_sink(f"unix:{sock_path}", batch_size=5, flush_interval=0.05)
+        for r in _records(12):
+            sink.emit(r)
+        sink.close()
+        t.join(5)
+        server.close()
+        assert [json.loads(l)["line_no"] for l in received] == list(range(1, 13))
+
+    def test_unreachable_socket_counts_errors(self, tmp_path):
+        """Failed writes are dropped and accounted for."""
+        sink = open_sink(f"unix:{tmp_path / 'missing.sock'}", batch_size=10, flush_interval=0.01)
+        sink.retries = 0
+        for r in _records(3):
+            sink.emit(r)
+        sink.close()
+        st = sink.stats()
+        assert st["dropped"] == 3 and st["errors"] >= 1 and "last_error" in st
+
+
+class TestHttpSink:
+    """Test the HTTP sink against a local stub collector."""
+
+    def test_post_batches(self):
+        """Each batch is POSTed as an NDJSON body."""
+        bodies = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                bodies.append((self.headers["Content-Type"], self.rfile.read(length)))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        t = threading.Thread(target=server.serve_forever, daemon=True)
+        t.start()
+        try:
+            sink = open_sink(f"http://127.0.0.1:{server.server_port}/ingest", batch_size=4, flush_interval=0.05)
+            for r in _records(10):
+                sink.emit(r)
+            sink.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert all(ct == "application/x-ndjson" for ct, _ in bodies)
+        lines = [json.loads(l) for _, b in bodies for l in b.decode().splitlines()]
+        assert [r["line_no"] for r in lines] == list(range(1, 11))
+        assert sink.stats()["batches"] == len(bodies) >= 3
+
+
+class TestBackpressure:
+    """Test bounded queues and drop accounting."""
+
+    def test_drop_when_full(self):
+        """With on_full=drop, records beyond the queue are dropped and counted."""
+        sink = _SlowSink(batch_size=1, flush_interval=0.01, queue_size=2, on_full="drop").start()
+        results = [sink.emit(r) for r in _records(10)]
+        sink.release.set()
+        sink.close()
+        st = sink.stats()
+        assert results.count(False) == st["dropped"] > 0
+        assert st["accepted"] + st["dropped"] == 10
+        assert len(sink.written) == st["written"] == st["accepted"]
+
+    def test_block_with_timeout(self):
+        """With on_full=block, producers wait and drop only after the timeout."""
+        sink = _SlowSink(batch_size=1, flush_interval=0.01, queue_size=1, on_full="block",
+                         block_timeout=0.05).start()
+        for r in _records(5):
+            sink.emit(r)
+        sink.release.set()
+        sink.close()
+        st = sink.stats()
+        assert st["blocked"] > 0
+        assert st["accepted"] + st["dropped"] == 5
+
+    def test_incomplete_sink_fails_on_construction(self):
+        """A subclass without _write is rejected when created, not at the first flush."""
+        class NoWrite(BatchingSink):
+            name = "nowrite"
+
+        with pytest.raises(TypeError):
+            NoWrite()
+
+
+class TestSinkSpecs:
+    """Test sink spec and unit parsing."""
+
+    def test_invalid_specs(self):
+        with pytest.raises(ValueError):
+            open_sink("nonsense")
+        with pytest.raises(ValueError):
+            open_sink("ftp://host/x")
+        with pytest.raises(ValueError):
+            open_sink("file:/tmp/x.ndjson?bogus=1")
+        with pytest.raises(ValueError):
+            open_sink("file:/tmp/x.ndjson?compress=maybe")
+
+    def test_units(self):
+        assert parse_size("50M") == 50 * 1024 * 1024
+        assert parse_size("512") == 512
+        assert parse_duration("1h") == 3600
+        assert parse_duration("5m") == 300
+        with pytest.raises(ValueError):
+            parse_duration("soon")
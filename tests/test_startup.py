@@ -0,0 +1,78 @@
+"""
+Test cases for CLI startup cost.
+
+Tests cover:
+- Heavy modules (rich, PyYAML) are not imported by `import detecttool.cli`
+- The JSON scan path never imports rich
+- Import time budget (python -X importtime)
+"""
+from __future__ import annotations
+import os
+import subprocess
+import sys
+import pytest
+from pathlib import Path
+
+
+PROJECT_ROOT = Path(__file__).parent.parent
+TEST_LOG = PROJECT_ROOT / "tests" / "fixtures" / "test.log"
+CONFIG_PATH = PROJECT_ROOT / "configs" / "rules.yaml"
+
+# 默认预算比较宽松，CI 机器上可以用环境变量收紧
+IMPORT_BUDGET_MS = float(os.environ.get("DETECTTOOL_IMPORT_BUDGET_MS", "400"))
+
+
+def _run_python(code: str, *args: str, cache_dir: Path) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (str(PROJECT_ROOT / "src"), env.get("PYTHONPATH")) if p
+    )
+    env["DETECTTOOL_CACHE_DIR"] = str(cache_dir)
+    return subprocess.run(
+        [sys.executable, *args, "-c", code],
+        capture_output=True, text=True, env=env, check=True,
+    )
+
+
+class TestLazyImports:
+    """Test that heavyweight modules are imported on demand only."""
+
+    def test_import_cli_is_lean(self, tmp_path):
+        """Importing the CLI must not pull in rich or PyYAML."""
+        proc = _run_python(
+            "import sys, detecttool.cli\n"
+            "print(','.join(sorted(m for m in ('rich', 'yaml') if m in sys.modules)))",
+            cache_dir=tmp_path,
+        )
+        assert proc.stdout.strip() == ""
+
+    def test_json_scan_never_imports_rich(self, tmp_path):
+        """`scan --json` with a warm config cache imports neither rich nor PyYAML."""
+        code = (
+            "import sys\n"
+            "from detecttool.cli import app\n"
+            f"try: app(['scan', '-f', {str(TEST_LOG)!r}, '-c', {str(CONFIG_PATH)!r}, '--json'])\n"
+            "except SystemExit: pass\n"
+            "print('LOADED=' + ','.join(sorted(m for m in ('rich', 'yaml') if m in sys.modules)), file=sys.stderr)\n"
+        )
+        _run_python(code, cache_dir=tmp_path)  # 预热配置缓存
+        proc = _run_python(code, cache_dir=tmp_path)
+        assert "LOADED=" in proc.stderr
+        assert proc.stderr.strip().splitlines()[-1] == "LOADED="
+
+
+@pytest.mark.slow
+class TestImportBudget:
+    """Guard the import time budget of the CLI module."""
+
+    def test_import_time_budget(self, tmp_path):
+        """Median cumulative import time of detecttool.cli stays under budget."""
+        samples = []
+        for _ in range(3):
+            proc = _run_python("import detecttool.cli", "-X", "importtime", cache_dir=tmp_path)
+            for line in proc.stderr.splitlines():
+                if line.rstrip().endswith("| detecttool.cli"):
+                    samples.append(int(line.split("|")[1]) / 1000.0)
+        assert samples, "importtime output did not include detecttool.cli"
+        median = sorted(samples)[len(samples) // 2]
+        assert median < IMPORT_BUDGET_MS, f"import took {median:.1f} ms (budget {IMPORT_BUDGET_MS} ms)"
@@ -6,6 +6,8 @@ Tests cover:
 - Count accuracy
 - Top N rankings
 - Edge cases (empty results, etc.)
+- Incremental stats over growing files
+- Time-bucketed histograms (NumPy and pure-Python backends)
 """
 from __future__ import annotations
 import pytest
@@ -256,3 +258,194 @@ class TestEdgeCases:
         top_procs = dict(stats["top_processes"])
         assert top_procs["python3"] == 2, "python3 should appear 2 times"
         assert top_procs["java"] == 1, "java should appear 1 time"
+
+
+class TestIncrementalStats:
+    """Test incremental statistics over growing log files."""
+
+    EXAMPLES = Path(__file__).parent.parent / "examples" / "logs"
+
+    @staticmethod
+    def _full(config, path: Path):
+        from detecttool.stats import StatsAccumulator
+        acc = StatsAccumulator().add_all(detect_lines(_iter_file_lines(path), config.rules))
+        total = sum(1 for _ in _iter_file_lines(path))
+        return acc.result(total, top_n=10)
+
+    @staticmethod
+    def _incremental(config, path: Path, state: Path):
+        from detecttool.stats import incremental_stats
+        return incremental_stats(str(path), config, "cfg", state)
+
+    @pytest.mark.parametrize("name", ["mixed_production.log", "oom_storm.log", "kernel_panic_full.log"])
+    def test_growing_file_matches_full_scan(self, config, tmp_path, name):
+        """Appending in arbitrary chunks (even mid-line/mid-block) gives full-scan results."""
+        data = (self.EXAMPLES / name).read_bytes()
+        log = tmp_path / "kern.log"
+        state = tmp_path / "state.json"
+        log.write_bytes(b"")
+        cuts = sorted({0, len(data) // 7, len(data) // 3, len(data) // 2 + 5, (len(data) * 4) // 5, len(data)})
+        modes = []
+        for start, end in zip(cuts, cuts[1:]):
+            with open(log, "ab") as f:
+                f.write(data[start:end])
+            result, info = self._incremental(config, log, state)
+            modes.append(info["mode"])
+            assert result == self._full(config, log), f"mismatch after {end} bytes"
+        assert modes[0] == "full" and set(modes[1:]) == {"incremental"}
+
+    def test_only_new_bytes_processed(self, config, tmp_path):
+        log = tmp_path / "kern.log"
+        state = tmp_path / "state.json"
+        log.write_bytes(TEST_LOG.read_bytes())
+        self._incremental(config, log, state)
+        extra = b"Dec 24 18:10:00 kernel: reboot: Restarting system\n"
+        with open(log, "ab") as f:
+            f.write(extra)
+        result, info = self._incremental(config, log, state)
+        assert info["mode"] == "incremental"
+        assert info["bytes_processed"] == len(extra)
+        assert result["by_type"]["REBOOT"] == 2
+        assert result["total_lines_scanned"] == 17
+
+    def test_rotation_and_truncation_fall_back(self, config, tmp_path):
+        log = tmp_path / "kern.log"
+        state = tmp_path / "state.json"
+        log.write_bytes(TEST_LOG.read_bytes())
+        self._incremental(config, log, state)
+
+        # 截断
+        log.write_bytes(b"Dec 24 18:10:00 kernel: reboot: Restarting system\n")
+        result, info = self._incremental(config, log, state)
+        assert info["mode"] == "full" and info["reason"] == "file truncated"
+        assert result["total_incidents"] == 1
+
+        # 轮转：新文件替换旧路径
+        rotated = tmp_path / "kern.log.new"
+        rotated.write_bytes(TEST_LOG.read_bytes())
+        rotated.replace(log)
+        result, info = self._incremental(config, log, state)
+        assert info["mode"] == "full" and info["reason"] == "file rotated"
+        assert result == self._full(config, log)
+
+    def test_rules_change_falls_back(self, config, tmp_path):
+        from detecttool.stats import incremental_stats
+        log = tmp_path / "kern.log"
+        state = tmp_path / "state.json"
+        log.write_bytes(TEST_LOG.read_bytes())
+        incremental_stats(str(log), config, "old", state)
+        _, info = incremental_stats(str(log), config, "new", state)
+        assert info["reason"] == "rules changed"
+
+    def test_cli_incremental_json(self, tmp_path):
+        """`stats --incremental --json` prints the same document as a full scan."""
+        from typer.testing import CliRunner
+        from detecttool.cli import app
+
+        runner = CliRunner()
+        log = tmp_path / "kern.log"
+        log.write_bytes(TEST_LOG.read_bytes())
+        cfg = str(Path(__file__).parent.parent / "configs" / "rules.yaml")
+        args = ["stats", "-f", str(log), "-c", cfg, "--json"]
+        inc_args = args + ["--incremental", "--state", str(tmp_path / "s.json")]
+        first = runner.invoke(app, inc_args)
+        second = runner.invoke(app, inc_args)
+        full = runner.invoke(app, args)
+        assert first.exit_code == second.exit_code == full.exit_code == 0
+        assert first.stdout == second.stdout == full.stdout
+
+
+class TestTimeline:
+    """Test time-bucketed incident histograms (stats --bucket)."""
+
+    EXAMPLES = Path(__file__).parent.parent / "examples" / "logs"
+
+    @staticmethod
+    def _incident(ts: str, type_: str = "OOM", severity: str = "high") -> Incident:
+        return Incident(rule_id="r", type=type_, severity=severity,
+                        message=f"Dec 24 {ts} host kernel: x", line_no=1, extracted={})
+
+    @pytest.fixture(params=[False, True], ids=["array", "numpy"])
+    def use_numpy(self, request):
+        if request.param:
+            pytest.importorskip("numpy")
+        return request.param
+
+    def test_bucket_counts_and_peak(self, use_numpy):
+        from detecttool.stats import TimeHistogram
+        h = TimeHistogram(60, use_numpy=use_numpy)
+        # 乱序时间戳：后面的事件落在更早的桶里
+        for ts, t, sev in [("10:05:10", "OOM", "high"), ("10:05:50", "PANIC", "critical"),
+                           ("10:01:00", "OOM", "high"), ("10:05:59", "OOM", "high"),
+                           ("10:09:00", "OOM", "high")]:
+            h.add(self._incident(ts, t, sev))
+        h.add(Incident(rule_id="r", type="OOM", severity="high", message="no timestamp",
+                       line_no=1, extracted={}))
+        out = h.result()
+        assert out["backend"] == ("numpy" if use_numpy else "array")
+        assert out["untimed_incidents"] == 1
+        assert [b["total"] for b in out["buckets"]] == [1, 3, 1]  # 空桶不输出
+        middle = out["buckets"][1]
+        assert middle["start"].endswith("10:05:00")
+        assert middle["by_type"] == {"OOM": 2, "PANIC": 1}
+        assert middle["by_severity"] == {"high": 2, "critical": 1}
+        assert out["peak"]["count"] == 3 and out["peak"]["per_minute"] == 3.0
+        assert out["peak_by_type"]["PANIC"]["count"] == 1
+
+    def test_backends_agree(self, config):
+        pytest.importorskip("numpy")
+        from detecttool.stats import TimeHistogram
+        incidents = detect_lines(_iter_file_lines(self.EXAMPLES / "mixed_production.log"), config.rules)
+        results = []
+        for use_numpy in (False, True):
+            h = TimeHistogram(300, use_numpy=use_numpy)
+            for inc in incidents:
+                h.add(inc)
+            out = h.result()
+            out.pop("backend")
+            results.append(out)
+        assert results[0] == results[1]
+        assert sum(b["total"] for b in results[0]["buckets"]) + results[0]["untimed_incidents"] == len(incidents)
+
+    def test_state_round_trip(self, use_numpy):
+        from detecttool.stats import TimeHistogram
+        h = TimeHistogram(60, use_numpy=use_numpy)
+        for ts in ("10:00:01", "10:00:02", "10:03:00"):
+            h.add(self._incident(ts))
+        restored = TimeHistogram.from_state(h.to_state(), use_numpy=use_numpy)
+        assert restored.result() == h.result()
+
+    def test_incremental_matches_full_scan(self, config, tmp_path):
+        from detecttool.stats import StatsAccumulator, incremental_stats
+        data = (self.EXAMPLES / "oom_storm.log").read_bytes()
+        log = tmp_path / "kern.log"
+        state = tmp_path / "state.json"
+        half = len(data) // 2
+        log.write_bytes(data[:half])
+        incremental_stats(str(log), config, "cfg", state, bucket_seconds=60)
+        log.write_bytes(data)
+        result, info = incremental_stats(str(log), config, "cfg", state, bucket_seconds=60)
+        assert info["mode"] == "incremental"
+
+        acc = StatsAccumulator(bucket_seconds=60)
+        acc.add_all(detect_lines(_iter_file_lines(log), config.rules))
+        assert result == acc.result(sum(1 for _ in _iter_file_lines(log)), top_n=10)
+
+        # 换桶宽 -> 旧的聚合不能复用
+        _, info = incremental_stats(str(log), config, "cfg", state, bucket_seconds=300)
+        assert info["reason"] == "bucket changed"
+
+    def test_cli_bucket_json(self):
+        import json
+        from typer.testing import CliRunner
+        from detecttool.cli import app
+
+        cfg = str(Path(__file__).parent.parent / "configs" / "rules.yaml")
+        result = CliRunner().invoke(app, ["stats", "-f", str(TEST_LOG), "-c", cfg, "--json", "--bucket", "5m"])
+        assert result.exit_code == 0
+        timeline = json.loads(result.stdout)["timeline"]
+        assert timeline["bucket_seconds"] == 300
+        assert sum(b["total"] for b in timeline["buckets"]) == 6
+
+        bad = CliRunner().invoke(app, ["stats", "-f", str(TEST_LOG), "-c", cfg, "--bucket", "soon"])
+        assert bad.exit_code == 1
@@ -0,0 +1,144 @@
+"""
+Test cases for the SQLite incident store.
+
+Tests cover:
+- SqliteSink batched inserts (WAL mode)
+- Filters, time ranges and group-by counts
+- Index usage and the `query` CLI command (including a file that is not a database)
+"""
+from __future__ import annotations
+import json
+import time
+import pytest
+from pathlib import Path
+from typer.testing import CliRunner
+from detecttool import store
+from detecttool.cli import app
+from detecttool.config import load_config
+from detecttool.engine import detect_lines
+from detecttool.sinks import open_sink
+from detecttool.units import parse_time
+
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+TEST_LOG = FIXTURES_DIR / "test.log"
+CONFIG_PATH = Path(__file__).parent.parent / "configs" / "rules.yaml"
+
+runner = CliRunner()
+
+
+def _iter_file_lines(path: Path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for i, line in enumerate(f, start=1):
+            yield i, line
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A database filled with the incidents of the test log via SqliteSink."""
+    incidents = detect_lines(_iter_file_lines(TEST_LOG), load_config(str(CONFIG_PATH)).rules)
+    path = tmp_path / "incidents.db"
+    sink = open_sink(f"sqlite:{path}", source="/var/log/kern.log", batch_size=4, flush_interval=0.01)
+    for inc in incidents:
+        sink.emit(inc)
+    sink.close()
+    assert sink.stats()["written"] == 6
+    return path
+
+
+class TestIncidentStore:
+    """Test the store module directly."""
+
+    def test_wal_and_rows(self, db_path):
+        conn = store.connect(str(db_path))
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        rows = store.query(conn)
+        assert len(rows) == 6
+        oom = [r for r in rows if r["type"] == "OOM"][0]
+        assert oom["pid"] == 1234 and oom["comm"] == "python3"
+        assert oom["source"] == "/var/log/kern.log"
+        assert oom["ts"] is not None
+        panic = [r for r in rows if r["type"] == "PANIC"][0]
+        assert any("panic stack trace" in l for l in panic["context"])
+
+    def test_filters(self, db_path):
+        conn = store.connect(str(db_path), readonly=True)
+        assert [r["type"] for r in store.query(conn, filters={"type": ["OOM"]})] == ["OOM"]
+        assert len(store.query(conn, filters={"severity": ["high", "critical"]})) == 5
+        assert len(store.query(conn, filters={"pid": [4321]})) == 1
+        assert store.query(conn, filters={"source": ["/elsewhere"]}) == []
+
+    def test_time_range(self, db_path):
+        conn = store.connect(str(db_path), readonly=True)
+        rows = store.query(conn)
+        deadlock_ts = [r["ts"] for r in rows if r["type"] == "DEADLOCK"][0]
+        later = store.query(conn, since=deadlock_ts)
+        assert [r["type"] for r in later] == ["DEADLOCK"]
+        assert len(store.query(conn, until=deadlock_ts)) == 5
+
+    def test_group_counts(self, db_path):
+        conn = store.connect(str(db_path), readonly=True)
+        by_sev = dict(store.group_counts(conn, "severity"))
+        assert by_sev == {"high": 4, "critical": 1, "medium": 1}
+        assert sum(n for _, n in store.group_counts(conn, "hour")) == 6
+        with pytest.raises(ValueError):
+            store.group_counts(conn, "bogus")
+
+    def test_group_by_hour_keeps_newest(self, tmp_path):
+        """With more hour buckets than the limit, the oldest are cut, not the newest."""
+        conn = store.connect(str(tmp_path / "hours.db"))
+        base = 1766534400  # 2025-12-24 00:00 UTC
+        for h in range(10):
+            stamp = time.strftime("%b %d %H:%M:%S", time.localtime(base + h * 3600))
+            store.insert_many(conn, [{"rule_id": "oom_basic", "type": "OOM", "severity": "high",
+                                      "message": f"{stamp} host kernel: Out of memory", "line_no": h}])
+        groups = store.group_counts(conn, "hour", limit=3)
+        everything = store.group_counts(conn, "hour", limit=100)
+        assert len(everything) == 10 and groups == everything[-3:]
+
+    def test_queries_use_indexes(self, db_path):
+        """Filtered queries are answered through an index, not a table scan."""
+        conn = store.connect(str(db_path), readonly=True)
+        plan = " ".join(
+            str(tuple(r)) for r in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM incidents WHERE type = ? AND ts >= ?", ("OOM", 0)
+            )
+        )
+        assert "USING" in plan and "INDEX" in plan
+
+
+class TestQueryCommand:
+    """Test the `query` CLI command."""
+
+    def test_query_json(self, db_path):
+        result = runner.invoke(app, ["query", "--db", str(db_path), "--type", "DEADLOCK", "--json"])
+        assert result.exit_code == 0, result.stdout
+        rows = json.loads(result.stdout)
+        assert len(rows) == 1 and rows[0]["extracted"]["secs"] == "120"
+
+    def test_query_group_by_table(self, db_path):
+        result = runner.invoke(app, ["query", "--db", str(db_path), "--group-by", "type"])
+        assert result.exit_code == 0, result.stdout
+        assert "Incidents by type" in result.stdout and "FS_EXCEPTION" in result.stdout
+
+    def test_query_missing_db(self, tmp_path):
+        result = runner.invoke(app, ["query", "--db", str(tmp_path / "none.db")])
+        assert result.exit_code != 0
+
+    def test_query_not_a_database(self, tmp_path):
+        bad = tmp_path / "notdb.db"
+        bad.write_bytes(b"this is not sqlite\n" * 100)
+        result = runner.invoke(app, ["query", "--db", str(bad)])
+        assert result.exit_code == 1 and "Cannot read database" in result.stdout  # 不是未捕获的 DatabaseError
+
+
+class TestParseTime:
+    """Test --since/--until time parsing."""
+
+    def test_formats(self):
+        now = 1_700_000_000.0
+        assert parse_time("30m", now=now) == now - 1800
+        assert parse_time("1700000000") == 1_700_000_000.0
+        assert parse_time("2025-12-24 03:15") == parse_time("2025-12-24T03:15:00")
+        with pytest.raises(ValueError):
+            parse_time("yesterday-ish")
@@ -0,0 +1,211 @@
+"""
+Test cases for the syslog receiver.
+
+Tests cover:
+- RFC 3164 / RFC 5424 parsing into host + BSD-style line (missing hostname/timestamp, structured data,
+  a 3164 message starting with a number is not taken for 5424)
+- TCP framing: octet-counted, LF/NUL terminated, split reads, oversized frames
+- Per-host detection state (blocks and cooldowns never mix hosts), host limit, idle flush, hot swap
+- One compiled multi-line BlockTable shared by all hosts, recompiled once on hot swap
+- End to end over UDP and TCP on localhost with a client generator
+- `serve-syslog` argument errors
+"""
+from __future__ import annotations
+import asyncio
+import socket
+import time
+import pytest
+from typer.testing import CliRunner
+from detecttool.cli import app
+from detecttool.config import load_config
+from detecttool.hosts import HostDetectors
+from detecttool.sources.syslog import (
+    OctetFramer, SyslogReceiver, format_syslog, frame_octet_counted, parse_address, parse_syslog,
+)
+
+NOW = time.mktime((2025, 12, 24, 10, 0, 0, 0, 0, -1))
+
+
+class TestParse:
+    """Test message parsing."""
+
+    def test_rfc3164(self):
+        msg = parse_syslog(b"<4>Dec 24 10:00:00 web1 kernel: Out of memory\n", "10.0.0.1")
+        assert msg == ("web1", "Dec 24 10:00:00 web1 kernel: Out of memory")
+
+    def test_rfc3164_without_hostname_or_timestamp(self):
+        assert parse_syslog(b"<4>Dec  4 10:00:00 kernel: oops", "10.0.0.1").host == "10.0.0.1"
+        msg = parse_syslog(b"<13>sshd[42]: hello", "10.0.0.2", now=NOW)
+        assert msg == ("10.0.0.2", "Dec 24 10:00:00 10.0.0.2 sshd[42]: hello")
+
+    def test_rfc5424(self):
+        data = (b'<34>1 2025-12-24T10:00:00.123+00:00 db2 kernel 77 ID1 '
+                b'[ex@1 a="x]\\"y"][ex@2 b="z"] \xef\xbb\xbfKernel panic - not syncing')
+        msg = parse_syslog(data, "10.0.0.3")
+        assert msg.host == "db2"
+        assert msg.line.endswith(" db2 kernel[77]: Kernel panic - not syncing")
+        nil = parse_syslog(b"<34>1 - - - - - - hi", "10.0.0.4", now=NOW)
+        assert nil == ("10.0.0.4", "Dec 24 10:00:00 10.0.0.4 hi")
+
+    def test_leading_number_is_not_rfc5424(self):
+        msg = parse_syslog(b"<13>1 kernel oops in module foo bar", "10.0.0.5", now=NOW)
+        assert msg == ("10.0.0.5", "Dec 24 10:00:00 10.0.0.5 1 kernel oops in module foo bar")
+
+    def test_roundtrip_with_generator(self):
+        for rfc in ("3164", "5424"):
+            msg = parse_syslog(format_syslog("h1", "EXT4-fs error", rfc=rfc, ts=NOW), "x")
+            assert msg == ("h1", "Dec 24 10:00:00 h1 kernel: EXT4-fs error")
+
+    def test_empty(self):
+        assert parse_syslog(b"\r\n", "x") is None
+
+    def test_address(self):
+        assert parse_address("127.0.0.1:5514") == ("127.0.0.1", 5514)
+        assert parse_address(":5514") == ("0.0.0.0", 5514)
+        assert parse_address("[::1]:514") == ("::1", 514)
+        with pytest.raises(ValueError):
+            parse_address("host:http")
+
+
+class TestFramer:
+    """Test TCP stream framing."""
+
+    def test_mixed_and_split(self):
+        f = OctetFramer()
+        data = frame_octet_counted(b"<1>a b") + b"<2>line\n" + frame_octet_counted(b"<3>c\nd") + b"<4>nul\x00"
+        out = []
+        for i in range(len(data)):  # 逐字节送入
+            out += f.feed(data[i:i + 1])
+        assert out == [b"<1>a b", b"<2>line", b"<3>c\nd", b"<4>nul"]
+
+    def test_oversized(self):
+        f = OctetFramer(max_message=4)
+        assert f.feed(b"10 0123") == [b"0123"]  # 够截断长度就先交出，剩余部分丢弃
+        assert f.feed(b"456789<1>x\n") == [b"<1>x"]
+        assert f.feed(b"abcdefgh") == [b"abcd"]
+        assert f.truncated == 2
+
+
+def _line(host: str, sec: int, msg: str) -> str:
+    return f"Dec 24 10:00:{sec:02d} {host} kernel: {msg}"
+
+
+class TestHostDetectors:
+    """Test per-host detection state."""
+
+    @pytest.fixture
+    def hosts(self, config_path):
+        cfg = load_config(str(config_path))
+        return HostDetectors(cfg.rules, prefilter=cfg.prefilter, max_hosts=2)
+
+    def test_blocks_do_not_mix(self, hosts):
+        assert hosts.process("a", _line("a", 0, "Kernel panic - not syncing: Fatal exception")) == []
+        hosts.process("b", _line("b", 0, "usb 1-2: new device"))
+        hosts.process("a", _line("a", 0, "CPU: 3 PID: 1 Comm: init"))
+        out = hosts.flush()
+        assert [(i.type, i.extracted["host"]) for i in out] == [("PANIC", "a")]
+        assert list(out[0].context) == [_line("a", 0, "CPU: 3 PID: 1 Comm: init")]
+
+    def test_cooldown_per_host(self, hosts):
+        oom = "Out of memory: Killed process 9 (java)"
+        assert len(hosts.process("a", _line("a", 1, oom))) == 1
+        assert hosts.process("a", _line("a", 1, oom)) == []  # 同一主机在冷却中
+        assert len(hosts.process("b", _line("b", 1, oom))) == 1
+
+    def test_max_hosts_flushes_evicted(self, hosts):
+        hosts.process("a", _line("a", 0, "Kernel panic - not syncing: x"))
+        hosts.process("b", _line("b", 0, "hello"))
+        out = hosts.process("c", _line("c", 0, "hello"))
+        assert [(i.type, i.extracted["host"]) for i in out] == [("PANIC", "a")]
+        assert hosts.stats()["hosts"] == 2 and hosts.stats()["evicted"] == 1
+
+    def test_heartbeat_idle_flush(self, hosts, monkeypatch):
+        hosts.process("a", _line("a", 0, "Kernel panic - not syncing: x"))
+        assert hosts.heartbeat() == []
+        later = time.time() + 5
+        monkeypatch.setattr(time, "time", lambda: later)
+        assert [i.type for i in hosts.heartbeat()] == ["PANIC"]
+        assert hosts.stats()["open_blocks"] == 0
+
+    def test_swap_rules(self, hosts):
+        hosts.process("a", _line("a", 0, "hello"))
+        diff = hosts.swap_rules([r for r in hosts.rules if r.type != "OOM"])
+        assert diff["removed"] == ["oom_basic"]
+        assert hosts.process("a", _line("a", 1, "Out of memory: Killed process 9 (java)")) == []
+
+    def test_block_table_shared(self, hosts):
+        hosts.process("a", _line("a", 0, "hello"))
+        hosts.process("b", _line("b", 0, "hello"))
+        a, b = hosts._hosts["a"].agg, hosts._hosts["b"].agg
+        assert a.table is b.table
+        old = a.table
+        hosts.swap_rules([r for r in hosts.rules if r.type != "OOM"])
+        assert a.table is b.table is not old
+        hosts.process("c", _line("c", 0, "hello"))  # 挤掉 a
+        assert hosts._hosts["c"].agg.table is b.table
+
+
+class TestReceiver:
+    """Test UDP and TCP end to end on localhost."""
+
+    def test_udp_and_tcp(self):
+        got = []
+
+        async def main():
+            r = SyslogReceiver(lambda host, line: got.append((host, line)),
+                               udp=("127.0.0.1", 0), tcp=("127.0.0.1", 0))
+            await r.start()
+            loop = asyncio.get_running_loop()
+
+            def client():
+                u = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                for i in range(20):
+                    u.sendto(format_syslog(f"u{i % 4}", f"msg {i}", ts=NOW), r.addresses["udp"])
+                u.close()
+                with socket.create_connection(r.addresses["tcp"]) as t:
+                    t.sendall(b"".join(frame_octet_counted(format_syslog(f"t{i % 3}", f"msg {i}", rfc="5424", ts=NOW))
+                                       for i in range(30)))
+                    t.sendall(format_syslog("t9", "last one, no newline", ts=NOW))
+
+            await loop.run_in_executor(None, client)
+            for _ in range(100):
+                if len(got) >= 51:
+                    break
+                await asyncio.sleep(0.02)
+            await r.close()
+            return r.stats()
+
+        stats = asyncio.run(main())
+        assert stats["udp_messages"] == 20 and stats["tcp_messages"] == 31 and stats["tcp_connections"] == 1
+        assert {h for h, _ in got} == {"u0", "u1", "u2", "u3", "t0", "t1", "t2", "t9"}
+        assert ("t9", "Dec 24 10:00:00 t9 kernel: last one, no newline") in got
+
+    def test_run_until_stopped(self):
+        ticks = []
+
+        async def main():
+            r = SyslogReceiver(lambda h, l: None, tcp=("127.0.0.1", 0))
+            stop = asyncio.Event()
+            asyncio.get_running_loop().call_later(0.2, stop.set)
+            await r.run(stop, tick=lambda: ticks.append(1), tick_interval=0.05)
+            return r
+
+        r = asyncio.run(main())
+        assert ticks and r._tcp_server is None
+
+    def test_needs_a_protocol(self):
+        with pytest.raises(ValueError):
+            SyslogReceiver(lambda h, l: None)
+
+
+class TestServeSyslogCli:
+    """Test `serve-syslog` argument handling."""
+
+    @pytest.mark.parametrize("args", [
+        ["--udp", "off", "--tcp", "off"],
+        ["--udp", "127.0.0.1:99999"],
+        ["--max-hosts", "0"],
+    ])
+    def test_bad_arguments(self, config_path, args):
+        result = CliRunner().invoke(app, ["serve-syslog", "-c", str(config_path)] + args)
+        assert result.exit_code == 1
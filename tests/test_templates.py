@@ -0,0 +1,110 @@
+"""
+Test cases for streaming log template mining.
+
+Tests cover:
+- syslog header stripping and digit masking
+- Clustering of variable lines into one template, bounded table size
+- NEW_TEMPLATE after warmup and TEMPLATE_SPIKE against the baseline
+- Saving and loading the template table
+- `scan --templates`
+"""
+from __future__ import annotations
+import json
+from typer.testing import CliRunner
+from detecttool.cli import app
+from detecttool.templates import TemplateMiner, _tokens
+
+
+def _line(sec: int, msg: str) -> str:
+    return f"Dec 24 10:{sec // 60 % 60:02d}:{sec % 60:02d} host kernel: [{sec}.000123] {msg}\n"
+
+
+class TestTokens:
+    """Test tokenization."""
+
+    def test_header_and_masking(self):
+        assert _tokens(_line(5, "usb 1-2: new device number 7")) == ["usb", "<*>", "new", "device", "number", "<*>"]
+        assert _tokens("Dec 24 17:40:30 kernel: reboot: Restarting system") == ["reboot:", "Restarting", "system"]
+        assert _tokens("no header here") == ["no", "header", "here"]
+
+
+class TestMining:
+    """Test template clustering and reporting."""
+
+    def test_variable_positions_merge(self):
+        m = TemplateMiner(warmup_lines=0)
+        m.process(1, _line(1, "eth0: link up speed fast"))
+        m.process(2, _line(2, "eth0: link up speed slow"))
+        m.process(3, _line(3, "eth0: link up speed slow"))
+        assert [(t.text, t.count) for t in m.templates.values()] == [("<*> link up speed <*>", 3)]
+
+    def test_bounded_table(self):
+        m = TemplateMiner(max_templates=10, warmup_lines=0)
+        for i in range(50):
+            m.process(i + 1, _line(i, f"word{chr(97 + i % 26)}{chr(97 + i // 26)} unique"))
+        assert len(m.templates) <= 10 and m.evicted > 0
+
+    def test_new_template_after_warmup(self):
+        m = TemplateMiner(warmup_lines=3)
+        out = []
+        for i, msg in enumerate(["alpha ready", "beta ready", "alpha ready", "alpha ready", "gamma failed badly"], start=1):
+            out += m.process(i, _line(i, msg))
+        assert [(i.type, i.line_no) for i in out] == [("NEW_TEMPLATE", 5)]
+        assert out[0].extracted["template"] == "gamma failed badly"
+        assert m.process(0, "") == []  # 心跳
+
+    def test_spike(self):
+        m = TemplateMiner(window_seconds=60, min_spike=10, spike_factor=5)
+        out, line_no = [], 0
+        for minute in range(5):  # 基线：每分钟 2 次
+            for k in range(2):
+                line_no += 1
+                out += m.process(line_no, _line(minute * 60 + k, "ata1: link reset"))
+        assert out == []
+        for k in range(30):  # 第 6 分钟突然 30 次
+            line_no += 1
+            out += m.process(line_no, _line(300 + k, "ata1: link reset"))
+        spikes = [i for i in out if i.type == "TEMPLATE_SPIKE"]
+        assert len(spikes) == 1  # 每个窗口只报一次
+        assert spikes[0].extracted["window_count"] == "10"  # 达到 min_spike 即报
+
+
+class TestPersistence:
+    """Test the template table between runs."""
+
+    def test_roundtrip(self, tmp_path):
+        m = TemplateMiner(warmup_lines=100)
+        for i in range(1, 20):
+            m.process(i, _line(i, f"sd {i}: attached disk"))
+        m.save(tmp_path / "t.json")
+
+        again = TemplateMiner(warmup_lines=100)
+        assert again.load(tmp_path / "t.json")
+        assert again.process(1, _line(1, "sd 9: attached disk")) == []
+        new = again.process(2, _line(2, "thermal zone critical"))
+        assert [i.type for i in new] == ["NEW_TEMPLATE"]  # 载入过的表不再预热
+
+    def test_bad_state_ignored(self, tmp_path):
+        (tmp_path / "t.json").write_text("{not json")
+        assert not TemplateMiner().load(tmp_path / "t.json")
+        (tmp_path / "t.json").write_text(json.dumps({"version": 999}))
+        assert not TemplateMiner().load(tmp_path / "t.json")
+
+
+class TestScanTemplates:
+    """Test `scan --templates`."""
+
+    def test_scan(self, test_log_path, config_path, tmp_path):
+        args = ["scan", "-f", str(test_log_path), "-c", str(config_path), "--json",
+                "--templates", "--templates-state", str(tmp_path / "t.json")]
+        first = json.loads(CliRunner().invoke(app, args + ["--template-warmup", "3"]).stdout)
+        assert any(i["type"] == "NEW_TEMPLATE" for i in first)
+        assert (tmp_path / "t.json").exists()
+        second = json.loads(CliRunner().invoke(app, args).stdout)
+        assert not any(i["type"] == "NEW_TEMPLATE" for i in second)
+        assert [i for i in first if i["type"] != "NEW_TEMPLATE"] == second
+
+    def test_bad_warmup(self, test_log_path, config_path):
+        result = CliRunner().invoke(app, ["scan", "-f", str(test_log_path), "-c", str(config_path),
+                                          "--templates", "--template-warmup", "-1"])
+        assert result.exit_code == 1